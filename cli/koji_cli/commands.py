@@ -35,10 +35,13 @@ from koji_cli.lib import (
     arg_filter,
     download_archive,
     download_file,
+    download_files,
     download_rpm,
     ensure_connection,
     error,
     format_inheritance_flags,
+    get_archive_download,
+    get_rpm_download,
     get_usage_str,
     greetings,
     linked_upload,
@@ -1756,11 +1759,24 @@ def handle_write_signed_rpm(goptions, session, args):
         for rpm_list in rpm_lists:
             rpms.extend(rpm_list.result)
 
-    with session.multicall(strict=True) as m:
-        for i, rpminfo in enumerate(rpms):
+    bulk = True
+    for i in range(0, len(rpms), 1000):
+        batch = rpms[i:i + 1000]
+        for j, rpminfo in enumerate(batch, i + 1):
             nvra = "%(name)s-%(version)s-%(release)s.%(arch)s" % rpminfo
-            print("[%d/%d] %s" % (i + 1, len(rpms), nvra))
-            m.writeSignedRPM(rpminfo['id'], key)
+            print("[%d/%d] %s" % (j, len(rpms), nvra))
+        if bulk:
+            try:
+                session.writeSignedRPMs([rpminfo['id'] for rpminfo in batch], key)
+                continue
+            except koji.GenericError as e:
+                if 'Invalid method' not in str(e):
+                    raise
+                # older hub
+                bulk = False
+        with session.multicall(strict=True) as m:
+            for rpminfo in batch:
+                m.writeSignedRPM(rpminfo['id'], key)
 
 
 def handle_prune_signed_copies(goptions, session, args):
@@ -6811,6 +6827,8 @@ def anon_handle_download_build(options, session, args):
     parser.add_option("--topurl", metavar="URL", default=options.topurl,
                       help="URL under which Koji files are accessible")
     parser.add_option("--noprogress", action="store_true", help="Do not display progress meter")
+    parser.add_option("--jobs", type="int", default=1,
+                      help="Number of files to download concurrently (default: 1)")
     parser.add_option("-q", "--quiet", action="store_true",
                       help="Suppress output", default=options.quiet)
     (suboptions, args) = parser.parse_args(args)
@@ -6818,6 +6836,8 @@ def anon_handle_download_build(options, session, args):
         parser.error("Please specify a package N-V-R or build ID")
     elif len(args) > 1:
         parser.error("Only a single package N-V-R or build ID may be specified")
+    if suboptions.jobs < 1:
+        parser.error("--jobs must be a positive number")
 
     ensure_connection(session, options)
     build = args[0]
@@ -6898,6 +6918,15 @@ def anon_handle_download_build(options, session, args):
                 warn("No such sigkey %s for rpm %s" % (suboptions.key, nvra))
                 rpms.remove(rpm)
 
+    if suboptions.jobs > 1:
+        downloads = [get_rpm_download(info, rpm, suboptions.topurl, sigkey=suboptions.key)
+                     for rpm in rpms]
+        downloads.extend([get_archive_download(info, archive, suboptions.topurl)
+                          for archive in archives])
+        download_files(downloads, jobs=suboptions.jobs, quiet=suboptions.quiet,
+                       noprogress=suboptions.noprogress)
+        return
+
     size = len(rpms) + len(archives)
     number = 0
 
@@ -6935,10 +6964,14 @@ def anon_handle_download_logs(options, session, args):
                       help="Continue previous download")
     parser.add_option("-d", "--dir", metavar="DIRECTORY", default='kojilogs',
                       help="Write logs to DIRECTORY")
+    parser.add_option("--jobs", type="int", default=1,
+                      help="Number of build logs to download concurrently (default: 1)")
     (suboptions, args) = parser.parse_args(args)
 
     if len(args) < 1:
         parser.error("Please specify at least one task id or n-v-r")
+    if suboptions.jobs < 1:
+        parser.error("--jobs must be a positive number")
 
     def write_fail_log(task_log_dir, task_id):
         """Gets output only from failed tasks"""
@@ -7046,6 +7079,7 @@ def anon_handle_download_logs(options, session, args):
         elif build_id:
             logs = session.getBuildLogs(build_id)
             match = suboptions.match
+            downloads = []
             for log in logs:
                 url = os.path.join(options.topurl, log['path'])
                 filepath = os.path.join(os.getcwd(), '%s/%s/%s' % (suboptions.dir,
@@ -7054,7 +7088,12 @@ def anon_handle_download_logs(options, session, args):
                     continue
                 if match and not koji.util.multi_fnmatch(log['name'], match):
                     continue
-                download_file(url, filepath)
+                if suboptions.jobs > 1:
+                    downloads.append({'url': url, 'path': filepath})
+                else:
+                    download_file(url, filepath)
+            if downloads:
+                download_files(downloads, jobs=suboptions.jobs)
 
 
 def anon_handle_download_task(options, session, args):
@@ -7085,12 +7124,16 @@ def anon_handle_download_task(options, session, args):
                       help="Regex pattern to filter files")
     parser.add_option("--skip", dest="skip", action="append", default=[],
                       help="Regex pattern to skip files")
+    parser.add_option("--jobs", type="int", default=1,
+                      help="Number of files to download concurrently (default: 1)")
 
     (suboptions, args) = parser.parse_args(args)
     if len(args) == 0:
         parser.error("Please specify a task ID")
     elif len(args) > 1:
         parser.error("Only one task ID may be specified")
+    if suboptions.jobs < 1:
+        parser.error("--jobs must be a positive number")
 
     base_task_id = int(args.pop())
     if len(suboptions.arches) > 0:
@@ -7217,6 +7260,7 @@ def anon_handle_download_task(options, session, args):
     number = 0
     pathinfo = koji.PathInfo(topdir=suboptions.topurl)
     files_downloaded = []
+    queued = []
     dirpertask_msg = False
     for (task, filename, volume, new_filename, task_id) in downloads:
         if suboptions.dirpertask:
@@ -7233,14 +7277,20 @@ def anon_handle_download_task(options, session, args):
             error('Invalid file name: %s' % filename)
         url = '%s/%s/%s' % (pathinfo.work(volume), pathinfo.taskrelpath(task["id"]), filename)
         if (new_filename, volume) not in files_downloaded:
-            download_file(url, new_filename, quiet=suboptions.quiet,
-                          noprogress=suboptions.noprogress, size=len(downloads), num=number)
+            if suboptions.jobs > 1:
+                queued.append({'url': url, 'path': new_filename})
+            else:
+                download_file(url, new_filename, quiet=suboptions.quiet,
+                              noprogress=suboptions.noprogress, size=len(downloads), num=number)
             files_downloaded.append((new_filename, volume))
         else:
             if not suboptions.quiet:
                 print("Downloading [%d/%d]: %s" % (number, len(downloads), new_filename))
                 print("File %s already downloaded, skipping" % new_filename)
             dirpertask_msg = True
+    if queued:
+        download_files(queued, jobs=suboptions.jobs, quiet=suboptions.quiet,
+                       noprogress=suboptions.noprogress)
     if dirpertask_msg:
         warn("Duplicate files, for download all duplicate files use --dirpertask.")
 
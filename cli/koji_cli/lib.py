@@ -1,6 +1,7 @@
 # coding=utf-8
 from __future__ import absolute_import, division
 
+import functools
 import hashlib
 import json
 import optparse
@@ -9,6 +10,7 @@ import random
 import socket
 import string
 import sys
+import threading
 import time
 from contextlib import closing
 from copy import copy
@@ -216,13 +218,18 @@ class TaskWatcher(object):
         else:
             return '%s: %s' % (error.__class__.__name__, str(error).strip())
 
-    def update(self):
-        """Update info and log if needed.  Returns True on state change."""
+    def update(self, info=None):
+        """Update info and log if needed.  Returns True on state change.
+
+        :param dict info: current task info (with request), fetched if not given
+        """
         if self.is_done():
             # Already done, nothing else to report
             return False
         last = self.info
-        self.info = self.session.getTaskInfo(self.id, request=True)
+        if info is None:
+            info = self.session.getTaskInfo(self.id, request=True)
+        self.info = info
         if self.info is None:
             if not self.quiet:
                 print("No such task id: %i" % self.id)
@@ -325,6 +332,89 @@ def display_task_results(tasks):
             print('%s has not completed' % task_label)
 
 
+class TaskTreeFeed(object):
+    """Follow the state changes of task trees via getTaskTreeChanges
+
+    A single call per poll reports the changes in the whole trees.
+    """
+
+    def __init__(self, session, task_ids, request=True):
+        self.session = session
+        self.task_ids = list(task_ids)
+        self.request = request
+        self.cursor = None
+        self.supported = True
+
+    def changes(self):
+        """Return the tasks created or changed since the last call
+
+        The first call returns all tasks of the trees, sorted by id.
+
+        :returns: list of task infos, or None if the hub does not support the call
+        """
+        if not self.supported:
+            return None
+        try:
+            result = self.session.getTaskTreeChanges(self.task_ids, cursor=self.cursor,
+                                                     request=self.request)
+        except koji.GenericError as e:
+            if 'Invalid method' not in str(e):
+                raise
+            # older hub
+            self.supported = False
+            return None
+        self.cursor = result['cursor']
+        return result['tasks']
+
+
+def _update_watched_tasks(session, tasks, quiet=False, topurl=None):
+    """Update the watchers one task at a time (for hubs without getTaskTreeChanges)
+
+    :returns: True if all tasks are done
+    """
+    all_done = True
+    for task_id, task in list(tasks.items()):
+        changed = task.update()
+        if not task.is_done():
+            all_done = False
+        elif changed and not quiet:
+            # task is done and state just changed
+            display_tasklist_status(tasks)
+        for child in session.getTaskChildren(task_id):
+            child_id = child['id']
+            if child_id not in tasks.keys():
+                tasks[child_id] = TaskWatcher(child_id, session, task.level + 1,
+                                              quiet=quiet, topurl=topurl)
+                tasks[child_id].update()
+                # If we found new children, go through the list again,
+                # in case they have children also
+                all_done = False
+    return all_done
+
+
+def _update_watched_tree(session, tasks, changes, quiet=False, topurl=None):
+    """Update the watchers with the changes reported by TaskTreeFeed
+
+    :returns: True if all tasks are done
+    """
+    for info in changes:
+        task = tasks.get(info['id'])
+        if task is None:
+            # new task, its parent has a lower id, so we already have it
+            parent = tasks.get(info['parent'])
+            level = parent.level + 1 if parent else 0
+            task = tasks[info['id']] = TaskWatcher(info['id'], session, level,
+                                                   quiet=quiet, topurl=topurl)
+        changed = task.update(info)
+        if changed and task.is_done() and not quiet:
+            display_tasklist_status(tasks)
+    for task in tasks.values():
+        if task.info is None:
+            # a watched task that the hub did not report
+            task.update()
+    return all([task.is_done() for task in tasks.values()])
+
+
 def watch_tasks(session, tasklist, quiet=False, poll_interval=60, ki_handler=None, topurl=None):
     if not tasklist:
         return
@@ -345,29 +435,18 @@ def watch_tasks(session, tasklist, quiet=False, poll_interval=60, ki_handler=Non
         tasks = {}
         for task_id in tasklist:
             tasks[task_id] = TaskWatcher(task_id, session, quiet=quiet, topurl=topurl)
+        feed = TaskTreeFeed(session, tasklist)
         while True:
-            all_done = True
-            for task_id, task in list(tasks.items()):
-                changed = task.update()
-                if not task.is_done():
-                    all_done = False
-                else:
-                    if changed:
-                        # task is done and state just changed
-                        if not quiet:
-                            display_tasklist_status(tasks)
+            changes = feed.changes()
+            if changes is None:
+                all_done = _update_watched_tasks(session, tasks, quiet=quiet, topurl=topurl)
+            else:
+                all_done = _update_watched_tree(session, tasks, changes, quiet=quiet,
+                                                topurl=topurl)
+            if all_done:
+                for task in tasks.values():
                     if task.level == 0 and not task.is_success():
                         rv = 1
-                for child in session.getTaskChildren(task_id):
-                    child_id = child['id']
-                    if child_id not in tasks.keys():
-                        tasks[child_id] = TaskWatcher(child_id, session, task.level + 1,
-                                                      quiet=quiet, topurl=topurl)
-                        tasks[child_id].update()
-                        # If we found new children, go through the list again,
-                        # in case they have children also
-                        all_done = False
-            if all_done:
                 if not quiet:
                     print('')
                     display_task_results(tasks)
@@ -407,10 +486,30 @@ def watch_logs(session, tasklist, opts, poll_interval):
     for task_id in tasklist:
         offsets[task_id] = {}
 
+    # task states from the feed, unused with older hubs
+    states = {}
+    feed = TaskTreeFeed(session, tasklist, request=False)
     lastlog = None
     while True:
+        changes = feed.changes()
+        if changes is not None:
+            for info in changes:
+                if info['id'] not in offsets:
+                    if not opts.follow:
+                        continue
+                    tasklist.append(info['id'])
+                    offsets[info['id']] = {}
+                states[info['id']] = info['state']
         for task_id in tasklist[:]:
-            if _isDone(session, task_id):
+            if task_id in states:
+                state = koji.TASK_STATES[states[task_id]]
+                if state in ['FREE', 'ASSIGNED']:
+                    # not started yet, so there is no output
+                    continue
+                done = state in ['CLOSED', 'CANCELED', 'FAILED']
+            else:
+                done = _isDone(session, task_id)
+            if done:
                 tasklist.remove(task_id)
 
             output = list_task_output_all_volumes(session, task_id)
@@ -443,7 +542,7 @@ def watch_logs(session, tasklist, opts, poll_interval):
                             lastlog = currlog
                         bytes_to_stdout(contents)
 
-            if opts.follow:
+            if opts.follow and changes is None:
                 for child in session.getTaskChildren(task_id):
                     if child['id'] not in tasklist:
                         tasklist.append(child['id'])
@@ -546,7 +645,7 @@ def linked_upload(localfile, path, name=None):
 
 
 def download_file(url, relpath, quiet=False, noprogress=False, size=None,
-                  num=None, filesize=None):
+                  num=None, filesize=None, session=None, progress=None):
     """Download files from remote
 
     :param str url: URL to be downloaded
@@ -558,7 +657,11 @@ def download_file(url, relpath, quiet=False, noprogress=False, size=None,
     :param int num: download index (printed in verbose mode)
     :param int filesize: expected file size, used for appending to file, no
                          other checks are performed, caller is responsible for
-                         checking, that resulting file is valid."""
+                         checking, that resulting file is valid.
+    :param requests.Session session: session to use for the requests, a new
+                                     one is created if not given
+    :param progress: callable called as progress(relpath, pos, filesize)
+                     whenever data is written to the file"""
 
     if '/' in relpath:
         koji.ensuredir(os.path.dirname(relpath))
@@ -569,7 +672,8 @@ def download_file(url, relpath, quiet=False, noprogress=False, size=None,
             print("Downloading: %s" % relpath)
 
     if not filesize:
-        response = requests.head(url, timeout=10, allow_redirects=True)
+        head = session.head if session else requests.head
+        response = head(url, timeout=10, allow_redirects=True)
         if response.status_code == 200 and response.headers.get('Content-Length'):
             filesize = int(response.headers['Content-Length'])
 
@@ -581,6 +685,9 @@ def download_file(url, relpath, quiet=False, noprogress=False, size=None,
         pos = f.tell()
         if pos != 0:
             if filesize == pos:
+                f.close()
+                if progress:
+                    progress(relpath, pos, filesize)
                 if not quiet:
                     print("File %s already downloaded, skipping" % relpath)
                 return
@@ -593,17 +700,21 @@ def download_file(url, relpath, quiet=False, noprogress=False, size=None,
 
     mtime = None
     try:
+        session = session or koji.request_with_retry()
         # closing needs to be used for requests < 2.18.0
-        with closing(koji.request_with_retry().get(url, headers=headers, stream=True)) as response:
+        with closing(session.get(url, headers=headers, stream=True)) as response:
             if response.status_code in (200, 416):  # full content provided or reaching behind EOF
                 # rewrite in such case
                 f.close()
                 f = open(relpath, 'wb')
+                pos = 0
             response.raise_for_status()
             length = filesize or int(response.headers.get('content-length') or 0)
             for chunk in response.iter_content(chunk_size=1024**2):
                 pos += len(chunk)
                 f.write(chunk)
+                if progress:
+                    progress(relpath, pos, filesize)
                 if not (quiet or noprogress):
                     _download_progress(length, pos, filesize)
             if not length and not (quiet or noprogress):
@@ -629,9 +740,120 @@ def download_file(url, relpath, quiet=False, noprogress=False, size=None,
         print('')
 
 
-def download_rpm(build, rpm, topurl, sigkey=None, quiet=False, noprogress=False, num=None,
-                 size=None):
-    "Wrapper around download_file, do additional checks for rpm files"
+def download_files(downloads, jobs=4, quiet=False, noprogress=False):
+    """Download files concurrently
+
+    The files are fetched by a pool of threads sharing one http session, so
+    connections are reused. Partial files are resumed where the expected size
+    is known (see download_file) and every file is checked by its check
+    callable once downloaded. A single progress meter is shown for all files.
+
+    The first failure stops starting new downloads. If it is a
+    koji.GenericError, it is reported via error(), other exceptions are
+    raised.
+
+    :param list downloads: dicts with 'url', 'path' and optionally 'filesize'
+                           (expected size) and 'check' (callable called with
+                           the path, raising koji.GenericError for an invalid
+                           file), as returned by get_rpm_download and
+                           get_archive_download
+    :param int jobs: number of concurrent downloads
+    :param bool quiet: no/verbose
+    :param bool noprogress: print progress bar
+    """
+    tracker = _DownloadTracker(downloads, quiet=quiet, noprogress=noprogress)
+    session = koji.request_with_retry(pool_maxsize=jobs)
+    todo = six.moves.queue.Queue()
+    for index in range(len(downloads)):
+        todo.put(index)
+    errors = []
+
+    def worker():
+        while not errors:
+            try:
+                index = todo.get_nowait()
+            except six.moves.queue.Empty:
+                return
+            info = downloads[index]
+            try:
+                download_file(info['url'], info['path'], quiet=True, noprogress=True,
+                              filesize=info.get('filesize'), session=session,
+                              progress=tracker.update)
+                if info.get('check'):
+                    info['check'](info['path'])
+            except Exception:
+                errors.append((index, sys.exc_info()))
+                return
+            tracker.finished(info['path'])
+
+    threads = []
+    for i in range(min(jobs, len(downloads))):
+        thread = threading.Thread(target=worker, name='download-%i' % i)
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    session.close()
+    tracker.close()
+    if errors:
+        index, exc_info = min(errors, key=lambda e: e[0])
+        if isinstance(exc_info[1], koji.GenericError):
+            error(str(exc_info[1]))
+        six.reraise(*exc_info)
+
+
+class _DownloadTracker(object):
+    """Aggregate progress of download_files"""
+
+    def __init__(self, downloads, quiet=False, noprogress=False):
+        self.lock = threading.Lock()
+        self.count = len(downloads)
+        self.done = 0
+        self.quiet = quiet
+        self.noprogress = noprogress
+        # expected and downloaded sizes per path
+        self.sizes = {}
+        self.written = {}
+        for info in downloads:
+            if info.get('filesize'):
+                self.sizes[info['path']] = info['filesize']
+
+    def update(self, path, pos, filesize):
+        with self.lock:
+            if filesize:
+                self.sizes.setdefault(path, filesize)
+            self.written[path] = pos
+            self._show()
+
+    def finished(self, path):
+        with self.lock:
+            self.done += 1
+            if not self.quiet:
+                # overwrite the progress meter
+                line = "Downloaded [%d/%d]: %s" % (self.done, self.count, path)
+                sys.stdout.write("%s\n" % line.ljust(79))
+            self._show()
+
+    def _show(self):
+        if self.quiet or self.noprogress:
+            return
+        total = sum(self.sizes.values())
+        written = sum(self.written.values())
+        # sizes of some files may not be known yet
+        total = max(total, written)
+        _download_progress(total, written, total)
+
+    def close(self):
+        if not (self.quiet or self.noprogress):
+            print('')
+
+
+def get_rpm_download(build, rpm, topurl, sigkey=None):
+    """Describe the download of a build rpm for download_files
+
+    :returns: dict with url, path, filesize and check
+    """
     pi = koji.PathInfo(topdir=topurl)
     if sigkey:
         fname = pi.signed(rpm, sigkey)
@@ -639,38 +861,59 @@ def download_rpm(build, rpm, topurl, sigkey=None, quiet=False, noprogress=False,
     else:
         fname = pi.rpm(rpm)
         filesize = rpm['size']
-    url = os.path.join(pi.build(build), fname)
-    path = os.path.basename(fname)
+    return {
+        'url': os.path.join(pi.build(build), fname),
+        'path': os.path.basename(fname),
+        'filesize': filesize,
+        'check': functools.partial(check_rpm_download, rpm=rpm, sigkey=sigkey),
+    }
+
 
-    download_file(url, path, quiet=quiet, noprogress=noprogress, filesize=filesize, num=num,
-                  size=size)
+def check_rpm_download(path, rpm, sigkey=None):
+    """Check a downloaded rpm against its data in the db, deleting it if it differs
 
+    :raises koji.GenericError: if the file does not match
+    """
     # size - we have stored size only for unsigned copies
     if not sigkey:
         size = os.path.getsize(path)
         if size != rpm['size']:
             os.unlink(path)
-            error("Downloaded rpm %s size %d does not match db size %d, deleting" %
-                  (path, size, rpm['size']))
+            raise koji.GenericError("Downloaded rpm %s size %d does not match db size %d, "
+                                    "deleting" % (path, size, rpm['size']))
 
     # basic sanity
     try:
         koji.check_rpm_file(path)
     except koji.GenericError as ex:
         os.unlink(path)
-        warn(str(ex))
-        error("Downloaded rpm %s is not valid rpm file, deleting" % path)
+        raise koji.GenericError("%s\nDownloaded rpm %s is not valid rpm file, deleting"
+                                % (ex, path))
 
     # payload hash
     sigmd5 = koji.get_header_fields(path, ['sigmd5'])['sigmd5']
     if rpm['payloadhash'] != koji.hex_string(sigmd5):
         os.unlink(path)
-        error("Downloaded rpm %s doesn't match db, deleting" % path)
+        raise koji.GenericError("Downloaded rpm %s doesn't match db, deleting" % path)
 
 
-def download_archive(build, archive, topurl, quiet=False, noprogress=False, num=None, size=None):
-    "Wrapper around download_file, do additional checks for archive files"
+def download_rpm(build, rpm, topurl, sigkey=None, quiet=False, noprogress=False, num=None,
+                 size=None):
+    "Wrapper around download_file, do additional checks for rpm files"
+    info = get_rpm_download(build, rpm, topurl, sigkey=sigkey)
+    download_file(info['url'], info['path'], quiet=quiet, noprogress=noprogress,
+                  filesize=info['filesize'], num=num, size=size)
+    try:
+        info['check'](info['path'])
+    except koji.GenericError as ex:
+        error(str(ex))
+
 
+def get_archive_download(build, archive, topurl):
+    """Describe the download of a build archive for download_files
+
+    :returns: dict with url, path, filesize and check
+    """
     pi = koji.PathInfo(topdir=topurl)
     if archive['btype'] == 'maven':
         url = os.path.join(pi.mavenbuild(build), pi.mavenfile(archive))
@@ -686,14 +929,24 @@ def download_archive(build, archive, topurl, quiet=False, noprogress=False, num=
         directory = pi.typedir(build, archive['btype'])
         url = os.path.join(directory, archive['filename'])
         path = archive['filename']
+    return {
+        'url': url,
+        'path': path,
+        'filesize': archive['size'],
+        'check': functools.partial(check_archive_download, archive=archive),
+    }
+
 
-    download_file(url, path, quiet=quiet, noprogress=noprogress, filesize=archive['size'], num=num,
-                  size=size)
+def check_archive_download(path, archive):
+    """Check a downloaded archive against its size and checksum, deleting it if it differs
 
+    :raises koji.GenericError: if the file does not match
+    """
     # check size
     if os.path.getsize(path) != archive['size']:
         os.unlink(path)
-        error("Downloaded rpm %s size does not match db size, deleting" % path)
+        raise koji.GenericError("Downloaded rpm %s size does not match db size, deleting"
+                                % path)
 
     # check checksum/checksum_type
     if archive['checksum_type'] == koji.CHECKSUM_TYPES['md5']:
@@ -704,7 +957,7 @@ def download_archive(build, archive, topurl, quiet=False, noprogress=False, num=
         hash = hashlib.sha256()
     else:
         # shouldn't happen
-        error("Unknown checksum type: %s" % archive['checksum_type'])
+        raise koji.GenericError("Unknown checksum type: %s" % archive['checksum_type'])
     with open(path, "rb") as f:
         while True:
             chunk = f.read(1024**2)
@@ -713,7 +966,18 @@ def download_archive(build, archive, topurl, quiet=False, noprogress=False, num=
                 break
     if hash.hexdigest() != archive['checksum']:
         os.unlink(path)
-        error("Downloaded archive %s doesn't match checksum, deleting" % path)
+        raise koji.GenericError("Downloaded archive %s doesn't match checksum, deleting" % path)
+
+
+def download_archive(build, archive, topurl, quiet=False, noprogress=False, num=None, size=None):
+    "Wrapper around download_file, do additional checks for archive files"
+    info = get_archive_download(build, archive, topurl)
+    download_file(info['url'], info['path'], quiet=quiet, noprogress=noprogress,
+                  filesize=info['filesize'], num=num, size=size)
+    try:
+        info['check'](info['path'])
+    except koji.GenericError as ex:
+        error(str(ex))
 
 
 def _download_progress(download_t, download_d, size=None):
@@ -41,6 +41,7 @@ import socket
 import struct
 import sys
 import tempfile
+import threading
 import time
 import traceback
 import warnings
@@ -68,6 +69,7 @@ from requests.packages.urllib3.util.retry import Retry
 from requests.packages.urllib3.exceptions import MaxRetryError, HostChangedError
 from six.moves import range, zip
 
+from koji import jsonplus
 from koji.tasks import parse_task_params
 from koji.xmlrpcplus import DateTime, Fault, dumps, getparser, loads
 from koji.util import deprecated
@@ -1121,9 +1123,14 @@ def spliced_sig_reader(path, sighdr, bufsize=8192):
     return io.BufferedReader(SplicedSigStreamReader(path, sighdr, bufsize), buffer_size=bufsize)
 
 
-def splice_rpm_sighdr(sighdr, src, dst=None, bufsize=8192, callback=None):
-    """Write a copy of an rpm with signature header spliced in"""
-    reader = spliced_sig_reader(src, sighdr, bufsize=bufsize)
+def splice_rpm_sighdr(sighdr, src, dst=None, bufsize=8192, callback=None, copy_range=False):
+    """Write a copy of an rpm with signature header spliced in
+
+    If copy_range is true, the part after the signature header is copied with
+    os.copy_file_range where the platform supports it, so the kernel copies the
+    data (or shares it, on filesystems with reflinks). The callback still gets
+    all of the data, which is then read from src once.
+    """
     if dst is not None:
         dirname = os.path.dirname(dst)
         os.makedirs(dirname, exist_ok=True)
@@ -1132,10 +1139,13 @@ def splice_rpm_sighdr(sighdr, src, dst=None, bufsize=8192, callback=None):
         (fd, dst_temp) = tempfile.mkstemp()
     os.close(fd)
     with open(dst_temp, 'wb') as dst_fo:
-        for buf in reader:
-            dst_fo.write(buf)
-            if callback:
-                callback(buf)
+        if copy_range:
+            _splice_copy_range(sighdr, src, dst_fo, bufsize, callback)
+        else:
+            for buf in spliced_sig_reader(src, sighdr, bufsize=bufsize):
+                dst_fo.write(buf)
+                if callback:
+                    callback(buf)
     if dst is not None:
         src_stats = os.stat(src)
         dst_temp_stats = os.stat(dst_temp)
@@ -1147,6 +1157,59 @@ def splice_rpm_sighdr(sighdr, src, dst=None, bufsize=8192, callback=None):
     return dst
 
 
+def _splice_copy_range(sighdr, src, dst_fo, bufsize, callback):
+    """Write the spliced rpm to dst_fo, using _copy_file_range for the data"""
+    (start, size) = find_rpm_sighdr(src)
+    with open(src, 'rb') as src_fo:
+        for buf in (src_fo.read(start), sighdr):
+            dst_fo.write(buf)
+            if callback:
+                callback(buf)
+        # skip original signature
+        src_fo.seek(size, 1)
+        copied = _copy_file_range(src_fo, dst_fo)
+        if copied and not callback:
+            return
+        # either copy the data ourselves, or read it for the callback
+        while True:
+            buf = src_fo.read(bufsize)
+            if not buf:
+                break
+            if not copied:
+                dst_fo.write(buf)
+            if callback:
+                callback(buf)
+
+
+def _copy_file_range(src_fo, dst_fo):
+    """Copy the rest of src_fo to dst_fo with os.copy_file_range
+
+    The position of src_fo is not changed. Returns False, without copying
+    anything, if os.copy_file_range is not supported for these files.
+    """
+    if not hasattr(os, 'copy_file_range'):
+        return False
+    offset = src_fo.tell()
+    end = os.fstat(src_fo.fileno()).st_size
+    dst_fo.flush()
+    dst_offset = dst_fo.tell()
+    copied = 0
+    while offset + copied < end:
+        try:
+            count = os.copy_file_range(src_fo.fileno(), dst_fo.fileno(), end - offset - copied,
+                                       offset + copied, dst_offset + copied)
+        except OSError as e:
+            if not copied and e.errno in (errno.EXDEV, errno.ENOSYS, errno.EOPNOTSUPP,
+                                          errno.EINVAL):
+                return False
+            raise
+        if not count:
+            break
+        copied += count
+    dst_fo.seek(dst_offset + copied)
+    return True
+
+
 def get_rpm_header(f, ts=None):
     """Return the rpm header."""
     if rpm is None:
@@ -1889,6 +1952,21 @@ name=build
     }
     # Append config_opts['plugin_conf'] to enable Mock package signing
     plugin_conf.update(opts.get('plugin_conf', {}))
+    # options to set within mock's default plugin options
+    plugin_opts = {}
+    if opts.get('repo_cache_dir'):
+        # share the root and package caches between buildroots for the same repo
+        cache_dir = opts['repo_cache_dir']
+        plugin_conf['root_cache_enable'] = True
+        plugin_conf['yum_cache_enable'] = True
+        plugin_opts['root_cache_opts'] = {
+            'dir': os.path.join(cache_dir, 'root_cache/'),
+            # the mock config is always newer than the cache, but the repo content is fixed
+            'age_check': False,
+        }
+        plugin_opts['yum_cache_opts'] = {
+            'dir': os.path.join(cache_dir, 'package_cache/'),
+        }
 
     macros = {
         '%_rpmfilename': '%%{NAME}-%%{VERSION}-%%{RELEASE}.%%{ARCH}.rpm',
@@ -1938,6 +2016,10 @@ name=build
                 parts.append("config_opts['plugin_conf'][%r][%r] = %r\n" % (key, key2, value2))
         else:
             parts.append("config_opts['plugin_conf'][%r] = %r\n" % (key, value))
+    for key in sorted(plugin_opts):
+        value = plugin_opts[key]
+        for key2 in sorted(value):
+            parts.append("config_opts['plugin_conf'][%r][%r] = %r\n" % (key, key2, value[key2]))
     parts.append("\n")
 
     if bind_opts:
@@ -2000,13 +2082,16 @@ def format_exc_plus():
 
 
 def request_with_retry(retries=3, backoff_factor=0.3,
-                       status_forcelist=(500, 502, 504, 408, 429), session=None):
+                       status_forcelist=(500, 502, 504, 408, 429), session=None,
+                       pool_maxsize=10):
     # stolen from https://www.peterbe.com/plog/best-practice-with-retries-with-requests
     session = session or requests.Session()
     retry = Retry(total=retries, read=retries, connect=retries,
                   backoff_factor=backoff_factor,
                   status_forcelist=status_forcelist)
-    adapter = HTTPAdapter(max_retries=retry)
+    # pool_maxsize limits the connections kept per host, it should be raised
+    # when the session is shared by more threads
+    adapter = HTTPAdapter(max_retries=retry, pool_maxsize=pool_maxsize)
     session.mount('http://', adapter)
     session.mount('https://', adapter)
     return session
@@ -2135,6 +2220,7 @@ def read_config(profile_name, user_config=None):
         'auth_timeout': DEFAULT_AUTH_TIMEOUT,
         'use_fast_upload': True,
         'upload_blocksize': 1048576,
+        'upload_jobs': 1,
         'poll_interval': 6,
         'principal': None,
         'keytab': None,
@@ -2144,6 +2230,7 @@ def read_config(profile_name, user_config=None):
         'authtype': None,
         'debug': False,
         'debug_xmlrpc': False,
+        'json_transport': True,
         'pyver': None,
         'plugin_paths': None,
         'force_auth': False,
@@ -2183,12 +2270,12 @@ def read_config(profile_name, user_config=None):
             # not have a default value set in the option parser.
             if name in result:
                 if name in ('anon_retry', 'offline_retry', 'use_fast_upload',
-                            'debug', 'debug_xmlrpc', 'force_auth'):
+                            'debug', 'debug_xmlrpc', 'force_auth', 'json_transport'):
                     result[name] = config.getboolean(profile_name, name)
                 elif name in ('max_retries', 'retry_interval',
                               'offline_retry_interval', 'poll_interval',
                               'timeout', 'auth_timeout',
-                              'upload_blocksize', 'pyver'):
+                              'upload_blocksize', 'upload_jobs', 'pyver'):
                     try:
                         result[name] = int(value)
                     except ValueError:
@@ -2570,6 +2657,7 @@ def grab_session_options(options):
         'password',
         'debug_xmlrpc',
         'debug',
+        'json_transport',
         'max_retries',
         'retry_interval',
         'offline_retry',
@@ -2579,6 +2667,7 @@ def grab_session_options(options):
         'auth_timeout',
         'use_fast_upload',
         'upload_blocksize',
+        'upload_jobs',
         'no_ssl_verify',
         'serverca',
     )
@@ -2620,12 +2709,17 @@ class ClientSession(object):
         self._multicall = MultiCallHack(weakref.ref(self))
         self._calls = []
         self.logger = logging.getLogger('koji')
+        # concurrent multicall batches each use their own requests session
+        self._local = threading.local()
+        self._callnum_lock = threading.Lock()
         self.rsession = None
         self.new_session()
         self.opts.setdefault('timeout', DEFAULT_REQUEST_TIMEOUT)
         self.exclusive = False
         self.auth_method = auth_method
         self.__hub_version = None
+        # whether the hub answered our last call in json
+        self._json_ok = False
 
     @property
     def hub_version(self):
@@ -2665,6 +2759,15 @@ class ClientSession(object):
     def multicall(self, value):
         self._multicall.value = value
 
+    @property
+    def rsession(self):
+        """The requests session of the current thread"""
+        return getattr(self._local, 'rsession', None)
+
+    @rsession.setter
+    def rsession(self, value):
+        self._local.rsession = value
+
     def new_session(self):
         self.logger.debug("Opening new requests session")
         if self.rsession:
@@ -2960,7 +3063,7 @@ class ClientSession(object):
         """compatibility wrapper for _callMethod"""
         return self._callMethod(name, args, opts)
 
-    def _prepCall(self, name, args, kwargs=None):
+    def _prepCall(self, name, args, kwargs=None, callnum=True):
         # pass named opts in a way the server can understand
         if kwargs is None:
             kwargs = {}
@@ -2974,13 +3077,15 @@ class ClientSession(object):
             # send sinfo in headers if we have it
             # still needed if not logged in for renewal case
             sinfo = self.sinfo.copy()
-            sinfo['callnum'] = self.callnum
-            self.callnum += 1
             headers += [
                 ('Koji-Session-Id', str(sinfo['session-id'])),
                 ('Koji-Session-Key', str(sinfo['session-key'])),
-                ('Koji-Session-Callnum', str(sinfo['callnum'])),
             ]
+            if callnum:
+                with self._callnum_lock:
+                    sinfo['callnum'] = self.callnum
+                    self.callnum += 1
+                headers.append(('Koji-Session-Callnum', str(sinfo['callnum'])))
 
         if self.logged_in and not self.sinfo.get('header-auth'):
             # old server
@@ -2990,8 +3095,15 @@ class ClientSession(object):
         else:
             handler = self.baseurl
 
-        request = dumps(args, name, allow_none=1)
-        if six.PY3:
+        use_json = self.opts.get('json_transport', True)
+        if use_json and self._json_ok:
+            # the hub supports it
+            request = jsonplus.dumps_request(name, args)
+            content_type = jsonplus.CONTENT_TYPE
+        else:
+            request = dumps(args, name, allow_none=1)
+            content_type = 'text/xml'
+        if six.PY3 or content_type == jsonplus.CONTENT_TYPE:
             # For python2, dumps() without encoding specified means return a str
             # encoded as UTF-8. For python3 it means "return a str with an appropriate
             # xml declaration for encoding as UTF-8".
@@ -2999,9 +3111,12 @@ class ClientSession(object):
         headers += [
             # connection class handles Host
             ('User-Agent', 'koji/1'),
-            ('Content-Type', 'text/xml'),
+            ('Content-Type', content_type),
             ('Content-Length', str(len(request))),
         ]
+        if use_json:
+            # hubs that support json will answer in json
+            headers.append(('Accept', '%s, text/xml' % jsonplus.CONTENT_TYPE))
         return handler, headers, request
 
     def _sanitize_url(self, url):
@@ -3028,6 +3143,29 @@ class ClientSession(object):
         return exc
 
     def _sendCall(self, handler, headers, request):
+        if dict(headers).get('Content-Type') != jsonplus.CONTENT_TYPE:
+            return self._sendCallReconnect(handler, headers, request)
+        try:
+            return self._sendCallReconnect(handler, headers, request)
+        except Fault:
+            if self._json_ok:
+                raise
+            # Newer hubs always answer json requests in json. This one answered
+            # in xml, so it could not even parse the call, e.g. an older hub
+            # behind the same load balancer. Send the call again as xml.
+            self.logger.debug("Hub does not accept json requests, resending as xml")
+            params, method = jsonplus.loads_request(request)
+            request = dumps(params, method, allow_none=1)
+            if six.PY3:
+                request = request.encode('utf-8')
+            headers = [h for h in headers if h[0] not in ('Content-Type', 'Content-Length')]
+            headers += [
+                ('Content-Type', 'text/xml'),
+                ('Content-Length', str(len(request))),
+            ]
+            return self._sendCallReconnect(handler, headers, request)
+
+    def _sendCallReconnect(self, handler, headers, request):
         # handle expired connections
         for i in (0, 1):
             try:
@@ -3076,6 +3214,9 @@ class ClientSession(object):
                     if len(_val) > 1024:
                         _val = _val[:1024] + '...'
                 self.logger.debug("%s: %r" % (_key, _val))
+        if self.rsession is None:
+            # first call from this thread
+            self.new_session()
         with warnings.catch_warnings():
             warnings.simplefilter("ignore")
             r = self.rsession.post(handler, **callopts)
@@ -3090,6 +3231,16 @@ class ClientSession(object):
         return ret
 
     def _read_xmlrpc_response(self, response):
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip()
+        if content_type == jsonplus.CONTENT_TYPE:
+            self._json_ok = True
+            chunks = []
+            for chunk in response.iter_content(65536):
+                if self.opts.get('debug_xmlrpc', False):
+                    self.logger.debug("body: %r" % chunk)
+                chunks.append(chunk)
+            return jsonplus.loads_response(b''.join(chunks))
+        self._json_ok = False
         p, u = getparser()
         for chunk in response.iter_content(8192):
             if self.opts.get('debug_xmlrpc', False):
@@ -3123,8 +3274,13 @@ class ClientSession(object):
         return _renew_expired_session
 
     @renew_expired_session
-    def _callMethod(self, name, args, kwargs=None, retry=True):
-        """Make a call to the hub with retries and other niceties"""
+    def _callMethod(self, name, args, kwargs=None, retry=True, callnum=True):
+        """Make a call to the hub with retries and other niceties
+
+        If callnum is false, the call is sent without a callnum. The hub then
+        does not check its sequence, which also means that it cannot detect
+        a retry of a call that already succeeded.
+        """
         if self.multicall:
             if kwargs is None:
                 kwargs = {}
@@ -3132,7 +3288,7 @@ class ClientSession(object):
             self._calls.append({'methodName': name, 'params': args})
             return MultiCallInProgress
         else:
-            handler, headers, request = self._prepCall(name, args, kwargs)
+            handler, headers, request = self._prepCall(name, args, kwargs, callnum=callnum)
             tries = 0
             self.retries = 0
             max_retries = self.opts.get('max_retries', 30)
@@ -3336,13 +3492,154 @@ class ClientSession(object):
         self.logger.debug("Fast upload: %s complete. %i bytes in %.1f seconds",
                           localfile, size, t2)
 
+    def uploadFiles(self, localfiles, path, names=None, callback=None, blocksize=None,
+                    jobs=None, overwrite=False, volume=None):
+        """Upload several files, sending their chunks in parallel
+
+        The files are created on the hub with prepareUploads, and their chunks
+        are then sent over jobs connections, each written at its own offset.
+        The hub computes the final checksum of every file, which is checked
+        against the local one.
+
+        Falls back to uploadWrapper for each file if jobs is 1 (the default is
+        the upload_jobs option), or if the hub does not support it.
+
+        :param list localfiles: paths of the local files
+        :param str path: upload directory
+        :param list names: upload names, defaults to the basenames
+        :param callback: called as callback(uploaded, total, chunk size, t1, t2)
+                         for the aggregate progress
+        :param int blocksize: chunk size, defaults to the upload_blocksize option
+        :param int jobs: number of parallel connections
+        """
+        if blocksize is None:
+            blocksize = self.opts.get('upload_blocksize', 1048576)
+        if jobs is None:
+            jobs = self.opts.get('upload_jobs', 1)
+        if names is None:
+            names = [os.path.basename(fn) for fn in localfiles]
+        if not self.logged_in:
+            raise ActionNotAllowed('You must be logged in to upload files')
+        sizes = [os.path.getsize(fn) for fn in localfiles]
+        callopts = {}
+        if volume and volume != 'DEFAULT':
+            callopts['volume'] = volume
+        if jobs > 1:
+            files = [{'name': name, 'size': size} for name, size in zip(names, sizes)]
+            try:
+                self._callMethod('prepareUploads', (path, files),
+                                 dict(callopts, overwrite=overwrite))
+            except GenericError as e:
+                if 'Invalid method' not in str(e):
+                    raise
+                jobs = 1
+        if jobs <= 1:
+            for localfile, name in zip(localfiles, names):
+                self.uploadWrapper(localfile, path, name, callback=callback,
+                                   blocksize=blocksize, overwrite=overwrite, volume=volume)
+            return
+
+        self.logger.debug("Parallel upload: %i files to %s with %i jobs",
+                          len(localfiles), path, jobs)
+        total = sum(sizes)
+        progress = {'ofs': 0}
+        errors = []
+        lock = threading.Lock()
+        chunks = six.moves.queue.Queue(maxsize=jobs * 2)
+        start = time.time()
+        if callback:
+            callback(0, total, 0, 0, 0)
+
+        def upload_chunks():
+            while True:
+                item = chunks.get()
+                if item is None:
+                    return
+                if errors:
+                    # drain the queue
+                    continue
+                name, ofs, chunk = item
+                lap = time.time()
+                try:
+                    result = self._callMethod(
+                        'rawUpload', (chunk, ofs, path, name),
+                        dict(callopts, verify='', parallel=True))
+                    if result['size'] != len(chunk):
+                        raise GenericError("server returned wrong chunk size: %s != %s" %
+                                           (result['size'], len(chunk)))
+                except Exception as e:
+                    with lock:
+                        errors.append(e)
+                    continue
+                with lock:
+                    progress['ofs'] += len(chunk)
+                    if callback:
+                        now = time.time()
+                        # max is to prevent possible divide by zero in callback function
+                        callback(progress['ofs'], total, len(chunk), max(now - lap, 0.00001),
+                                 max(now - start, 0.00001))
+
+        threads = [threading.Thread(target=upload_chunks) for i in range(jobs)]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        checksums = []
+        try:
+            for localfile, name, size in zip(localfiles, names, sizes):
+                chksum = hashlib.sha256()
+                ofs = 0
+                with open(localfile, 'rb') as fo:
+                    while not errors:
+                        chunk = fo.read(blocksize)
+                        if not chunk:
+                            break
+                        chksum.update(chunk)
+                        chunks.put((name, ofs, chunk))
+                        ofs += len(chunk)
+                if ofs != size and not errors:
+                    raise GenericError("Local file changed size: %s, %s -> %s"
+                                       % (localfile, size, ofs))
+                checksums.append((name, ofs, chksum.hexdigest()))
+        finally:
+            for thread in threads:
+                chunks.put(None)
+            for thread in threads:
+                thread.join()
+        if errors:
+            raise errors[0]
+
+        # the hub computes the checksums of the assembled files
+        with self.multicall(strict=True) as m:
+            results = [m.checkUpload(path, name, verify='sha256', **callopts)
+                       for name, size, hexdigest in checksums]
+        for (name, size, hexdigest), result in zip(checksums, results):
+            result = result.result
+            if result is None:
+                raise GenericError("File upload failed: %s/%s" % (path, name))
+            if int(result['size']) != size:
+                raise GenericError("Uploaded file is wrong length: %s/%s, %s != %s"
+                                   % (path, name, result['size'], size))
+            if result['hexdigest'] != hexdigest:
+                raise GenericError("Uploaded file has wrong checksum: %s/%s, %s != %s"
+                                   % (path, name, result['hexdigest'], hexdigest))
+        self.logger.debug("Parallel upload: %i files complete. %i bytes in %.1f seconds",
+                          len(localfiles), total, time.time() - start)
+
     def _prepUpload(self, chunk, offset, path, name, verify="adler32", overwrite=False,
-                    volume=None):
+                    volume=None, parallel=False):
         """prep a rawUpload call"""
         if not self.logged_in:
             raise ActionNotAllowed("you must be logged in to upload")
         sinfo = self.sinfo.copy()
-        sinfo['callnum'] = self.callnum
+        if parallel:
+            # parallel chunks are sent concurrently and may be retried as they
+            # are, so they go without a callnum. Otherwise the hub would update
+            # the callnum of the session, and handle them one at a time.
+            sinfo['callnum'] = None
+        else:
+            with self._callnum_lock:
+                sinfo['callnum'] = self.callnum
+                self.callnum += 1
         args = {
             'filename': name,
             'filepath': path,
@@ -3353,16 +3650,20 @@ class ClientSession(object):
             args['overwrite'] = "1"
         if volume is not None:
             args['volume'] = volume
+        if parallel:
+            args['parallel'] = "1"
         size = len(chunk)
-        self.callnum += 1
         headers = []
         if sinfo.get('header-auth'):
             headers += [
                 ('Koji-Session-Id', str(self.sinfo['session-id'])),
                 ('Koji-Session-Key', str(self.sinfo['session-key'])),
-                ('Koji-Session-Callnum', str(sinfo['callnum'])),
             ]
+            if sinfo['callnum'] is not None:
+                headers.append(('Koji-Session-Callnum', str(sinfo['callnum'])))
         else:
+            if sinfo['callnum'] is None:
+                del sinfo['callnum']
             args.update(sinfo)
         handler = "%s?%s" % (self.baseurl, six.moves.urllib.parse.urlencode(args))
         headers += [
@@ -3545,10 +3846,11 @@ class MultiCallSession(object):
 
     """Manages a single multicall, acts like a session"""
 
-    def __init__(self, session, strict=False, batch=None):
+    def __init__(self, session, strict=False, batch=None, concurrency=None):
         self._session = session
         self._strict = strict
         self._batch = batch
+        self._concurrency = concurrency
         self._calls = []
 
     def __getattr__(self, name):
@@ -3567,19 +3869,34 @@ class MultiCallSession(object):
         """compatibility wrapper for _callMethod"""
         return self._callMethod(name, args, opts)
 
-    def call_all(self, strict=None, batch=None):
+    def call_all(self, strict=None, batch=None, concurrency=None):
         """Perform all calls in one or more multiCall batches
 
         Returns a list of results for each call. For successful calls, the
         entry will be a singleton list. For calls that raised a fault, the
         entry will be a dictionary with keys "faultCode", "faultString",
         and "traceback".
+
+        If concurrency is greater than one, up to that many batches are sent
+        at the same time, each over its own connection. The results are still
+        returned in call order. The batches may be executed by the hub in any
+        order, so this is only suitable for calls that do not depend on each
+        other (typically read-only calls).
+
+        The concurrent batches are sent without a callnum. Otherwise, for a
+        logged-in session, the hub would handle them one at a time, since
+        recording the callnum locks the session until the end of the call,
+        and a batch could fail with a SequenceError if a later one committed
+        first. As a consequence, the hub cannot detect the retry of a batch
+        that already succeeded, so the calls must be safe to repeat.
         """
 
         if strict is None:
             strict = self._strict
         if batch is None:
             batch = self._batch
+        if concurrency is None:
+            concurrency = self._concurrency
 
         if len(self._calls) == 0:
             return []
@@ -3594,9 +3911,11 @@ class MultiCallSession(object):
         else:
             batches = [calls]
         results = []
-        for calls in batches:
-            args = ([c.format() for c in calls],)
-            _results = self._session._callMethod('multiCall', args, {})
+        if concurrency and concurrency > 1 and len(batches) > 1:
+            batch_results = self._call_concurrent(batches, concurrency)
+        else:
+            batch_results = (self._call_batch(calls) for calls in batches)
+        for calls, _results in zip(batches, batch_results):
             for call, result in zip(calls, _results):
                 call._result = result
             results.extend(_results)
@@ -3609,6 +3928,61 @@ class MultiCallSession(object):
                     raise err
         return results
 
+    def _call_batch(self, calls, callnum=True):
+        args = ([c.format() for c in calls],)
+        if callnum:
+            return self._session._callMethod('multiCall', args, {})
+        return self._session._callMethod('multiCall', args, {}, callnum=False)
+
+    def _call_concurrent(self, batches, concurrency):
+        """Send the batches using up to concurrency threads
+
+        Returns the list of results of each batch. If any batch fails, no
+        further batches are sent, the results of the completed ones are
+        stored in their calls, and the error of the first failed batch is
+        raised.
+        """
+        batch_results = [None] * len(batches)
+        errors = {}
+        todo = six.moves.queue.Queue()
+        for n in range(len(batches)):
+            todo.put(n)
+
+        def worker():
+            try:
+                while not errors:
+                    try:
+                        n = todo.get_nowait()
+                    except six.moves.queue.Empty:
+                        break
+                    try:
+                        # see call_all about the callnum
+                        batch_results[n] = self._call_batch(batches[n], callnum=False)
+                    except Exception:
+                        errors[n] = sys.exc_info()
+            finally:
+                # each thread has its own connection
+                if self._session.rsession:
+                    self._session.rsession.close()
+
+        self._session.logger.debug("Sending %i batches over %i connections",
+                                   len(batches), min(concurrency, len(batches)))
+        threads = []
+        for i in range(min(concurrency, len(batches))):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+            threads.append(thread)
+        for thread in threads:
+            thread.join()
+        if errors:
+            for calls, _results in zip(batches, batch_results):
+                if _results is not None:
+                    for call, result in zip(calls, _results):
+                        call._result = result
+            six.reraise(*errors[min(errors)])
+        return batch_results
+
     # alias for compatibility with ClientSession
     multiCall = call_all
 
@@ -717,6 +717,12 @@ class SCM(object):
 # END kojikamid dup #
 
 
+def repo_cache_dir(options, repo_id, arch, install_group):
+    """Return the directory of the mock caches shared by buildroots for a repo"""
+    return os.path.join(options.mock_repo_cache_dir,
+                        'repo-%i-%s-%s' % (repo_id, arch, install_group))
+
+
 class TaskManager(object):
 
     def __init__(self, options, session):
@@ -732,6 +738,8 @@ class TaskManager(object):
         self.ready = False
         self.hostdata = {}
         self.task_load = 0.0
+        self.wait_supported = True
+        self.task_snapshot = None
         self.host_id = self.session.host.getID()
         self.start_ts = self.session.getSessionInfo()['start_ts']
         self.logger = logging.getLogger("koji.TaskManager")
@@ -915,6 +923,8 @@ class TaskManager(object):
         self.logger.debug("Local buildroots: %d" % len(local_br))
         self.logger.debug("Active buildroots: %d" % len(db_br))
         self.logger.debug("Expired/stray buildroots: %d" % len(local_only))
+        if getattr(self.options, 'mock_repo_cache', False):
+            self.pruneRepoCache()
 
     def _scanLocalBuildroots(self):
         # XXX
@@ -1032,10 +1042,94 @@ class TaskManager(object):
             # TODO: now it would be duplicated by updateHost
             # 'ready': self.ready,
             # 'task_load': self.task_load,
-            # cpu_load, free_mem, free_disk, ...
         }
+        try:
+            data.update(self._get_resource_data())
+        except Exception:
+            # the scheduler can do without these
+            self.logger.warning('Unable to read resource data', exc_info=True)
+        if getattr(self.options, 'mock_repo_cache', False):
+            try:
+                data['repo_cache'] = self._get_repo_cache_data()
+            except Exception:
+                self.logger.warning('Unable to read repo cache data', exc_info=True)
+        return data
+
+    def _get_resource_data(self):
+        """Measure the current resource usage of the host
+
+        Memory and disk values are in MiB. The scheduler uses these to avoid
+        assigning tasks to hosts that are short on resources.
+        """
+        data = {
+            'cpus': os.sysconf('SC_NPROCESSORS_ONLN'),
+            'loadavg': list(os.getloadavg()),
+        }
+        meminfo = {}
+        with open('/proc/meminfo', 'rt') as fo:
+            for line in fo:
+                parts = line.split()
+                if len(parts) >= 2:
+                    meminfo[parts[0].rstrip(':')] = int(parts[1])
+        if 'MemTotal' in meminfo:
+            data['mem_total'] = meminfo['MemTotal'] // 1024
+        if 'MemAvailable' in meminfo:
+            data['mem_available'] = meminfo['MemAvailable'] // 1024
+        br_path = self.options.mockdir
+        if os.path.isdir(br_path):
+            fs_stat = os.statvfs(br_path)
+            data['disk_free'] = fs_stat.f_bavail * fs_stat.f_bsize // 1024 // 1024
+            data['buildroots'] = len([d for d in os.listdir(br_path)
+                                      if os.path.isdir(os.path.join(br_path, d))])
         return data
 
+    def _get_repo_cache_data(self):
+        """List the repos with warm mock caches on this host, most recently used first
+
+        The scheduler prefers hosts with a warm cache for the repo of a task.
+        """
+        cache_dir = self.options.mock_repo_cache_dir
+        if not os.path.isdir(cache_dir):
+            return []
+        entries = []
+        for name in os.listdir(cache_dir):
+            # repo-<repo_id>-<arch>-<install_group>
+            parts = name.split('-', 3)
+            if len(parts) < 4 or parts[0] != 'repo':
+                continue
+            try:
+                repo_id = int(parts[1])
+                mtime = os.stat(os.path.join(cache_dir, name)).st_mtime
+            except (ValueError, OSError):
+                continue
+            entries.append((mtime, repo_id))
+        entries.sort(reverse=True)
+        repos = []
+        for mtime, repo_id in entries:
+            if repo_id not in repos:
+                repos.append(repo_id)
+            # keep the host data small
+            if len(repos) >= 100:
+                break
+        return repos
+
+    def pruneRepoCache(self):
+        """Remove mock repo caches that have not been used recently"""
+        cache_dir = self.options.mock_repo_cache_dir
+        if not os.path.isdir(cache_dir):
+            return
+        for name in os.listdir(cache_dir):
+            if not name.startswith('repo-'):
+                continue
+            path = os.path.join(cache_dir, name)
+            try:
+                age = time.time() - os.stat(path).st_mtime
+            except OSError:
+                continue
+            if age > self.options.mock_repo_cache_lifetime:
+                self.logger.info("Removing repo cache: %s", path)
+                safe_rmtree(path, unmount=False, strict=False)
+
     def getNextTask(self):
         """Task the next task
 
@@ -1072,6 +1166,30 @@ class TaskManager(object):
 
         return False
 
+    def waitForTasks(self):
+        """Wait for the hub to report a change in our tasks
+
+        This replaces the sleep between polls when the hub supports it.
+
+        :returns: True after waiting, None if the caller should sleep instead
+        """
+        if not self.wait_supported:
+            return None
+        try:
+            snapshot = self.session.host.waitForTasks(self.task_snapshot)
+        except koji.GenericError as e:
+            if 'Invalid method' not in str(e):
+                raise
+            # older hub
+            self.logger.info("Hub does not support waiting for tasks, polling instead")
+            self.wait_supported = False
+            return None
+        if snapshot is None:
+            # disabled on the hub
+            return None
+        self.task_snapshot = snapshot
+        return True
+
     def _waitTask(self, task_id, pid=None):
         """Wait (nohang) on the task, return true if finished"""
         if pid is None:
@@ -0,0 +1,161 @@
+"""
+JSON encoding of koji calls
+
+This is an alternative to XML-RPC that is much cheaper to encode and decode.
+The client asks for it with an Accept header, and only sends JSON requests
+once the hub has answered in JSON. The data model is that of XML-RPC, and the
+few types that JSON lacks are sent as tagged objects.
+"""
+
+from __future__ import absolute_import
+
+import base64
+import datetime
+import json
+import re
+import types
+
+import six
+
+from koji.xmlrpcplus import DateTime, Fault, xmlrpc_client
+
+
+CONTENT_TYPE = 'application/json'
+TYPE_KEY = '__koji_type__'
+
+# re.Pattern is supported >= py3.7
+PATTERN_TYPE = getattr(re, 'Pattern', None) or re._pattern_type
+
+
+class Encoder(json.JSONEncoder):
+    """Encode the types that XML-RPC supports, but JSON does not"""
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault('ensure_ascii', False)
+        kwargs.setdefault('separators', (',', ':'))
+        super(Encoder, self).__init__(**kwargs)
+
+    def default(self, value):
+        if isinstance(value, types.GeneratorType):
+            return list(value)
+        elif isinstance(value, datetime.datetime):
+            # marshalled as a DateTime by xmlrpc
+            value = DateTime(value)
+        if isinstance(value, DateTime):
+            return {TYPE_KEY: 'datetime', 'value': value.value}
+        elif isinstance(value, xmlrpc_client.Binary):
+            value = value.data
+        if isinstance(value, (bytes, bytearray)):
+            return {TYPE_KEY: 'binary', 'value': base64.b64encode(value).decode()}
+        elif isinstance(value, PATTERN_TYPE):
+            return repr(value)
+        return super(Encoder, self).default(value)
+
+
+def _object_hook(value):
+    vtype = value.get(TYPE_KEY)
+    if vtype is None:
+        return value
+    elif vtype == 'datetime':
+        return DateTime(value['value'])
+    elif vtype == 'binary':
+        return xmlrpc_client.Binary(base64.b64decode(value['value']))
+    raise ValueError('Unknown encoded type: %r' % vtype)
+
+
+def _loads(data):
+    if isinstance(data, bytes):
+        data = data.decode('utf-8')
+    return json.loads(data, object_hook=_object_hook)
+
+
+def dumps_request(method, params, encoder=Encoder):
+    """Encode a call"""
+    return encoder().encode({'method': method, 'params': params})
+
+
+def loads_request(data):
+    """Decode a call
+
+    :returns: a tuple (params, method), like xmlrpc loads
+    """
+    request = _loads(data)
+    if not isinstance(request, dict) or not isinstance(request.get('method'), six.string_types) \
+            or not isinstance(request.get('params'), list):
+        raise ValueError('Invalid request')
+    return tuple(request['params']), request['method']
+
+
+def dumps_response(value, encoder=Encoder):
+    """Encode a result or a Fault"""
+    if isinstance(value, Fault):
+        data = {'fault': {'faultCode': value.faultCode, 'faultString': value.faultString}}
+    else:
+        data = {'result': value}
+    return encoder().encode(data)
+
+
+def _is_generator(value):
+    return isinstance(value, types.GeneratorType)
+
+
+def _iterencode(encoder, value):
+    """Like encoder.iterencode, but only consume generators as the output is read
+
+    The json module encodes a generator through Encoder.default, which has to
+    turn it into a list first. Here the generators, and the lists, tuples and
+    dicts that directly hold some, are encoded item by item instead.
+    """
+    if _is_generator(value) or (isinstance(value, (list, tuple)) and
+                                any(_is_generator(item) for item in value)):
+        yield '['
+        first = True
+        for item in value:
+            if not first:
+                yield ','
+            first = False
+            for part in _iterencode(encoder, item):
+                yield part
+        yield ']'
+    elif (isinstance(value, dict) and
+            any(_is_generator(item) for item in value.values()) and
+            all(isinstance(key, six.string_types) for key in value)):
+        yield '{'
+        first = True
+        for key, item in value.items():
+            if not first:
+                yield ','
+            first = False
+            yield encoder.encode(key) + ':'
+            for part in _iterencode(encoder, item):
+                yield part
+        yield '}'
+    else:
+        for part in encoder.iterencode(value):
+            yield part
+
+
+def dumps_response_iter(value, encoder=Encoder, chunksize=65536):
+    """Encode a result as an iterator of string chunks of about chunksize characters
+
+    Generators in the result are consumed while the chunks are read.
+    """
+    out = []
+    size = 0
+    for part in _iterencode(encoder(), {'result': value}):
+        out.append(part)
+        size += len(part)
+        if size >= chunksize:
+            yield ''.join(out)
+            out = []
+            size = 0
+    yield ''.join(out)
+
+
+def loads_response(data):
+    """Decode a response, raising Fault for faults"""
+    response = _loads(data)
+    if 'fault' in response:
+        fault = response['fault']
+        raise Fault(fault['faultCode'], fault['faultString'])
+    return response['result']
@@ -205,6 +205,16 @@ def convert_datetime(f):
     return f
 
 
+def read_only(f):
+    """a decorator that marks an exported function as only reading data
+
+    the HandlerRegistry lets anonymous calls to such functions use the read
+    replica of the database (see DBReplicaConnectionString)
+    """
+    setattr(f, 'read_only', True)
+    return f
+
+
 def register_callback(cbtype, func):
     if cbtype not in callbacks:
         raise koji.PluginError('"%s" is not a valid callback type' % cbtype)
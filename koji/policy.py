@@ -21,11 +21,38 @@ from __future__ import absolute_import
 
 import fnmatch
 import logging
+import re
 
 import six
 
 import koji
-from koji.util import to_list, multi_fnmatch
+from koji.util import to_list
+
+
+GLOB_CHARS = re.compile(r'[*?[]')
+
+
+def compile_patterns(patterns):
+    """Compile a list of glob patterns into a single matching function
+
+    The returned function takes a string and returns True if it matches any of
+    the patterns, like multi_fnmatch. Patterns without wildcards are compared
+    directly, the others are compiled into a single regex when first needed.
+    """
+    literals = set([p for p in patterns if not GLOB_CHARS.search(p)])
+    globs = [p for p in patterns if p not in literals]
+    compiled = []
+
+    def match(value):
+        if value in literals:
+            return True
+        if not globs:
+            return False
+        if not compiled:
+            compiled.append(re.compile('|'.join(['(?:%s)' % fnmatch.translate(p)
+                                                 for p in globs])))
+        return compiled[0].match(value) is not None
+    return match
 
 
 class BaseSimpleTest(object):
@@ -125,24 +152,28 @@ class MatchTest(BaseSimpleTest):
     name = 'match'
     field = None
 
-    def run(self, data):
-        args = self.str.split()[1:]
+    def __init__(self, str):
+        super(MatchTest, self).__init__(str)
+        args = str.split()[1:]
         if self.field is None:
-            field = args[0]
+            self._field = args[0] if args else None
             args = args[1:]
         else:
             # expected when we are subclassed
-            field = self.field
+            self._field = self.field
+        self._match = compile_patterns(args)
+
+    def run(self, data):
+        field = self._field
+        if field is None:
+            raise koji.GenericError("Missing field in policy test: %s" % self.str)
         if field not in data:
             return False
         value = data[field]
         if value is None:
             # None does not match any pattern
             return False
-        for pattern in args:
-            if fnmatch.fnmatch(value, pattern):
-                return True
-        return False
+        return self._match(value)
 
 
 class MatchAnyTest(BaseSimpleTest):
@@ -158,14 +189,18 @@ class MatchAnyTest(BaseSimpleTest):
     name = 'match_any'
     field = None
 
+    def __init__(self, str):
+        super(MatchAnyTest, self).__init__(str)
+        args = str.split()[1:]
+        if args:
+            self.field = args[0]
+        self._match = compile_patterns(args[1:])
+
     def run(self, data):
-        args = self.str.split()[1:]
-        self.field = args[0]
-        args = args[1:]
         tgt = data.get(self.field)
         if tgt and isinstance(tgt, (list, tuple, set)):
             for i in tgt:
-                if i is not None and multi_fnmatch(str(i), args):
+                if i is not None and self._match(str(i)):
                     return True
         return False
 
@@ -183,14 +218,18 @@ class MatchAllTest(BaseSimpleTest):
     name = 'match_all'
     field = None
 
+    def __init__(self, str):
+        super(MatchAllTest, self).__init__(str)
+        args = str.split()[1:]
+        if args:
+            self.field = args[0]
+        self._match = compile_patterns(args[1:])
+
     def run(self, data):
-        args = self.str.split()[1:]
-        self.field = args[0]
-        args = args[1:]
         tgt = data.get(self.field)
         if tgt and isinstance(tgt, (list, tuple, set)):
             for i in tgt:
-                if i is None or not multi_fnmatch(str(i), args):
+                if i is None or not self._match(str(i)):
                     return False
             return True
         return False
@@ -258,9 +297,16 @@ class CompareTest(BaseSimpleTest):
 
 
 class SimpleRuleSet(object):
+    """A parsed policy
+
+    Each distinct test in the rules is only instantiated once, and its result is
+    computed at most once per apply() call, no matter how many rules use it.
+    """
 
     def __init__(self, rules, tests):
         self.tests = tests
+        # test handlers by their test string
+        self.handlers = {}
         self.rules = self.parse_rules(rules)
         self.lastrule = None
         self.lastaction = None
@@ -354,11 +400,17 @@ class SimpleRuleSet(object):
         return tests, negate, action
 
     def get_test_handler(self, str):
+        key = ' '.join(str.split())
+        handler = self.handlers.get(key)
+        if handler is not None:
+            return handler
         name = str.split(None, 1)[0]
         try:
-            return self.tests[name](str)
+            handler = self.tests[name](str)
         except KeyError:
             raise koji.GenericError("missing test handler: %s" % name)
+        self.handlers[key] = handler
+        return handler
 
     def all_actions(self):
         """report a list of all actions in the ruleset
@@ -376,14 +428,20 @@ class SimpleRuleSet(object):
         _recurse(self.ruleset, index)
         return to_list(index.keys())
 
-    def _apply(self, rules, data, top=False):
+    def _apply(self, rules, data, top=False, results=None):
+        if results is None:
+            results = {}
         for tests, negate, action in rules:
             if top:
                 self.lastrule = []
             value = False
             for test in tests:
-                check = test.run(data)
-                self.logger.debug("%s -> %s", test, check)
+                # the same data gives the same result, so run each test only once
+                if test in results:
+                    check = results[test]
+                else:
+                    check = results[test] = test.run(data)
+                    self.logger.debug("%s -> %s", test, check)
                 if not check:
                     break
             else:
@@ -396,7 +454,7 @@ class SimpleRuleSet(object):
                 if isinstance(action, list):
                     self.logger.debug("matched: entering subrule")
                     # action is a list of subrules
-                    ret = self._apply(action, data)
+                    ret = self._apply(action, data, results=results)
                     if ret is not None:
                         return ret
                     # if ret is None, then none of the subrules matched,
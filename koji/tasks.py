@@ -480,6 +480,18 @@ class BaseTaskHandler(object):
         if os.path.isfile(filename) and os.stat(filename).st_size > 0:
             self.session.uploadWrapper(filename, uploadPath, remoteName, volume=volume)
 
+    def uploadFiles(self, filenames, relPath=None, volume=None):
+        """Upload the files with the given names to the task output directory
+        on the hub, together. See ClientSession.uploadFiles"""
+        uploadPath = self.getUploadDir()
+        if relPath:
+            relPath = relPath.strip('/')
+            uploadPath += '/' + relPath
+        # Only upload files with content
+        filenames = [fn for fn in filenames if os.path.isfile(fn) and os.stat(fn).st_size > 0]
+        if filenames:
+            self.session.uploadFiles(filenames, uploadPath, volume=volume)
+
     def uploadTree(self, dirpath, flatten=False, volume=None):
         """Upload the directory tree at dirpath to the task directory on the
         hub, preserving the directory structure"""
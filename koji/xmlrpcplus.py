@@ -66,6 +66,77 @@ class ExtendedMarshaller(xmlrpc_client.Marshaller):
     except AttributeError:
         dispatch[re._pattern_type] = dump_re
 
+    # the standard container handlers, which iter_dump knows how to split
+    _split_arrays = (dispatch[list], dispatch[tuple], dump_generator)
+    _split_structs = (dispatch[dict],)
+
+    def iter_dump(self, values, chunksize=65536, depth=2):
+        """Like dumps, but yield the result in chunks of about chunksize characters
+
+        Arrays, structs and generators in the top depth levels of the values are split
+        between their items, so a large response never has to be held in memory as a
+        single string, and generators are only consumed as the output is read.
+        """
+        if isinstance(values, Fault):
+            yield self.dumps(values)
+            return
+        out = []
+        write = out.append
+        state = {'checked': 0, 'size': 0}
+        write("<params>\n")
+        for v in values:
+            write("<param>\n")
+            for _ in self._iter_value(v, write, depth):
+                # we are between container items
+                state['size'] += sum([len(x) for x in out[state['checked']:]])
+                state['checked'] = len(out)
+                if state['size'] >= chunksize:
+                    chunk = ''.join(out)
+                    del out[:]
+                    state['checked'] = state['size'] = 0
+                    yield chunk
+            write("</param>\n")
+        write("</params>\n")
+        yield ''.join(out)
+
+    def _splittable(self, value):
+        f = self.dispatch.get(type(value))
+        return f in self._split_arrays or f in self._split_structs
+
+    def _iter_value(self, value, write, depth):
+        if depth <= 0 or not self._splittable(value):
+            self._dump(value, write)
+            return
+        i = id(value)
+        if i in self.memo:
+            raise TypeError("cannot marshal recursive containers")
+        self.memo[i] = None
+        if self.dispatch[type(value)] in self._split_structs:
+            write("<value><struct>\n")
+            for k, v in value.items():
+                write("<member>\n")
+                if not isinstance(k, six.string_types):
+                    raise TypeError("dictionary key must be string")
+                write("<name>%s</name>\n" % xmlrpc_client.escape(k))
+                if depth > 1 and self._splittable(v):
+                    for _ in self._iter_value(v, write, depth - 1):
+                        yield
+                else:
+                    self._dump(v, write)
+                write("</member>\n")
+            write("</struct></value>\n")
+        else:
+            write("<value><array><data>\n")
+            for v in value:
+                if depth > 1 and self._splittable(v):
+                    for _ in self._iter_value(v, write, depth - 1):
+                        yield
+                else:
+                    self._dump(v, write)
+                yield
+            write("</data></array></value>\n")
+        del self.memo[i]
+
 
 if six.PY2:
     ExtendedMarshaller.dispatch[long] = ExtendedMarshaller.dump_int  # noqa: F821
@@ -127,3 +198,42 @@ def dumps(params, methodname=None, methodresponse=None, encoding=None,
     else:
         return data  # return as is
     return ''.join(parts)
+
+
+def dumps_iter(params, methodresponse=None, encoding=None, allow_none=1, marshaller=None,
+               chunksize=65536):
+    """encode an xmlrpc response as an iterator of string chunks
+
+    Joining the chunks gives the same result as dumps. Generators in the params
+    are consumed as the chunks are read.
+    """
+
+    if isinstance(params, Fault):
+        methodresponse = 1
+    elif not isinstance(params, tuple):
+        raise TypeError('params must be a tuple or Fault instance')
+    elif methodresponse and len(params) != 1:
+        raise ValueError('response tuple must be a singleton')
+
+    if not encoding:
+        encoding = "utf-8"
+
+    if marshaller is not None:
+        m = marshaller(encoding, allow_none=True)
+    else:
+        m = ExtendedMarshaller(encoding, allow_none=True)
+
+    if encoding != "utf-8":
+        prefix = "<?xml version='1.0' encoding='%s'?>\n" % str(encoding)
+    else:
+        prefix = "<?xml version='1.0'?>\n"  # utf-8 is default
+    if methodresponse:
+        prefix += "<methodResponse>\n"
+    for chunk in m.iter_dump(params, chunksize=chunksize):
+        if prefix:
+            # so that the first chunk already holds some data
+            chunk = prefix + chunk
+            prefix = None
+        yield chunk
+    if methodresponse:
+        yield "</methodResponse>\n"
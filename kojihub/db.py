@@ -23,6 +23,8 @@
 
 from __future__ import absolute_import
 
+import datetime
+import io
 import logging
 import koji
 import os
@@ -34,9 +36,13 @@ import os
 # del psycopg2.extensions.string_types[1083]
 # del psycopg2.extensions.string_types[1266]
 import re
+import select
 import sys
+import threading
 import time
 import traceback
+import weakref
+from collections import OrderedDict
 
 import psycopg2
 
@@ -46,9 +52,13 @@ context = koji.context.context
 
 POSITIONAL_RE = re.compile(r'%[a-z]')
 NAMED_RE = re.compile(r'%\(([^\)]+)\)[a-z]')
+# placeholders and escaped percent signs of preformatted sql
+PREPARE_RE = re.compile(r'%(?:\(([^\)]+)\))?s|%%')
 
 ## Globals ##
 _DBopts = None
+# options for the optional read replica, see connect_replica()
+_DBreplicaOpts = None
 # A persistent connection to the database.
 # A new connection will be created whenever
 # Apache forks a new worker, and that connection
@@ -59,6 +69,13 @@ _DBopts = None
 # but play it safe anyway.
 _DBconn = koji.context.ThreadLocal()
 
+# server side prepared statements of each connection, see CursorWrapper._execute_prepared()
+_prepared = weakref.WeakKeyDictionary()
+
+# how often to check the replication lag of the replica (in seconds)
+REPLICA_LAG_INTERVAL = 5
+_replica_lag = {'checked': 0, 'lag': None}
+
 logger = logging.getLogger('koji.db')
 
 
@@ -124,8 +141,9 @@ class CursorWrapper:
         """psycopg2 requires all variable placeholders to use the string (%s) datatype,
         regardless of the actual type of the data. Format the sql string to be compliant.
         It also requires IN parameters to be in tuple rather than list format."""
-        sql = POSITIONAL_RE.sub(r'%s', sql)
-        sql = NAMED_RE.sub(r'%(\1)s', sql)
+        return _preformat_sql(sql), self._preformat_params(params)
+
+    def _preformat_params(self, params):
         if isinstance(params, dict):
             for name, value in params.items():
                 if isinstance(value, list):
@@ -136,16 +154,26 @@ class CursorWrapper:
             for i, item in enumerate(params):
                 if isinstance(item, list):
                     params[i] = tuple(item)
-        return sql, params
+        return params
 
     def execute(self, operation, parameters=(), log_errors=True):
         debug = self.logger.isEnabledFor(logging.DEBUG)
-        operation, parameters = self.preformat(operation, parameters)
+        statement = None
+        if isinstance(operation, Statement):
+            # the sql was preformatted when the statement was cached
+            statement = operation
+            operation = statement.sql
+            parameters = self._preformat_params(parameters)
+        else:
+            operation, parameters = self.preformat(operation, parameters)
         if debug:
             self.logger.debug(self.quote(operation, parameters))
             start = time.time()
         try:
-            ret = self.cursor.execute(operation, parameters)
+            if statement is not None and statement_cache.prepare:
+                ret = self._execute_prepared(statement, parameters)
+            else:
+                ret = self.cursor.execute(operation, parameters)
         except Exception:
             if log_errors:
                 self.logger.error('Query failed. Query was: %s', self.quote(operation, parameters))
@@ -154,6 +182,68 @@ class CursorWrapper:
             self.logger.debug("Execute operation completed in %.4f seconds", time.time() - start)
         return ret
 
+    def _execute_prepared(self, statement, parameters):
+        """Execute a cached statement as a server side prepared statement
+
+        The statement is prepared the first time it is used on the connection.
+        Statements which cannot be prepared are executed as usual, e.g. those
+        with IN lists, whose parameters do not fit a single placeholder.
+        """
+        if not isinstance(parameters, dict) or \
+                any(isinstance(value, tuple) for value in parameters.values()):
+            return self.cursor.execute(statement.sql, parameters)
+        statements = _prepared.setdefault(self.cursor.connection, {})
+        execute_sql = statements.get(statement)
+        if execute_sql is None:
+            if len(statements) >= statement_cache.size:
+                return self.cursor.execute(statement.sql, parameters)
+            execute_sql = self._prepare(statement, 'koji_stmt_%i' % len(statements))
+            statements[statement] = execute_sql
+        if not execute_sql:
+            return self.cursor.execute(statement.sql, parameters)
+        statement_cache.executed_prepared += 1
+        return self.cursor.execute(execute_sql, parameters)
+
+    def _prepare(self, statement, name):
+        """Prepare a statement on the server
+
+        Return the sql that executes it, or False if it cannot be prepared.
+        """
+        names = []
+
+        def placeholder(match):
+            if match.group(0) == '%%':
+                # PREPARE is run without parameters, so nothing unescapes it
+                return '%'
+            key = match.group(1)
+            if key is None:
+                raise ValueError('positional parameter')
+            if key not in names:
+                names.append(key)
+            return '$%i' % (names.index(key) + 1)
+
+        try:
+            sql = PREPARE_RE.sub(placeholder, statement.sql)
+        except ValueError:
+            return False
+        # a failure aborts the transaction, so use a savepoint
+        self.cursor.execute('SAVEPOINT koji_prepare')
+        try:
+            self.cursor.execute('PREPARE %s AS %s' % (name, sql))
+        except psycopg2.Error as e:
+            self.cursor.execute('ROLLBACK TO SAVEPOINT koji_prepare')
+            self.logger.debug('Unable to prepare statement: %s', e)
+            return False
+        self.cursor.execute('RELEASE SAVEPOINT koji_prepare')
+        if not names:
+            return 'EXECUTE %s' % name
+        return 'EXECUTE %s (%s)' % (name, ', '.join(['%%(%s)s' % key for key in names]))
+
+
+def _preformat_sql(sql):
+    sql = POSITIONAL_RE.sub(r'%s', sql)
+    return NAMED_RE.sub(r'%(\1)s', sql)
+
 
 ## Functions ##
 def provideDBopts(**opts):
@@ -171,13 +261,30 @@ def getDBopts():
     return _DBopts
 
 
-def connect():
+def provideReplicaDBopts(**opts):
+    global _DBreplicaOpts
+    if _DBreplicaOpts is None:
+        _DBreplicaOpts = dict([i for i in opts.items() if i[1] is not None])
+
+
+def getReplicaDBopts():
+    return _DBreplicaOpts
+
+
+def connect(replica=False):
+    """Return a connection to the database
+
+    The connection is kept open and reused for later requests handled by the
+    same thread. If replica is true, the connection is to the read replica
+    (see provideReplicaDBopts) instead of the primary database.
+    """
     logger = logging.getLogger('koji.db')
     global _DBconn
-    if hasattr(_DBconn, 'conn'):
+    key = 'replica' if replica else 'conn'
+    if hasattr(_DBconn, key):
         # Make sure the previous transaction has been
         # closed.  This is safe to call multiple times.
-        conn = _DBconn.conn
+        conn = getattr(_DBconn, key)
         try:
             # Under normal circumstances, the last use of this connection
             # will have issued a raw ROLLBACK to close the transaction. To
@@ -189,9 +296,9 @@ def connect():
             conn.rollback()
             return DBWrapper(conn)
         except psycopg2.Error:
-            del _DBconn.conn
+            delattr(_DBconn, key)
     # create a fresh connection
-    opts = _DBopts
+    opts = _DBreplicaOpts if replica else _DBopts
     if opts is None:
         opts = {}
     try:
@@ -205,11 +312,97 @@ def connect():
         raise
     # XXX test
     # return conn
-    _DBconn.conn = conn
+    setattr(_DBconn, key, conn)
 
     return DBWrapper(conn)
 
 
+def replica_lag(cnx):
+    """Return the replication lag of a replica connection in seconds
+
+    The lag is zero if the replica has replayed everything it has received,
+    or if the database is not a replica at all. It is None if the replica is
+    not streaming from the primary (e.g. its WAL receiver is disconnected),
+    since it then has no way to know how far behind it is.
+
+    Without the pg_read_all_stats role, the status of the WAL receiver is not
+    visible, and a running WAL receiver is assumed to be streaming.
+    """
+    c = cnx.cursor()
+    c.execute("""SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver
+                         WHERE status = 'streaming' OR status IS NULL) THEN NULL
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+        END""", {})
+    lag = c.fetchone()[0]
+    c.close()
+    if lag is None:
+        return None
+    return float(lag)
+
+
+def connect_replica(max_lag=None):
+    """Return a connection to the read replica, or None if it should not be used
+
+    None is returned if no replica is configured, if it cannot be reached, or
+    if its replication lag is over max_lag seconds. The lag is checked at most
+    every REPLICA_LAG_INTERVAL seconds.
+    """
+    if not _DBreplicaOpts:
+        return None
+    try:
+        cnx = connect(replica=True)
+    except Exception:
+        # connect() logs the error
+        logger.warning('Read replica unavailable, using the primary database')
+        return None
+    now = time.time()
+    if max_lag and now - _replica_lag['checked'] > REPLICA_LAG_INTERVAL:
+        try:
+            _replica_lag['lag'] = replica_lag(cnx)
+        except Exception:
+            logger.exception('Unable to check read replica lag, using the primary database')
+            return None
+        _replica_lag['checked'] = now
+    if max_lag and _replica_lag['lag'] is None:
+        logger.info('Read replica is not streaming from the primary, using the primary database')
+        cnx.close()
+        return None
+    if max_lag and _replica_lag['lag'] > max_lag:
+        logger.info('Read replica is %.1f seconds behind, using the primary database',
+                    _replica_lag['lag'])
+        cnx.close()
+        return None
+    return cnx
+
+
+class ReplicaStats(object):
+    """Count the calls to read-only methods handled by the replica and the primary
+
+    The counts are kept per hub process and per method. Calls end up on the
+    primary when the caller is logged in, or when the replica is unavailable or
+    too far behind.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def record(self, method, replica):
+        with self.lock:
+            counts = self.calls.setdefault(method, {'replica': 0, 'primary': 0})
+            counts['replica' if replica else 'primary'] += 1
+
+    def stats(self):
+        with self.lock:
+            return dict([(method, dict(counts)) for method, counts in self.calls.items()])
+
+
+replica_stats = ReplicaStats()
+
+
 def _dml(operation, values, log_errors=True):
     """Run an insert, update, or delete. Return number of rows affected
     If log is False, errors will not be logged. It makes sense only for
@@ -221,6 +414,32 @@ def _dml(operation, values, log_errors=True):
     logger.debug("Operation affected %s row(s)", ret)
     c.close()
     context.commit_pending = True
+    # cached lookups may be out of date now (see kojihub.LookupCache)
+    context.lookup_cache = {}
+    return ret
+
+
+def _copy(table, columns, data):
+    """Load rows into a table with COPY FROM STDIN. Return number of rows loaded
+
+    :param str table: table name
+    :param list columns: column names, in the order of the data
+    :param str data: the rows, in the text format of COPY
+    """
+    c = context.cnx.cursor()
+    query = 'COPY %s (%s) FROM STDIN' % (table, ', '.join(columns))
+    logger.debug(query)
+    try:
+        c.copy_expert(query, io.StringIO(data))
+    except Exception:
+        logger.error('Copy failed. Query was: %s', query)
+        raise
+    ret = c.rowcount
+    logger.debug("Operation affected %s row(s)", ret)
+    c.close()
+    context.commit_pending = True
+    # cached lookups may be out of date now (see kojihub.LookupCache)
+    context.lookup_cache = {}
     return ret
 
 
@@ -358,6 +577,53 @@ def db_lock(name, wait=True):
     raise koji.LockError(f"Lock not defined: {name}")
 
 
+def listen(channel):
+    """Listen for notifications on the given channel
+
+    Notifications only start after the transaction is committed, so this
+    commits the current transaction. Use wait_notify() to wait for them.
+    """
+    c = context.cnx.cursor()
+    c.execute('LISTEN %s' % channel, {})
+    c.close()
+    context.cnx.commit()
+
+
+def unlisten():
+    """Stop listening for notifications and drop any pending ones
+
+    The connection is reused by later requests, so callers of listen() should
+    always call this when they are done.
+    """
+    c = context.cnx.cursor()
+    c.execute('UNLISTEN *', {})
+    c.close()
+    context.cnx.commit()
+    del context.cnx.notifies[:]
+
+
+def wait_notify(timeout):
+    """Wait for a notification on one of the channels we listen on
+
+    The current transaction is committed first, so that the connection is not
+    left idle in a transaction while we wait.
+
+    :param float timeout: maximum time to wait in seconds
+    :returns: list of notified channels, empty if the timeout expired
+    """
+    context.cnx.commit()
+    deadline = time.time() + timeout
+    while not context.cnx.notifies:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            break
+        if select.select([context.cnx], [], [], remaining)[0]:
+            context.cnx.poll()
+    channels = [n.channel for n in context.cnx.notifies]
+    del context.cnx.notifies[:]
+    return channels
+
+
 class Savepoint(object):
 
     def __init__(self, name):
@@ -591,6 +857,84 @@ class DeleteProcessor(object):
         return _dml(str(self), self.get_values())
 
 
+class Statement(str):
+    """The text of a query, as kept by StatementCache
+
+    It compares equal to the query text. The sql attribute holds the text as
+    preformatted by CursorWrapper, which uses it instead of preformatting again.
+    """
+
+    def __new__(cls, text):
+        self = super(Statement, cls).__new__(cls, text)
+        self.sql = _preformat_sql(text)
+        return self
+
+
+class StatementCache(object):
+    """Reuse the text of queries with the same shape
+
+    Most calls run a handful of QueryProcessor queries, which differ only in
+    their values. The text of recent queries is kept per process, keyed by
+    everything that the text depends on, so it is neither rebuilt nor
+    preformatted again.
+
+    If prepare is true, cached statements are also prepared on the server
+    the first time they are used on a connection (see CursorWrapper).
+    """
+
+    def __init__(self, size=1000, prepare=False):
+        self.size = size
+        self.prepare = prepare
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.executed_prepared = 0
+
+    def get(self, query):
+        """Return the text of a QueryProcessor query"""
+        if not self.size:
+            return str(query)
+        key = query._shape()
+        with self.lock:
+            try:
+                statement = self.entries.get(key)
+            except TypeError:
+                # unhashable query parts
+                return str(query)
+            if statement is not None:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return statement
+            self.misses += 1
+        statement = Statement(str(query))
+        with self.lock:
+            self.entries[key] = statement
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return statement
+
+    def stats(self):
+        """Return the hit counts of this process"""
+        lookups = self.hits + self.misses
+        return {
+            'size': self.size,
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else None,
+            'prepare': self.prepare,
+            'executed_prepared': self.executed_prepared,
+        }
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+statement_cache = StatementCache()
+
+
 class QueryProcessor(object):
     """
     Build a query from its components.
@@ -613,7 +957,8 @@ class QueryProcessor(object):
         limit: an integer to use in the 'LIMIT' clause
         asList: if True, return results as a list of lists, where each list contains the
                 column values in query order, rather than the usual list of maps
-        rowlock: if True, use "FOR UPDATE" to lock the queried rows
+        rowlock: if True, use "FOR UPDATE" to lock the queried rows. If 'skip', also
+                 skip the rows that are already locked ("FOR UPDATE SKIP LOCKED")
         group: a column or alias name to use in the 'GROUP BY' clause
                (controlled by enable_group)
     - enable_group: if True, opts.group will be enabled
@@ -712,8 +1057,24 @@ SELECT %(col_str)s
             query = 'SELECT count(*)\nFROM (' + query + ') numrows'
         if self.opts.get('rowlock'):
             query += '\n FOR UPDATE'
+            if self.opts['rowlock'] == 'skip':
+                query += ' SKIP LOCKED'
         return query
 
+    def _shape(self):
+        """Return a key for everything that the query text depends on"""
+        opts = self.opts
+        order_map = None
+        if self.order_map is not None and opts.get('order'):
+            order_map = tuple(self.order_map.items())
+        return (tuple(self.columns or ()), tuple(self.aliases or ()), tuple(self.tables or ()),
+                tuple(self.joins or ()), tuple(self.clauses or ()), self.enable_group,
+                bool(opts.get('countOnly')), opts.get('offset'), opts.get('limit'),
+                opts.get('order'), opts.get('group'), opts.get('rowlock'), order_map)
+
+    def _statement(self):
+        return statement_cache.get(self)
+
     def __repr__(self):
         return '<QueryProcessor: ' \
                'columns=%r, aliases=%r, tables=%r, joins=%r, clauses=%r, values=%r, opts=%r>' % \
@@ -794,10 +1155,10 @@ SELECT %(col_str)s
 
     def singleValue(self, strict=True):
         # self.transform not applied here
-        return _singleValue(str(self), self.values, strict=strict)
+        return _singleValue(self._statement(), self.values, strict=strict)
 
     def execute(self):
-        query = str(self)
+        query = self._statement()
         if self.opts.get('countOnly'):
             return _singleValue(query, self.values, strict=True)
         elif self.opts.get('asList'):
@@ -828,7 +1189,7 @@ SELECT %(col_str)s
             cname = "qp_cursor_%s_%i_%i" % (id(self), os.getpid(), self.cursors)
             self.cursors += 1
             self.logger.debug('Setting up query iterator. cname=%r', cname)
-            return self._iterate(cname, str(self), self.values.copy(), fields,
+            return self._iterate(cname, self._statement(), self.values.copy(), fields,
                                  self.iterchunksize, self.opts.get('asList'))
 
     def _iterate(self, cname, query, values, fields, chunksize, as_list=False):
@@ -1003,8 +1364,31 @@ class QueryView:
         return self.query.singleValue(strict=strict)
 
 
+# escapes of the text format of COPY
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+
+def _copy_value(value):
+    """Format a value for the text format of COPY
+
+    Raises TypeError for the types that need the adaptation of psycopg2
+    """
+    if value is None:
+        return '\\N'
+    elif isinstance(value, bool):
+        return 't' if value else 'f'
+    elif isinstance(value, (int, float)):
+        return str(value)
+    elif isinstance(value, str):
+        return value.translate(_COPY_ESCAPES)
+    elif isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError('Unsupported type for copy: %s' % type(value))
+
+
 class BulkInsertProcessor(object):
-    def __init__(self, table, data=None, columns=None, strict=True, batch=1000):
+    def __init__(self, table, data=None, columns=None, strict=True, batch=1000, copy=False,
+                 skip_dup=False):
         """Do bulk inserts - it has some limitations compared to
         InsertProcessor (no rawset, dup_check).
 
@@ -1017,6 +1401,12 @@ class BulkInsertProcessor(object):
         strict  - if True, all records must contain values for all columns.
                   if False, missing values will be inserted as NULLs
         batch   - batch size for inserts (one statement per batch)
+        copy    - if True, load the data with COPY FROM STDIN rather than
+                  INSERT statements, which is much faster for many rows.
+                  Batches with values other than None, bool, numbers,
+                  strings and dates still use INSERT
+        skip_dup - if True, rows which conflict with existing ones are
+                   skipped (ON CONFLICT DO NOTHING). COPY is not used then
         """
 
         self.table = table
@@ -1031,6 +1421,8 @@ class BulkInsertProcessor(object):
                 self.columns |= set(row.keys())
         self.strict = strict
         self.batch = batch
+        self.copy = copy
+        self.skip_dup = skip_dup
 
     def __str__(self):
         if not self.data:
@@ -1070,6 +1462,8 @@ class BulkInsertProcessor(object):
             values.append("(%s)" % ', '.join(row_values))
             i += 1
         parts.append("VALUES %s" % ', '.join(values))
+        if self.skip_dup:
+            parts.append(" ON CONFLICT DO NOTHING")
         return ''.join(parts), prepared_data
 
     def __repr__(self):
@@ -1090,7 +1484,42 @@ class BulkInsertProcessor(object):
                 data = self.data[i:i + self.batch]
                 self._one_insert(data)
 
+    def _get_copy(self, data):
+        """
+        Generate the input of COPY for the given data
+
+        :param list data: list of rows (dict format) to insert
+        :returns: (columns, data in the text format of COPY)
+        :raises TypeError: if a value is not supported by _copy_value
+        """
+
+        if not data:
+            # should not happen
+            raise ValueError('no data for insert')
+        columns = sorted(self.columns)
+        lines = []
+        for row in data:
+            row_values = []
+            for key in columns:
+                if key in row:
+                    row_values.append(_copy_value(row[key]))
+                elif self.strict:
+                    raise koji.GenericError("Missing value %s in BulkInsert" % key)
+                else:
+                    row_values.append('\\N')
+            lines.append('\t'.join(row_values))
+        lines.append('')
+        return columns, '\n'.join(lines)
+
     def _one_insert(self, data):
+        if self.copy and not self.skip_dup:
+            try:
+                columns, copy_data = self._get_copy(data)
+            except TypeError as e:
+                logger.debug('Using insert rather than copy: %s', e)
+            else:
+                _copy(self.table, columns, copy_data)
+                return
         query, params = self._get_insert(data)
         _dml(query, params)
 
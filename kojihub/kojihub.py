@@ -34,9 +34,12 @@ import filecmp
 import fnmatch
 import functools
 import hashlib
+import heapq
+import itertools
 import json
 import logging
 import os
+import queue
 import re
 import secrets
 import shutil
@@ -44,11 +47,13 @@ import stat
 import sys
 import tarfile
 import tempfile
+import threading
 import time
 import types
 import traceback
 from urllib.parse import parse_qs
 import zipfile
+import zlib
 from collections import defaultdict, OrderedDict
 
 import rpm
@@ -94,6 +99,11 @@ from .db import (  # noqa: F401
     get_event,
     nextval,
     currval,
+    listen,
+    replica_stats,
+    statement_cache,
+    unlisten,
+    wait_notify,
 )
 
 
@@ -289,6 +299,11 @@ class Task(object):
         if state == koji.TASK_STATES['OPEN']:
             update.rawset(start_time='NOW()')
         update.execute()
+        if newstate == 'ASSIGNED':
+            scheduler.notify_host(host_id)
+        if info['host_id'] != host_id:
+            # the previous host should notice that it lost the task
+            scheduler.notify_host(info['host_id'])
         self.runCallbacks('postTaskStateChange', info, 'state', koji.TASK_STATES[newstate])
         self.runCallbacks('postTaskStateChange', info, 'host_id', host_id)
         return True
@@ -337,6 +352,7 @@ class Task(object):
         update = UpdateProcessor('task', clauses=['id=%(task_id)s'], values={'task_id': self.id},
                                  data={'state': newstate, 'host_id': newhost})
         update.execute()
+        scheduler.notify_host(info['host_id'])
         self.runCallbacks('postTaskStateChange', info, 'state', koji.TASK_STATES['FREE'])
         self.runCallbacks('postTaskStateChange', info, 'host_id', None)
         return True
@@ -390,10 +406,17 @@ class Task(object):
                                  data={'result': info['result'], 'state': state},
                                  rawdata={'completion_time': 'NOW()'})
         update.execute()
+        self._notifyHosts(info)
 
         self.runCallbacks('postTaskStateChange', info, 'state', state)
         self.runCallbacks('postTaskStateChange', info, 'completion_ts', now)
 
+    def _notifyHosts(self, info):
+        """Wake the hosts of a finished task and of its (possibly waiting) parent"""
+        scheduler.notify_host(info['host_id'])
+        if info['parent'] is not None:
+            scheduler.notify_task_host(info['parent'])
+
     def close(self, result):
         # access checks should be performed by calling function
         self._close(result, koji.TASK_STATES['CLOSED'])
@@ -441,6 +464,7 @@ class Task(object):
         update = UpdateProcessor('task', clauses=['id = %(task_id)i'], values={'task_id': self.id},
                                  data={'state': st_canceled}, rawdata={'completion_time': 'NOW()'})
         update.execute()
+        self._notifyHosts(info)
         self.runCallbacks('postTaskStateChange', info, 'state', koji.TASK_STATES['CANCELED'])
         self.runCallbacks('postTaskStateChange', info, 'completion_ts', now)
         # cancel associated builds (only if state is 'BUILDING')
@@ -875,17 +899,259 @@ def _writeInheritanceData(tag_id, changes, clear=False):
         insert = InsertProcessor('tag_inheritance', data=newlink)
         insert.make_create()
         insert.execute()
+    if [link for link in data.values() if link.get('is_update')]:
+        set_tag_last_change(tag_id)
+    inheritance_cache.invalidate()
+
+
+def readInheritanceGraph(tag_id, event=None, reverse=False):
+    """Read all inheritance links reachable from a tag in a single query
+
+    Returns a dictionary mapping tag ids to the list of their inheritance
+    links, ordered by priority. The links have the same format as the ones
+    returned by readInheritanceData (or readDescendantsData if reverse is
+    True).
+
+    Links that are pruned by maxdepth or intransitive settings are still
+    included. It is up to readFullInheritanceRecurse to apply those.
+    """
+    if reverse:
+        start, follow = 'parent_id', 'tag_id'
+    else:
+        start, follow = 'tag_id', 'parent_id'
+    columns = ['tag_id', 'parent_id', 'priority', 'maxdepth', 'intransitive', 'noconfig',
+               'pkg_filter']
+    col_str = ', '.join(columns)
+    rec_col_str = ', '.join(['tag_inheritance.%s' % c for c in columns])
+    query = """WITH RECURSIVE links(%(col_str)s) AS (
+        SELECT %(col_str)s FROM tag_inheritance
+        WHERE %(start_cond)s AND %(start)s = %%(tag_id)i
+      UNION
+        SELECT %(rec_col_str)s FROM tag_inheritance
+        JOIN links ON tag_inheritance.%(start)s = links.%(follow)s
+        WHERE %(rec_cond)s
+    )
+    SELECT %(links_col_str)s, tag.name FROM links
+    JOIN tag ON links.%(follow)s = tag.id
+    ORDER BY links.priority""" % {
+        'col_str': col_str,
+        'rec_col_str': rec_col_str,
+        'links_col_str': ', '.join(['links.%s' % c for c in columns]),
+        'start': start,
+        'follow': follow,
+        'start_cond': eventCondition(event),
+        'rec_cond': eventCondition(event, table='tag_inheritance'),
+    }
+    graph = {}
+    for link in _multiRow(query, {'tag_id': tag_id}, columns + ['name']):
+        if reverse:
+            graph.setdefault(link['parent_id'], []).append(link)
+        else:
+            link['child_id'] = link.pop('tag_id')
+            graph.setdefault(link['child_id'], []).append(link)
+    return graph
+
+
+class InheritanceCache(object):
+    """Cache for flattened tag inheritance, keyed by (tag_id, event, reverse)
+
+    Inheritance at a past event cannot change, so those results are kept in a
+    per-process LRU cache and shared between requests. Results for the current
+    state (event=None) are only kept for the duration of a single request, since
+    other hub processes may change the inheritance at any time.
+
+    Tag names are not versioned, so they are not cached. They are looked up
+    again whenever a result is read from the cache.
+    """
+
+    def __init__(self, size=1000):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        # the highest event that we know no open transaction can precede
+        self.stable_event = None
+        self.hits = 0
+        self.misses = 0
+
+    def _request_entries(self):
+        entries = getattr(context, 'inheritance_cache', None)
+        if not isinstance(entries, dict):
+            entries = {}
+            context.inheritance_cache = entries
+        return entries
+
+    def is_stable(self, event):
+        """Check whether inheritance data for event can no longer change
+
+        Event ids are handed out when a transaction starts writing, so a
+        transaction holding a lower event may still commit after a higher one.
+        An event is stable once it is committed and every transaction that
+        started writing before it has finished. This must be checked before
+        the data is read, so that such transactions are visible to the read.
+        """
+        if event is None or not self.size:
+            return False
+        own_event = getattr(context, 'event_id', None)
+        if isinstance(own_event, int) and event >= own_event:
+            # our own transaction may still write data for this event
+            return False
+        if getattr(context, 'replica', False) is True:
+            # transactions open on the primary cannot be seen from a replica
+            return False
+        if self.stable_event is not None and event <= self.stable_event:
+            return True
+        # the event time is taken right after its id, and open transactions
+        # of other roles show no xact_start, so count those as well
+        query = QueryProcessor(
+            tables=['events'], clauses=['id = %(event)i'], values={'event': event},
+            columns=["""NOT EXISTS (SELECT 1 FROM pg_stat_activity
+                WHERE pid <> pg_backend_pid() AND backend_xid IS NOT NULL
+                AND (xact_start IS NULL OR xact_start < events.time + '1 second'::interval))"""],
+            aliases=['stable'])
+        if not query.singleValue(strict=False):
+            return False
+        with self.lock:
+            if self.stable_event is None or event > self.stable_event:
+                self.stable_event = event
+        return True
+
+    def get(self, tag_id, event, reverse):
+        key = (tag_id, event, reverse)
+        if event is None:
+            order = self._request_entries().get(key)
+        else:
+            with self.lock:
+                order = self.entries.get(key)
+                if order is not None:
+                    self.entries.move_to_end(key)
+        if order is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        order = self._copy(order)
+        _set_inheritance_names(order, reverse)
+        return order
+
+    def set(self, tag_id, event, reverse, order, stable=False):
+        """Cache a result
+
+        Results for past events are only shared between requests if stable
+        is true, see is_stable()
+        """
+        key = (tag_id, event, reverse)
+        order = self._copy(order)
+        for link in order:
+            link.pop('name', None)
+        if event is None:
+            self._request_entries()[key] = order
+        elif self.size and stable:
+            with self.lock:
+                self.entries[key] = order
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+
+    def invalidate(self):
+        """Drop all cached data
+
+        Called whenever inheritance data is written
+        """
+        context.inheritance_cache = {}
+        with self.lock:
+            self.entries.clear()
+
+    @staticmethod
+    def _copy(order):
+        # callers are free to modify the links they get
+        return [dict(link, filter=list(link['filter'])) for link in order]
+
+
+def _get_tag_names(tag_ids):
+    """Return a dictionary mapping the given tag ids to their current names"""
+    query = QueryProcessor(tables=['tag'], columns=['id', 'name'],
+                           clauses=['id IN %(tag_ids)s'], values={'tag_ids': list(tag_ids)},
+                           opts={'asList': True})
+    return dict(query.execute())
+
+
+def _set_inheritance_names(order, reverse):
+    """Fill in the tag names of cached inheritance links"""
+    if not order:
+        return
+    key = 'tag_id' if reverse else 'parent_id'
+    tag_ids = tuple(sorted(set([link[key] for link in order])))
+    names = lookup_cache.call(_get_tag_names, tag_ids)
+    for link in order:
+        link['name'] = names.get(link[key])
+
+
+inheritance_cache = InheritanceCache()
+
+
+class LookupCache(object):
+    """Memoize lookups for the duration of a request
+
+    The results are kept in the request context, so they are dropped at the end
+    of the request by context._threadclear(). They are also dropped whenever the
+    request changes any data (see db._dml), so a cached result never hides a
+    change made by the request itself.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+
+    def _request_entries(self):
+        entries = getattr(context, 'lookup_cache', None)
+        if not isinstance(entries, dict):
+            entries = {}
+            context.lookup_cache = entries
+        return entries
+
+    def call(self, func, *args, **kwargs):
+        """Return func(*args, **kwargs), reusing an earlier result if possible"""
+        key = (func, args, tuple(sorted(kwargs.items())))
+        entries = self._request_entries()
+        try:
+            result = entries[key]
+        except KeyError:
+            self.misses += 1
+            result = func(*args, **kwargs)
+            entries[key] = result
+        except TypeError:
+            # unhashable arguments, e.g. a buildinfo dict
+            return func(*args, **kwargs)
+        else:
+            self.hits += 1
+        # callers are free to modify the results they get
+        return copy.deepcopy(result)
+
+    def clear(self):
+        """Drop the results cached by the current request"""
+        context.lookup_cache = {}
+
+
+lookup_cache = LookupCache()
 
 
 def readFullInheritance(tag_id, event=None, reverse=False):
     """Returns a list representing the full, ordered inheritance from tag"""
+    order = inheritance_cache.get(tag_id, event, reverse)
+    if order is not None:
+        logger.debug('Inheritance cache hit for tag %s (event %s, reverse %s)',
+                     tag_id, event, reverse)
+        return order
+    stable = inheritance_cache.is_stable(event)
     order = []
-    readFullInheritanceRecurse(tag_id, event, order, {}, {}, 0, None, False, [], reverse)
+    graph = readInheritanceGraph(tag_id, event, reverse)
+    readFullInheritanceRecurse(tag_id, event, order, {}, {}, 0, None, False, [], reverse,
+                               graph=graph)
+    inheritance_cache.set(tag_id, event, reverse, order, stable=stable)
     return order
 
 
 def readFullInheritanceRecurse(tag_id, event, order, top, hist, currdepth, maxdepth, noconfig,
-                               pfilter, reverse):
+                               pfilter, reverse, graph=None):
     if maxdepth is not None and maxdepth < 1:
         return
     # note: maxdepth is relative to where we are, but currdepth is absolute from
@@ -893,7 +1159,10 @@ def readFullInheritanceRecurse(tag_id, event, order, top, hist, currdepth, maxde
     currdepth += 1
     top = top.copy()
     top[tag_id] = 1
-    if reverse:
+    if graph is not None:
+        # links may be visited more than once, so copy them
+        node = [link.copy() for link in graph.get(tag_id, [])]
+    elif reverse:
         node = readDescendantsData(tag_id, event)
     else:
         node = readInheritanceData(tag_id, event)
@@ -969,7 +1238,7 @@ def readFullInheritanceRecurse(tag_id, event, order, top, hist, currdepth, maxde
             # add link, but don't follow it
             continue
         readFullInheritanceRecurse(id, event, order, top, hist, currdepth, nextdepth, noconfig,
-                                   filter, reverse)
+                                   filter, reverse, graph=graph)
 
 # tag-package operations
 #       add
@@ -985,6 +1254,7 @@ def _pkglist_remove(tag_id, pkg_id):
     update = UpdateProcessor('tag_packages', values=locals(), clauses=clauses)
     update.make_revoke()  # XXX user_id?
     update.execute()
+    set_tag_last_change(tag_id)
 
 
 def _pkglist_owner_remove(tag_id, pkg_id):
@@ -1016,6 +1286,7 @@ def _pkglist_add(tag_id, pkg_id, owner, block, extra_arches):
     insert = InsertProcessor('tag_packages', data=data)
     insert.make_create()  # XXX user_id?
     insert.execute()
+    set_tag_last_change(tag_id)
     _pkglist_owner_add(tag_id, pkg_id, owner)
 
 
@@ -1498,6 +1769,10 @@ def readTaggedBuilds(tag, event=None, inherit=False, latest=False, package=None,
                                tables=tables, joins=joins, clauses=clauses, values=locals(),
                                opts=queryOpts)
 
+    if len(taglist) > 1:
+        return _readTaggedBuildsSetBased(taglist, packages, latest, fields, joins, clauses,
+                                         locals(), extra)
+
     builds = []
     seen = {}   # used to enforce the 'latest' option
     for tagid in taglist:
@@ -1523,8 +1798,64 @@ def readTaggedBuilds(tag, event=None, inherit=False, latest=False, package=None,
     return builds
 
 
+def _readTaggedBuildsSetBased(taglist, packages, latest, fields, joins, clauses, values, extra):
+    """Read tagged builds for a whole inheritance chain in a single query
+
+    This gives the same results as querying the tags in taglist one by one, but
+    the per-package 'latest' selection is done by the database (via a window
+    function ranking the builds by inheritance order and tagging event), so
+    only the returned builds are transferred.
+
+    The other arguments are the query components prepared by readTaggedBuilds.
+    """
+    pkg_ids = [pkgid for pkgid, pinfo in packages.items() if not pinfo['blocked']]
+    if not pkg_ids:
+        # everything is blocked (or missing from the package list)
+        return []
+    values = dict(values)
+    values['pkg_ids'] = pkg_ids
+    # the inheritance order, given as (tag_id, position) rows
+    # (the same tag can appear more than once)
+    tag_values = []
+    for n, tag_id in enumerate(taglist):
+        values['tag_%i' % n] = tag_id
+        tag_values.append('(%%(tag_%i)i, %i)' % (n, n))
+    chain = '(VALUES %s) AS chain(tag_id, ord)' % ', '.join(tag_values)
+    joins = ['tag_listing ON tag_listing.tag_id = chain.tag_id'] + joins
+    clauses = [c for c in clauses if c != 'tag_id = %(tagid)s']
+    clauses.append('build.pkg_id IN %(pkg_ids)s')
+    # for duplicate aliases, the last column wins (same as with QueryProcessor)
+    fieldmap = OrderedDict()
+    for column, alias in sorted(fields, key=lambda x: (x[1], x[0])):
+        fieldmap[alias] = column
+    columns = ['%s AS %s' % (column, alias) for alias, column in fieldmap.items()]
+    columns.append('chain.ord AS chain_order')
+    if latest:
+        columns.append('row_number() OVER (PARTITION BY build.pkg_id '
+                       'ORDER BY chain.ord, tag_listing.create_event DESC) AS pkg_rank')
+    inner = QueryProcessor(columns=columns, tables=[chain], joins=joins, clauses=clauses,
+                           values=values)
+    outer_clauses = []
+    if latest:
+        values['latest'] = int(latest)
+        outer_clauses.append('pkg_rank <= %(latest)i')
+    aliases = list(fieldmap.keys()) + ['chain_order']
+    if extra:
+        transform = _fix_extra_field
+    else:
+        transform = None
+    query = QueryProcessor(columns=aliases, aliases=aliases,
+                           tables=['(%s) AS ranked' % inner], clauses=outer_clauses,
+                           values=values, transform=transform,
+                           opts={'order': 'chain_order,-create_event'})
+    builds = query.execute()
+    for build in builds:
+        del build['chain_order']
+    return builds
+
+
 def readTaggedRPMS(tag, package=None, arch=None, event=None, inherit=False, latest=True,
-                   rpmsigs=False, owner=None, type=None, extra=True, draft=None):
+                   rpmsigs=False, owner=None, type=None, extra=True, draft=None, build_ids=None):
     """Returns a list of rpms and builds for specified tag
 
     :param int|str tag: The tag name or ID to search
@@ -1548,8 +1879,11 @@ def readTaggedRPMS(tag, package=None, arch=None, event=None, inherit=False, late
                              - None: no filter (both draft and regular builds)
                              - True: draft only
                              - False: regular only
+    :param list build_ids: only report rpms of these builds. The build selection
+                           and the returned list of builds are not affected.
     :returns: a two-element list. The first element is the list of RPMs, and
-              the second element is the list of builds.
+              the second element is the list of builds. The RPMs are ordered
+              by tag in the inheritance and then by id.
     """
     taglist = [tag]
     if inherit:
@@ -1561,6 +1895,14 @@ def readTaggedRPMS(tag, package=None, arch=None, event=None, inherit=False, late
                               owner=owner, type=type, draft=draft)
     # index builds
     build_idx = dict([(b['build_id'], b) for b in builds])
+    # we only need to fetch rpms of the builds we picked from each tag
+    tag_builds = {}
+    if build_ids is not None:
+        build_ids = set(build_ids)
+    for build in build_idx.values():
+        if build_ids is not None and build['build_id'] not in build_ids:
+            continue
+        tag_builds.setdefault(build['tag_id'], []).append(build['build_id'])
 
     # the following query is run for each tag in the inheritance
     fields = [('rpminfo.name', 'name'),
@@ -1579,8 +1921,9 @@ def readTaggedRPMS(tag, package=None, arch=None, event=None, inherit=False, late
               ]
     tables = ['rpminfo']
     joins = ['tag_listing ON rpminfo.build_id = tag_listing.build_id']
-    clauses = [eventCondition(event, 'tag_listing'), 'tag_id=%(tagid)s']
-    data = {}  # tagid added later
+    clauses = [eventCondition(event, 'tag_listing'), 'tag_id=%(tagid)s',
+               'rpminfo.build_id IN %(build_ids)s']
+    data = {}  # tagid and build_ids added later
     if package:
         joins.append('build ON rpminfo.build_id = build.id')
         joins.append('package ON package.id = build.pkg_id')
@@ -1605,12 +1948,12 @@ def readTaggedRPMS(tag, package=None, arch=None, event=None, inherit=False, late
         query = QueryProcessor(tables=tables, joins=joins, clauses=clauses,
                                columns=[pair[0] for pair in fields],
                                aliases=[pair[1] for pair in fields],
-                               values=data, transform=_fix_rpm_row)
+                               values=data, transform=_fix_rpm_row, opts={'order': 'id'})
     else:
         query = QueryProcessor(tables=tables, joins=joins, clauses=clauses,
                                columns=[pair[0] for pair in fields],
                                aliases=[pair[1] for pair in fields],
-                               values=data)
+                               values=data, opts={'order': 'id'})
 
     # unique constraints ensure that each of these queries will not report
     # duplicate rpminfo entries, BUT since we make the query multiple times,
@@ -1628,7 +1971,11 @@ def readTaggedRPMS(tag, package=None, arch=None, event=None, inherit=False, late
                 continue
             else:
                 tags_seen[tagid] = 1
+            if tagid not in tag_builds:
+                # none of the chosen builds come from this tag
+                continue
             query.values['tagid'] = tagid
+            query.values['build_ids'] = tag_builds[tagid]
             for rpminfo in query.iterate():
                 # note: we're checking against the build list because
                 # it has been filtered by the package list. The tag
@@ -1846,6 +2193,7 @@ def _direct_tag_build(tag, build, user, force=False):
     insert.set(tag_id=tag_id, build_id=build_id)
     insert.make_create(user_id=user_id)
     insert.execute()
+    set_tag_last_change(tag_id)
     koji.plugin.run_callbacks('postTag', tag=tag, build=build, user=user, force=force)
 
 
@@ -1881,6 +2229,8 @@ def _direct_untag_build(tag, build, user, strict=True, force=False):
     if count == 0 and strict:
         nvr = "%(name)s-%(version)s-%(release)s" % build
         raise koji.TagError("build %s not in tag %s" % (nvr, tag['name']))
+    if count:
+        set_tag_last_change(tag['id'])
     koji.plugin.run_callbacks(
         'postUntag', tag=tag, build=build, user=user, force=force, strict=strict)
 
@@ -1945,6 +2295,7 @@ def _grplist_add(taginfo, grpinfo, block, force, **opts):
     insert = InsertProcessor('group_config', data=opts)
     insert.make_create()
     insert.execute()
+    set_tag_last_change(tag['id'])
 
 
 def grplist_remove(taginfo, grpinfo, force=False):
@@ -1987,6 +2338,7 @@ def _grplist_remove(taginfo, grpinfo, force=False):
     update = UpdateProcessor('group_config', values=locals(), clauses=clauses)
     update.make_revoke()
     update.execute()
+    set_tag_last_change(tag_id)
 
 
 def grplist_block(taginfo, grpinfo):
@@ -2022,6 +2374,7 @@ def _grplist_unblock(taginfo, grpinfo):
     update = UpdateProcessor(table, values=locals(), clauses=clauses)
     update.make_revoke()
     update.execute()
+    set_tag_last_change(tag_id)
 
 
 # tag-group-pkg operations
@@ -2092,6 +2445,7 @@ def _grp_pkg_add(taginfo, grpinfo, pkg_name, block, force, **opts):
     insert = InsertProcessor('group_package_listing', data=opts)
     insert.make_create()
     insert.execute()
+    set_tag_last_change(tag['id'])
 
 
 def grp_pkg_remove(taginfo, grpinfo, pkg_name):
@@ -2115,6 +2469,7 @@ def _grp_pkg_remove(taginfo, grpinfo, pkg_name):
                                       'group_id = %(grp_id)s'])
     update.make_revoke()
     update.execute()
+    set_tag_last_change(tag_id)
 
 
 def grp_pkg_block(taginfo, grpinfo, pkg_name):
@@ -2149,6 +2504,7 @@ def _grp_pkg_unblock(taginfo, grpinfo, pkg_name):
     update = UpdateProcessor('group_package_listing', values=locals(), clauses=clauses)
     update.make_revoke()
     update.execute()
+    set_tag_last_change(tag_id)
 
 
 # tag-group-req operations
@@ -2220,6 +2576,7 @@ def _grp_req_add(taginfo, grpinfo, reqinfo, block, force, **opts):
     insert = InsertProcessor('group_req_listing', data=opts)
     insert.make_create()
     insert.execute()
+    set_tag_last_change(tag['id'])
 
 
 def grp_req_remove(taginfo, grpinfo, reqinfo, force=None):
@@ -2246,6 +2603,7 @@ def _grp_req_remove(taginfo, grpinfo, reqinfo, force):
                                       'group_id = %(grp_id)s'])
     update.make_revoke()
     update.execute()
+    set_tag_last_change(tag_id)
 
 
 def grp_req_block(taginfo, grpinfo, reqinfo):
@@ -2282,6 +2640,7 @@ def _grp_req_unblock(taginfo, grpinfo, reqinfo):
     update = UpdateProcessor('group_req_listing', values=locals(), clauses=clauses)
     update.make_revoke()
     update.execute()
+    set_tag_last_change(tag_id)
 
 
 def get_tag_groups(tag, event=None, inherit=True, incl_pkgs=True, incl_reqs=True):
@@ -2582,6 +2941,86 @@ def get_task_descendents(task, childMap=None, request=False):
     return childMap
 
 
+def _encode_task_cursor(states):
+    """Encode a map of task ids to states as an opaque cursor string"""
+    parts = []
+    last = 0
+    for task_id in sorted(states):
+        # ids in a task tree are close together, so the deltas stay short
+        parts.append('%x:%x' % (task_id - last, states[task_id]))
+        last = task_id
+    data = zlib.compress(','.join(parts).encode())
+    return base64.urlsafe_b64encode(data).decode()
+
+
+def _decode_task_cursor(cursor):
+    """Decode a cursor from _encode_task_cursor"""
+    states = {}
+    try:
+        data = zlib.decompress(base64.urlsafe_b64decode(cursor)).decode()
+        task_id = 0
+        for part in data.split(','):
+            if not part:
+                continue
+            delta, state = part.split(':')
+            task_id += int(delta, 16)
+            states[task_id] = int(state, 16)
+    except Exception:
+        raise koji.ParameterError('Invalid cursor: %r' % cursor)
+    return states
+
+
+def get_task_tree_changes(task_ids, cursor=None, request=False):
+    """Report the state changes in the given task trees since the cursor
+
+    The trees are the given tasks with all their descendants. The cursor encodes the
+    state of every task in the trees, so no data is kept on the hub between calls.
+
+    :param list task_ids: ids of the root tasks
+    :param str cursor: cursor from the previous call, None for the first call
+    :param bool request: include the decoded task requests
+    :returns: dict with the new cursor and the list of tasks that are new or
+              changed state since the cursor, sorted by id
+    """
+    task_ids = [convert_value(task_id, cast=int) for task_id in
+                convert_value(task_ids, cast=(list, tuple), check_only=True)]
+    known = {}
+    if cursor is not None:
+        known = _decode_task_cursor(convert_value(cursor, cast=str, check_only=True))
+    result = {'tasks': []}
+    if not task_ids:
+        result['cursor'] = _encode_task_cursor({})
+        return result
+    query = """WITH RECURSIVE tree(id, state) AS (
+        SELECT id, state FROM task WHERE id IN %(task_ids)s
+      UNION
+        SELECT task.id, task.state FROM task JOIN tree ON task.parent = tree.id
+    )
+    SELECT id, state FROM tree"""
+    states = {}
+    for row in _multiRow(query, {'task_ids': task_ids}, ['id', 'state']):
+        states[row['id']] = row['state']
+    result['cursor'] = _encode_task_cursor(states)
+    changed = [task_id for task_id, state in states.items() if known.get(task_id) != state]
+    if not changed:
+        return result
+    fields = Task.fields
+    if request:
+        fields = fields + (('request', 'request'),)
+    columns, aliases = zip(*fields)
+    query = QueryProcessor(columns=list(columns), aliases=list(aliases), tables=['task'],
+                           clauses=['id IN %(ids)s'], values={'ids': changed},
+                           opts={'order': 'id'})
+    result['tasks'] = query.execute()
+    if request:
+        for task in result['tasks']:
+            if task['request'].find('<?xml', 0, 10) == -1:
+                # handle older base64 encoded data
+                task['request'] = base64.b64decode(task['request'])
+            task['request'] = koji.xmlrpcplus.loads(task['request'])[0]
+    return result
+
+
 def maven_tag_archives(tag_id, event_id=None, inherit=True):
     """
     Get Maven artifacts associated with the given tag, following inheritance.
@@ -2678,6 +3117,227 @@ def maven_tag_archives(tag_id, event_id=None, inherit=True):
     return _iter_archives()
 
 
+# write buffer size for the repo_init list files
+REPO_INIT_BUFSIZE = 1024 * 1024
+
+
+def _repo_arches(tinfo, with_separate_src=False):
+    """Return the arches of a repo for the tag"""
+    repo_arches = {}
+    if with_separate_src:
+        repo_arches['src'] = 1
+    if tinfo['arches']:
+        for arch in tinfo['arches'].split():
+            arch = koji.canonArch(arch)
+            if arch in ['src', 'noarch']:
+                continue
+            repo_arches[arch] = 1
+    return repo_arches
+
+
+def _repo_list_entries(rpms, builddirs, repo_arches, with_src=False, with_debuginfo=False,
+                       with_separate_src=False):
+    """Yield the repo list entries for the given rpms
+
+    Each entry is a tuple of the rpm, the list of repo arches it belongs to,
+    its pkglist line and its rpmlist.jsonl line. Rpms that do not belong to
+    any repo arch are skipped.
+    """
+    relpathinfo = koji.PathInfo(topdir='toplink')
+    for rpminfo in rpms:
+        if not with_debuginfo and koji.is_debuginfo(rpminfo['name']):
+            continue
+        arch = rpminfo['arch']
+        if arch == 'src':
+            targets = []
+            if with_src:
+                targets.extend(repo_arches)
+            if with_separate_src:
+                targets.append(arch)
+        elif arch == 'noarch':
+            targets = [a for a in repo_arches if a != 'src']
+        else:
+            repoarch = koji.canonArch(arch)
+            if repoarch not in repo_arches:
+                # Do not create a repo for arches not in the arch list for this tag
+                continue
+            targets = [repoarch]
+        if not targets:
+            continue
+        relpath = "%s/%s\n" % (builddirs[rpminfo['build_id']], relpathinfo.rpm(rpminfo))
+        # must be one line for nl-delimited json
+        rpm_json = json.dumps(rpminfo, indent=None) + '\n'
+        yield rpminfo, targets, relpath, rpm_json
+
+
+def _write_repo_lists(repodir, repo_arches, entries, suffix=''):
+    """Write the pkglist and rpmlist.jsonl files of a repo
+
+    :param str repodir: the repo directory, the arch directories must exist
+    :param dict repo_arches: the repo arches
+    :param entries: iterable of entries from _repo_list_entries
+    :param str suffix: optional suffix for the file names
+    """
+    pkglist = {}
+    rpmlist = {}
+    for repoarch in repo_arches:
+        archdir = joinpath(repodir, repoarch)
+        pkglist[repoarch] = open(joinpath(archdir, 'pkglist' + suffix), 'wt', encoding='utf-8',
+                                 buffering=REPO_INIT_BUFSIZE)
+        rpmlist[repoarch] = open(joinpath(archdir, 'rpmlist.jsonl' + suffix), 'wt',
+                                 encoding='utf-8', buffering=REPO_INIT_BUFSIZE)
+    try:
+        # Each rpm is serialized once, no matter how many arches it is written to.
+        for rpminfo, targets, relpath, rpm_json in entries:
+            for repoarch in targets:
+                pkglist[repoarch].write(relpath)
+                rpmlist[repoarch].write(rpm_json)
+    finally:
+        for repoarch in repo_arches:
+            pkglist[repoarch].close()
+            rpmlist[repoarch].close()
+
+
+def _repo_init_base(tinfo, event_id, repo_arches, latest, options):
+    """Find a previous repo that the lists of a new repo can be derived from
+
+    The previous repo must be a ready repo of the same tag with the same
+    options, arches and inheritance, and there must be no non-versioned
+    updates (e.g. volume changes) for the tags in the inheritance since it
+    was created.
+
+    :param dict tinfo: the tag of the new repo
+    :param int event_id: the event of the new repo
+    :param dict repo_arches: the arches of the new repo
+    :param bool latest: whether the new repo uses only the latest builds
+    :param dict options: the with_* options of the new repo
+    :returns: a dict with the id, directory, tag list and the ids of the
+              packages changed since the previous repo, or None
+    """
+    query = QueryProcessor(tables=['repo'], columns=['id', 'create_event'],
+                           clauses=['tag_id = %(tag_id)i', 'state = %(state)i',
+                                    'dist IS FALSE', 'create_event <= %(event_id)i'],
+                           values={'tag_id': tinfo['id'], 'state': koji.REPO_READY,
+                                   'event_id': event_id},
+                           opts={'order': '-create_event,-id', 'limit': 5})
+    for repo in query.execute():
+        repodir = koji.pathinfo.repo(repo['id'], tinfo['name'])
+        try:
+            with open(joinpath(repodir, 'repo.json'), 'rt', encoding='utf-8') as fp:
+                repo_data = json.load(fp)
+        except (OSError, ValueError):
+            continue
+        if [repo_data.get(key) for key in options] == list(options.values()):
+            break
+    else:
+        return None
+
+    start = repo['create_event']
+    old_tinfo = get_tag(tinfo['id'], event=start)
+    if not old_tinfo:
+        return None
+    if _repo_arches(old_tinfo, options['with_separate_src']) != repo_arches:
+        return None
+    if (not old_tinfo['extra'].get('repo_include_all', False)) != latest:
+        return None
+    inheritance = readFullInheritance(tinfo['id'], event=event_id)
+    if readFullInheritance(tinfo['id'], event=start) != inheritance:
+        return None
+    taglist = [tinfo['id']] + [link['parent_id'] for link in inheritance]
+    values = {'taglist': taglist, 'start': start, 'end': event_id}
+
+    # non-versioned changes are not part of the delta
+    query = QueryProcessor(tables=['tag_updates'], columns=['id'],
+                           clauses=['update_event > %(start)i', 'update_event <= %(end)i',
+                                    'tag_id IN %(taglist)s'],
+                           values=values, opts={'limit': 1})
+    if query.execute():
+        return None
+
+    # the builds chosen for a package only depend on the tag_listing and
+    # tag_packages entries for that package in the inheritance
+    changed = set()
+    for table, column, joins in (
+            ('tag_listing', 'build.pkg_id', ['build ON build.id = tag_listing.build_id']),
+            ('tag_packages', 'tag_packages.package_id', [])):
+        clauses = [
+            '%s.tag_id IN %%(taglist)s' % table,
+            '(%(t)s.create_event > %%(start)i AND %(t)s.create_event <= %%(end)i) OR '
+            '(%(t)s.revoke_event > %%(start)i AND %(t)s.revoke_event <= %%(end)i)' % {'t': table},
+        ]
+        query = QueryProcessor(tables=[table], columns=['DISTINCT %s' % column],
+                               aliases=['package_id'], joins=joins, clauses=clauses,
+                               values=values, opts={'asList': True})
+        changed.update(row[0] for row in query.execute())
+    return {'id': repo['id'], 'dir': repodir, 'taglist': taglist, 'changed_pkgs': changed}
+
+
+def _write_repo_lists_incremental(repodir, repo_arches, base, builds, entries, suffix=''):
+    """Write the pkglist and rpmlist.jsonl files of a repo based on a previous repo
+
+    The entries of builds of unchanged packages are copied from the lists of
+    the previous repo and merged with the entries of the changed packages, so
+    that the result is the same as from _write_repo_lists with all rpms.
+
+    :param str repodir: the repo directory, the arch directories must exist
+    :param dict repo_arches: the repo arches
+    :param dict base: the previous repo, as returned by _repo_init_base
+    :param list builds: the builds of the new repo
+    :param entries: iterable of entries from _repo_list_entries for the
+                    builds of the changed packages
+    :param str suffix: optional suffix for the file names
+    :raises koji.GenericError: if the lists of the previous repo cannot be used
+    """
+    # repo lists are ordered by tag in the inheritance and then by rpm id
+    tag_order = {}
+    for n, tag_id in enumerate(base['taglist']):
+        tag_order.setdefault(tag_id, n)
+    kept_builds = {}
+    build_order = {}
+    for build in builds:
+        build_order[build['build_id']] = tag_order[build['tag_id']]
+        if build['package_id'] not in base['changed_pkgs']:
+            kept_builds[build['build_id']] = build_order[build['build_id']]
+    added = dict([(repoarch, []) for repoarch in repo_arches])
+    for rpminfo, targets, relpath, rpm_json in entries:
+        key = (build_order[rpminfo['build_id']], rpminfo['id'])
+        for repoarch in targets:
+            added[repoarch].append((key, relpath, rpm_json))
+
+    def _kept_entries(old_pkglist, old_rpmlist):
+        last = None
+        for relpath, rpm_json in itertools.zip_longest(old_pkglist, old_rpmlist):
+            if relpath is None or rpm_json is None:
+                raise koji.GenericError('Mismatched repo lists in repo %(id)i' % base)
+            rpminfo = json.loads(rpm_json)
+            order = kept_builds.get(rpminfo['build_id'])
+            if order is None:
+                # build is no longer in the repo, or its package changed
+                continue
+            key = (order, rpminfo['id'])
+            if last is not None and key <= last:
+                raise koji.GenericError('Repo lists of repo %(id)i are not ordered' % base)
+            last = key
+            yield key, relpath, rpm_json
+
+    for repoarch in repo_arches:
+        added[repoarch].sort(key=lambda x: x[0])
+        old_archdir = joinpath(base['dir'], repoarch)
+        archdir = joinpath(repodir, repoarch)
+        with open(joinpath(old_archdir, 'pkglist'), 'rt', encoding='utf-8') as old_pkglist, \
+                open(joinpath(old_archdir, 'rpmlist.jsonl'), 'rt',
+                     encoding='utf-8') as old_rpmlist, \
+                open(joinpath(archdir, 'pkglist' + suffix), 'wt', encoding='utf-8',
+                     buffering=REPO_INIT_BUFSIZE) as pkglist, \
+                open(joinpath(archdir, 'rpmlist.jsonl' + suffix), 'wt', encoding='utf-8',
+                     buffering=REPO_INIT_BUFSIZE) as rpmlist:
+            kept = _kept_entries(old_pkglist, old_rpmlist)
+            for key, relpath, rpm_json in heapq.merge(kept, added[repoarch],
+                                                      key=lambda x: x[0]):
+                pkglist.write(relpath)
+                rpmlist.write(rpm_json)
+
+
 def repo_init(tag, task_id=None, with_src=False, with_debuginfo=False, event=None,
               with_separate_src=False):
     """Create a new repo entry in the INIT state, return full repo data
@@ -2692,15 +3352,7 @@ def repo_init(tag, task_id=None, with_src=False, with_debuginfo=False, event=Non
                               with_debuginfo=with_debuginfo, event=event, repo_id=None,
                               with_separate_src=with_separate_src, task_id=task_id)
     tag_id = tinfo['id']
-    repo_arches = {}
-    if with_separate_src:
-        repo_arches['src'] = 1
-    if tinfo['arches']:
-        for arch in tinfo['arches'].split():
-            arch = koji.canonArch(arch)
-            if arch in ['src', 'noarch']:
-                continue
-            repo_arches[arch] = 1
+    repo_arches = _repo_arches(tinfo, with_separate_src)
     repo_id = nextval('repo_id_seq')
     if event is None:
         event_id = _singleValue("SELECT get_event()")
@@ -2719,6 +3371,14 @@ def repo_init(tag, task_id=None, with_src=False, with_debuginfo=False, event=Non
     # Note: the repo_include_all option is not recommended for common use
     #       see https://pagure.io/koji/issue/588 for background
     rpms, builds = readTaggedRPMS(tag_id, event=event_id, inherit=True, latest=latest)
+    list_opts = {
+        'with_src': bool(with_src),
+        'with_separate_src': bool(with_separate_src),
+        'with_debuginfo': bool(with_debuginfo),
+    }
+    base = None
+    if context.opts.get('IncrementalRepoInit') or context.opts.get('IncrementalRepoVerify'):
+        base = _repo_init_base(tinfo, event_id, repo_arches, latest, list_opts)
 
     groups = readTagGroups(tag_id, event=event_id, inherit=True)
     blocks = [pkg for pkg in readPackageList(tag_id, event=event_id, inherit=True,
@@ -2755,8 +3415,6 @@ def repo_init(tag, task_id=None, with_src=False, with_debuginfo=False, event=Non
         relpath = relpathinfo.build(build)
         builddirs[build['id']] = relpath.lstrip('/')
     # generate pkglist and rpmlist files
-    pkglist = {}
-    rpmlist = {}
     for repoarch in repo_arches:
         archdir = joinpath(repodir, repoarch)
         koji.ensuredir(archdir)
@@ -2764,44 +3422,50 @@ def repo_init(tag, task_id=None, with_src=False, with_debuginfo=False, event=Non
         top_relpath = os.path.relpath(koji.pathinfo.topdir, archdir)
         top_link = joinpath(archdir, 'toplink')
         os.symlink(top_relpath, top_link)
-        pkglist[repoarch] = open(joinpath(archdir, 'pkglist'), 'wt', encoding='utf-8')
-        rpmlist[repoarch] = open(joinpath(archdir, 'rpmlist.jsonl'), 'wt', encoding='utf-8')
-    # NOTE - rpms is a generator
-    for rpminfo in rpms:
-        if not with_debuginfo and koji.is_debuginfo(rpminfo['name']):
-            continue
-        relpath = "%s/%s\n" % (builddirs[rpminfo['build_id']], relpathinfo.rpm(rpminfo))
-        rpm_json = json.dumps(rpminfo, indent=None)
-        # must be one line for nl-delimited json
-        arch = rpminfo['arch']
-        if arch == 'src':
-            if with_src:
-                for repoarch in repo_arches:
-                    pkglist[repoarch].write(relpath)
-                    rpmlist[repoarch].write(rpm_json)
-                    rpmlist[repoarch].write('\n')
-            if with_separate_src:
-                pkglist[arch].write(relpath)
-                rpmlist[arch].write(rpm_json)
-                rpmlist[arch].write('\n')
-        elif arch == 'noarch':
+
+    def _write_incremental(suffix=''):
+        # only the rpms of the changed packages are read from the db
+        changed = [b['build_id'] for b in builds if b['package_id'] in base['changed_pkgs']]
+        new_rpms = []
+        if changed:
+            new_rpms = readTaggedRPMS(tag_id, event=event_id, inherit=True, latest=latest,
+                                      build_ids=changed)[0]
+        entries = _repo_list_entries(new_rpms, builddirs, repo_arches, **list_opts)
+        try:
+            _write_repo_lists_incremental(repodir, repo_arches, base, builds, entries,
+                                          suffix=suffix)
+        except (koji.GenericError, OSError, ValueError) as e:
+            logger.warning('Unable to derive repo %i from repo %i: %s', repo_id, base['id'], e)
+            return False
+        return True
+
+    if base and not context.opts.get('IncrementalRepoVerify'):
+        done = _write_incremental()
+    else:
+        done = False
+    if not done:
+        # NOTE - rpms is a generator, backed by a server side cursor, so we never
+        # hold the full rpm list in memory.
+        _write_repo_lists(repodir, repo_arches,
+                          _repo_list_entries(rpms, builddirs, repo_arches, **list_opts))
+        if base and context.opts.get('IncrementalRepoVerify'):
+            # the full lists are used, the incremental ones are only compared
+            suffix = '.incremental'
+            verified = _write_incremental(suffix)
             for repoarch in repo_arches:
-                if repoarch == 'src':
-                    continue
-                pkglist[repoarch].write(relpath)
-                rpmlist[repoarch].write(rpm_json)
-                rpmlist[repoarch].write('\n')
-        else:
-            repoarch = koji.canonArch(arch)
-            if repoarch not in repo_arches:
-                # Do not create a repo for arches not in the arch list for this tag
-                continue
-            pkglist[repoarch].write(relpath)
-            rpmlist[repoarch].write(rpm_json)
-            rpmlist[repoarch].write('\n')
-    for repoarch in repo_arches:
-        pkglist[repoarch].close()
-        rpmlist[repoarch].close()
+                for fn in ('pkglist', 'rpmlist.jsonl'):
+                    path = joinpath(repodir, repoarch, fn)
+                    if not os.path.exists(path + suffix):
+                        continue
+                    if verified and not filecmp.cmp(path, path + suffix, shallow=False):
+                        logger.error('Incremental %s for repo %i differs from full '
+                                     'generation (based on repo %i)',
+                                     joinpath(repoarch, fn), repo_id, base['id'])
+                        verified = False
+                    os.unlink(path + suffix)
+            if verified:
+                logger.info('Incremental lists for repo %i verified (based on repo %i)',
+                            repo_id, base['id'])
 
     # write blocked package lists
     for repoarch in repo_arches:
@@ -3091,31 +3755,49 @@ def tag_changed_since_event(event, taglist):
     Returns: True or False
     """
     data = locals().copy()
-    # first check the tag_updates table
-    query = QueryProcessor(tables=['tag_updates'], columns=['id'],
-                           clauses=['update_event > %(event)i', 'tag_id IN %(taglist)s'],
+    query = QueryProcessor(tables=['tag_last_change'], columns=['tag_id'],
+                           clauses=['event_id > %(event)i', 'tag_id IN %(taglist)s'],
                            values=data, opts={'limit': 1})
-    if query.execute():
-        return True
-    # also check these versioned tables
-    tables = (
-        'tag_listing',
-        'tag_inheritance',
-        'tag_config',
-        'tag_extra',
-        'tag_packages',
-        'tag_external_repos',
-        'group_package_listing',
-        'group_req_listing',
-        'group_config',
-    )
-    for table in tables:
-        query = QueryProcessor(tables=[table], columns=['tag_id'], values=data,
-                               clauses=['create_event > %(event)i OR revoke_event > %(event)i',
-                                        'tag_id IN %(taglist)s'], opts={'limit': 1})
-        if query.execute():
-            return True
-    return False
+    return bool(query.execute())
+
+
+def tags_changed_since_events(checks):
+    """Report which of several tag lists have changes since their events
+
+    This is a bulk version of tag_changed_since_event. The repo daemon uses it
+    to check all of its repos at once. Like tag_changed_since_event, it does
+    not figure inheritance.
+
+    :param list checks: list of [key, event, taglist] entries, where key is
+                        an arbitrary identifier of the entry (e.g. a repo id)
+    :returns: list of the keys of the entries with changes
+    """
+    if not isinstance(checks, (list, tuple)):
+        raise koji.ParameterError('Invalid type for checks: %s' % builtins.type(checks))
+    entries = []
+    tags = set()
+    for check in checks:
+        if not isinstance(check, (list, tuple)) or len(check) != 3:
+            raise koji.ParameterError('Invalid check entry: %r' % (check,))
+        key, event, taglist = check
+        event = convert_value(event, cast=int)
+        taglist = [convert_value(tag_id, cast=int) for tag_id in taglist]
+        entries.append((key, event, taglist))
+        tags.update(taglist)
+    if not tags:
+        return []
+    values = {'tags': list(tags), 'event': min([entry[1] for entry in entries])}
+    query = QueryProcessor(tables=['tag_last_change'], columns=['tag_id', 'event_id'],
+                           clauses=['event_id > %(event)i', 'tag_id IN %(tags)s'],
+                           values=values)
+    last_change = dict([(row['tag_id'], row['event_id']) for row in query.execute()])
+    changed = []
+    for key, event, taglist in entries:
+        for tag_id in taglist:
+            if last_change.get(tag_id, 0) > event:
+                changed.append(key)
+                break
+    return changed
 
 
 def set_tag_update(tag_id, utype, event_id=None, user_id=None):
@@ -3132,6 +3814,58 @@ def set_tag_update(tag_id, utype, event_id=None, user_id=None):
             'updater_id': user_id}
     insert = InsertProcessor('tag_updates', data=data)
     insert.execute()
+    set_tag_last_change(tag_id, event_id=event_id)
+
+
+def set_tag_last_change(tag_ids, event_id=None):
+    """Record a change of the given tags in the tag_last_change table
+
+    The table holds the last event that changed the content of each tag, via
+    tag_listing, tag_inheritance, tag_config, tag_extra, tag_packages,
+    tag_external_repos, the group tables or tag_updates. Any code changing
+    these must call this function, since tag_changed_since_event relies on it.
+
+    The changes are only collected here. They are written by
+    flush_tag_last_change just before the request is committed, so the rows of
+    tag_last_change are not locked while the rest of the request runs.
+
+    :param tag_ids: tag id or list of tag ids
+    :param int event_id: event of the change, the current event by default
+    """
+    if isinstance(tag_ids, int):
+        tag_ids = [tag_ids]
+    if event_id is None:
+        event_id = get_event()
+    pending = getattr(context, 'tag_last_change', None)
+    if pending is None:
+        pending = context.tag_last_change = []
+    pending.extend([(tag_id, event_id) for tag_id in tag_ids])
+
+
+def flush_tag_last_change():
+    """Write the tag changes collected by set_tag_last_change
+
+    All the rows are upserted by a single statement, in tag order. As every
+    request does this last, concurrent requests cannot deadlock on them.
+    """
+    pending = getattr(context, 'tag_last_change', None)
+    if not pending:
+        return
+    context.tag_last_change = []
+    changes = {}
+    for tag_id, event_id in pending:
+        if event_id > changes.get(tag_id, 0):
+            changes[tag_id] = event_id
+    tag_ids = sorted(changes)
+    event_ids = [changes[tag_id] for tag_id in tag_ids]
+    insert = """INSERT INTO tag_last_change (tag_id, event_id)
+    SELECT tag.id, changes.event_id
+    FROM unnest(%(tag_ids)s::INTEGER[], %(event_ids)s::INTEGER[]) AS changes(tag_id, event_id)
+    JOIN tag ON tag.id = changes.tag_id
+    ORDER BY tag.id
+    ON CONFLICT (tag_id) DO UPDATE
+    SET event_id = GREATEST(tag_last_change.event_id, EXCLUDED.event_id)"""
+    _dml(insert, {'tag_ids': tag_ids, 'event_ids': event_ids})
 
 
 def create_build_target(name, build_tag, dest_tag):
@@ -3493,6 +4227,7 @@ def _create_tag(name, parent=None, arches=None, perm=None, locked=False, maven_s
             insert = InsertProcessor('tag_extra', data=data)
             insert.make_create()
             insert.execute()
+    set_tag_last_change(tag_id)
 
     if parent_id:
         data = {'parent_id': parent_id,
@@ -3722,6 +4457,7 @@ def _edit_tag(tagInfo, **kwargs):
                 insert = InsertProcessor('tag_extra', data=data)
                 insert.make_create()
                 insert.execute()
+                changed = True
 
     if 'block_extra' in kwargs:
         for key in kwargs['block_extra']:
@@ -3739,6 +4475,7 @@ def _edit_tag(tagInfo, **kwargs):
             insert = InsertProcessor('tag_extra', data=data)
             insert.make_create()
             insert.execute()
+            changed = True
 
     # handle remove_extra data
     if 'remove_extra' in kwargs:
@@ -3756,6 +4493,10 @@ def _edit_tag(tagInfo, **kwargs):
                                                                         'key=%(key)s'])
             update.make_revoke()
             update.execute()
+            changed = True
+
+    if changed:
+        set_tag_last_change(tag['id'])
 
 
 def old_edit_tag(tagInfo, name, arches, locked, permissionID, extra=None):
@@ -3783,6 +4524,11 @@ def _delete_tag(tagInfo):
 
     tag = get_tag(tagInfo, strict=True)
     tagID = tag['id']
+    # child tags lose their inheritance link
+    query = QueryProcessor(tables=['tag_inheritance'], columns=['tag_id'],
+                           clauses=['parent_id = %(tagID)i', 'active = TRUE'],
+                           values={'tagID': tagID}, opts={'asList': True})
+    changed_tags = [tagID] + [row[0] for row in query.execute()]
 
     _tagDelete('tag_config', tagID)
     # technically, to 'delete' the tag we only have to revoke the tag_config entry
@@ -3790,6 +4536,7 @@ def _delete_tag(tagInfo):
     _tagDelete('tag_extra', tagID)
     _tagDelete('tag_inheritance', tagID)
     _tagDelete('tag_inheritance', tagID, 'parent_id')
+    inheritance_cache.invalidate()
     _tagDelete('build_target_config', tagID, 'build_tag')
     _tagDelete('build_target_config', tagID, 'dest_tag')
     _tagDelete('tag_listing', tagID)
@@ -3799,6 +4546,7 @@ def _delete_tag(tagInfo):
     _tagDelete('group_config', tagID)
     _tagDelete('group_req_listing', tagID)
     _tagDelete('group_package_listing', tagID)
+    set_tag_last_change(changed_tags)
     # note: we do not delete the entry in the tag table (we can't actually, it
     # is still referenced by the revoked rows).
     # note: there is no need to do anything with the repo entries that reference tagID
@@ -3979,6 +4727,7 @@ def add_external_repo_to_tag(tag_info, repo_info, priority, merge_mode='koji', a
                merge_mode=merge_mode, arches=arches)
     insert.make_create()
     insert.execute()
+    set_tag_last_change(tag_id)
 
 
 def remove_external_repo_from_tag(tag_info, repo_info):
@@ -3999,6 +4748,7 @@ def remove_external_repo_from_tag(tag_info, repo_info):
                              clauses=["tag_id = %(tag_id)i", "external_repo_id = %(repo_id)i"])
     update.make_revoke()
     update.execute()
+    set_tag_last_change(tag_id)
 
 
 def edit_tag_external_repo(tag_info, repo_info, priority=None, merge_mode=None, arches=None):
@@ -4662,26 +5412,87 @@ def get_rpm(rpminfo, strict=False, multi=False):
       3. external rpms (highest rpm id)
     OTOH if multi is True, then all matching results are returned as a list
     """
+    data = _get_rpm_data(rpminfo)
+    rpms = _get_rpms(data)
+    if multi:
+        return rpms
+    return _pick_rpm(rpms, data, strict)
+
+
+def lookup_rpms(rpminfos, strict=False):
+    """Get information about many rpms at once
+
+    This is the bulk version of get_rpm, for e.g. buildroot listings. All the
+    rpms are looked up with a few queries rather than one per rpm, and the
+    same preference is applied when an entry matches several rpms (draft and
+    external rpms).
+
+    :param list rpminfos: rpms in any of the forms that get_rpm accepts
+    :param bool strict: raise an error if an rpm does not exist
+    :returns: list of maps like get_rpm returns, in the same order as
+              rpminfos, with None for the missing rpms if strict is False
+    """
+    entries = [_get_rpm_data(rpminfo) for rpminfo in rpminfos]
+    repo_ids = {}
+    ids = set()
+    nvras = set()
+    for data in entries:
+        location = data.get('location')
+        if location and location not in repo_ids:
+            repo_ids[location] = get_external_repo_id(location, strict=True)
+        if 'id' in data:
+            ids.add(int(data['id']))
+        else:
+            nvras.add((data['name'], data['version'], data['release'], data['arch']))
+
+    by_id = {}
+    by_nvra = {}
+    for clause, keys in (
+            ('rpminfo.id IN %(keys)s', sorted(ids)),
+            ('(rpminfo.name, rpminfo.version, rpminfo.release, rpminfo.arch) IN %(keys)s',
+             sorted(nvras))):
+        for i in range(0, len(keys), 1000):
+            query = _get_rpms_query([clause], {'keys': keys[i:i + 1000]})
+            for rinfo in query.execute():
+                by_id[rinfo['id']] = rinfo
+                nvra = (rinfo['name'], rinfo['version'], rinfo['release'], rinfo['arch'])
+                by_nvra.setdefault(nvra, []).append(rinfo)
+
+    results = []
+    for data in entries:
+        if 'id' in data:
+            rinfo = by_id.get(int(data['id']))
+            rpms = [rinfo] if rinfo else []
+        else:
+            rpms = by_nvra.get((data['name'], data['version'], data['release'], data['arch']),
+                               [])
+        if data.get('location'):
+            repo_id = repo_ids[data['location']]
+            rpms = [r for r in rpms if r['external_repo_id'] == repo_id]
+        results.append(_pick_rpm(rpms, data, strict))
+    return results
+
+
+def _get_rpm_data(rpminfo):
+    """Convert the rpminfo argument of get_rpm to the map used for the lookup"""
     # we can look up by id or NVRA
-    data = None
     if isinstance(rpminfo, int):
-        data = {'id': rpminfo}
+        return {'id': rpminfo}
     elif isinstance(rpminfo, str):
         # either nvra or id as a string
         try:
-            data = {'id': int(rpminfo)}
+            return {'id': int(rpminfo)}
         except ValueError:
-            data = koji.parse_NVRA(rpminfo)
+            return koji.parse_NVRA(rpminfo)
     elif isinstance(rpminfo, dict):
-        data = rpminfo.copy()
+        return rpminfo.copy()
     else:
         raise koji.GenericError("Invalid type for rpminfo: %r" % type(rpminfo))
 
-    rpms = _get_rpms(data)
-    if multi:
-        return rpms
 
-    # otherwise make sure we have a single rpm
+def _pick_rpm(rpms, data, strict=False):
+    """Pick the preferred rpm out of the matches for data (see get_rpm)"""
+    # make sure we have a single rpm
     if not rpms:
         if strict:
             raise koji.GenericError("No such rpm: %r" % data)
@@ -4689,7 +5500,7 @@ def get_rpm(rpminfo, strict=False, multi=False):
     elif len(rpms) == 1:
         return rpms[0]
     else:
-        # pick our preferred, as described above
+        # pick our preferred, as described in get_rpm
         nondraft = None
         draft = None
         external = None
@@ -4713,6 +5524,20 @@ def get_rpm(rpminfo, strict=False, multi=False):
 
 def _get_rpms(data):
     """Helper function for get_rpm"""
+    clauses = []
+    if 'id' in data:
+        clauses.append("rpminfo.id=%(id)s")
+    else:
+        clauses.append("rpminfo.name=%(name)s AND version=%(version)s "
+                       "AND release=%(release)s AND arch=%(arch)s")
+    if 'location' in data:
+        data['external_repo_id'] = get_external_repo_id(data['location'], strict=True)
+        clauses.append("""external_repo_id = %(external_repo_id)s""")
+    return _get_rpms_query(clauses, data).execute()
+
+
+def _get_rpms_query(clauses, values):
+    """Return the rpminfo query for get_rpm and lookup_rpms"""
     fields = (
         ('rpminfo.id', 'id'),
         ('build_id', 'build_id'),
@@ -4731,21 +5556,10 @@ def _get_rpms(data):
         ('metadata_only', 'metadata_only'),
         ('extra', 'extra'),
     )
-    clauses = []
-    if 'id' in data:
-        clauses.append("rpminfo.id=%(id)s")
-    else:
-        clauses.append("rpminfo.name=%(name)s AND version=%(version)s "
-                       "AND release=%(release)s AND arch=%(arch)s")
-    if 'location' in data:
-        data['external_repo_id'] = get_external_repo_id(data['location'], strict=True)
-        clauses.append("""external_repo_id = %(external_repo_id)s""")
     joins = ['external_repo ON rpminfo.external_repo_id = external_repo.id']
-
-    query = QueryProcessor(columns=[f[0] for f in fields], aliases=[f[1] for f in fields],
-                           tables=['rpminfo'], joins=joins, clauses=clauses,
-                           values=data, transform=_fix_rpm_row)
-    return query.execute()
+    return QueryProcessor(columns=[f[0] for f in fields], aliases=[f[1] for f in fields],
+                          tables=['rpminfo'], joins=joins, clauses=clauses,
+                          values=values, transform=_fix_rpm_row)
 
 
 def list_rpms(buildID=None, buildrootID=None, imageID=None, componentBuildrootID=None, hostID=None,
@@ -6993,9 +7807,11 @@ class CG_Importer(object):
     def match_components(self, components):
         rpms = []
         files = []
+        # the rpms are looked up together
+        rpm_matches = iter(self.match_rpms([c for c in components if c['type'] == 'rpm']))
         for comp in components:
             if comp['type'] == 'rpm':
-                match = self.match_rpm(comp)
+                match = next(rpm_matches)
                 if match:
                     rpms.append(match)
             elif comp['type'] == 'file':
@@ -7026,28 +7842,39 @@ class CG_Importer(object):
     log_error = functools.partialmethod(log, level=logging.ERROR)
 
     def match_rpm(self, comp):
-        # TODO: do we allow inclusion of external rpms?
-        if 'location' in comp:
-            raise koji.GenericError("External rpms not allowed")
-        if 'id' in comp:
-            # not in metadata spec, and will confuse get_rpm
-            raise koji.GenericError("Unexpected 'id' field in component")
+        return self.match_rpms([comp])[0]
+
+    def match_rpms(self, comps):
+        """Match a list of rpm components, with bulk lookups
+
+        :returns: a list with the rpm info or None for each component
+        """
+        for comp in comps:
+            # TODO: do we allow inclusion of external rpms?
+            if 'location' in comp:
+                raise koji.GenericError("External rpms not allowed")
+            if 'id' in comp:
+                # not in metadata spec, and will confuse get_rpm
+                raise koji.GenericError("Unexpected 'id' field in component")
+        results = []
         # rpm is no more unique with NVRA as draft build is introduced
-        rinfo = get_rpm(comp, strict=False)
-        if not rinfo:
-            # XXX - this is a temporary workaround until we can better track external refs
-            self.log_warning("IGNORING unmatched rpm component: %r" % comp)
-            return None
-        # TODO: we should consider how to handle them once draft build is enabled for CG
-        reject_draft(rinfo, is_rpm=True)
-        if rinfo['payloadhash'] != comp['sigmd5']:
-            # XXX - this is a temporary workaround until we can better track external refs
-            self.log_warning("IGNORING rpm component (md5 mismatch): %r" % comp)
-            # nvr = "%(name)s-%(version)s-%(release)s" % rinfo
-            # raise koji.GenericError("md5sum mismatch for %s: %s != %s"
-            #            % (nvr, comp['sigmd5'], rinfo['payloadhash']))
-        # TODO - should we check the signature field?
-        return rinfo
+        for comp, rinfo in zip(comps, lookup_rpms(comps)):
+            if not rinfo:
+                # XXX - this is a temporary workaround until we can better track external refs
+                self.log_warning("IGNORING unmatched rpm component: %r" % comp)
+                results.append(None)
+                continue
+            # TODO: we should consider how to handle them once draft build is enabled for CG
+            reject_draft(rinfo, is_rpm=True)
+            if rinfo['payloadhash'] != comp['sigmd5']:
+                # XXX - this is a temporary workaround until we can better track external refs
+                self.log_warning("IGNORING rpm component (md5 mismatch): %r" % comp)
+                # nvr = "%(name)s-%(version)s-%(release)s" % rinfo
+                # raise koji.GenericError("md5sum mismatch for %s: %s != %s"
+                #            % (nvr, comp['sigmd5'], rinfo['payloadhash']))
+            # TODO - should we check the signature field?
+            results.append(rinfo)
+        return results
 
     def match_file(self, comp):
         # hmm, how do we look up archives?
@@ -7232,13 +8059,13 @@ class CG_Importer(object):
         archives = fileinfo['hub.archives']
 
         if rpmlist:
-            insert = BulkInsertProcessor('archive_rpm_components')
+            insert = BulkInsertProcessor('archive_rpm_components', copy=True)
             for rpminfo in rpmlist:
                 insert.add_record(archive_id=archive_id, rpm_id=rpminfo['id'])
             insert.execute()
 
         if archives:
-            insert = BulkInsertProcessor('archive_components')
+            insert = BulkInsertProcessor('archive_components', copy=True)
             for archiveinfo in archives:
                 insert.add_record(archive_id=archive_id, component_id=archiveinfo['id'])
             insert.execute()
@@ -7260,25 +8087,7 @@ def add_external_rpm(rpminfo, external_repo, strict=True):
 
     # [!] Calling function should perform access checks
 
-    # sanity check rpminfo
-    dtypes = (
-        ('name', str),
-        ('version', str),
-        ('release', str),
-        ('epoch', (int, type(None))),
-        ('arch', str),
-        ('payloadhash', str),
-        ('size', int),
-        ('buildtime', int))
-    for field, allowed in dtypes:
-        if field not in rpminfo:
-            raise koji.GenericError("%s field missing: %r" % (field, rpminfo))
-        if not isinstance(rpminfo[field], allowed):
-            # this will catch unwanted NULLs
-            raise koji.GenericError("Invalid value for %s: %r" % (field, rpminfo[field]))
-    # strip extra fields
-    rpminfo = dslice(rpminfo, [x[0] for x in dtypes])
-    # TODO: more sanity checks for payloadhash
+    rpminfo = _check_external_rpminfo(rpminfo)
 
     def check_dup():
         # Check to see if we have it
@@ -7286,14 +8095,11 @@ def add_external_rpm(rpminfo, external_repo, strict=True):
         data['location'] = external_repo
         previous = get_rpm(data, strict=False)
         if previous:
-            disp = "%(name)s-%(version)s-%(release)s.%(arch)s@%(external_repo_name)s" % previous
             if strict:
-                raise koji.GenericError("external rpm already exists: %s" % disp)
-            elif data['payloadhash'] != previous['payloadhash']:
-                raise koji.GenericError("hash changed for external rpm: %s (%s -> %s)"
-                                        % (disp, previous['payloadhash'], data['payloadhash']))
-            else:
-                return previous
+                raise koji.GenericError("external rpm already exists: %s"
+                                        % _external_rpm_disp(previous))
+            _check_external_rpm_hash(previous, data)
+            return previous
 
     previous = check_dup()
     if previous:
@@ -7321,6 +8127,66 @@ def add_external_rpm(rpminfo, external_repo, strict=True):
     return get_rpm(data['id'])
 
 
+def _check_external_rpminfo(rpminfo):
+    """Sanity check the rpminfo of an external rpm, return it without extra fields"""
+    dtypes = (
+        ('name', str),
+        ('version', str),
+        ('release', str),
+        ('epoch', (int, type(None))),
+        ('arch', str),
+        ('payloadhash', str),
+        ('size', int),
+        ('buildtime', int))
+    for field, allowed in dtypes:
+        if field not in rpminfo:
+            raise koji.GenericError("%s field missing: %r" % (field, rpminfo))
+        if not isinstance(rpminfo[field], allowed):
+            # this will catch unwanted NULLs
+            raise koji.GenericError("Invalid value for %s: %r" % (field, rpminfo[field]))
+    # TODO: more sanity checks for payloadhash
+    # strip extra fields
+    return dslice(rpminfo, [x[0] for x in dtypes])
+
+
+def _external_rpm_disp(rinfo):
+    return "%(name)s-%(version)s-%(release)s.%(arch)s@%(external_repo_name)s" % rinfo
+
+
+def _check_external_rpm_hash(previous, rpminfo):
+    if rpminfo['payloadhash'] != previous['payloadhash']:
+        raise koji.GenericError("hash changed for external rpm: %s (%s -> %s)"
+                                % (_external_rpm_disp(previous), previous['payloadhash'],
+                                   rpminfo['payloadhash']))
+
+
+def lookup_rpm_list(rpmlist):
+    """Look up the rpms of a buildroot or image listing
+
+    The entries with a location are external rpms, which are added if they
+    are not known yet, as add_external_rpm(strict=False) does. The other rpms
+    must exist. The lookups are done in bulk (see lookup_rpms).
+
+    :param list rpmlist: list of rpm info maps
+    :returns: list of maps like get_rpm returns, in the same order
+    """
+    for an_rpm in rpmlist:
+        if an_rpm.get('location'):
+            _check_external_rpminfo(an_rpm)
+    results = []
+    for an_rpm, rinfo in zip(rpmlist, lookup_rpms(rpmlist)):
+        location = an_rpm.get('location')
+        if rinfo is None:
+            if not location:
+                raise koji.GenericError("No such rpm: %r" % an_rpm)
+            # will add if missing
+            rinfo = add_external_rpm(an_rpm, location, strict=False)
+        elif location:
+            _check_external_rpm_hash(rinfo, an_rpm)
+        results.append(rinfo)
+    return results
+
+
 def import_build_log(fn, buildinfo, subdir=None):
     """Move a logfile related to a build to the right place"""
     logdir = koji.pathinfo.build_logs(buildinfo)
@@ -8192,12 +9058,18 @@ def calculate_chsum(path, checksum_types):
     return msum.to_hexdigest()
 
 
-def write_signed_rpm(an_rpm, sigkey, force=False):
-    """Write a signed copy of the rpm"""
+def _rpm_checksum_types():
+    """Return the checksum types of signed rpms (RPMDefaultChecksums)"""
     checksum_types = context.opts.get('RPMDefaultChecksums').split()
     for ch_type in checksum_types:
         if ch_type not in koji.CHECKSUM_TYPES:
             raise koji.GenericError(f"Checksum_type {ch_type} isn't supported")
+    return checksum_types
+
+
+def write_signed_rpm(an_rpm, sigkey, force=False):
+    """Write a signed copy of the rpm"""
+    checksum_types = _rpm_checksum_types()
 
     sigkey = sigkey.lower()
     rinfo = get_rpm(an_rpm, strict=True)
@@ -8238,6 +9110,138 @@ def write_signed_rpm(an_rpm, sigkey, force=False):
     create_rpm_checksum(rpm_id, sigkey, msum.to_hexdigest())
 
 
+def write_signed_rpms(rpms, sigkey, force=False):
+    """Write signed copies of many rpms
+
+    This is the bulk version of write_signed_rpm. The rpms are looked up with a
+    few queries, the copies are written by a pool of WriteSignedRPMThreads
+    threads, and the checksums are stored at once at the end. The data after
+    the signature header is copied with copy_file_range where possible.
+
+    :param rpms: list of rpms (ids, nvras or rpminfo maps), or a build, to
+                 write all of its rpms
+    :param str sigkey: the signature key
+    :param bool force: rewrite the signed copies which already exist
+    :returns: the number of rpms
+    """
+    checksum_types = _rpm_checksum_types()
+    sigkey = sigkey.lower()
+    if isinstance(rpms, (list, tuple)):
+        rinfos = lookup_rpms(rpms, strict=True)
+    else:
+        binfo = get_build(rpms, strict=True)
+        rinfos = list_rpms(buildID=binfo['id'])
+    # skip duplicates
+    rinfos = list({rinfo['id']: rinfo for rinfo in rinfos}.values())
+    if not rinfos:
+        return 0
+    for rinfo in rinfos:
+        if rinfo['external_repo_id']:
+            raise koji.GenericError("Not an internal rpm: %s (from %s)"
+                                    % (rinfo['id'], rinfo['external_repo_name']))
+
+    # the build directories
+    query = QueryProcessor(tables=['build'],
+                           columns=['build.id', 'package.name', 'build.version',
+                                    'build.release', 'volume.name'],
+                           aliases=['id', 'name', 'version', 'release', 'volume_name'],
+                           joins=['package ON build.pkg_id = package.id',
+                                  'volume ON build.volume_id = volume.id'],
+                           clauses=['build.id IN %(build_ids)s'],
+                           values={'build_ids': sorted({r['build_id'] for r in rinfos})})
+    builddirs = {binfo['id']: koji.pathinfo.build(binfo) for binfo in query.execute()}
+
+    # make sure we have the signatures in the db
+    query = QueryProcessor(tables=['rpmsigs'], columns=['rpm_id'],
+                           clauses=['rpm_id IN %(rpm_ids)s', 'sigkey=%(sigkey)s'],
+                           values={'rpm_ids': [r['id'] for r in rinfos], 'sigkey': sigkey},
+                           opts={'asList': True})
+    signed_ids = {row[0] for row in query.execute()}
+
+    jobs = []
+    for rinfo in rinfos:
+        builddir = builddirs[rinfo['build_id']]
+        rpm_path = "%s/%s" % (builddir, koji.pathinfo.rpm(rinfo))
+        if not os.path.exists(rpm_path):
+            raise koji.GenericError("No such path: %s" % rpm_path)
+        if not os.path.isfile(rpm_path):
+            raise koji.GenericError("Not a regular file: %s" % rpm_path)
+        if rinfo['id'] not in signed_ids:
+            nvra = "%(name)s-%(version)s-%(release)s.%(arch)s" % rinfo
+            raise koji.GenericError("No cached signature for package %s, key %s"
+                                    % (nvra, sigkey))
+        sigpath = "%s/%s" % (builddir, koji.pathinfo.sighdr(rinfo, sigkey))
+        signedpath = "%s/%s" % (builddir, koji.pathinfo.signed(rinfo, sigkey))
+        jobs.append((rpm_path, sigpath, signedpath, checksum_types, force))
+
+    results = _run_threaded(_write_signed_copy, jobs,
+                            context.opts.get('WriteSignedRPMThreads', 4))
+    create_rpm_checksums(sigkey, {rinfo['id']: chsum_dict
+                                  for rinfo, chsum_dict in zip(rinfos, results)})
+    return len(rinfos)
+
+
+def _write_signed_copy(rpm_path, sigpath, signedpath, checksum_types, force):
+    """Write a signed copy of an rpm and return its checksums
+
+    An existing copy is only checksummed, unless force is true.
+    """
+    if os.path.exists(signedpath):
+        if not force:
+            return calculate_chsum(signedpath, checksum_types)
+        os.unlink(signedpath)
+    with open(sigpath, 'rb') as fo:
+        sighdr = fo.read()
+    msum = MultiSum(checksum_types)
+    koji.splice_rpm_sighdr(sighdr, rpm_path, dst=signedpath, bufsize=1024 ** 2,
+                           callback=msum.update, copy_range=True)
+    return msum.to_hexdigest()
+
+
+def _run_threaded(func, jobs, threads):
+    """Call func for each tuple of args in jobs, in a pool of threads
+
+    The jobs are fed to the threads through a bounded queue. The functions
+    must not use the database, whose connection belongs to the request thread.
+
+    :returns: list of the results, in the order of jobs
+    :raises: the first error of func, once all the threads stopped
+    """
+    if threads <= 1 or len(jobs) <= 1:
+        return [func(*args) for args in jobs]
+    results = [None] * len(jobs)
+    errors = []
+    pending = queue.Queue(maxsize=threads * 2)
+
+    def worker():
+        while True:
+            item = pending.get()
+            if item is None:
+                return
+            if errors:
+                # drain the queue
+                continue
+            i, args = item
+            try:
+                results[i] = func(*args)
+            except Exception as e:
+                errors.append(e)
+
+    workers = [threading.Thread(target=worker) for i in range(min(threads, len(jobs)))]
+    for thread in workers:
+        thread.daemon = True
+        thread.start()
+    for item in enumerate(jobs):
+        pending.put(item)
+    for thread in workers:
+        pending.put(None)
+    for thread in workers:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
 def query_history(tables=None, **kwargs):
     """Returns history data from various tables that support it
 
@@ -8749,6 +9753,130 @@ def build_references(build_id, limit=None, lazy=False):
     return ret
 
 
+def list_trash_candidates(min_age, name=None, draft=None, queryOpts=None):
+    """Returns the untagged and unreferenced builds, which may be moved to the trashcan
+
+    This is the set based equivalent of calling build_references() for each of
+    the untagged builds. A complete build is returned if all of the following
+    are true:
+
+    - it is not tagged
+    - no complete build used its rpms or archives in a buildroot
+    - no archive of a complete build contains its rpms or archives
+    - none of its rpms or archives were used in a buildroot in the last min_age seconds
+    - it was untagged at least min_age seconds ago, or it was never tagged and
+      was created at least min_age seconds ago
+
+    :param int min_age: minimum age in seconds
+    :param str name: only return builds of this package
+    :param bool draft: bool or None option that indicates the filter based on draft field
+        - None: no filter (both draft and regular builds)
+        - True: draft only
+        - False: regular only
+    :param dict queryOpts: query options
+
+    :returns: iterator of dicts with id, name, version, release, nvr, draft,
+              owner_id and owner_name
+    """
+    min_age = convert_value(min_age, cast=int)
+    if min_age < 0:
+        raise koji.ParameterError('min_age must not be negative')
+    before = time.time() - min_age
+    st_complete = koji.BUILD_STATES['COMPLETE']
+    clauses = [
+        'build.state = %(st_complete)i',
+        # not tagged
+        """NOT EXISTS
+             (SELECT 1 FROM tag_listing
+              WHERE tag_listing.build_id = build.id
+                AND tag_listing.active IS TRUE)""",
+        # untagged long enough ago
+        """NOT EXISTS
+             (SELECT 1 FROM tag_listing
+              JOIN events AS untagged ON untagged.id = tag_listing.revoke_event
+              WHERE tag_listing.build_id = build.id
+                AND untagged.time > to_timestamp(%(before)s))""",
+        # or never tagged and created long enough ago
+        """(events.time <= to_timestamp(%(before)s)
+            OR EXISTS (SELECT 1 FROM tag_listing WHERE tag_listing.build_id = build.id))""",
+        # rpms in buildroots of complete builds
+        """NOT EXISTS
+             (SELECT 1 FROM rpminfo
+              JOIN buildroot_listing ON buildroot_listing.rpm_id = rpminfo.id
+              JOIN rpminfo AS br_rpm ON br_rpm.buildroot_id = buildroot_listing.buildroot_id
+              JOIN build AS br_build ON br_build.id = br_rpm.build_id
+              WHERE rpminfo.build_id = build.id
+                AND br_build.state = %(st_complete)i)""",
+        # rpms as components of archives of complete builds
+        """NOT EXISTS
+             (SELECT 1 FROM rpminfo
+              JOIN archive_rpm_components ON archive_rpm_components.rpm_id = rpminfo.id
+              JOIN archiveinfo ON archiveinfo.id = archive_rpm_components.archive_id
+              JOIN build AS comp_build ON comp_build.id = archiveinfo.build_id
+              WHERE rpminfo.build_id = build.id
+                AND comp_build.state = %(st_complete)i)""",
+        # archives in buildroots of complete builds
+        """NOT EXISTS
+             (SELECT 1 FROM archiveinfo
+              JOIN buildroot_archives ON buildroot_archives.archive_id = archiveinfo.id
+              JOIN archiveinfo AS br_archive
+                ON br_archive.buildroot_id = buildroot_archives.buildroot_id
+              JOIN build AS br_build ON br_build.id = br_archive.build_id
+              WHERE archiveinfo.build_id = build.id
+                AND br_build.state = %(st_complete)i)""",
+        # archives as components of archives of complete builds
+        """NOT EXISTS
+             (SELECT 1 FROM archiveinfo
+              JOIN archive_components ON archive_components.component_id = archiveinfo.id
+              JOIN archiveinfo AS comp_archive ON comp_archive.id = archive_components.archive_id
+              JOIN build AS comp_build ON comp_build.id = comp_archive.build_id
+              WHERE archiveinfo.build_id = build.id
+                AND comp_build.state = %(st_complete)i)""",
+        # rpms used in recent buildroots
+        """NOT EXISTS
+             (SELECT 1 FROM rpminfo
+              JOIN buildroot_listing ON buildroot_listing.rpm_id = rpminfo.id
+              JOIN standard_buildroot
+                ON standard_buildroot.buildroot_id = buildroot_listing.buildroot_id
+              JOIN events AS used ON used.id = standard_buildroot.create_event
+              WHERE rpminfo.build_id = build.id
+                AND used.time > to_timestamp(%(before)s))""",
+        # archives used in recent buildroots
+        """NOT EXISTS
+             (SELECT 1 FROM archiveinfo
+              JOIN buildroot_archives ON buildroot_archives.archive_id = archiveinfo.id
+              JOIN standard_buildroot
+                ON standard_buildroot.buildroot_id = buildroot_archives.buildroot_id
+              JOIN events AS used ON used.id = standard_buildroot.create_event
+              WHERE archiveinfo.build_id = build.id
+                AND used.time > to_timestamp(%(before)s))""",
+    ]
+    if name is not None:
+        clauses.append('package.name = %(name)s')
+    if draft is not None:
+        clauses.append(draft_clause(draft, table='build'))
+
+    fields = [
+        ('build.id', 'id'),
+        ('package.name', 'name'),
+        ('build.version', 'version'),
+        ('build.release', 'release'),
+        ("package.name || '-' || build.version || '-' || build.release", 'nvr'),
+        ('build.draft', 'draft'),
+        ('users.id', 'owner_id'),
+        ('users.name', 'owner_name'),
+    ]
+    columns, aliases = zip(*fields)
+    joins = ['package ON build.pkg_id = package.id',
+             'users ON build.owner = users.id',
+             'events ON build.create_event = events.id']
+    query = QueryProcessor(tables=['build'], columns=columns, aliases=aliases, joins=joins,
+                           clauses=clauses,
+                           values={'st_complete': st_complete, 'before': before, 'name': name},
+                           opts=queryOpts)
+    return query.iterate()
+
+
 def delete_build(build, strict=True, min_ref_age=604800):
     """delete a build, if possible
 
@@ -8837,9 +9965,15 @@ def _delete_build(binfo):
                                  values={'rpm_id': rpm_id})
         delete.execute()
     values = {'build_id': build_id}
+    query = QueryProcessor(tables=['tag_listing'], columns=['tag_id'],
+                           clauses=['build_id = %(build_id)i', 'active = TRUE'],
+                           values=values, opts={'asList': True})
+    tag_ids = [row[0] for row in query.execute()]
     update = UpdateProcessor('tag_listing', clauses=["build_id=%(build_id)i"], values=values)
     update.make_revoke()
     update.execute()
+    if tag_ids:
+        set_tag_last_change(tag_ids)
     update = UpdateProcessor('build', values=values, clauses=['id=%(build_id)i'],
                              data={'state': st_deleted})
     update.execute()
@@ -8967,9 +10101,17 @@ def reset_build(build):
     delete = DeleteProcessor(table='build_types', clauses=['build_id=%(id)i'],
                              values={'id': binfo['build_id']})
     delete.execute()
+    query = QueryProcessor(tables=['tag_listing'], columns=['DISTINCT tag_id'],
+                           aliases=['tag_id'], clauses=['build_id = %(id)i'],
+                           values={'id': binfo['build_id']}, opts={'asList': True})
+    tag_ids = [row[0] for row in query.execute()]
     delete = DeleteProcessor(table='tag_listing', clauses=['build_id=%(id)i'],
                              values={'id': binfo['build_id']})
     delete.execute()
+    # the tag_listing rows are deleted rather than revoked, so record a
+    # non-versioned update to keep incremental repo init from reusing them
+    for tag_id in tag_ids:
+        set_tag_update(tag_id, 'MANUAL')
     binfo['state'] = koji.BUILD_STATES['CANCELED']
     update = UpdateProcessor('build', clauses=['id=%(id)s'], values={'id': binfo['id']},
                              data={'state': binfo['state'], 'task_id': None, 'volume_id': 0})
@@ -9431,9 +10573,9 @@ class OperationTest(koji.policy.MatchTest):
 def policy_get_user(data):
     """Determine user from policy data (default to logged-in user)"""
     if 'user_id' in data:
-        return get_user(data['user_id'])
+        return lookup_cache.call(get_user, data['user_id'])
     elif context.session.logged_in:
-        return get_user(context.session.user_id)
+        return lookup_cache.call(get_user, context.session.user_id)
     return None
 
 
@@ -9444,7 +10586,7 @@ def policy_get_pkg(data):
     if package does not exist yet, the id field will be None
     """
     if 'package' in data:
-        pkginfo = lookup_package(data['package'], strict=False)
+        pkginfo = lookup_cache.call(lookup_package, data['package'], strict=False)
         if not pkginfo:
             # for some operations (e.g. adding a new package), the package
             # entry may not exist yet
@@ -9454,7 +10596,7 @@ def policy_get_pkg(data):
                 raise koji.GenericError("No such package: %s" % data['package'])
         return pkginfo
     if 'build' in data:
-        binfo = get_build(data['build'], strict=True)
+        binfo = lookup_cache.call(get_build, data['build'], strict=True)
         return {'id': binfo['package_id'], 'name': binfo['name']}
     # else
     raise koji.GenericError("policy requires package data")
@@ -9468,7 +10610,7 @@ def policy_get_version(data):
     if 'version' in data:
         return data['version']
     if 'build' in data:
-        return get_build(data['build'], strict=True)['version']
+        return lookup_cache.call(get_build, data['build'], strict=True)['version']
     # else
     raise koji.GenericError("policy requires version data")
 
@@ -9481,21 +10623,26 @@ def policy_get_release(data):
     if 'release' in data:
         return data['release']
     if 'build' in data:
-        return get_build(data['build'], strict=True)['release']
+        return lookup_cache.call(get_build, data['build'], strict=True)['release']
     # else
     raise koji.GenericError("policy requires release data")
 
 
+def _get_build_brs(build_id):
+    """Return the set of buildroot ids of the rpms and archives of a build"""
+    rpm_brs = [r['buildroot_id'] for r in list_rpms(buildID=build_id)]
+    archive_brs = [a['buildroot_id'] for a in list_archives(buildID=build_id)]
+    return set(rpm_brs + archive_brs)
+
+
 def policy_get_brs(data):
     """Determine content generators from policy data"""
 
     if 'buildroots' in data:
         return set(data['buildroots'])
     elif 'build' in data:
-        binfo = get_build(data['build'], strict=True)
-        rpm_brs = [r['buildroot_id'] for r in list_rpms(buildID=binfo['id'])]
-        archive_brs = [a['buildroot_id'] for a in list_archives(buildID=binfo['id'])]
-        return set(rpm_brs + archive_brs)
+        binfo = lookup_cache.call(get_build, data['build'], strict=True)
+        return lookup_cache.call(_get_build_brs, binfo['id'])
     else:
         return set()
 
@@ -9504,7 +10651,7 @@ def policy_get_cgs(data):
     # pull cg info out
     # note that br_id will be None if a component had no buildroot
     if 'cg_list' in data:
-        cgs = [lookup_name('content_generator', cg, strict=True)['name']
+        cgs = [lookup_cache.call(lookup_name, 'content_generator', cg, strict=True)['name']
                for cg in data['cg_list']]
         return set(cgs)
     # otherwise try buildroot data
@@ -9513,7 +10660,7 @@ def policy_get_cgs(data):
         if br_id is None:
             cgs.add(None)
         else:
-            cgs.add(get_buildroot(br_id, strict=True)['cg_name'])
+            cgs.add(lookup_cache.call(get_buildroot, br_id, strict=True)['cg_name'])
     return cgs
 
 
@@ -9521,10 +10668,11 @@ def policy_get_build_tags(data, taginfo=False):
     """If taginfo is set, return list of taginfos, else list of names only"""
     tags = {}
     if 'build_tag' in data:
-        buildtag = get_tag(data['build_tag'], strict=True, event="auto")
+        buildtag = lookup_cache.call(get_tag, data['build_tag'], strict=True, event="auto")
         tags[buildtag['name']] = buildtag
     elif 'build_tags' in data:
-        build_tags = [get_tag(t, strict=True, event="auto") for t in data['build_tags']]
+        build_tags = [lookup_cache.call(get_tag, t, strict=True, event="auto")
+                      for t in data['build_tags']]
         for tag in build_tags:
             tags[tag['name']] = tag
 
@@ -9532,10 +10680,10 @@ def policy_get_build_tags(data, taginfo=False):
         # see if we have a target
         target = data.get('target')
         if target:
-            target = get_build_target(target, strict=False)
+            target = lookup_cache.call(get_build_target, target, strict=False)
             if target:
-                tags[target['build_tag_name']] = get_tag(target['build_tag'], strict=True,
-                                                         event="auto")
+                tags[target['build_tag_name']] = lookup_cache.call(
+                    get_tag, target['build_tag'], strict=True, event="auto")
 
     if not tags:
         # otherwise look at buildroots
@@ -9543,11 +10691,12 @@ def policy_get_build_tags(data, taginfo=False):
             if br_id is None:
                 tags[None] = None
             else:
-                tinfo = get_buildroot(br_id, strict=True)
+                tinfo = lookup_cache.call(get_buildroot, br_id, strict=True)
                 # CG don't need to have buildroots based on tags
                 if tinfo['tag_name']:
-                    tags[tinfo['tag_name']] = get_tag(tinfo['tag_name'], strict=True,
-                                                      event=tinfo['repo_create_event_id'])
+                    tags[tinfo['tag_name']] = lookup_cache.call(
+                        get_tag, tinfo['tag_name'], strict=True,
+                        event=tinfo['repo_create_event_id'])
 
     if taginfo:
         tags = tags.values()
@@ -9561,7 +10710,7 @@ def policy_get_build_types(data):
         # btypes can be already populated by caller
         return set(data['btypes'])
     if 'build' in data:
-        binfo = get_build(data['build'], strict=True)
+        binfo = lookup_cache.call(get_build, data['build'], strict=True)
         return set(get_build_type(binfo).keys())
     return set()
 
@@ -9615,9 +10764,9 @@ class VolumeTest(koji.policy.MatchTest):
         # we need to find the volume name from the base data
         volinfo = None
         if 'volume' in data:
-            volinfo = lookup_name('volume', data['volume'], strict=False)
+            volinfo = lookup_cache.call(lookup_name, 'volume', data['volume'], strict=False)
         elif 'build' in data:
-            build = get_build(data['build'])
+            build = lookup_cache.call(get_build, data['build'])
             volinfo = {'id': build['volume_id'], 'name': build['volume_name']}
         if not volinfo:
             return False
@@ -9684,7 +10833,7 @@ class TagTest(koji.policy.MatchTest):
         tag = data.get('tag')
         if tag is None:
             return None
-        return get_tag(tag, strict=False)
+        return lookup_cache.call(get_tag, tag, strict=False)
 
     def run(self, data):
         # we need to find the tag name from the base data
@@ -9702,7 +10851,7 @@ class FromTagTest(TagTest):
         tag = data.get('fromtag')
         if tag is None:
             return None
-        return get_tag(tag, strict=False)
+        return lookup_cache.call(get_tag, tag, strict=False)
 
 
 class HasTagTest(koji.policy.BaseSimpleTest):
@@ -9797,7 +10946,7 @@ class ImportedTest(koji.policy.BaseSimpleTest):
         build_info = data.get('build')
         if not build_info:
             raise koji.GenericError('policy data must contain a build')
-        build_id = get_build(build_info, strict=True)['id']
+        build_id = lookup_cache.call(get_build, build_info, strict=True)['id']
         # no test args
         for rpminfo in list_rpms(buildID=build_id):
             if rpminfo['buildroot_id'] is None:
@@ -9843,8 +10992,8 @@ class IsBuildOwnerTest(koji.policy.BaseSimpleTest):
     name = "is_build_owner"
 
     def run(self, data):
-        build = get_build(data['build'])
-        owner = get_user(build['owner_id'])
+        build = lookup_cache.call(get_build, data['build'])
+        owner = lookup_cache.call(get_user, build['owner_id'])
         user = policy_get_user(data)
         if not user:
             return False
@@ -9866,7 +11015,7 @@ class IsDraftTest(koji.policy.BaseSimpleTest):
         if 'draft' in data:
             return bool(data['draft'])
         if 'build' in data:
-            build = get_build(data['build'])
+            build = lookup_cache.call(get_build, data['build'])
             return build.get('draft', False)
         # default...
         return False
@@ -9986,7 +11135,7 @@ class PolicyTest(koji.policy.BaseSimpleTest):
         # we store some instance-specific state in context for loop detection
         # note that context is thread local and cleared after each call
         # note that this instance represents a specific test in the policy
-        # i.e. each occurrence of 'policy foo' is a separate instance
+        # i.e. each ruleset has a separate instance for 'policy foo'
         key = 'policy_test_state_%s_running' % id(self)
         if hasattr(context, key):
             # LOOP!
@@ -10250,21 +11399,17 @@ def importImageInternal(task_id, build_info, imgdata):
     # record all of the RPMs installed in the image(s)
     # verify they were built in Koji or in an external repo
     rpm_ids = []
-    for an_rpm in imgdata['rpmlist']:
-        location = an_rpm.get('location')
-        if location:
-            data = add_external_rpm(an_rpm, location, strict=False)
-        else:
-            data = get_rpm(an_rpm, strict=True)
-            # unlike buildroot, we simply reject draft rpms as rpm components
-            # because we probably don't want to keep the nvra uniqueness here.
-            reject_draft(data, is_rpm=True)
+    for data in lookup_rpm_list(imgdata['rpmlist']):
+        # unlike buildroot, we simply reject draft rpms as rpm components
+        # because we probably don't want to keep the nvra uniqueness here.
+        # (external rpms are never drafts)
+        reject_draft(data, is_rpm=True)
         rpm_ids.append(data['id'])
     # we sort to try to avoid deadlock issues
     rpm_ids.sort()
 
     # associate those RPMs with the image
-    insert = BulkInsertProcessor('archive_rpm_components')
+    insert = BulkInsertProcessor('archive_rpm_components', copy=True)
     for archive in archives:
         logger.info('working on archive %s', archive)
         if archive['filename'].endswith('xml'):
@@ -10676,6 +11821,7 @@ class RootExports(object):
 
         return make_task('image', [name, version, arches, target, inst_tree, opts], **taskOpts)
 
+    @koji.plugin.read_only
     def hello(self, *args):
         """Simple testing call returning a string"""
         return "Hello World"
@@ -10688,15 +11834,42 @@ class RootExports(object):
         "debugging. raise an error"
         raise koji.GenericError("test error")
 
+    @koji.plugin.read_only
     def echo(self, *args):
         return args
 
+    @koji.plugin.read_only
     def getKojiVersion(self):
         return koji.__version__
 
+    @koji.plugin.read_only
     def getAPIVersion(self):
         return koji.API_VERSION
 
+    def getQueryCacheStats(self):
+        """Return the hit counts of the query statement cache
+
+        The counts are kept per hub process, so they are those of the process
+        which handles the call.
+
+        :returns: dict with size, entries, hits, misses, hit_rate, prepare and
+                  executed_prepared (the executions of server side prepared
+                  statements)
+        """
+        return statement_cache.stats()
+
+    def getReplicaStats(self):
+        """Return how many calls to read-only methods the read replica handled
+
+        The counts are kept per hub process, so they are those of the process
+        which handles the call. They are only kept when a read replica is
+        configured.
+
+        :returns: dict mapping method names to dicts with the replica and
+                  primary counts
+        """
+        return replica_stats.stats()
+
     def mavenEnabled(self):
         """Get status of maven support"""
         return bool(context.opts.get('EnableMaven'))
@@ -10775,6 +11948,7 @@ class RootExports(object):
         else:
             return context.opts
 
+    @koji.plugin.read_only
     def getEvent(self, id):
         """
         Get information about the event with the given id.
@@ -10795,6 +11969,7 @@ class RootExports(object):
                                clauses=['id = %(id)i'], values={'id': id})
         return query.executeOne(strict=True)
 
+    @koji.plugin.read_only
     def getLastEvent(self, before=None):
         """
         Get the id and timestamp of the last event recorded in the system.
@@ -10948,6 +12123,43 @@ class RootExports(object):
             os.close(fd)
         return True
 
+    def prepareUploads(self, path, files, overwrite=False, volume=None):
+        """Create the files of a parallel upload
+
+        Each file is created with its final size, so that its chunks can then
+        be uploaded in any order and over several connections (rawUpload with
+        the parallel option). Use checkUpload to verify the results.
+
+        :param str path: upload directory
+        :param list files: list of dicts with name and size keys
+        :param bool overwrite: replace existing files
+        :param str volume: volume name
+        :returns: None
+        """
+        context.session.assertLogin()
+        for info in files:
+            name = info['name']
+            size = convert_value(info['size'], cast=int)
+            if size < 0:
+                raise koji.ParameterError("Invalid size for %s: %r" % (name, size))
+            fn = get_upload_path(path, name, create=True, volume=volume)
+            if os.path.exists(fn):
+                if not os.path.isfile(fn):
+                    raise koji.GenericError("destination not a file: %s" % fn)
+                if not overwrite:
+                    raise koji.GenericError("upload path exists: %s" % fn)
+            fd = os.open(fn, os.O_RDWR | os.O_CREAT, 0o666)
+            try:
+                try:
+                    fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except IOError as e:
+                    raise koji.LockError(e)
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+            finally:
+                # this will also remove our lock
+                os.close(fd)
+
     def checkUpload(self, path, name, verify=None, tail=None, volume=None):
         """Return basic information about an uploaded file"""
         fn = get_upload_path(path, name, volume=volume)
@@ -11011,7 +12223,7 @@ class RootExports(object):
             contents = f.read(size)
         return base64encode(contents)
 
-    listTaskOutput = staticmethod(list_task_output)
+    listTaskOutput = staticmethod(koji.plugin.read_only(list_task_output))
 
     createTag = staticmethod(create_tag)
     editTag = staticmethod(old_edit_tag)
@@ -11019,8 +12231,8 @@ class RootExports(object):
     deleteTag = staticmethod(delete_tag)
 
     createExternalRepo = staticmethod(create_external_repo)
-    listExternalRepos = staticmethod(get_external_repos)
-    getExternalRepo = staticmethod(get_external_repo)
+    listExternalRepos = staticmethod(koji.plugin.read_only(get_external_repos))
+    getExternalRepo = staticmethod(koji.plugin.read_only(get_external_repo))
     editExternalRepo = staticmethod(edit_external_repo)
     deleteExternalRepo = staticmethod(delete_external_repo)
 
@@ -11053,7 +12265,7 @@ class RootExports(object):
         remove_external_repo_from_tag(tag_info, repo_info)
 
     editTagExternalRepo = staticmethod(edit_tag_external_repo)
-    getTagExternalRepos = staticmethod(get_tag_external_repos)
+    getTagExternalRepos = staticmethod(koji.plugin.read_only(get_tag_external_repos))
     getExternalRepoList = staticmethod(get_external_repo_list)
 
     resetBuild = staticmethod(reset_build)
@@ -11091,7 +12303,8 @@ class RootExports(object):
     CGImport = staticmethod(cg_import)
 
     untaggedBuilds = staticmethod(untagged_builds)
-    queryHistory = staticmethod(query_history)
+    listTrashCandidates = staticmethod(list_trash_candidates)
+    queryHistory = staticmethod(koji.plugin.read_only(query_history))
 
     deleteBuild = staticmethod(delete_build)
 
@@ -11101,9 +12314,10 @@ class RootExports(object):
 
     addVolume = staticmethod(add_volume)
     removeVolume = staticmethod(remove_volume)
-    listVolumes = staticmethod(list_volumes)
+    listVolumes = staticmethod(koji.plugin.read_only(list_volumes))
     changeBuildVolume = staticmethod(change_build_volume)
 
+    @koji.plugin.read_only
     def getVolume(self, volume, strict=False):
         """Lookup the given volume
 
@@ -11859,30 +13073,31 @@ class RootExports(object):
             tasklist.append(task_id)
         return tasklist
 
-    listTags = staticmethod(list_tags)
+    listTags = staticmethod(koji.plugin.read_only(list_tags))
 
-    getBuild = staticmethod(get_build)
-    getBuildLogs = staticmethod(get_build_logs)
-    getNextRelease = staticmethod(get_next_release)
-    getMavenBuild = staticmethod(get_maven_build)
-    getWinBuild = staticmethod(get_win_build)
-    getImageBuild = staticmethod(get_image_build)
-    getBuildType = staticmethod(get_build_type)
+    getBuild = staticmethod(koji.plugin.read_only(get_build))
+    getBuildLogs = staticmethod(koji.plugin.read_only(get_build_logs))
+    getNextRelease = staticmethod(koji.plugin.read_only(get_next_release))
+    getMavenBuild = staticmethod(koji.plugin.read_only(get_maven_build))
+    getWinBuild = staticmethod(koji.plugin.read_only(get_win_build))
+    getImageBuild = staticmethod(koji.plugin.read_only(get_image_build))
+    getBuildType = staticmethod(koji.plugin.read_only(get_build_type))
     getArchiveTypes = staticmethod(get_archive_types)
     getArchiveType = staticmethod(get_archive_type)
-    listArchives = staticmethod(list_archives)
-    getArchive = staticmethod(get_archive)
+    listArchives = staticmethod(koji.plugin.read_only(list_archives))
+    getArchive = staticmethod(koji.plugin.read_only(get_archive))
     getMavenArchive = staticmethod(get_maven_archive)
     getWinArchive = staticmethod(get_win_archive)
     getImageArchive = staticmethod(get_image_archive)
-    listArchiveFiles = staticmethod(list_archive_files)
-    getArchiveFile = staticmethod(get_archive_file)
+    listArchiveFiles = staticmethod(koji.plugin.read_only(list_archive_files))
+    getArchiveFile = staticmethod(koji.plugin.read_only(get_archive_file))
 
-    listBTypes = staticmethod(list_btypes)
+    listBTypes = staticmethod(koji.plugin.read_only(list_btypes))
     addBType = staticmethod(add_btype)
 
     addArchiveType = staticmethod(add_archive_type)
 
+    @koji.plugin.read_only
     def getChangelogEntries(self, buildID=None, taskID=None, filepath=None, author=None,
                             before=None, after=None, queryOpts=None, strict=False):
         """Get changelog entries for the build with the given ID,
@@ -12047,6 +13262,7 @@ class RootExports(object):
             raise koji.GenericError("Finished task's priority can't be updated")
         task.setPriority(priority, recurse=recurse)
 
+    @koji.plugin.read_only
     def listTagged(self, tag, event=None, inherit=False, prefix=None, latest=False, package=None,
                    owner=None, type=None, strict=True, extra=False, draft=None):
         """List builds tagged with tag.
@@ -12082,6 +13298,7 @@ class RootExports(object):
                        if build['package_name'].lower().startswith(prefix)]
         return results
 
+    @koji.plugin.read_only
     def listTaggedRPMS(self, tag, event=None, inherit=False, latest=False, package=None, arch=None,
                        rpmsigs=False, owner=None, type=None, strict=True, extra=True,
                        draft=None):
@@ -12116,6 +13333,7 @@ class RootExports(object):
                               package=package, arch=arch, rpmsigs=rpmsigs, owner=owner,
                               type=type, extra=extra, draft=draft)
 
+    @koji.plugin.read_only
     def listTaggedArchives(self, tag, event=None, inherit=False, latest=False, package=None,
                            type=None, strict=True, extra=True):
         """List archives and builds within a tag.
@@ -12139,6 +13357,7 @@ class RootExports(object):
         return readTaggedArchives(tag['id'], event=event, inherit=inherit, latest=latest,
                                   package=package, type=type, extra=extra)
 
+    @koji.plugin.read_only
     def listBuilds(self, packageID=None, userID=None, taskID=None, prefix=None, state=None,
                    volumeID=None, source=None, createdBefore=None, createdAfter=None,
                    completeBefore=None, completeAfter=None, type=None, typeInfo=None,
@@ -12353,6 +13572,7 @@ class RootExports(object):
 
         return query.iterate()
 
+    @koji.plugin.read_only
     def getLatestBuilds(self, tag, event=None, package=None, type=None, draft=None):
         """List latest builds for tag (inheritance enabled, wrapper of readTaggedBuilds)
 
@@ -12374,6 +13594,7 @@ class RootExports(object):
         return readTaggedBuilds(tag, event, inherit=True, latest=True, package=package, type=type,
                                 draft=draft)
 
+    @koji.plugin.read_only
     def getLatestRPMS(self, tag, package=None, arch=None, event=None, rpmsigs=False, type=None,
                       draft=None):
         """List latest RPMS for tag (inheritance enabled, wrapper of readTaggedBuilds)
@@ -12402,6 +13623,7 @@ class RootExports(object):
         return readTaggedRPMS(tag, package=package, arch=arch, event=event, inherit=True,
                               latest=True, rpmsigs=rpmsigs, type=type, draft=draft)
 
+    @koji.plugin.read_only
     def getLatestMavenArchives(self, tag, event=None, inherit=True):
         """Return a list of the latest Maven archives in the tag, as of the given event
            (or now if event is None).  If inherit is True, follow the tag hierarchy
@@ -12458,10 +13680,11 @@ class RootExports(object):
     groupReqListBlock = staticmethod(grp_req_block)
     groupReqListUnblock = staticmethod(grp_req_unblock)
 
-    getTagGroups = staticmethod(readTagGroups)
+    getTagGroups = staticmethod(koji.plugin.read_only(readTagGroups))
 
     checkTagAccess = staticmethod(check_tag_access)
 
+    @koji.plugin.read_only
     def getInheritanceData(self, tag, event=None):
         """Return inheritance data for tag"""
         tag = get_tag_id(tag, strict=True)
@@ -12489,6 +13712,7 @@ class RootExports(object):
         context.session.assertPerm('tag')
         return writeInheritanceData(tag, data, clear=clear)
 
+    @koji.plugin.read_only
     def getFullInheritance(self, tag, event=None, reverse=False, **kwargs):
         """
         :param int|str tag: tag ID | name
@@ -12514,8 +13738,9 @@ class RootExports(object):
             tag = get_tag_id(tag, strict=True)
         return readFullInheritance(tag, event, reverse)
 
-    listRPMs = staticmethod(list_rpms)
+    listRPMs = staticmethod(koji.plugin.read_only(list_rpms))
 
+    @koji.plugin.read_only
     def listBuildRPMs(self, build):
         """Get information about all the RPMs generated by the build with the given
         ID.  A list of maps is returned, each map containing the following keys:
@@ -12539,8 +13764,9 @@ class RootExports(object):
             build = self.findBuildID(build, strict=True)
         return self.listRPMs(buildID=build)
 
-    getRPM = staticmethod(get_rpm)
+    getRPM = staticmethod(koji.plugin.read_only(get_rpm))
 
+    @koji.plugin.read_only
     def getRPMDeps(self, rpmID, depType=None, queryOpts=None, strict=False):
         """Return dependency information about the RPM with the given ID.
         If depType is specified, restrict results to dependencies of the given type.
@@ -12594,6 +13820,7 @@ class RootExports(object):
 
         return _applyQueryOpts(results, queryOpts)
 
+    @koji.plugin.read_only
     def listRPMFiles(self, rpmID, queryOpts=None):
         """List files associated with the RPM with the given ID.  A list of maps
         will be returned, each with the following keys:
@@ -12637,6 +13864,7 @@ class RootExports(object):
 
         return _applyQueryOpts(results, queryOpts)
 
+    @koji.plugin.read_only
     def getRPMFile(self, rpmID, filename, strict=False):
         """
         Get info about the file in the given RPM with the given filename.
@@ -12759,7 +13987,7 @@ class RootExports(object):
         headers = koji.get_header_fields(rpm_path, headers)
         return koji.fixEncodingRecurse(headers, remove_nonprintable=True)
 
-    queryRPMSigs = staticmethod(query_rpm_sigs)
+    queryRPMSigs = staticmethod(koji.plugin.read_only(query_rpm_sigs))
 
     def getRPMChecksums(self, rpm_id, checksum_types=None, cacheonly=False):
         """Returns RPM checksums for specific rpm.
@@ -12836,6 +14064,18 @@ class RootExports(object):
         # XXX - still not sure if this is the right restriction
         return write_signed_rpm(an_rpm, sigkey, force)
 
+    def writeSignedRPMs(self, rpms, sigkey, force=False):
+        """Write signed copies of many rpms
+
+        :param rpms: list of rpms (ids, nvras or rpminfo maps), or a build, to
+                     write all of its rpms
+        :param str sigkey: the signature key
+        :param bool force: rewrite the signed copies which already exist
+        :returns: the number of rpms
+        """
+        context.session.assertPerm('sign')
+        return write_signed_rpms(rpms, sigkey, force)
+
     def addRPMSig(self, an_rpm, data):
         """Store a signature header for an rpm
 
@@ -12862,8 +14102,8 @@ class RootExports(object):
         return delete_rpm_sig(rpminfo, sigkey=sigkey, all_sigs=all_sigs)
 
     findBuildID = staticmethod(find_build_id)
-    getTagID = staticmethod(get_tag_id)
-    getTag = staticmethod(get_tag)
+    getTagID = staticmethod(koji.plugin.read_only(get_tag_id))
+    getTag = staticmethod(koji.plugin.read_only(get_tag))
 
     def getPackageID(self, name, strict=False):
         """Get package ID by name.
@@ -12880,8 +14120,9 @@ class RootExports(object):
             return None
         return r['id']
 
-    getPackage = staticmethod(lookup_package)
+    getPackage = staticmethod(koji.plugin.read_only(lookup_package))
 
+    @koji.plugin.read_only
     def listPackages(self, tagID=None, userID=None, pkgID=None, prefix=None, inherited=False,
                      with_dups=False, event=None, queryOpts=None, with_owners=True,
                      with_blocked=True):
@@ -12956,6 +14197,7 @@ class RootExports(object):
 
         return _applyQueryOpts(results, queryOpts)
 
+    @koji.plugin.read_only
     def listPackagesSimple(self, prefix=None, queryOpts=None):
         """list packages that starts with prefix and are filted
         and ordered by queryOpts.
@@ -12994,6 +14236,7 @@ class RootExports(object):
             # still might be blocked
             return not pkgs[pkg_id]['blocked']
 
+    @koji.plugin.read_only
     def getPackageConfig(self, tag, pkg, event=None):
         """Get config for package in tag"""
         tag_id = get_tag_id(tag, strict=False)
@@ -13003,7 +14246,7 @@ class RootExports(object):
         pkgs = readPackageList(tagID=tag_id, pkgID=pkg_id, inherit=True, event=event)
         return pkgs.get(pkg_id, None)
 
-    getUser = staticmethod(get_user)
+    getUser = staticmethod(koji.plugin.read_only(get_user))
     editUser = staticmethod(edit_user)
 
     def grantPermission(self, userinfo, permission, create=False, description=None):
@@ -13108,7 +14351,7 @@ class RootExports(object):
             raise koji.GenericError('No such user: %s' % username)
         set_user_status(user, koji.USER_STATUS['BLOCKED'])
 
-    listCGs = staticmethod(list_cgs)
+    listCGs = staticmethod(koji.plugin.read_only(list_cgs))
     grantCGAccess = staticmethod(grant_cg_access)
     revokeCGAccess = staticmethod(revoke_cg_access)
 
@@ -13116,8 +14359,9 @@ class RootExports(object):
     newGroup = staticmethod(new_group)
     addGroupMember = staticmethod(add_group_member)
     dropGroupMember = staticmethod(drop_group_member)
-    getGroupMembers = staticmethod(get_group_members)
+    getGroupMembers = staticmethod(koji.plugin.read_only(get_group_members))
 
+    @koji.plugin.read_only
     def listUsers(self, userType=koji.USERTYPES['NORMAL'], prefix=None, queryOpts=None, perm=None,
                   inherited_perm=False):
         """List users in the system
@@ -13189,6 +14433,7 @@ class RootExports(object):
                                enable_group=True, transform=xform_user_krb)
         return query.execute()
 
+    @koji.plugin.read_only
     def getBuildConfig(self, tag, event=None):
         """Return build configuration associated with a tag"""
         taginfo = get_tag(tag, strict=True, event=event, blocked=True)
@@ -13214,6 +14459,7 @@ class RootExports(object):
                 taginfo['extra'][k] = v[1]
         return taginfo
 
+    @koji.plugin.read_only
     def getRepo(self, tag, state=None, event=None, dist=False):
         """Get individual repository data based on tag and additional filters.
         If more repos fits, most recent is returned.
@@ -13253,8 +14499,8 @@ class RootExports(object):
                                opts={'order': '-creation_time', 'limit': 1})
         return query.executeOne()
 
-    repoInfo = staticmethod(repo_info)
-    getActiveRepos = staticmethod(get_active_repos)
+    repoInfo = staticmethod(koji.plugin.read_only(repo_info))
+    getActiveRepos = staticmethod(koji.plugin.read_only(get_active_repos))
 
     def distRepo(self, tag, keys, **task_opts):
         """Create a dist-repo task. returns task id"""
@@ -13318,11 +14564,12 @@ class RootExports(object):
         repo_problem(repo_id)
 
     tagChangedSinceEvent = staticmethod(tag_changed_since_event)
+    getTagsChangedSince = staticmethod(tags_changed_since_events)
     createBuildTarget = staticmethod(create_build_target)
     editBuildTarget = staticmethod(edit_build_target)
     deleteBuildTarget = staticmethod(delete_build_target)
-    getBuildTargets = staticmethod(get_build_targets)
-    getBuildTarget = staticmethod(get_build_target)
+    getBuildTargets = staticmethod(koji.plugin.read_only(get_build_targets))
+    getBuildTarget = staticmethod(koji.plugin.read_only(get_build_target))
 
     def taskFinished(self, taskId):
         """Returns True if task is finished
@@ -13334,6 +14581,7 @@ class RootExports(object):
         task = Task(taskId)
         return task.isFinished()
 
+    @koji.plugin.read_only
     def getTaskRequest(self, taskId):
         """Return original task request as a list. Content depends on task type
 
@@ -13344,6 +14592,7 @@ class RootExports(object):
         task = Task(taskId)
         return task.getRequest()
 
+    @koji.plugin.read_only
     def getTaskResult(self, taskId, raise_fault=True):
         """Returns task results depending on task type. For buildArch it is a dict with build info,
         for newRepo list with two items, etc.
@@ -13356,6 +14605,7 @@ class RootExports(object):
         task = Task(taskId)
         return task.getResult(raise_fault=raise_fault)
 
+    @koji.plugin.read_only
     def getTaskInfo(self, task_id, request=False, strict=False):
         """Get information about a task
 
@@ -13375,6 +14625,7 @@ class RootExports(object):
         else:
             return ret
 
+    @koji.plugin.read_only
     def getTaskChildren(self, task_id, request=False, strict=False):
         """Return a list of the children
         of the Task with the given ID."""
@@ -13384,6 +14635,7 @@ class RootExports(object):
             task.getInfo(strict=True)
         return task.getChildren(request=request)
 
+    @koji.plugin.read_only
     def getTaskDescendents(self, task_id, request=False):
         """Get all descendents of the task with the given ID.
         Return a map of task_id -> list of child tasks.  If the given
@@ -13395,6 +14647,25 @@ class RootExports(object):
         task = Task(task_id)
         return get_task_descendents(task, request=request)
 
+    def getTaskTreeChanges(self, task_ids, cursor=None, request=False):
+        """Get the state changes in the given task trees
+
+        This lets clients follow large trees of tasks with a single call per poll, instead of
+        querying each task. The first call (with no cursor) returns all the tasks of the trees.
+        Later calls, passing the cursor returned by the previous one, return only the tasks
+        that were created or changed state since then.
+
+        :param list task_ids: ids of the root tasks, the trees include all their descendants
+        :param str cursor: cursor from the previous call
+        :param bool request: if True, return also the requests of the tasks
+        :returns: dict with keys:
+
+            - cursor: to pass to the next call
+            - tasks: list of new or changed tasks (as getTaskInfo), sorted by id
+        """
+        return get_task_tree_changes(task_ids, cursor=cursor, request=request)
+
+    @koji.plugin.read_only
     def listTasks(self, opts=None, queryOpts=None):
         """Return list of tasks filtered by options
 
@@ -13648,7 +14919,7 @@ class RootExports(object):
         """Mark a channel as disabled"""
         set_channel_enabled(channelname, enabled=False, comment=comment)
 
-    getHost = staticmethod(get_host)
+    getHost = staticmethod(koji.plugin.read_only(get_host))
     editHost = staticmethod(edit_host)
     addHostToChannel = staticmethod(add_host_to_channel)
     removeHostFromChannel = staticmethod(remove_host_from_channel)
@@ -13656,6 +14927,7 @@ class RootExports(object):
     editChannel = staticmethod(edit_channel)
     addChannel = staticmethod(add_channel)
 
+    @koji.plugin.read_only
     def listHosts(self, arches=None, channelID=None, ready=None, enabled=None, userID=None,
                   queryOpts=None):
         """List builder hosts.
@@ -13753,17 +15025,17 @@ class RootExports(object):
 
     getAllArches = staticmethod(get_all_arches)
 
-    getChannel = staticmethod(get_channel)
-    listChannels = staticmethod(list_channels)
+    getChannel = staticmethod(koji.plugin.read_only(get_channel))
+    listChannels = staticmethod(koji.plugin.read_only(list_channels))
 
-    getBuildroot = staticmethod(get_buildroot)
+    getBuildroot = staticmethod(koji.plugin.read_only(get_buildroot))
 
     def getBuildrootListing(self, id):
         """Return a list of packages in the buildroot"""
         br = BuildRoot(id)
         return br.getList()
 
-    listBuildroots = staticmethod(query_buildroots)
+    listBuildroots = staticmethod(koji.plugin.read_only(query_buildroots))
 
     def hasPerm(self, perm, strict=False):
         """Check if the logged-in user has the given permission.  Return False if
@@ -13776,6 +15048,7 @@ class RootExports(object):
         """Get a list of the permissions granted to the currently logged-in user."""
         return context.session.getPerms()
 
+    @koji.plugin.read_only
     def getUserPerms(self, userID=None, with_groups=True):
         """Get a list of the permissions granted to the user with the given ID/name.
         Options:
@@ -13794,6 +15067,7 @@ class RootExports(object):
         user_info = get_user(userID, strict=True)
         return get_user_perms(user_info['id'], inheritance_data=True)
 
+    @koji.plugin.read_only
     def getAllPerms(self):
         """Get a list of all permissions in the system.  Returns a list of maps.  Each
         map contains the following keys:
@@ -13995,6 +15269,7 @@ class RootExports(object):
 
         return _count, results
 
+    @koji.plugin.read_only
     def getBuildNotifications(self, userID=None):
         """Get build notifications for the user with the given ID, name or
         Kerberos principal. If no user is specified, get the notifications for
@@ -14195,6 +15470,7 @@ class RootExports(object):
                      'maven': 'archiveinfo',
                      'win': 'archiveinfo'}
 
+    @koji.plugin.read_only
     def search(self, terms, type, matchType, queryOpts=None):
         """Search for an item in the database matching "terms".
 
@@ -14464,13 +15740,8 @@ class BuildRoot(object):
         if update:
             current = set([r['rpm_id'] for r in self.getList()])
         rpm_ids = []
-        for an_rpm in rpmlist:
-            location = an_rpm.get('location')
-            if location:
-                data = add_external_rpm(an_rpm, location, strict=False)
-                # will add if missing, compare if not
-            else:
-                data = get_rpm(an_rpm, strict=True)
+        # external rpms will be added if missing, compared if not
+        for data in lookup_rpm_list(rpmlist):
             rpm_id = data['id']
             if update and rpm_id in current:
                 # ignore duplicate packages for updates
@@ -14481,7 +15752,7 @@ class BuildRoot(object):
 
         # actually do the inserts (in bulk)
         if rpm_ids:
-            insert = BulkInsertProcessor(table='buildroot_listing')
+            insert = BulkInsertProcessor(table='buildroot_listing', copy=True)
             for rpm_id in rpm_ids:
                 insert.add_record(buildroot_id=self.id, rpm_id=rpm_id, is_update=update)
             insert.execute()
@@ -14538,7 +15809,7 @@ class BuildRoot(object):
         new_archives = archives.difference(current)
 
         if new_archives:
-            insert = BulkInsertProcessor('buildroot_archives')
+            insert = BulkInsertProcessor('buildroot_archives', copy=True)
             for archive_id in sorted(new_archives):
                 insert.add_record(buildroot_id=self.id,
                                   project_dep=project,
@@ -14702,6 +15973,52 @@ class Host(object):
                     task['alert'] = True
         return tasks
 
+    def getTaskSnapshot(self):
+        """Summarize the assigned and open tasks of the host
+
+        Returns a sorted list of [task_id, state, alert] entries, where alert is True for
+        waiting tasks that can be woken.
+        """
+        host_id = self.id
+        states = [koji.TASK_STATES['ASSIGNED'], koji.TASK_STATES['OPEN']]
+        query = QueryProcessor(tables=['task'], columns=['id', 'state', 'waiting'],
+                               clauses=['host_id = %(host_id)s', 'state IN %(states)s'],
+                               values={'host_id': host_id, 'states': states},
+                               opts={'order': 'id'})
+        snapshot = []
+        for task in query.execute():
+            alert = False
+            if task['waiting']:
+                alert, _ = self.taskWaitCheck(task['id'])
+            snapshot.append([task['id'], task['state'], bool(alert)])
+        return snapshot
+
+    def waitForTasks(self, snapshot=None):
+        """Wait until the tasks of the host change
+
+        If the current task snapshot (see getTaskSnapshot) differs from the given one, it is
+        returned right away. Otherwise we wait for a notification that one of the tasks of the
+        host changed, or for up to TaskWaitTimeout seconds, and return the snapshot.
+
+        :param list snapshot: the snapshot returned by the previous call
+        :returns: the task snapshot, or None if waiting is disabled
+        """
+        timeout = context.opts['TaskWaitTimeout']
+        if not timeout or getattr(context, 'in_multicall', False):
+            # we commit while waiting, which would break the multicall savepoints
+            return None
+        # the host must check in often enough to be considered ready
+        timeout = min(timeout, context.opts['ReadyTimeout'] // 2)
+        listen(scheduler.host_channel(self.id))
+        try:
+            # we are already listening, so no change can slip in after this
+            current = self.getTaskSnapshot()
+            if current == snapshot:
+                wait_notify(timeout)
+            return current
+        finally:
+            unlisten()
+
     def updateHost(self, task_load, ready):
         task_load = float(task_load)
         update = UpdateProcessor(
@@ -14849,6 +16166,20 @@ class HostExports(object):
         host.verify()
         return host.getHostTasks()
 
+    def waitForTasks(self, snapshot=None):
+        """Wait for a change in the tasks of this host
+
+        This lets builders avoid polling while idle. Pass the result of the previous call
+        as snapshot.
+
+        :param list snapshot: task snapshot from the previous call
+        :returns: the current task snapshot, or None if waiting is disabled on the hub
+        """
+        snapshot = convert_value(snapshot, cast=list, none_allowed=True)
+        host = Host()
+        host.verify()
+        return host.waitForTasks(snapshot)
+
     def taskSetWait(self, parent, tasks):
         host = Host()
         host.verify()
@@ -15899,6 +17230,10 @@ class HostExports(object):
         """Write a signed copy of the rpm"""
         return write_signed_rpm(an_rpm, sigkey, force)
 
+    def writeSignedRPMs(self, rpms, sigkey, force=False):
+        """Write signed copies of many rpms"""
+        return write_signed_rpms(rpms, sigkey, force)
+
 
 def get_upload_path(reldir, name, create=False, volume=None):
     orig_reldir = reldir
@@ -15972,24 +17307,45 @@ def handle_upload(environ):
     offset = args.get('offset', ('0',))[0]
     offset = int(offset)
     volume = args.get('volume', ('DEFAULT',))[0]
+    # parallel chunks go to a file created by prepareUploads, and are written
+    # at their offset without truncating it
+    parallel = args.get('parallel', ('',))[0]
     fn = get_upload_path(path, name, create=True, volume=volume)
-    if os.path.exists(fn):
+    if parallel:
+        # uploads never commit, so the callnum update of the session check is
+        # dropped anyway. Drop it now, so that its row lock on the session does
+        # not make the other chunks of this session wait for this one.
+        context.cnx.rollback()
+        if offset < 0:
+            raise koji.GenericError("invalid offset for parallel upload: %i" % offset)
+        if not os.path.isfile(fn):
+            raise koji.GenericError("parallel upload not prepared: %s" % fn)
+    elif os.path.exists(fn):
         if not os.path.isfile(fn):
             raise koji.GenericError("destination not a file: %s" % fn)
         if offset == 0 and not overwrite:
             raise koji.GenericError("upload path exists: %s" % fn)
-    chksum = get_verify_class(verify)()
+    chksum = None
+    if verify:
+        chksum = get_verify_class(verify)()
     size = 0
     inf = environ['wsgi.input']
-    fd = os.open(fn, os.O_RDWR | os.O_CREAT, 0o666)
+    if parallel:
+        fd = os.open(fn, os.O_RDWR)
+    else:
+        fd = os.open(fn, os.O_RDWR | os.O_CREAT, 0o666)
     try:
         try:
-            fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            if parallel:
+                # chunks of the same file are written concurrently
+                fcntl.lockf(fd, fcntl.LOCK_SH | fcntl.LOCK_NB)
+            else:
+                fcntl.lockf(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
         except IOError as e:
             raise koji.LockError(e)
         if offset == -1:
             offset = os.lseek(fd, 0, 2)
-        else:
+        elif not parallel:
             os.ftruncate(fd, offset)
             os.lseek(fd, offset, 0)
         while True:
@@ -16011,7 +17367,10 @@ def handle_upload(environ):
             size += len(chunk)
             if verify:
                 chksum.update(chunk)
-            os.write(fd, chunk)
+            if parallel:
+                os.pwrite(fd, chunk, offset + size - len(chunk))
+            else:
+                os.write(fd, chunk)
     finally:
         # this will also remove our lock
         os.close(fd)
@@ -16125,6 +17484,35 @@ def create_rpm_checksum(rpm_id, sigkey, chsum_dict):
             upsert.execute()
 
 
+def create_rpm_checksums(sigkey, checksums):
+    """Creates the checksums of many RPMs at once
+
+    :param string sigkey: Sigkey of the RPMs
+    :param dict checksums: Dict of RPM id and its dict of checksum type and hash
+    """
+    if not checksums:
+        return
+    query = QueryProcessor(tables=['rpm_checksum'],
+                           columns=['checksum_type', 'checksum', 'rpm_id'],
+                           clauses=['rpm_id IN %(rpm_ids)s', 'sigkey=%(sigkey)s'],
+                           values={'rpm_ids': sorted(checksums), 'sigkey': sigkey})
+    existing = {(r['rpm_id'], r['checksum_type']): r['checksum'] for r in query.execute()}
+    insert = BulkInsertProcessor(table='rpm_checksum', skip_dup=True)
+    for rpm_id, chsum_dict in sorted(checksums.items()):
+        for func, chsum in sorted(chsum_dict.items()):
+            checksum_type = koji.CHECKSUM_TYPES[func]
+            old = existing.get((rpm_id, checksum_type))
+            if old is None:
+                insert.add_record(rpm_id=rpm_id, sigkey=sigkey, checksum=chsum,
+                                  checksum_type=checksum_type)
+            elif old != chsum:
+                raise koji.GenericError(
+                    f"Calculate checksum is different than checksum in DB for "
+                    f"rpm ID {rpm_id}, sigkey {sigkey} and checksum type {func}.")
+    if insert.data:
+        insert.execute()
+
+
 def reject_draft(data, is_rpm=False, error=None):
     """block draft build/rpm
 
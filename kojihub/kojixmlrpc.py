@@ -20,6 +20,7 @@
 
 import datetime
 import inspect
+import itertools
 import logging
 import os
 import pprint
@@ -31,6 +32,7 @@ import traceback
 import re
 
 import koji
+import koji.jsonplus
 import koji.plugin
 import koji.policy
 import koji.util
@@ -38,7 +40,7 @@ import kojihub
 from koji.context import context
 # import xmlrpclib functions from koji to use tweaked Marshaller
 from koji.server import ServerError, BadRequest, RequestTimeout
-from koji.xmlrpcplus import ExtendedMarshaller, Fault, dumps, getparser
+from koji.xmlrpcplus import ExtendedMarshaller, Fault, dumps, dumps_iter, getparser
 from . import auth
 from . import db
 from . import scheduler
@@ -49,6 +51,9 @@ GLOBAL_HEADERS = [
     ('Koji-Version', koji.__version__),
 ]
 
+# approximate size of the chunks of streamed responses
+STREAM_CHUNK_SIZE = 65536
+
 
 class Marshaller(ExtendedMarshaller):
 
@@ -61,11 +66,22 @@ class Marshaller(ExtendedMarshaller):
     dispatch[datetime.datetime] = dump_datetime
 
 
+class JSONEncoder(koji.jsonplus.Encoder):
+
+    def default(self, value):
+        if isinstance(value, datetime.datetime):
+            # as for xmlrpc, we return datetime objects as strings
+            return value.isoformat(' ')
+        return super(JSONEncoder, self).default(value)
+
+
 class HandlerRegistry(object):
     """Track handlers for RPC calls"""
 
     def __init__(self):
         self.funcs = {}
+        # names of the handlers marked with koji.plugin.read_only
+        self.read_only = set()
         # introspection functions
         self.register_function(self.list_api, name="_listapi")
         self.register_function(self.system_listMethods, name="system.listMethods")
@@ -77,6 +93,10 @@ class HandlerRegistry(object):
         if name is None:
             name = function.__name__
         self.funcs[name] = function
+        if getattr(function, 'read_only', False) is True:
+            self.read_only.add(name)
+        else:
+            self.read_only.discard(name)
 
     def register_module(self, instance, prefix=None):
         """Register all the public functions in an instance with prefix prepended
@@ -204,6 +224,8 @@ class ModXMLRPCRequestHandler(object):
 
     def __init__(self, handlers):
         self.traceback = False
+        self.streaming = False
+        self.json = False
         self.handlers = handlers  # expecting HandlerRegistry instance
         self.logger = logging.getLogger('koji.xmlrpc')
 
@@ -216,7 +238,12 @@ class ModXMLRPCRequestHandler(object):
             return self.handlers.get(name)
 
     def _read_request(self, stream):
-        parser, unmarshaller = getparser()
+        json_request = context.environ.get('CONTENT_TYPE') == koji.jsonplus.CONTENT_TYPE
+        if json_request:
+            parser = None
+            chunks = []
+        else:
+            parser, unmarshaller = getparser()
         rlen = 0
         maxlen = opts.get('MaxRequestLength', None)
         while True:
@@ -237,10 +264,39 @@ class ModXMLRPCRequestHandler(object):
             rlen += len(chunk)
             if maxlen and rlen > maxlen:
                 raise koji.GenericError('Request too long')
-            parser.feed(chunk)
+            if json_request:
+                chunks.append(chunk)
+            else:
+                parser.feed(chunk)
+        if json_request:
+            try:
+                return koji.jsonplus.loads_request(b''.join(chunks))
+            except ValueError as e:
+                raise BadRequest('Invalid JSON request: %s' % e)
         parser.close()
         return unmarshaller.close(), unmarshaller.getmethodname()
 
+    def _wants_json(self, environ):
+        """Whether the client accepts JSON responses"""
+        if environ.get('CONTENT_TYPE') == koji.jsonplus.CONTENT_TYPE:
+            # always, so that clients can tell an older hub from its xml answer
+            return True
+        if not context.opts.get('JSONTransport'):
+            return False
+        accept = [t.split(';')[0].strip() for t in environ.get('HTTP_ACCEPT', '').split(',')]
+        return koji.jsonplus.CONTENT_TYPE in accept
+
+    def _encode(self, response):
+        """Encode a single response tuple or a Fault"""
+        if self.json:
+            if not isinstance(response, Fault):
+                response = response[0]
+            return koji.jsonplus.dumps_response(response, encoder=JSONEncoder)
+        elif isinstance(response, Fault):
+            return dumps(response, marshaller=Marshaller)
+        else:
+            return dumps(response, methodresponse=1, marshaller=Marshaller)
+
     def _log_exception(self):
         e_class, e = sys.exc_info()[:2]
         faultCode = getattr(e_class, 'faultCode', 1)
@@ -265,28 +321,55 @@ class ModXMLRPCRequestHandler(object):
         return faultCode, faultString
 
     def _wrap_handler(self, handler, environ):
-        """Catch exceptions and encode response of handler"""
+        """Catch exceptions and encode response of handler
 
+        Returns an iterable of response chunks. If the call made no changes and the
+        StreamResponses option is enabled, the response is encoded while it is sent
+        (see _stream_response). Otherwise it is a list with a single chunk.
+        """
+
+        self.json = self._wants_json(environ)
         # generate response
         try:
             response = handler(environ)
             # wrap response in a singleton tuple
             response = (response,)
-            response = dumps(response, methodresponse=1, marshaller=Marshaller)
+            if context.opts.get('StreamResponses') and not context.commit_pending:
+                response = self._stream_response(response)
+            else:
+                response = [self._encode(response)]
         except ServerError:
             raise
             # these are handled higher up
         except Fault as fault:
             self.traceback = True
-            response = dumps(fault, marshaller=Marshaller)
+            response = [self._encode(fault)]
         except Exception:
             self.traceback = True
             # report exception back to server
             faultCode, faultString = self._log_exception()
-            response = dumps(Fault(faultCode, faultString), marshaller=Marshaller)
+            response = [self._encode(Fault(faultCode, faultString))]
 
         return response
 
+    def _stream_response(self, response):
+        """Encode the response chunk by chunk as it is sent
+
+        Generators in the response are only consumed while sending, so large results
+        are never held in memory as a whole. The transaction stays open until the
+        response is sent, which is why only calls without changes are streamed.
+        """
+        if self.json:
+            chunks = koji.jsonplus.dumps_response_iter(response[0], encoder=JSONEncoder,
+                                                       chunksize=STREAM_CHUNK_SIZE)
+        else:
+            chunks = dumps_iter(response, methodresponse=1, marshaller=Marshaller,
+                                chunksize=STREAM_CHUNK_SIZE)
+        # encode the first chunk now, so that most errors still result in a fault
+        first = next(chunks)
+        self.streaming = True
+        return itertools.chain([first], chunks)
+
     def handle_upload(self, environ):
         # uploads can't be in a multicall
         context.method = None
@@ -296,8 +379,41 @@ class ModXMLRPCRequestHandler(object):
 
     def handle_rpc(self, environ):
         params, method = self._read_request(environ['wsgi.input'])
+        if self._replica_ok(method, params, environ):
+            cnx = db.connect_replica(max_lag=context.opts.get('ReplicaMaxLag'))
+            if cnx is not None:
+                context.cnx.close()
+                context.cnx = cnx
+                context.replica = True
         return self._dispatch(method, params)
 
+    def _replica_ok(self, method, params, environ):
+        """Whether the call may be handled by the read replica
+
+        Only anonymous calls to read-only methods qualify, i.e. those marked
+        with koji.plugin.read_only, or listed in the ReplicaMethods option.
+        Logged-in callers may need to read their own changes, and validating
+        their session updates it.
+        """
+        if not context.opts.get('DBReplicaConnectionString'):
+            return False
+        if 'HTTP_KOJI_SESSION_ID' in environ or \
+                'session-id' in environ.get('QUERY_STRING', ''):
+            return False
+        if method in ('multiCall', 'system.multicall'):
+            try:
+                names = [call['methodName'] for call in params[0]]
+            except Exception:
+                # let multiCall report the problem
+                return False
+            return bool(names) and all([self._read_only(name) for name in names])
+        return self._read_only(method)
+
+    def _read_only(self, method):
+        if method in self.handlers.read_only:
+            return True
+        return method in context.opts.get('ReplicaMethods', '').split()
+
     def check_session(self):
         if not hasattr(context, "session"):
             # we may be called again by one of our meta-calls (like multiCall)
@@ -335,13 +451,17 @@ class ModXMLRPCRequestHandler(object):
 
         ret = koji.util.call_with_argcheck(func, params, opts)
 
+        if context.opts.get('DBReplicaConnectionString') and self._read_only(method):
+            db.replica_stats.record(method, getattr(context, 'replica', False) is True)
+
         if self.logger.isEnabledFor(logging.INFO):
             rusage = resource.getrusage(resource.RUSAGE_SELF)
             self.logger.info(
-                "Completed method %s for session %s (#%s): %f seconds, rss %s, stime %f",
+                "Completed method %s for session %s (#%s): %f seconds, rss %s, stime %f, db %s",
                 method, context.session.id, context.session.callnum,
                 time.time() - start,
-                rusage.ru_maxrss, rusage.ru_stime)
+                rusage.ru_maxrss, rusage.ru_stime,
+                'replica' if getattr(context, 'replica', False) else 'primary')
 
         return ret
 
@@ -349,6 +469,7 @@ class ModXMLRPCRequestHandler(object):
         """Execute a multicall.  Execute each method call in the calls list, collecting
         results and errors, and return those as a list."""
         results = []
+        context.in_multicall = True
         for call in calls:
             savepoint = db.Savepoint('multiCall_loop')
             try:
@@ -445,6 +566,9 @@ def load_config(environ):
         ['DBPort', 'integer', None],
         ['DBPass', 'string', None],
         ['DBConnectionString', 'string', None],
+        ['DBReplicaConnectionString', 'string', None],
+        ['ReplicaMaxLag', 'integer', 30],
+        ['ReplicaMethods', 'string', ''],
         ['KojiDir', 'string', None],
 
         ['AuthPrincipal', 'string', None],
@@ -497,6 +621,13 @@ def load_config(environ):
 
         ['MemoryWarnThreshold', 'integer', 5000],
         ['MaxRequestLength', 'integer', 4194304],
+        ['StreamResponses', 'boolean', False],
+        ['JSONTransport', 'boolean', True],
+        ['InheritanceCacheSize', 'integer', 1000],
+        ['QueryCacheSize', 'integer', 1000],
+        ['QueryPrepare', 'boolean', False],
+        ['IncrementalRepoInit', 'boolean', False],
+        ['IncrementalRepoVerify', 'boolean', False],
 
         ['LockOut', 'boolean', False],
         ['ServerOffline', 'boolean', False],
@@ -507,6 +638,7 @@ def load_config(environ):
         ['RegexUserName', 'string', r'^[A-Za-z0-9/_.@-]+$'],
 
         ['RPMDefaultChecksums', 'string', 'md5 sha256'],
+        ['WriteSignedRPMThreads', 'integer', 4],
 
         ['SessionRenewalTimeout', 'integer', 1440],
 
@@ -518,6 +650,10 @@ def load_config(environ):
         ['SoftRefusalTimeout', 'integer', 900],
         ['HostTimeout', 'integer', 900],
         ['RunInterval', 'integer', 60],
+        ['MemoryPerWeight', 'integer', 0],
+        ['DiskPerWeight', 'integer', 0],
+        ['AffinityBonus', 'integer', 2],
+        ['TaskWaitTimeout', 'integer', 0],
     ]
     opts = {}
     for name, dtype, default in cfgmap:
@@ -751,6 +887,9 @@ def server_setup(environ):
         plugins = load_plugins(opts)
         registry = get_registry(opts, plugins)
         policy = get_policy(opts, plugins)
+        kojihub.inheritance_cache.size = opts['InheritanceCacheSize']
+        db.statement_cache.size = opts['QueryCacheSize']
+        db.statement_cache.prepare = opts['QueryPrepare']
         if opts.get('DBConnectionString'):
             db.provideDBopts(dsn=opts['DBConnectionString'])
         else:
@@ -759,6 +898,8 @@ def server_setup(environ):
                              password=opts.get("DBPass", None),
                              host=opts.get("DBHost", None),
                              port=opts.get("DBPort", None))
+        if opts.get('DBReplicaConnectionString'):
+            db.provideReplicaDBopts(dsn=opts['DBReplicaConnectionString'])
     except Exception:
         tb_str = ''.join(traceback.format_exception(*sys.exc_info()))
         logger.error(tb_str)
@@ -797,6 +938,7 @@ def application(environ, start_response):
     # XXX check request length
     # XXX most of this should be moved elsewhere
     if 1:
+        streamed = None
         try:
             start = time.time()
             memory_usage_at_start = get_memory_usage()
@@ -821,45 +963,97 @@ def application(environ, start_response):
                 return error_reply(start_response, '400 Bad Request', str(e) + '\n')
             except RequestTimeout as e:
                 return error_reply(start_response, '408 Request Timeout', str(e) + '\n')
-            response = response.encode()
+            content_type = koji.jsonplus.CONTENT_TYPE if h.json else "text/xml"
+            if h.streaming:
+                # the length is not known in advance
+                headers = GLOBAL_HEADERS + [('Content-Type', content_type)]
+                start_response('200 OK', headers)
+                # the response cleans up the request when it is done
+                streamed = StreamedResponse(h, response, start, memory_usage_at_start)
+                return streamed
+            response = response[0].encode()
             headers = GLOBAL_HEADERS + [
                 ('Content-Length', str(len(response))),
-                ('Content-Type', "text/xml"),
+                ('Content-Type', content_type),
             ]
             start_response('200 OK', headers)
-            if h.traceback:
-                # rollback
-                context.cnx.rollback()
-            elif context.commit_pending:
-                # Currently there is not much data we can provide to the
-                # pre/postCommit callbacks. The handler can access context at
-                # least
-                koji.plugin.run_callbacks('preCommit')
-                context.cnx.commit()
-                koji.plugin.run_callbacks('postCommit')
-            memory_usage_at_end = get_memory_usage()
-            if memory_usage_at_end - memory_usage_at_start > opts['MemoryWarnThreshold']:
-                paramstr = repr(getattr(context, 'params', 'UNKNOWN'))
-                if len(paramstr) > 120:
-                    paramstr = paramstr[:117] + "..."
-                h.logger.warning(
-                    "Memory usage of process %d grew from %d KiB to %d KiB (+%d KiB) processing "
-                    "request %s with args %s" %
-                    (os.getpid(), memory_usage_at_start, memory_usage_at_end,
-                     memory_usage_at_end - memory_usage_at_start, context.method, paramstr))
-            h.logger.debug("Returning %d bytes after %f seconds", len(response),
-                           time.time() - start)
+            finish_request(h, len(response), start, memory_usage_at_start)
         finally:
             # make sure context gets cleaned up
-            if hasattr(context, 'cnx'):
-                try:
-                    context.cnx.close()
-                except Exception:
-                    pass
-            context._threadclear()
+            if streamed is None:
+                cleanup_request()
         return [response]  # XXX
 
 
+def finish_request(h, size, start, memory_usage_at_start):
+    """Commit or roll back the request transaction and log its statistics"""
+    if h.traceback:
+        # rollback
+        context.cnx.rollback()
+    elif context.commit_pending:
+        # Currently there is not much data we can provide to the
+        # pre/postCommit callbacks. The handler can access context at
+        # least
+        koji.plugin.run_callbacks('preCommit')
+        kojihub.flush_tag_last_change()
+        context.cnx.commit()
+        koji.plugin.run_callbacks('postCommit')
+    memory_usage_at_end = get_memory_usage()
+    if memory_usage_at_end - memory_usage_at_start > opts['MemoryWarnThreshold']:
+        paramstr = repr(getattr(context, 'params', 'UNKNOWN'))
+        if len(paramstr) > 120:
+            paramstr = paramstr[:117] + "..."
+        h.logger.warning(
+            "Memory usage of process %d grew from %d KiB to %d KiB (+%d KiB) processing "
+            "request %s with args %s" %
+            (os.getpid(), memory_usage_at_start, memory_usage_at_end,
+             memory_usage_at_end - memory_usage_at_start, context.method, paramstr))
+    h.logger.debug("Returning %d bytes after %f seconds", size, time.time() - start)
+
+
+def cleanup_request():
+    """Close the db connection and clear the request context"""
+    if hasattr(context, 'cnx'):
+        try:
+            context.cnx.close()
+        except Exception:
+            pass
+    context._threadclear()
+
+
+class StreamedResponse(object):
+    """WSGI response iterable for streamed responses
+
+    The request context, including its transaction, stays in place until the
+    server closes the response.
+    """
+
+    def __init__(self, h, chunks, start, memory_usage_at_start):
+        self.h = h
+        self.chunks = chunks
+        self.start = start
+        self.memory_usage_at_start = memory_usage_at_start
+        self.size = 0
+
+    def __iter__(self):
+        try:
+            for chunk in self.chunks:
+                chunk = chunk.encode()
+                self.size += len(chunk)
+                yield chunk
+        except Exception:
+            # it is too late for a fault, the client gets an incomplete response
+            self.h.traceback = True
+            self.h._log_exception()
+            raise
+
+    def close(self):
+        try:
+            finish_request(self.h, self.size, self.start, self.memory_usage_at_start)
+        finally:
+            cleanup_request()
+
+
 def get_registry(opts, plugins):
     # Create and populate handler registry
     registry = HandlerRegistry()
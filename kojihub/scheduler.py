@@ -1,12 +1,15 @@
+import collections
+import heapq
 import json
 import logging
+import threading
 import time
 
 import koji
 from koji.context import context
 from . import kojihub
 from .db import QueryProcessor, InsertProcessor, UpsertProcessor, UpdateProcessor, \
-    DeleteProcessor, QueryView, db_lock
+    DeleteProcessor, QueryView, db_lock, _dml
 
 
 logger = logging.getLogger('koji.scheduler')
@@ -91,6 +94,30 @@ def get_tasks_for_host(hostID, retry=True):
     return tasks
 
 
+def host_channel(hostID):
+    """Return the notification channel for the given host"""
+    return 'koji_host_%i' % hostID
+
+
+def notify_host(hostID):
+    """Wake the host if it is waiting for its tasks to change
+
+    The notification is sent when the transaction commits, so a rolled back
+    change does not wake anyone. Nothing is sent unless TaskWaitTimeout is set.
+    """
+    if hostID is None or not context.opts.get('TaskWaitTimeout'):
+        return
+    _dml('NOTIFY %s' % host_channel(hostID), {})
+
+
+def notify_task_host(taskID):
+    """Wake the host of the given task, if any (see notify_host)"""
+    if not context.opts.get('TaskWaitTimeout'):
+        return
+    _dml("SELECT pg_notify('koji_host_' || host_id, '') FROM task "
+         "WHERE id = %(task_id)s AND host_id IS NOT NULL", {'task_id': taskID})
+
+
 def set_refusal(hostID, taskID, soft=True, by_host=False, msg=''):
     data = {
         'host_id': kojihub.convert_value(hostID, cast=int),
@@ -213,6 +240,11 @@ class TaskScheduler(object):
         self.soft_refusal_timeout = context.opts['SoftRefusalTimeout']
         self.host_timeout = context.opts['HostTimeout']
         self.run_interval = context.opts['RunInterval']
+        # resources (in MiB) needed per unit of task weight
+        self.mem_per_weight = context.opts['MemoryPerWeight']
+        self.disk_per_weight = context.opts['DiskPerWeight']
+        # how much worse a host with a warm cache for the task repo may rank
+        self.affinity_bonus = context.opts['AffinityBonus']
 
     def run(self, force=False):
         if not db_lock('scheduler', wait=force):
@@ -273,12 +305,92 @@ class TaskScheduler(object):
         return ret
 
     def do_schedule(self):
-        # debug
-        logger.info(f'Hosts: {len(self.hosts)}')
-        logger.info(f'Free tasks: {len(self.free_tasks)}')
-        logger.info(f'Active tasks: {len(self.active_tasks)}')
+        logger.debug('Hosts: %i, free tasks: %i, active tasks: %i',
+                     len(self.hosts), len(self.free_tasks), len(self.active_tasks))
+
+        self.get_host_load()
+        refusals = self.get_refusals()
+        self.get_demand(refusals)
+        for host in self.hosts.values():
+            self._rank_host(host)
+
+        # Candidate hosts for each bin are kept in a heap ordered by rank. The heaps are only
+        # built for bins that have free tasks and are updated in place as tasks are assigned.
+        self._heaps = {}
+        # hosts that cannot fit even the lightest task are left out of the heaps
+        weights = [t['weight'] for t in self.free_tasks]
+        if weights:
+            self._min_weight = min(weights)
+
+        if self.affinity_bonus:
+            # only tasks that a warm host could take need their repo now
+            warm_bins = set()
+            for hosts in self._warm_hosts.values():
+                for host in hosts:
+                    warm_bins.update(host['_bins'])
+            self._get_task_repos([t for t in self.free_tasks if t['_bin'] in warm_bins])
+
+        # tasks are already in priority order
+        assigned = []
+        for task in self.free_tasks:
+            h_refused = refusals.get(task['task_id'], {})
+            host = self._pop_host(task, h_refused)
+            host = self._check_affinity(task, host, h_refused)
+            if host is None:
+                logger.debug('Could not assign task %s', task['task_id'])
+                continue
+            assigned.append((task, host))
+            # add run entry
+            self.assign(task, host)
+            # update our totals and rank
+            host['_load'] += task['weight']
+            host['_ntasks'] += 1
+            if host['_mem_avail'] is not None:
+                host['_mem_avail'] -= task['weight'] * self.mem_per_weight
+            if host['_disk_free'] is not None:
+                host['_disk_free'] -= task['weight'] * self.disk_per_weight
+            self._rank_host(host)
+            self._push_host(host)
+
+        if self.affinity_bonus:
+            self._get_task_repos([task for task, host in assigned])
+            affinity_tasks = affinity_hits = 0
+            for task, host in assigned:
+                if task['_repo_id']:
+                    affinity_tasks += 1
+                    if task['_repo_id'] in host['_repo_cache']:
+                        affinity_hits += 1
+            self.update_affinity_stats(affinity_tasks, affinity_hits)
+
+    def _get_task_repos(self, tasks):
+        """Set the _repo_id of the tasks that do not have it yet"""
+        todo = [task for task in tasks if '_repo_id' not in task]
+        if not todo:
+            return
+        repos = task_repo_cache.get([task['task_id'] for task in todo])
+        for task in todo:
+            task['_repo_id'] = repos.get(task['task_id'])
+
+    def get_host_load(self):
+        """Calculate host load and task count from the active tasks"""
+        for host in self.hosts.values():
+            host['_load'] = 0.0
+            host['_ntasks'] = 0
+            host['_demand'] = 0.0
+            # host data might be unset
+            hostdata = host['data']
+            if hostdata is None:
+                hostdata = {}
+            host['_maxjobs'] = hostdata.get('maxjobs') or self.maxjobs
+            self._get_host_resources(host, hostdata)
+            host['_repo_cache'] = set(hostdata.get('repo_cache') or [])
+
+        # index hosts by the repos they have warm caches for
+        self._warm_hosts = {}
+        for host in self.hosts.values():
+            for repo_id in host['_repo_cache']:
+                self._warm_hosts.setdefault(repo_id, []).append(host)
 
-        # calculate host load and task count
         for task in self.active_tasks:
             # for now, we mirror what kojid updateTasks has been doing
             host = self.hosts.get(task['host_id'])
@@ -286,46 +398,67 @@ class TaskScheduler(object):
                 # not showing as ready
                 # TODO log and deal with this condition
                 continue
-            host.setdefault('_load', 0.0)
             if not task['waiting']:
                 host['_load'] += task['weight']
-            host.setdefault('_ntasks', 0)
             host['_ntasks'] += 1
 
         for host in self.hosts.values():
-            host.setdefault('_load', 0.0)
-            host.setdefault('_ntasks', 0)
-            host.setdefault('_demand', 0.0)
-            # host data might be unset
-            hostdata = host['data']
-            if hostdata is None:
-                hostdata = {}
-            host.setdefault('_maxjobs', hostdata.get('maxjobs') or self.maxjobs)
-            # temporary test code
-            logger.info(f'Host: {host}')
             ldiff = host['task_load'] - host['_load']
             if abs(ldiff) > 0.01:
                 # this is expected in a number of cases, just observing
-                logger.info(f'Host load differs by {ldiff:.2f}: {host}')
+                logger.debug('Host %s load differs by %.2f', host['name'], ldiff)
 
-        # figure out which hosts *can* take each task
-        # at the moment this is mostly just bin, but in the future it will be more complex
-        refusals = self.get_refusals()
+    def _get_host_resources(self, host, hostdata):
+        """Read the resource data reported by the host
+
+        Older builders do not report these, in which case the host is not limited by them.
+        """
+        host['_mem_avail'] = hostdata.get('mem_available')
+        host['_disk_free'] = hostdata.get('disk_free')
+        # pressure raises the rank of busy hosts
+        pressure = 0.0
+        cpus = hostdata.get('cpus')
+        loadavg = hostdata.get('loadavg')
+        if cpus and loadavg:
+            pressure += min(loadavg[0] / cpus, 2.0)
+        mem_total = hostdata.get('mem_total')
+        if mem_total and host['_mem_avail'] is not None:
+            pressure += max(0.0, 1.0 - host['_mem_avail'] / mem_total)
+        host['_pressure'] = pressure
+
+    def get_demand(self, refusals):
+        """Estimate the pending load for each host
+
+        Each free task adds its weight to the demand of the hosts that could take it, split
+        evenly between them. Tasks are grouped by bin and needed capacity, so that the candidate
+        hosts only need to be found once per group.
+        """
+        groups = {}
         for task in self.free_tasks:
-            task['_hosts'] = []
             min_avail = min(0, task['weight'] - self.capacity_overcommit)
-            h_refused = refusals.get(task['task_id'], {})
-            for host in self.hosts_by_bin.get(task['_bin'], []):
-                if (host['ready'] and
-                        host['_ntasks'] < host['_maxjobs'] and
-                        host['capacity'] - host['_load'] > min_avail and
-                        host['id'] not in h_refused):
-                    task['_hosts'].append(host)
-            logger.info(f'Task {task["task_id"]}: {len(task["_hosts"])} options')
-            for host in task['_hosts']:
-                # demand gives us a rough measure of how much overall load is pending for the host
-                host.setdefault('_demand', 0.0)
-                host['_demand'] += task['weight'] / len(task['_hosts'])
+            groups.setdefault((task['_bin'], min_avail), []).append(task)
+
+        for (tbin, min_avail), tasks in groups.items():
+            hosts = [h for h in self.hosts_by_bin.get(tbin, [])
+                     if (h['ready'] and
+                         h['_ntasks'] < h['_maxjobs'] and
+                         h['capacity'] - h['_load'] > min_avail)]
+            if not hosts:
+                continue
+            host_ids = set([h['id'] for h in hosts])
+            share = 0.0
+            for task in tasks:
+                h_refused = [h_id for h_id in refusals.get(task['task_id'], {})
+                             if h_id in host_ids]
+                noptions = len(hosts) - len(h_refused)
+                if noptions <= 0:
+                    continue
+                share += task['weight'] / noptions
+                # refusing hosts get no share of this task
+                for h_id in h_refused:
+                    self.hosts[h_id]['_demand'] -= task['weight'] / noptions
+            for host in hosts:
+                host['_demand'] += share
 
         # normalize demand to 1
         max_demand = sum([h['_demand'] for h in self.hosts.values()])
@@ -333,30 +466,121 @@ class TaskScheduler(object):
             for h in self.hosts.values():
                 h['_demand'] = (h['_demand'] / max_demand)
 
-        for h in self.hosts.values():
-            self._rank_host(h)
+    def _check_affinity(self, task, host, h_refused):
+        """Prefer a host with a warm cache for the task repo
 
-        # tasks are already in priority order
-        for task in self.free_tasks:
-            min_avail = task['weight'] - self.capacity_overcommit
-            task['_hosts'].sort(key=lambda h: h['_rank'])
-            logger.debug('Task %i choices: %s', task['task_id'],
-                         [(h['name'], "%(_rank).2f" % h) for h in task['_hosts']])
-            for host in task['_hosts']:
-                if (host['capacity'] - host['_load'] > min_avail and
-                        host['_ntasks'] < host['_maxjobs']):
-                    # add run entry
-                    self.assign(task, host)
-                    # update our totals and rank
-                    host['_load'] += task['weight']
-                    host['_ntasks'] += 1
-                    self._rank_host(host)
-                    break
-            else:
-                logger.debug('Could not assign task %s', task['task_id'])
+        The best ranked of these is chosen instead of the given host, unless it ranks worse
+        by more than the affinity bonus.
+        """
+        repo_id = task.get('_repo_id')
+        if not repo_id or host is None or repo_id in host['_repo_cache']:
+            # without a host from the bin heap, no warm host can take the task either
+            return host
+        warm_hosts = self._warm_hosts.get(repo_id)
+        if not warm_hosts:
+            return host
+        best = None
+        usable = []
+        for warm in warm_hosts:
+            if not self._host_usable(warm):
+                continue
+            usable.append(warm)
+            if (task['_bin'] in warm['_bins'] and
+                    warm['id'] not in h_refused and
+                    self._host_fits(warm, task['weight'])):
+                if best is None or (warm['_rank'], warm['id']) < (best['_rank'], best['id']):
+                    best = warm
+        # hosts that are done for this run stay that way
+        self._warm_hosts[repo_id] = usable
+        if best is None or best['_rank'] > host['_rank'] + self.affinity_bonus:
+            return host
+        # return the unused host to the bin heap
+        entry = (host['_rank'], host['id'], host['_version'])
+        heapq.heappush(self._heaps[task['_bin']], entry)
+        return best
+
+    def update_affinity_stats(self, tasks, hits):
+        """Add to the count of assignments of tasks with a repo, and of those to warm hosts"""
+        if not tasks:
+            return
+        logger.info('Assigned %i of %i tasks with a repo to hosts with a warm cache',
+                    hits, tasks)
+        stats = get_affinity_stats()
+        stats['tasks'] += tasks
+        stats['hits'] += hits
+        upsert = UpsertProcessor(
+            'scheduler_sys_data',
+            data={'name': 'affinity_stats',
+                  'data': json.dumps({'tasks': stats['tasks'], 'hits': stats['hits']})},
+            keys=['name'],
+        )
+        upsert.execute()
 
     def _rank_host(self, host):
-        host['_rank'] = host['_load'] + host['_ntasks'] + host['_demand']
+        host['_rank'] = host['_load'] + host['_ntasks'] + host['_demand'] + host['_pressure']
+        # heap entries carrying an older version are stale
+        host['_version'] = host.get('_version', 0) + 1
+
+    def _host_fits(self, host, weight):
+        """Check whether a host has the capacity and resources for a task of given weight"""
+        if host['capacity'] - host['_load'] <= weight - self.capacity_overcommit:
+            return False
+        if (host['_mem_avail'] is not None and
+                host['_mem_avail'] < weight * self.mem_per_weight):
+            return False
+        if (host['_disk_free'] is not None and
+                host['_disk_free'] < weight * self.disk_per_weight):
+            return False
+        return True
+
+    def _host_usable(self, host):
+        """Check whether a host could take any more of the free tasks in this run"""
+        return (host['ready'] and
+                host['_ntasks'] < host['_maxjobs'] and
+                self._host_fits(host, self._min_weight))
+
+    def _bin_heap(self, tbin):
+        heap = self._heaps.get(tbin)
+        if heap is None:
+            heap = [(h['_rank'], h['id'], h['_version'])
+                    for h in self.hosts_by_bin.get(tbin, []) if self._host_usable(h)]
+            heapq.heapify(heap)
+            self._heaps[tbin] = heap
+        return heap
+
+    def _push_host(self, host):
+        """Add the current rank of a host to the heaps of its bins"""
+        if not self._host_usable(host):
+            return
+        entry = (host['_rank'], host['id'], host['_version'])
+        for tbin in host['_bins']:
+            heap = self._heaps.get(tbin)
+            if heap is not None:
+                heapq.heappush(heap, entry)
+
+    def _pop_host(self, task, h_refused):
+        """Take the best ranked host that can run the task from the bin heap
+
+        Returns None if there is no such host
+        """
+        heap = self._bin_heap(task['_bin'])
+        skipped = []
+        found = None
+        while heap:
+            entry = heapq.heappop(heap)
+            host = self.hosts[entry[1]]
+            if entry[2] != host['_version'] or not self._host_usable(host):
+                # stale entry, or the host is done for this run
+                continue
+            if host['id'] in h_refused or not self._host_fits(host, task['weight']):
+                # not for this task, but maybe for others
+                skipped.append(entry)
+                continue
+            found = host
+            break
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+        return found
 
     def check_active_tasks(self):
         """Check on active tasks"""
@@ -552,14 +776,17 @@ class TaskScheduler(object):
     def _get_hosts(self):
         """Query enabled hosts"""
 
+        config = host_config_cache.get()
+        if not config:
+            return []
+
+        # the static part of the host data comes from the cache
         fields = (
             ('host.id', 'id'),
             ('host.name', 'name'),
             ("date_part('epoch', host.update_time)", 'update_ts'),
             ('host.task_load', 'task_load'),
             ('host.ready', 'ready'),
-            ('host_config.arches', 'arches'),
-            ('host_config.capacity', 'capacity'),
             ('scheduler_host_data.data', 'data'),
         )
         fields, aliases = zip(*fields)
@@ -568,30 +795,19 @@ class TaskScheduler(object):
             tables=['host'],
             columns=fields,
             aliases=aliases,
-            clauses=[
-                'host_config.enabled IS TRUE',
-                'host_config.active IS TRUE',
-            ],
-            joins=[
-                'LEFT JOIN host_config ON host.id = host_config.host_id',
-                'LEFT JOIN scheduler_host_data ON host.id = scheduler_host_data.host_id',
-            ]
+            clauses=['host.id IN %(host_ids)s'],
+            joins=['LEFT JOIN scheduler_host_data ON host.id = scheduler_host_data.host_id'],
+            values={'host_ids': list(config)},
         )
 
-        hosts = query.execute()
-
-        # also get channel info
-        query = QueryProcessor(
-            tables=['host_channels'],
-            columns=['host_id', 'channel_id'],
-            clauses=['active IS TRUE', 'channels.enabled IS TRUE'],
-            joins=['channels ON host_channels.channel_id = channels.id'],
-        )
-        chan_idx = {}
-        for row in query.execute():
-            chan_idx.setdefault(row['host_id'], []).append(row['channel_id'])
-        for host in hosts:
-            host['channels'] = chan_idx.get(host['id'], [])
+        hosts = []
+        for host in query.execute():
+            hconfig = config.get(host['id'])
+            if not hconfig:
+                continue
+            host.update(hconfig)
+            host['channels'] = list(hconfig['channels'])
+            hosts.append(host)
 
         return hosts
 
@@ -626,6 +842,182 @@ class TaskScheduler(object):
         return True
 
 
+class HostConfigCache(object):
+    """Cache for the host configuration used by the scheduler
+
+    Host arches, capacity and channels rarely change, so they are kept in a per-process cache
+    and shared between scheduler runs. The host_config and host_channels tables are versioned,
+    so every committed write adds a row or sets a revoke_event. A single cheap query of their row
+    counts and event sums (plus the enabled channels) tells us whether the cached data is still
+    current. The latest events alone would not do, since a transaction holding a lower event may
+    commit after one with a higher event. The rest of the host data (ready, load, checkin time)
+    is read on every run.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.fingerprint = None
+        self.config = None
+        self.hits = 0
+        self.misses = 0
+
+    def _fingerprint(self):
+        query = QueryProcessor(
+            tables=['host_config'],
+            columns=['COUNT(*)', 'SUM(host_config.create_event)',
+                     'SUM(COALESCE(host_config.revoke_event, 0))',
+                     '(SELECT COUNT(*) FROM host_channels)',
+                     '(SELECT SUM(create_event) FROM host_channels)',
+                     '(SELECT SUM(COALESCE(revoke_event, 0)) FROM host_channels)',
+                     '(SELECT array_agg(id ORDER BY id) FROM channels WHERE enabled IS TRUE)'],
+            opts={'asList': True},
+        )
+        return query.executeOne()
+
+    def _read(self):
+        query = QueryProcessor(
+            tables=['host_config'],
+            columns=['host_id', 'arches', 'capacity'],
+            clauses=['active IS TRUE', 'enabled IS TRUE'],
+        )
+        config = {}
+        for row in query.execute():
+            config[row['host_id']] = {
+                'arches': row['arches'],
+                'capacity': row['capacity'],
+                'channels': [],
+            }
+
+        query = QueryProcessor(
+            tables=['host_channels'],
+            columns=['host_id', 'channel_id'],
+            clauses=['active IS TRUE', 'channels.enabled IS TRUE'],
+            joins=['channels ON host_channels.channel_id = channels.id'],
+        )
+        for row in query.execute():
+            if row['host_id'] in config:
+                config[row['host_id']]['channels'].append(row['channel_id'])
+
+        return config
+
+    def get(self):
+        """Return the configuration of enabled hosts, indexed by host id
+
+        The result is shared and should not be modified
+        """
+        fingerprint = self._fingerprint()
+        with self.lock:
+            if self.config is not None and fingerprint == self.fingerprint:
+                self.hits += 1
+                return self.config
+        self.misses += 1
+        config = self._read()
+        with self.lock:
+            self.fingerprint = fingerprint
+            self.config = config
+        return config
+
+    def invalidate(self):
+        with self.lock:
+            self.fingerprint = None
+            self.config = None
+
+
+host_config_cache = HostConfigCache()
+
+
+def get_task_repo(request):
+    """Return the repo id given in the options of a task request, if any"""
+    if not request or request.find('<?xml', 0, 10) == -1:
+        # older base64 encoded data, not worth handling here
+        return None
+    try:
+        params, method = koji.xmlrpcplus.loads(request)
+    except Exception:
+        logger.warning('Unable to parse task request', exc_info=True)
+        return None
+    for param in params:
+        if isinstance(param, dict) and param.get('repo_id'):
+            return param['repo_id']
+    return None
+
+
+class TaskRepoCache(object):
+    """Cache for the repo ids of tasks, read from their requests
+
+    The scheduler needs the repo of a free task to prefer hosts with a warm cache for it. A
+    task request never changes, so it only needs to be fetched and parsed once, instead of on
+    every run for as long as the task waits. The cache is per process, and the oldest entries
+    are dropped once it holds more than size tasks.
+    """
+
+    def __init__(self, size=20000):
+        self.lock = threading.Lock()
+        self.size = size
+        self.repos = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, task_ids):
+        """Return the repo id of each task (None if it has none), indexed by task id
+
+        The requests of the tasks that are not cached are read with a single query.
+        """
+        result = {}
+        missing = []
+        with self.lock:
+            for task_id in task_ids:
+                if task_id in self.repos:
+                    result[task_id] = self.repos[task_id]
+                else:
+                    missing.append(task_id)
+            self.hits += len(result)
+            self.misses += len(missing)
+        if not missing:
+            return result
+        query = QueryProcessor(
+            tables=['task'],
+            columns=['id', 'request'],
+            clauses=['id IN %(task_ids)s'],
+            values={'task_ids': missing},
+        )
+        fetched = {}
+        for row in query.execute():
+            fetched[row['id']] = get_task_repo(row['request'])
+        with self.lock:
+            for task_id in missing:
+                result[task_id] = self.repos[task_id] = fetched.get(task_id)
+            while len(self.repos) > self.size:
+                self.repos.popitem(last=False)
+        return result
+
+    def clear(self):
+        with self.lock:
+            self.repos.clear()
+
+
+task_repo_cache = TaskRepoCache()
+
+
+def get_affinity_stats():
+    """Return the counts of assigned tasks with a repo and of those assigned to hosts with
+    a warm cache for that repo"""
+    query = QueryProcessor(
+        tables=['scheduler_sys_data'],
+        columns=['data'],
+        clauses=['name = %(name)s'],
+        values={'name': 'affinity_stats'},
+    )
+    stats = query.singleValue(strict=False) or {}
+    tasks = stats.get('tasks', 0)
+    hits = stats.get('hits', 0)
+    return {
+        'tasks': tasks,
+        'hits': hits,
+        'hit_rate': hits / tasks if tasks else None,
+    }
+
+
 # exported as assignTask in kojihub
 def do_assign(task_id, host, force=False, override=False):
     """Assign a task to a host
@@ -648,6 +1040,7 @@ class SchedulerExports:
     getTaskRefusals = staticmethod(get_task_refusals)
     getHostData = staticmethod(get_host_data)
     getLogMessages = staticmethod(get_log_messages)
+    getAffinityStats = staticmethod(get_affinity_stats)
 
     def doRun(self, force=False):
         """Run the scheduler
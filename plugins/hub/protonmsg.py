@@ -7,21 +7,65 @@
 
 import json
 import logging
+import optparse
+import os
 import random
+import time
 
-from proton import Message, SSLDomain
+from proton import Delivery, Message, SSLDomain
 from proton.handlers import MessagingHandler
 from proton.reactor import Container
+from proton.utils import BlockingConnection
 
 import koji
 from koji.context import context
 from koji.plugin import callback, convert_datetime, ignore_error
 from kojihub import get_build_type
-from kojihub.db import QueryProcessor, InsertProcessor, DeleteProcessor, db_lock
+from kojihub.db import (
+    BulkInsertProcessor,
+    DeleteProcessor,
+    InsertProcessor,
+    QueryProcessor,
+    db_lock,
+    listen,
+    wait_notify,
+)
 
 CONFIG_FILE = '/etc/koji-hub/plugins/protonmsg.conf'
 CONFIG = None
 LOG = logging.getLogger('koji.plugin.protonmsg')
+# notified when messages are queued for the delivery worker
+QUEUE_CHANNEL = 'koji_protonmsg_queue'
+
+
+def _ssl_domain(conf):
+    """Return the SSLDomain for the configured cert, or None"""
+    if conf.has_option('broker', 'cert') and conf.has_option('broker', 'cacert'):
+        ssl = SSLDomain(SSLDomain.MODE_CLIENT)
+        cert = conf.get('broker', 'cert')
+        ssl.set_credentials(cert, cert, None)
+        ssl.set_trusted_ca_db(conf.get('broker', 'cacert'))
+        ssl.set_peer_authentication(SSLDomain.VERIFY_PEER)
+        return ssl
+    return None
+
+
+def _topic_prefix(conf):
+    """Normalize topic_prefix value that the user configured.
+
+    RabbitMQ brokers require that topics start with "/topic/"
+    ActiveMQ brokers require that topics start with "topic://"
+
+    If the user specified a prefix that begins with one or the other, use
+    that. For backwards compatibility, if the user chose neither, prepend
+    "topic://".
+    """
+    koji_topic_prefix = conf.get('broker', 'topic_prefix')
+    if koji_topic_prefix.startswith('/topic/'):
+        return koji_topic_prefix
+    if koji_topic_prefix.startswith('topic://'):
+        return koji_topic_prefix
+    return 'topic://' + koji_topic_prefix
 
 
 class TimeoutHandler(MessagingHandler):
@@ -39,14 +83,7 @@ class TimeoutHandler(MessagingHandler):
     def on_start(self, event):
         self.log.debug('Container starting')
         event.container.connected = False
-        if self.conf.has_option('broker', 'cert') and self.conf.has_option('broker', 'cacert'):
-            ssl = SSLDomain(SSLDomain.MODE_CLIENT)
-            cert = self.conf.get('broker', 'cert')
-            ssl.set_credentials(cert, cert, None)
-            ssl.set_trusted_ca_db(self.conf.get('broker', 'cacert'))
-            ssl.set_peer_authentication(SSLDomain.VERIFY_PEER)
-        else:
-            ssl = None
+        ssl = _ssl_domain(self.conf)
         self.log.debug('connecting to %s', self.url)
         event.container.connect(url=self.url, reconnect=False, ssl_domain=ssl)
         connect_timeout = self.conf.getint('broker', 'connect_timeout')
@@ -76,21 +113,7 @@ class TimeoutHandler(MessagingHandler):
 
     @property
     def topic_prefix(self):
-        """Normalize topic_prefix value that the user configured.
-
-        RabbitMQ brokers require that topics start with "/topic/"
-        ActiveMQ brokers require that topics start with "topic://"
-
-        If the user specified a prefix that begins with one or the other, use
-        that. For backwards compatibility, if the user chose neither, prepend
-        "topic://".
-        """
-        koji_topic_prefix = self.conf.get('broker', 'topic_prefix')
-        if koji_topic_prefix.startswith('/topic/'):
-            return koji_topic_prefix
-        if koji_topic_prefix.startswith('topic://'):
-            return koji_topic_prefix
-        return 'topic://' + koji_topic_prefix
+        return _topic_prefix(self.conf)
 
     def send_msgs(self, event):
         for msg in self.msgs:
@@ -357,17 +380,26 @@ def _send_msgs(urls, msgs, CONFIG):
     return msgs
 
 
-def store_to_db(msgs):
+def store_to_db(msgs, notify=False):
     c = context.cnx.cursor()
     # we're running in postCommit, so we need to handle new transaction
     c.execute('BEGIN')
-    for msg in msgs:
-        address = msg['address']
-        body = msg['body']
-        props = json.dumps(msg['props'])
-        insert = InsertProcessor(table='proton_queue')
-        insert.set(address=address, props=props, body=body)
+    if notify:
+        insert = BulkInsertProcessor(table='proton_queue')
+        for msg in msgs:
+            insert.add_record(address=msg['address'], props=json.dumps(msg['props']),
+                              body=msg['body'])
         insert.execute()
+        # wake the delivery worker
+        c.execute('NOTIFY %s' % QUEUE_CHANNEL)
+    else:
+        for msg in msgs:
+            address = msg['address']
+            body = msg['body']
+            props = json.dumps(msg['props'])
+            insert = InsertProcessor(table='proton_queue')
+            insert.set(address=address, props=props, body=body)
+            insert.execute()
     c.execute('COMMIT')
 
 
@@ -414,6 +446,204 @@ def handle_db_msgs(urls, CONFIG):
             c.execute('ROLLBACK')
 
 
+class BrokerConnection(object):
+    """A persistent connection to one of the brokers, used by the delivery worker"""
+
+    def __init__(self, urls, conf):
+        self.urls = urls
+        self.conf = conf
+        self.topic_prefix = _topic_prefix(conf)
+        self.connect_timeout = conf.getint('broker', 'connect_timeout')
+        self.send_timeout = conf.getint('broker', 'send_timeout')
+        self.conn = None
+        self.senders = {}
+
+    def open(self):
+        urls = list(self.urls)
+        random.shuffle(urls)
+        for url in urls:
+            try:
+                self.conn = BlockingConnection(url, timeout=self.connect_timeout,
+                                               ssl_domain=_ssl_domain(self.conf))
+            except Exception as ex:
+                LOG.warning('could not connect to %s: %s', url, ex)
+                continue
+            LOG.info('connected to %s', url)
+            return
+        raise koji.GenericError('could not connect to any destinations')
+
+    def close(self):
+        if self.conn is None:
+            return
+        try:
+            self.conn.close()
+        except Exception as ex:
+            LOG.debug('error closing connection: %s', ex)
+        self.conn = None
+        self.senders = {}
+
+    def send(self, msgs):
+        """Send the messages and wait until the broker settles all of them
+
+        The messages are not sent one by one, so a batch only takes about one
+        round trip to the broker.
+
+        :returns: list of the messages that the broker accepted
+        """
+        if self.conn is None:
+            self.open()
+        deliveries = []
+        for msg in msgs:
+            # address is like "topic://koji.package.add"
+            address = self.topic_prefix + '.' + msg['address']
+            sender = self.senders.get(address)
+            if sender is None:
+                sender = self.senders[address] = self.conn.create_sender(address)
+            pmsg = Message(properties=msg['props'], body=msg['body'])
+            deliveries.append((sender.link.send(pmsg), msg))
+        self.conn.wait(lambda: all(d.settled for d, m in deliveries),
+                       timeout=self.send_timeout, msg='sending %i messages' % len(msgs))
+        accepted = []
+        for delivery, msg in deliveries:
+            if delivery.remote_state == Delivery.ACCEPTED:
+                accepted.append(msg)
+            else:
+                LOG.error('message was not accepted (%s): %s', delivery.remote_state,
+                          msg['props'])
+            delivery.settle()
+        return accepted
+
+
+class DeliveryWorker(object):
+    """Deliver the messages of the database queue over a persistent connection
+
+    With the worker option of the queue section, the hub only queues the
+    messages, and this worker sends them in batches that span many requests.
+    Several workers can run at once, each batch is locked with SKIP LOCKED.
+    """
+
+    def __init__(self, conf, broker=None):
+        self.conf = conf
+        if broker is None:
+            broker = BrokerConnection(conf.get('broker', 'urls').split(), conf)
+        self.broker = broker
+        self.batch_size = conf.getint('queue', 'batch_size', fallback=100)
+        self.max_age = conf.getint('queue', 'max_age', fallback=24)
+        self.poll_interval = conf.getint('queue', 'poll_interval', fallback=10)
+        self.retry_interval = conf.getint('queue', 'retry_interval', fallback=30)
+        self.stats_interval = conf.getint('queue', 'stats_interval', fallback=60)
+        self.stats_file = conf.get('queue', 'stats_file', fallback=None)
+        self.test_mode = conf.getboolean('broker', 'test_mode', fallback=False)
+        self.last_report = None
+        self.stats = {
+            'sent': 0,
+            'failed': 0,
+            'batches': 0,
+            # the queue, as of the last report
+            'queue_depth': 0,
+            'queue_age': 0.0,
+            # seconds from queueing to delivery, for the last batch
+            'latency': 0.0,
+            'send_time': 0.0,
+        }
+
+    def expire(self):
+        delete = DeleteProcessor(
+            table='proton_queue',
+            clauses=[f"created_ts < NOW() -'{self.max_age:d} hours'::interval"])
+        expired = delete.execute()
+        if expired:
+            LOG.warning('dropped %i messages older than %i hours', expired, self.max_age)
+        context.cnx.commit()
+
+    def deliver(self):
+        """Send one batch of queued messages
+
+        :returns: a tuple (number of messages fetched, number of messages sent)
+        """
+        query = QueryProcessor(tables=('proton_queue',),
+                               columns=('id', 'address', 'props', 'body::TEXT',
+                                        'EXTRACT(EPOCH FROM NOW() - created_ts)'),
+                               aliases=('id', 'address', 'props', 'body', 'age'),
+                               opts={'order': 'id', 'limit': self.batch_size,
+                                     'rowlock': 'skip'})
+        msgs = query.execute()
+        if not msgs:
+            context.cnx.commit()
+            return 0, 0
+        start = time.time()
+        if self.test_mode:
+            LOG.debug('test mode: skipping send for %i messages from db', len(msgs))
+            sent = msgs
+        else:
+            try:
+                sent = self.broker.send(msgs)
+            except Exception as ex:
+                LOG.error('could not send %i messages: %s', len(msgs), ex)
+                self.broker.close()
+                sent = []
+        send_time = time.time() - start
+        if sent:
+            delete = DeleteProcessor(table='proton_queue', clauses=['id IN %(ids)s'],
+                                     values={'ids': [m['id'] for m in sent]})
+            delete.execute()
+        # this also releases the rows of the unsent messages
+        context.cnx.commit()
+        self.stats['sent'] += len(sent)
+        self.stats['failed'] += len(msgs) - len(sent)
+        self.stats['batches'] += 1
+        self.stats['send_time'] = send_time
+        if sent:
+            self.stats['latency'] = max(float(m['age']) for m in sent) + send_time
+        LOG.debug('sent %i of %i messages in %.3f seconds', len(sent), len(msgs), send_time)
+        return len(msgs), len(sent)
+
+    def report(self):
+        """Update the queue metrics, log them, and write them to the stats file"""
+        age = 'COALESCE(EXTRACT(EPOCH FROM NOW() - MIN(created_ts)), 0)'
+        query = QueryProcessor(tables=('proton_queue',), columns=('COUNT(*)', age),
+                               aliases=('depth', 'age'))
+        row = query.executeOne()
+        context.cnx.commit()
+        self.stats['queue_depth'] = row['depth']
+        self.stats['queue_age'] = float(row['age'])
+        LOG.info('queue depth: %(queue_depth)i, oldest: %(queue_age).1fs, '
+                 'latency: %(latency).3fs, sent: %(sent)i, failed: %(failed)i', self.stats)
+        if self.stats_file:
+            data = dict(self.stats, timestamp=time.time())
+            tmp = self.stats_file + '.tmp'
+            with open(tmp, 'wt') as fo:
+                json.dump(data, fo)
+            os.rename(tmp, self.stats_file)
+        self.last_report = time.time()
+
+    def drain(self):
+        """Send batches until the queue is empty, or a send fails
+
+        :returns: True if the queue was emptied
+        """
+        while True:
+            fetched, sent = self.deliver()
+            if not fetched:
+                return True
+            if sent < fetched:
+                return False
+
+    def run(self):
+        """Deliver messages as they are queued, until interrupted"""
+        listen(QUEUE_CHANNEL)
+        while True:
+            if self.last_report is None or time.time() - self.last_report > self.stats_interval:
+                self.expire()
+                self.report()
+            if self.drain():
+                # a notification may have arrived while we were sending, so
+                # this returns at once in that case
+                wait_notify(self.poll_interval)
+            else:
+                time.sleep(self.retry_interval)
+
+
 @ignore_error
 @convert_datetime
 @callback('postCommit')
@@ -432,6 +662,11 @@ def send_queued_msgs(cbtype, *args, **kws):
     if CONFIG.has_option('queue', 'enabled'):
         db_enabled = CONFIG.getboolean('queue', 'enabled')
 
+    if db_enabled and CONFIG.getboolean('queue', 'worker', fallback=False):
+        # the delivery worker sends them
+        store_to_db(msgs, notify=True)
+        return
+
     if test_mode:
         LOG.debug('test mode: skipping send to urls: %r', urls)
         fail_chance = CONFIG.getint('broker', 'test_mode_fail', fallback=0)
@@ -463,3 +698,52 @@ def send_queued_msgs(cbtype, *args, **kws):
             handle_db_msgs(urls, CONFIG)
     elif unsent:
         LOG.error('could not send %i messages. db queue disabled' % len(msgs))
+
+
+def main():
+    """Run the delivery worker"""
+    from kojihub import db, kojixmlrpc
+
+    parser = optparse.OptionParser(usage='%prog [options]',
+                                   description='Deliver the messages queued by the protonmsg '
+                                               'hub plugin')
+    parser.add_option('-c', '--conf', default=CONFIG_FILE, help='Path to protonmsg.conf')
+    parser.add_option('--hub-conf', default='/etc/koji-hub/hub.conf',
+                      help="Path to koji's hub.conf, for the database options")
+    parser.add_option('--hub-config-dir', default='/etc/koji-hub/hub.conf.d',
+                      help="Path to koji's hub.conf directory")
+    parser.add_option('--once', action='store_true',
+                      help='Send the queued messages and exit')
+    parser.add_option('-d', '--debug', action='store_true', help='Show debug output')
+    options, args = parser.parse_args()
+
+    logging.basicConfig(level=logging.DEBUG if options.debug else logging.INFO,
+                        format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+    conf = koji.read_config_files([(options.conf, True)])
+    opts = kojixmlrpc.load_config({'koji.hub.ConfigFile': options.hub_conf,
+                                   'koji.hub.ConfigDir': options.hub_config_dir})
+    if opts.get('DBConnectionString'):
+        db.provideDBopts(dsn=opts['DBConnectionString'])
+    else:
+        db.provideDBopts(database=opts["DBName"],
+                         user=opts["DBUser"],
+                         password=opts.get("DBPass", None),
+                         host=opts.get("DBHost", None),
+                         port=opts.get("DBPort", None))
+    context.cnx = db.connect()
+
+    worker = DeliveryWorker(conf)
+    try:
+        if options.once:
+            worker.drain()
+            worker.report()
+        else:
+            worker.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        worker.broker.close()
+
+
+if __name__ == '__main__':
+    main()
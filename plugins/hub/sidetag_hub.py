@@ -4,7 +4,7 @@
 
 import koji
 from koji.context import context
-from koji.plugin import callback, export
+from koji.plugin import callback, export, read_only
 from koji.util import multi_fnmatch
 import koji.policy
 from kojihub import (
@@ -196,6 +196,7 @@ def _remove_sidetag(sidetag):
 
 
 @export
+@read_only
 def listSideTags(basetag=None, user=None, queryOpts=None):
     """List all sidetags with additional filters
 
@@ -1,9 +1,53 @@
 -- upgrade script to migrate the Koji database schema
 -- from version 1.33 to 1.34
 
-BEGIN;
+-- CREATE INDEX CONCURRENTLY cannot run inside a transaction block, so these
+-- indexes are created before it, without locking rpminfo against writes
 
 CREATE INDEX CONCURRENTLY IF NOT EXISTS rpminfo_nvra
     ON rpminfo(name,version,release,arch,external_repo_id);
 
+-- used to find the builds which used an rpm in their buildroot (listTrashCandidates)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS rpminfo_buildroot ON rpminfo(buildroot_id);
+
+BEGIN;
+
+-- last change of each tag, maintained by the hub
+CREATE TABLE IF NOT EXISTS tag_last_change (
+        tag_id INTEGER NOT NULL PRIMARY KEY REFERENCES tag(id),
+        event_id INTEGER NOT NULL REFERENCES events(id)
+) WITHOUT OIDS;
+
+CREATE INDEX IF NOT EXISTS tag_last_change_by_event ON tag_last_change (event_id);
+
+-- backfill from existing data
+-- (this can be rerun safely, e.g. if an older hub was still running)
+INSERT INTO tag_last_change (tag_id, event_id)
+SELECT tag_id, MAX(event_id) FROM (
+    SELECT tag_id, MAX(update_event) AS event_id FROM tag_updates GROUP BY tag_id
+    UNION ALL
+    SELECT tag_id, MAX(GREATEST(create_event, revoke_event)) FROM tag_listing GROUP BY tag_id
+    UNION ALL
+    SELECT tag_id, MAX(GREATEST(create_event, revoke_event)) FROM tag_inheritance GROUP BY tag_id
+    UNION ALL
+    SELECT tag_id, MAX(GREATEST(create_event, revoke_event)) FROM tag_config GROUP BY tag_id
+    UNION ALL
+    SELECT tag_id, MAX(GREATEST(create_event, revoke_event)) FROM tag_extra GROUP BY tag_id
+    UNION ALL
+    SELECT tag_id, MAX(GREATEST(create_event, revoke_event)) FROM tag_packages GROUP BY tag_id
+    UNION ALL
+    SELECT tag_id, MAX(GREATEST(create_event, revoke_event)) FROM tag_external_repos
+        GROUP BY tag_id
+    UNION ALL
+    SELECT tag_id, MAX(GREATEST(create_event, revoke_event)) FROM group_config GROUP BY tag_id
+    UNION ALL
+    SELECT tag_id, MAX(GREATEST(create_event, revoke_event)) FROM group_package_listing
+        GROUP BY tag_id
+    UNION ALL
+    SELECT tag_id, MAX(GREATEST(create_event, revoke_event)) FROM group_req_listing
+        GROUP BY tag_id
+) AS changes GROUP BY tag_id
+ON CONFLICT (tag_id) DO UPDATE
+SET event_id = GREATEST(tag_last_change.event_id, EXCLUDED.event_id);
+
 COMMIT;
@@ -436,6 +436,18 @@ CREATE TABLE tag_updates (
 CREATE INDEX tag_updates_by_tag ON tag_updates (tag_id);
 CREATE INDEX tag_updates_by_event ON tag_updates (update_event);
 
+-- the tag_last_change table holds the last event that changed the content of
+-- each tag, via the versioned tag tables (tag_listing, tag_inheritance,
+-- tag_config, tag_extra, tag_packages, tag_external_repos, group_config,
+-- group_package_listing, group_req_listing) or tag_updates.
+-- It is maintained by the hub and used to check for tag changes.
+CREATE TABLE tag_last_change (
+        tag_id INTEGER NOT NULL PRIMARY KEY REFERENCES tag(id),
+        event_id INTEGER NOT NULL REFERENCES events(id)
+) WITHOUT OIDS;
+
+CREATE INDEX tag_last_change_by_event ON tag_last_change (event_id);
+
 -- a build target tells the system where to build the package
 -- and how to tag it afterwards.
 CREATE TABLE build_target (
@@ -750,6 +762,7 @@ CREATE TABLE rpminfo (
     OR (draft IS NOT NULL AND build_id IS NOT NULL AND external_repo_id = 0))
 ) WITHOUT OIDS;
 CREATE INDEX rpminfo_build ON rpminfo(build_id);
+CREATE INDEX rpminfo_buildroot ON rpminfo(buildroot_id);
 CREATE UNIQUE INDEX rpminfo_unique_nvra_not_draft ON rpminfo(name,version,release,arch,external_repo_id)
   WHERE draft IS NOT TRUE;
 CREATE INDEX rpminfo_nvra ON rpminfo(name,version,release,arch,external_repo_id);
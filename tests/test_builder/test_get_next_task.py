@@ -1,5 +1,9 @@
 from __future__ import absolute_import
 import mock
+import os
+import shutil
+import tempfile
+import time
 import unittest
 
 import koji.daemon
@@ -216,3 +220,129 @@ class TestTakeTask(unittest.TestCase):
         self.session.host.openTask.assert_called_once()
         self.tm.runTask.assert_not_called()
         self.tm.forkTask.assert_not_called()
+
+
+class TestGetHostData(unittest.TestCase):
+
+    MEMINFO = 'MemTotal:       16384000 kB\nMemFree:         1024000 kB\n' \
+              'MemAvailable:    8192000 kB\n'
+
+    def setUp(self):
+        self.options = mock.MagicMock()
+        self.options.mockdir = '/var/lib/mock'
+        self.options.maxjobs = 10
+        self.options.mock_repo_cache = False
+        self.session = mock.MagicMock()
+        self.tm = koji.daemon.TaskManager(self.options, self.session)
+        self.tm.handlers = {'fake': mock.MagicMock()}
+        mock.patch('os.sysconf', return_value=8).start()
+        mock.patch('os.getloadavg', return_value=(2.0, 1.5, 1.0)).start()
+        mock.patch('os.statvfs', return_value=mock.MagicMock(f_bavail=1024,
+                                                             f_bsize=1024 * 1024)).start()
+        self.isdir = mock.patch('os.path.isdir', return_value=True).start()
+        mock.patch('os.listdir', return_value=['br1', 'br2']).start()
+        self.open = mock.patch('koji.daemon.open', mock.mock_open(read_data=self.MEMINFO),
+                               create=True).start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def test_resources(self):
+        data = self.tm._get_host_data()
+        self.assertEqual(data, {
+            'methods': ['fake'],
+            'maxjobs': 10,
+            'cpus': 8,
+            'loadavg': [2.0, 1.5, 1.0],
+            'mem_total': 16000,
+            'mem_available': 8000,
+            'disk_free': 1024,
+            'buildroots': 2,
+        })
+
+    def test_no_mockdir(self):
+        self.isdir.return_value = False
+        data = self.tm._get_host_data()
+        self.assertNotIn('disk_free', data)
+        self.assertNotIn('buildroots', data)
+        self.assertEqual(data['mem_available'], 8000)
+
+    def test_error(self):
+        self.open.side_effect = IOError('no proc')
+        data = self.tm._get_host_data()
+        self.assertEqual(data, {'methods': ['fake'], 'maxjobs': 10})
+
+
+class TestRepoCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.options = mock.MagicMock()
+        self.options.mock_repo_cache = True
+        self.options.mock_repo_cache_dir = self.tempdir
+        self.options.mock_repo_cache_lifetime = 3600
+        self.session = mock.MagicMock()
+        self.tm = koji.daemon.TaskManager(self.options, self.session)
+        now = time.time()
+        for repo_id, arch, group, age in [(10, 'x86_64', 'build', 100),
+                                          (11, 'x86_64', 'build', 7200),
+                                          (12, 'x86_64', 'srpm-build', 50),
+                                          (10, 'noarch', 'build', 10)]:
+            path = koji.daemon.repo_cache_dir(self.options, repo_id, arch, group)
+            os.mkdir(path)
+            os.utime(path, (now - age, now - age))
+        os.mkdir(os.path.join(self.tempdir, 'other'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_get_repo_cache_data(self):
+        self.assertEqual(self.tm._get_repo_cache_data(), [10, 12, 11])
+
+    def test_prune(self):
+        self.tm.pruneRepoCache()
+        self.assertEqual(sorted(os.listdir(self.tempdir)),
+                         ['other', 'repo-10-noarch-build', 'repo-10-x86_64-build',
+                          'repo-12-x86_64-srpm-build'])
+
+
+class TestWaitForTasks(unittest.TestCase):
+
+    def setUp(self):
+        self.options = mock.MagicMock()
+        self.session = mock.MagicMock()
+        self.tm = koji.daemon.TaskManager(self.options, self.session)
+
+    def test_wait(self):
+        snapshot = [[1, koji.TASK_STATES['OPEN'], False]]
+        self.session.host.waitForTasks.return_value = snapshot
+
+        self.assertEqual(self.tm.waitForTasks(), True)
+        self.session.host.waitForTasks.assert_called_once_with(None)
+
+        # the snapshot is passed back on the next call
+        self.assertEqual(self.tm.waitForTasks(), True)
+        self.session.host.waitForTasks.assert_called_with(snapshot)
+
+    def test_disabled_on_hub(self):
+        self.session.host.waitForTasks.return_value = None
+
+        self.assertEqual(self.tm.waitForTasks(), None)
+        self.assertEqual(self.tm.waitForTasks(), None)
+        # we keep asking, the hub could be reconfigured
+        self.assertEqual(self.session.host.waitForTasks.call_count, 2)
+
+    def test_old_hub(self):
+        self.session.host.waitForTasks.side_effect = koji.GenericError(
+            'Invalid method: host.waitForTasks')
+
+        self.assertEqual(self.tm.waitForTasks(), None)
+        self.assertEqual(self.tm.waitForTasks(), None)
+        self.session.host.waitForTasks.assert_called_once()
+
+    def test_error(self):
+        self.session.host.waitForTasks.side_effect = koji.GenericError('other error')
+
+        with self.assertRaises(koji.GenericError):
+            self.tm.waitForTasks()
+        self.assertEqual(self.tm.wait_supported, True)
@@ -268,6 +268,37 @@ class TestDownloadBuild(utils.CliTestCase):
             exit_code=1
         )
 
+    @mock.patch('koji_cli.commands.download_rpm')
+    @mock.patch('koji_cli.commands.download_files')
+    def test_download_build_jobs(self, download_files, download_rpm):
+        rpms = [dict(self.getrpminfo, id=294 + i, arch=arch)
+                for i, arch in enumerate(['noarch', 'src'])]
+        self.options.topurl = 'https://topurl'
+        self.session.getBuild.return_value = self.build_templ
+        self.session.listRPMs.return_value = rpms
+        anon_handle_download_build(self.options, self.session, ['1', '--jobs', '4'])
+        download_rpm.assert_not_called()
+        download_files.assert_called_once()
+        args, kwargs = download_files.call_args
+        self.assertEqual(kwargs, {'jobs': 4, 'quiet': self.options.quiet, 'noprogress': None})
+        self.assertEqual(
+            [(d['url'], d['path'], d['filesize']) for d in args[0]],
+            [('https://topurl/packages/bash/4.4.12/5.fc26/noarch/test-rpm-1.1-11.noarch.rpm',
+              'test-rpm-1.1-11.noarch.rpm', 7030),
+             ('https://topurl/packages/bash/4.4.12/5.fc26/src/test-rpm-1.1-11.src.rpm',
+              'test-rpm-1.1-11.src.rpm', 7030)])
+
+    def test_download_build_jobs_invalid(self):
+        self.assert_system_exit(
+            anon_handle_download_build,
+            self.options,
+            self.session,
+            ['1', '--jobs', '0'],
+            stderr=self.format_error_message('--jobs must be a positive number'),
+            activate_session=None,
+            exit_code=2
+        )
+
     def test_handle_add_volume_help(self):
         self.assert_help(
             anon_handle_download_build,
@@ -288,5 +319,6 @@ Options:
   --key=KEY             Download rpms signed with the given key
   --topurl=URL          URL under which Koji files are accessible
   --noprogress          Do not display progress meter
+  --jobs=JOBS           Number of files to download concurrently (default: 1)
   -q, --quiet           Suppress output
 """ % self.progname)
@@ -9,7 +9,8 @@ import requests
 import unittest
 
 
-from koji_cli.lib import download_file, _download_progress
+import koji
+from koji_cli.lib import download_file, download_files, _download_progress
 
 
 def mock_open():
@@ -206,5 +207,86 @@ class TestDownloadFileError(unittest.TestCase):
             pass
 
 
+class TestDownloadFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.stdout = mock.patch('sys.stdout', new_callable=six.StringIO).start()
+        self.stderr = mock.patch('sys.stderr', new_callable=six.StringIO).start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+        shutil.rmtree(self.tempdir)
+
+    def read(self, name):
+        with open(os.path.join(self.tempdir, name), 'rb') as fo:
+            return fo.read()
+
+    @requests_mock.Mocker()
+    def test_download_files(self, m):
+        m.head('http://url/b', headers={'Content-Length': '3'})
+        m.get('http://url/a', content=b'aaaaa')
+        m.get('http://url/b', content=b'bbb')
+        # partially downloaded file is resumed
+        with open(os.path.join(self.tempdir, 'c'), 'wb') as fo:
+            fo.write(b'cc')
+        m.get('http://url/c', content=b'ccc', status_code=206)
+        check = mock.MagicMock()
+        downloads = [
+            {'url': 'http://url/a', 'path': self.tempdir + '/a', 'filesize': 5, 'check': check},
+            {'url': 'http://url/b', 'path': self.tempdir + '/b'},
+            {'url': 'http://url/c', 'path': self.tempdir + '/c', 'filesize': 5},
+        ]
+
+        download_files(downloads, jobs=2, quiet=True)
+
+        self.assertEqual(self.read('a'), b'aaaaa')
+        self.assertEqual(self.read('b'), b'bbb')
+        self.assertEqual(self.read('c'), b'ccccc')
+        check.assert_called_once_with(self.tempdir + '/a')
+        ranges = dict((r.url, r.headers.get('Range')) for r in m.request_history
+                      if r.method == 'GET')
+        self.assertEqual(ranges, {'http://url/a': None, 'http://url/b': None,
+                                  'http://url/c': 'bytes=2-'})
+        self.assertEqual(self.stdout.getvalue(), '')
+
+    @requests_mock.Mocker()
+    def test_download_files_progress(self, m):
+        m.get('http://url/a', content=b'aaaaa')
+        m.get('http://url/b', content=b'bbbbb')
+        downloads = [
+            {'url': 'http://url/a', 'path': self.tempdir + '/a', 'filesize': 5},
+            {'url': 'http://url/b', 'path': self.tempdir + '/b', 'filesize': 5},
+        ]
+
+        download_files(downloads, jobs=1)
+
+        lines = self.stdout.getvalue().split('\n')
+        self.assertEqual(lines[0], '[==================                  ]  50% 5.00 B / 10.00 B\r'
+                         + ('Downloaded [1/2]: %s/a' % self.tempdir).ljust(79))
+        self.assertTrue(lines[1].endswith(('Downloaded [2/2]: %s/b' % self.tempdir).ljust(79)))
+        self.assertEqual(lines[2], '[====================================] 100% 10.00 B / 10.00 B\r')
+
+    @requests_mock.Mocker()
+    def test_download_files_check_failed(self, m):
+        m.get('http://url/a', content=b'aaaaa')
+        check = mock.MagicMock(side_effect=koji.GenericError('Bad file'))
+        downloads = [{'url': 'http://url/a', 'path': self.tempdir + '/a', 'filesize': 5,
+                      'check': check}]
+
+        with self.assertRaises(SystemExit):
+            download_files(downloads, quiet=True)
+        self.assertEqual(self.stderr.getvalue(), 'Bad file\n')
+
+    @requests_mock.Mocker()
+    def test_download_files_http_error(self, m):
+        m.get('http://url/a', status_code=404)
+        downloads = [{'url': 'http://url/a', 'path': self.tempdir + '/a', 'filesize': 5}]
+
+        with self.assertRaises(requests.HTTPError):
+            download_files(downloads, quiet=True)
+        self.assertFalse(os.path.exists(self.tempdir + '/a'))
+
+
 if __name__ == '__main__':
     unittest.main()
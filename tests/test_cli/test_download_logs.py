@@ -196,4 +196,6 @@ Options:
   -c, --continue        Continue previous download
   -d DIRECTORY, --dir=DIRECTORY
                         Write logs to DIRECTORY
+  --jobs=JOBS           Number of build logs to download concurrently
+                        (default: 1)
 """ % (self.progname, self.progname))
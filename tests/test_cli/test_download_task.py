@@ -171,6 +171,26 @@ Default behavior without --all option downloads .rpm files only for build and bu
                  'vol2/somerpm.x86_64.rpm', quiet=None, noprogress=None, size=2, num=2)])
         self.assertIsNone(rv)
 
+    @mock.patch('koji_cli.commands.download_files')
+    def test_handle_download_task_jobs(self, download_files):
+        args = [str(self.parent_task_id), '--jobs=4']
+        self.session.getTaskInfo.return_value = self.parent_task_info
+        self.session.getTaskChildren.return_value = []
+        self.list_task_output_all_volumes.return_value = {
+            'somerpm.x86_64.rpm': ['DEFAULT', 'vol2'],
+            'somelog.log': ['DEFAULT']}
+
+        rv = anon_handle_download_task(self.options, self.session, args)
+
+        self.assertIsNone(rv)
+        self.download_file.assert_not_called()
+        download_files.assert_called_once_with([
+            {'url': 'https://topurl/work/tasks/123/123/somerpm.x86_64.rpm',
+             'path': 'somerpm.x86_64.rpm'},
+            {'url': 'https://topurl/vol/vol2/work/tasks/123/123/somerpm.x86_64.rpm',
+             'path': 'vol2/somerpm.x86_64.rpm'}],
+            jobs=4, quiet=None, noprogress=None)
+
     def test_handle_download_task_log(self):
         args = [str(self.parent_task_id), '--log']
         self.session.getTaskInfo.return_value = self.parent_task_info
@@ -434,6 +454,7 @@ Options:
   --parentonly     Download parent's files only
   --filter=FILTER  Regex pattern to filter files
   --skip=SKIP      Regex pattern to skip files
+  --jobs=JOBS      Number of files to download concurrently (default: 1)
 """ % self.progname)
 
     def test_handle_download_no_task_id(self):
@@ -3,7 +3,9 @@ import mock
 import unittest
 from six.moves import StringIO
 
+import koji
 from koji_cli.commands import anon_handle_watch_logs
+from koji_cli.lib import watch_logs
 from . import utils
 
 
@@ -85,5 +87,48 @@ Options:
         self.ensure_connection.assert_not_called()
 
 
+class TestWatchLogsFeed(unittest.TestCase):
+
+    def setUp(self):
+        self.session = mock.MagicMock()
+        self.opts = mock.MagicMock(log=None, follow=True)
+        self.session.listTaskOutput.return_value = {'build.log': ['DEFAULT']}
+        self.logs = {1: [b'parent log'], 2: [b'child log']}
+        self.session.downloadTaskOutput.side_effect = \
+            lambda task_id, *args, **kw: self.logs[task_id] and self.logs[task_id].pop(0) or b''
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    @mock.patch('time.sleep')
+    @mock.patch('koji_cli.lib.bytes_to_stdout')
+    @mock.patch('sys.stdout', new_callable=StringIO)
+    def test_watch_logs_feed(self, stdout, bytes_to_stdout, sleep):
+        FREE = koji.TASK_STATES['FREE']
+        OPEN = koji.TASK_STATES['OPEN']
+        CLOSED = koji.TASK_STATES['CLOSED']
+        self.session.getTaskTreeChanges.side_effect = [
+            {'cursor': 'c1', 'tasks': [{'id': 1, 'state': OPEN},
+                                       {'id': 2, 'state': FREE}]},
+            {'cursor': 'c2', 'tasks': [{'id': 1, 'state': CLOSED},
+                                       {'id': 2, 'state': CLOSED}]},
+        ]
+
+        watch_logs(self.session, [1], self.opts, poll_interval=5)
+
+        self.assertEqual(bytes_to_stdout.mock_calls,
+                         [mock.call(b'parent log'), mock.call(b'child log')])
+        self.assertEqual(self.session.getTaskTreeChanges.mock_calls, [
+            mock.call([1], cursor=None, request=False),
+            mock.call([1], cursor='c1', request=False)])
+        # the free task is skipped
+        self.assertEqual(self.session.listTaskOutput.mock_calls, [
+            mock.call(1, all_volumes=True),
+            mock.call(1, all_volumes=True),
+            mock.call(2, all_volumes=True)])
+        self.session.getTaskInfo.assert_not_called()
+        self.session.getTaskChildren.assert_not_called()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -143,6 +143,83 @@ some output
         self.assertMultiLineEqual(stdout.getvalue(), expected)
 
 
+class TestWatchTasksFeed(unittest.TestCase):
+
+    def setUp(self):
+        self.session = mock.MagicMock()
+        self.session.getHost.return_value = {'name': 'builder-01'}
+        self.build = {'id': 1208, 'parent': None, 'method': 'build', 'arch': 'noarch',
+                      'host_id': None, 'state': koji.TASK_STATES['FREE'],
+                      'request': ['git://example.com/users/mikem/fake.git#master', 'f24', {}]}
+        self.srpm = {'id': 1209, 'parent': 1208, 'method': 'buildSRPMFromSCM',
+                     'arch': 'noarch', 'host_id': None, 'state': koji.TASK_STATES['FREE'],
+                     'request': ['git://example.com/users/mikem/fake.git#master', 'f24', {}]}
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def task(self, info, state, host_id=None):
+        return dict(info, state=koji.TASK_STATES[state], host_id=host_id)
+
+    @mock.patch('time.sleep')
+    @mock.patch('sys.stdout', new_callable=six.StringIO)
+    def test_watch_tasks_feed(self, stdout, sleep):
+        self.session.getTaskTreeChanges.side_effect = [
+            {'cursor': 'c1', 'tasks': [self.build]},
+            {'cursor': 'c2', 'tasks': [self.task(self.build, 'OPEN', 1), self.srpm]},
+            {'cursor': 'c3', 'tasks': []},
+            {'cursor': 'c4', 'tasks': [self.task(self.srpm, 'OPEN', 1)]},
+            {'cursor': 'c5', 'tasks': [self.task(self.build, 'CLOSED', 1),
+                                       self.task(self.srpm, 'CLOSED', 1)]},
+        ]
+
+        rv = watch_tasks(self.session, [1208], quiet=False, poll_interval=5)
+
+        self.assertEqual(rv, 0)
+        expected = ('''Watching tasks (this may be safely interrupted)...
+1208 build (f24, /users/mikem/fake.git:master): free
+1208 build (f24, /users/mikem/fake.git:master): free -> open (builder-01)
+  1209 buildSRPMFromSCM (/users/mikem/fake.git:master): free
+  1209 buildSRPMFromSCM (/users/mikem/fake.git:master): free -> open (builder-01)
+1208 build (f24, /users/mikem/fake.git:master): open (builder-01) -> closed
+  0 free  1 open  1 done  0 failed
+  1209 buildSRPMFromSCM (/users/mikem/fake.git:master): open (builder-01) -> closed
+  0 free  0 open  2 done  0 failed
+
+1208 build (f24, /users/mikem/fake.git:master) completed successfully
+''')
+        self.assertMultiLineEqual(stdout.getvalue(), expected)
+        self.assertEqual(self.session.getTaskTreeChanges.mock_calls, [
+            mock.call([1208], cursor=cursor, request=True)
+            for cursor in [None, 'c1', 'c2', 'c3', 'c4']])
+        self.session.getTaskInfo.assert_not_called()
+        self.session.getTaskChildren.assert_not_called()
+        self.assertEqual(len(sleep.mock_calls), 4)
+
+    @mock.patch('sys.stdout', new_callable=six.StringIO)
+    def test_watch_tasks_feed_failed(self, stdout):
+        self.session.getTaskTreeChanges.return_value = {
+            'cursor': 'c1', 'tasks': [self.task(self.build, 'FAILED', 1),
+                                      self.task(self.srpm, 'CANCELED', 1)]}
+        self.session.getTaskResult.side_effect = koji.GenericError('oops')
+
+        rv = watch_tasks(self.session, [1208], quiet=True, poll_interval=0)
+
+        self.assertEqual(rv, 1)
+        self.assertEqual(stdout.getvalue(), '')
+
+    @mock.patch('sys.stdout', new_callable=six.StringIO)
+    def test_watch_tasks_feed_no_task(self, stdout):
+        self.session.getTaskTreeChanges.return_value = {'cursor': 'c1', 'tasks': []}
+        self.session.getTaskInfo.return_value = None
+
+        with self.assertRaises(SystemExit):
+            watch_tasks(self.session, [1208], poll_interval=0)
+
+        self.session.getTaskInfo.assert_called_once_with(1208, request=True)
+        self.assertIn('No such task id: 1208', stdout.getvalue())
+
+
 class TestWatchLogsCLI(utils.CliTestCase):
 
     def setUp(self):
@@ -121,6 +121,8 @@ class TestWriteSignedRPM(utils.CliTestCase):
         arguments = [fake_sigkey]
         options = mock.MagicMock()
         session = mock.MagicMock()
+        session.writeSignedRPMs.side_effect = koji.GenericError(
+            'Invalid method: writeSignedRPMs')
         mcall = session.multicall.return_value.__enter__.return_value
 
         def vm(result):
@@ -216,6 +218,25 @@ class TestWriteSignedRPM(utils.CliTestCase):
         session.queryRPMSigs.assert_not_called()
         mcall.writeSignedRPM.assert_not_called()
 
+    @mock.patch('sys.stdout', new_callable=six.StringIO)
+    @mock.patch('koji_cli.commands.activate_session')
+    def test_handle_write_signed_rpm_bulk(self, activate_session_mock, stdout):
+        """Test handle_write_signed_rpm function with writeSignedRPMs"""
+        fake_sigkey = '64dab85d'
+        options = mock.MagicMock()
+        session = mock.MagicMock()
+        rpms = [dict(GET_RPM_RESULTS[i % 4], id=i) for i in range(1500)]
+        session.listRPMs.return_value = rpms
+
+        handle_write_signed_rpm(options, session, [fake_sigkey, '--buildid', '1'])
+
+        session.writeSignedRPMs.assert_has_calls([
+            call(list(range(1000)), fake_sigkey),
+            call(list(range(1000, 1500)), fake_sigkey),
+        ])
+        session.multicall.assert_not_called()
+        self.assertIn('[1500/1500] bash-4.4.12-5.fc26.x86_64', stdout.getvalue())
+
     def test_handle_write_signed_rpm_argument_test(self):
         """Test handle_write_signed_rpm function without arguments"""
         options = mock.MagicMock()
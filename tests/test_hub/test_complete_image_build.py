@@ -58,6 +58,7 @@ class TestCompleteImageBuild(unittest.TestCase):
         self.Task.return_value.assertHost = mock.MagicMock()
         self.get_build = mock.patch('kojihub.kojihub.get_build').start()
         mock.patch('kojihub.kojihub.get_rpm', new=self.my_get_rpm).start()
+        mock.patch('kojihub.kojihub.lookup_rpms', new=self.my_lookup_rpms).start()
         self.get_image_build = mock.patch('kojihub.kojihub.get_image_build').start()
         mock.patch('kojihub.kojihub.get_archive_type', new=self.my_get_archive_type).start()
         mock.patch('kojihub.kojihub.lookup_name', new=self.my_lookup_name).start()
@@ -136,6 +137,9 @@ class TestCompleteImageBuild(unittest.TestCase):
         self.rpms[key] = rpminfo
         return ret
 
+    def my_lookup_rpms(self, rpminfos, **kw):
+        return [self.my_get_rpm(rpminfo) for rpminfo in rpminfos]
+
     def my_lookup_name(self, table, info, **kw):
         if table == 'btype':
             return {
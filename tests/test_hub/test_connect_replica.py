@@ -0,0 +1,83 @@
+import mock
+import unittest
+from decimal import Decimal
+
+from kojihub import db
+
+
+class TestConnectReplica(unittest.TestCase):
+
+    def setUp(self):
+        self.connect = mock.patch('kojihub.db.connect').start()
+        self.cnx = self.connect.return_value
+        self.lag = mock.patch('kojihub.db.replica_lag', return_value=2.0).start()
+        mock.patch('kojihub.db._DBreplicaOpts', new={'dsn': 'dbname=replica'}).start()
+        mock.patch('kojihub.db._replica_lag', new={'checked': 0, 'lag': None}).start()
+        self.time = mock.patch('time.time', return_value=1000.0).start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def test_not_configured(self):
+        db._DBreplicaOpts = None
+        self.assertEqual(db.connect_replica(max_lag=30), None)
+        self.connect.assert_not_called()
+
+    def test_replica(self):
+        self.assertEqual(db.connect_replica(max_lag=30), self.cnx)
+        self.connect.assert_called_once_with(replica=True)
+        self.lag.assert_called_once_with(self.cnx)
+
+        # the lag is not checked again right away
+        self.time.return_value = 1001.0
+        self.assertEqual(db.connect_replica(max_lag=30), self.cnx)
+        self.lag.assert_called_once()
+        self.time.return_value = 1000.0 + db.REPLICA_LAG_INTERVAL + 1
+        db.connect_replica(max_lag=30)
+        self.assertEqual(self.lag.call_count, 2)
+
+    def test_lagging(self):
+        self.lag.return_value = 60.0
+        self.assertEqual(db.connect_replica(max_lag=30), None)
+        self.cnx.close.assert_called_once_with()
+
+    def test_not_streaming(self):
+        self.lag.return_value = None
+        self.assertEqual(db.connect_replica(max_lag=30), None)
+        self.cnx.close.assert_called_once_with()
+
+    def test_no_lag_check(self):
+        self.assertEqual(db.connect_replica(max_lag=0), self.cnx)
+        self.lag.assert_not_called()
+
+    def test_unavailable(self):
+        self.connect.side_effect = Exception('connection refused')
+        self.assertEqual(db.connect_replica(max_lag=30), None)
+
+    def test_lag_error(self):
+        self.lag.side_effect = Exception('query failed')
+        self.assertEqual(db.connect_replica(max_lag=30), None)
+
+
+class TestReplicaLag(unittest.TestCase):
+
+    def setUp(self):
+        self.cnx = mock.MagicMock()
+        self.cursor = self.cnx.cursor.return_value
+
+    def test_lag(self):
+        self.cursor.fetchone.return_value = [Decimal('2.5')]
+        self.assertEqual(db.replica_lag(self.cnx), 2.5)
+        sql = self.cursor.execute.call_args[0][0]
+        self.assertIn('pg_last_xact_replay_timestamp()', sql)
+        self.cursor.close.assert_called_once_with()
+
+    def test_disconnected(self):
+        # the WAL receiver does not stream, so the lag is unknown, even though
+        # the replica replayed everything it received
+        self.cursor.fetchone.return_value = [None]
+        self.assertEqual(db.replica_lag(self.cnx), None)
+        sql = self.cursor.execute.call_args[0][0]
+        self.assertIn("FROM pg_stat_wal_receiver", sql)
+        self.assertIn("status = 'streaming'", sql)
+        self.assertLess(sql.index('pg_stat_wal_receiver'), sql.index('pg_last_wal_receive_lsn'))
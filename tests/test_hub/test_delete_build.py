@@ -49,6 +49,7 @@ class TestDeleteBuild(unittest.TestCase):
         self.context_db.event_id = 42
         self.context_db.session.user_id = 24
         self.get_build = mock.patch("kojihub.kojihub.get_build").start()
+        self.set_tag_last_change = mock.patch("kojihub.kojihub.set_tag_last_change").start()
         self._delete_build = mock.patch("kojihub.kojihub._delete_build").start()
         self.get_user = mock.patch("kojihub.kojihub.get_user").start()
         self.context = mock.patch("kojihub.kojihub.context").start()
@@ -130,6 +131,7 @@ class TestDeleteBuild(unittest.TestCase):
     def test_delete_build_queries(self, rmtree, unlink):
         self.query_execute.side_effect = [
             [(123,)],  # rpm ids
+            [(7,), (8,)],  # tag ids
             {'id': 0, 'name': 'DEFAULT'},  # volume DEFAULT
             [{'id': 0, 'name': 'DEFAULT'},
              {'id': 1, 'name': 'testvol'},
@@ -138,13 +140,18 @@ class TestDeleteBuild(unittest.TestCase):
 
         kojihub._delete_build(self.binfo)
 
-        self.assertEqual(len(self.queries), 3)
+        self.assertEqual(len(self.queries), 4)
         query = self.queries[0]
         self.assertEqual(query.tables, ["rpminfo"])
         self.assertEqual(query.joins, None)
         self.assertEqual(query.clauses, ["build_id=%(build_id)i"])
         self.assertEqual(query.columns, ["id"])
 
+        query = self.queries[1]
+        self.assertEqual(query.tables, ["tag_listing"])
+        self.assertEqual(query.clauses, ["active = TRUE", "build_id = %(build_id)i"])
+        self.set_tag_last_change.assert_called_once_with([7, 8])
+
         self.assertEqual(len(self.deletes), 2)
         delete = self.deletes[0]
         self.assertEqual(delete.table, "rpmsigs")
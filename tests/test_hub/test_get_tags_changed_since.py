@@ -0,0 +1,58 @@
+import unittest
+
+import mock
+
+import koji
+import kojihub
+
+QP = kojihub.QueryProcessor
+
+
+class TestGetTagsChangedSince(unittest.TestCase):
+
+    def getQuery(self, *args, **kwargs):
+        query = QP(*args, **kwargs)
+        query.execute = mock.MagicMock(return_value=self.query_result)
+        self.queries.append(query)
+        return query
+
+    def setUp(self):
+        self.QueryProcessor = mock.patch('kojihub.kojihub.QueryProcessor',
+                                         side_effect=self.getQuery).start()
+        self.queries = []
+        self.query_result = []
+        self.exports = kojihub.RootExports()
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def test_changed(self):
+        self.query_result = [
+            {'tag_id': 1, 'event_id': 150},
+            {'tag_id': 3, 'event_id': 300},
+        ]
+        checks = [
+            [10, 100, [1, 2]],  # tag 1 changed
+            [11, 200, [1, 2]],  # no change since event 200
+            [12, 200, [2, 3]],  # tag 3 changed
+            [13, 100, [4]],
+        ]
+        result = self.exports.getTagsChangedSince(checks)
+        self.assertEqual(result, [10, 12])
+        self.assertEqual(len(self.queries), 1)
+        query = self.queries[0]
+        self.assertEqual(query.tables, ['tag_last_change'])
+        self.assertEqual(query.clauses, ['event_id > %(event)i', 'tag_id IN %(tags)s'])
+        self.assertEqual(sorted(query.values['tags']), [1, 2, 3, 4])
+        self.assertEqual(query.values['event'], 100)
+
+    def test_empty(self):
+        self.assertEqual(self.exports.getTagsChangedSince([]), [])
+        self.assertEqual(self.exports.getTagsChangedSince([[10, 100, []]]), [])
+        self.assertEqual(len(self.queries), 0)
+
+    def test_invalid(self):
+        for checks in ('foo', [[10, 100]], [[10, 'foo', [1]]], [[10, 100, ['foo']]]):
+            with self.assertRaises(koji.ParameterError):
+                self.exports.getTagsChangedSince(checks)
+        self.assertEqual(len(self.queries), 0)
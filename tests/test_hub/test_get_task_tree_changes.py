@@ -0,0 +1,93 @@
+import mock
+import unittest
+
+import koji
+import kojihub
+
+
+QP = kojihub.QueryProcessor
+FREE = koji.TASK_STATES['FREE']
+OPEN = koji.TASK_STATES['OPEN']
+CLOSED = koji.TASK_STATES['CLOSED']
+
+
+class TestGetTaskTreeChanges(unittest.TestCase):
+
+    def setUp(self):
+        self.exports = kojihub.RootExports()
+        self._multiRow = mock.patch('kojihub.kojihub._multiRow').start()
+        self._multiRow.return_value = [
+            {'id': 100, 'state': OPEN},
+            {'id': 101, 'state': CLOSED},
+            {'id': 105, 'state': FREE},
+        ]
+        self.queries = []
+        self.execute = mock.MagicMock()
+        self.QueryProcessor = mock.patch('kojihub.kojihub.QueryProcessor',
+                                         side_effect=self.get_query).start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def get_query(self, *args, **kwargs):
+        query = QP(*args, **kwargs)
+        query.execute = self.execute
+        self.queries.append(query)
+        return query
+
+    def test_first_call(self):
+        self.execute.return_value = ['tasks']
+
+        result = self.exports.getTaskTreeChanges([100])
+
+        self.assertEqual(result['tasks'], ['tasks'])
+        self.assertEqual(kojihub.kojihub._decode_task_cursor(result['cursor']),
+                         {100: OPEN, 101: CLOSED, 105: FREE})
+        query, values, fields = self._multiRow.call_args[0]
+        self.assertIn('WITH RECURSIVE', query)
+        self.assertEqual(values, {'task_ids': [100]})
+        self.assertEqual(len(self.queries), 1)
+        query = self.queries[0]
+        self.assertEqual(query.tables, ['task'])
+        self.assertEqual(query.clauses, ['id IN %(ids)s'])
+        self.assertEqual(sorted(query.values['ids']), [100, 101, 105])
+        self.assertNotIn('request', query.aliases)
+
+    def test_changes(self):
+        cursor = kojihub.kojihub._encode_task_cursor({100: OPEN, 101: OPEN})
+        self.execute.return_value = ['tasks']
+
+        result = self.exports.getTaskTreeChanges([100], cursor)
+
+        self.assertEqual(result['tasks'], ['tasks'])
+        self.assertEqual(sorted(self.queries[0].values['ids']), [101, 105])
+
+    def test_no_changes(self):
+        cursor = kojihub.kojihub._encode_task_cursor({100: OPEN, 101: CLOSED, 105: FREE})
+
+        result = self.exports.getTaskTreeChanges([100], cursor)
+
+        self.assertEqual(result, {'cursor': cursor, 'tasks': []})
+        self.assertEqual(self.queries, [])
+
+    def test_request(self):
+        self._multiRow.return_value = [{'id': 100, 'state': OPEN}]
+        self.execute.return_value = [
+            {'id': 100, 'request': koji.xmlrpcplus.dumps(('arg',), methodname='build')}]
+
+        result = self.exports.getTaskTreeChanges([100], request=True)
+
+        self.assertEqual(result['tasks'], [{'id': 100, 'request': ('arg',)}])
+        self.assertIn('request', self.queries[0].aliases)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(koji.ParameterError):
+            self.exports.getTaskTreeChanges([100], 'bogus')
+        self._multiRow.assert_not_called()
+
+    def test_cursor_roundtrip(self):
+        states = {1: FREE, 2: OPEN, 5000: CLOSED, 123456: OPEN}
+        cursor = kojihub.kojihub._encode_task_cursor(states)
+        self.assertEqual(kojihub.kojihub._decode_task_cursor(cursor), states)
+        self.assertEqual(kojihub.kojihub._decode_task_cursor(
+            kojihub.kojihub._encode_task_cursor({})), {})
@@ -18,7 +18,7 @@ class TestImportImageInternal(unittest.TestCase):
         self.path_work = mock.patch('koji.pathinfo.work').start()
         self.import_archive = mock.patch('kojihub.kojihub.import_archive').start()
         self.build = mock.patch('koji.pathinfo.build').start()
-        self.get_rpm = mock.patch('kojihub.kojihub.get_rpm').start()
+        self.lookup_rpms = mock.patch('kojihub.kojihub.lookup_rpms').start()
 
     def tearDown(self):
         shutil.rmtree(self.tempdir)
@@ -86,7 +86,7 @@ class TestImportImageInternal(unittest.TestCase):
         self.context_db.cnx.cursor.return_value = cursor
         self.context_db.session.host_id = 42
         self.get_build.return_value = build_info
-        self.get_rpm.return_value = rpm
+        self.lookup_rpms.return_value = [rpm]
         self.get_archive_type.return_value = 4
         self.path_work.return_value = self.tempdir
         self.build.return_value = self.tempdir
@@ -108,10 +108,7 @@ class TestImportImageInternal(unittest.TestCase):
         self.assertEqual(dest, self.tempdir + '/data/logs/image/x86_64/foo.log')
 
         # And.. check all the sql statements
-        self.assertEqual(len(cursor.execute.mock_calls), 1)
-        expression, kwargs = cursor.execute.mock_calls[0][1]
-        expression = " ".join(expression.split())
-        expected = 'INSERT INTO archive_rpm_components (archive_id, rpm_id) ' + \
-            'VALUES (%(archive_id0)s, %(rpm_id0)s)'
-        self.assertEqual(expression, expected)
-        self.assertEqual(kwargs, {'archive_id0': 9, 'rpm_id0': 6})
+        self.assertEqual(len(cursor.copy_expert.mock_calls), 1)
+        expression, data = cursor.copy_expert.mock_calls[0][1]
+        self.assertEqual(expression, 'COPY archive_rpm_components (archive_id, rpm_id) FROM STDIN')
+        self.assertEqual(data.getvalue(), '9\t6\n')
@@ -1,5 +1,13 @@
+import datetime
+import io
 import unittest
 
+import mock
+
+import koji
+import koji.jsonplus
+from koji.xmlrpcplus import Fault, dumps, loads
+import kojihub
 from kojihub import kojixmlrpc
 
 
@@ -90,3 +98,284 @@ class TestHandler(unittest.TestCase):
         help = "endpoint(par1, par2, par3=None, par4='text')\ndescription: Random method docstring"
         self.assertEqual(result, help)
 
+
+class TestStreaming(unittest.TestCase):
+
+    def setUp(self):
+        self.context = mock.patch('kojihub.kojixmlrpc.context').start()
+        self.context.opts = {'StreamResponses': True}
+        self.context.commit_pending = False
+        mock.patch('kojihub.kojixmlrpc.opts', new={'MemoryWarnThreshold': 5000},
+                   create=True).start()
+        mock.patch('kojihub.kojixmlrpc.get_memory_usage', return_value=0).start()
+        self.run_callbacks = mock.patch('koji.plugin.run_callbacks').start()
+        self.h = kojixmlrpc.ModXMLRPCRequestHandler(kojixmlrpc.HandlerRegistry())
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def gen(self):
+        for n in range(10000):
+            yield {'id': n}
+
+    def test_stream(self):
+        response = self.h._wrap_handler(lambda environ: self.gen(), {})
+        self.assertTrue(self.h.streaming)
+        self.assertFalse(self.h.traceback)
+        chunks = list(response)
+        self.assertGreater(len(chunks), 1)
+        expect = dumps((list(self.gen()),), methodresponse=1)
+        self.assertEqual(''.join(chunks), expect)
+
+    def test_no_stream_with_changes(self):
+        self.context.commit_pending = True
+        response = self.h._wrap_handler(lambda environ: self.gen(), {})
+        self.assertFalse(self.h.streaming)
+        self.assertEqual(response, [dumps((list(self.gen()),), methodresponse=1)])
+
+    def test_no_stream_disabled(self):
+        self.context.opts['StreamResponses'] = False
+        response = self.h._wrap_handler(lambda environ: self.gen(), {})
+        self.assertFalse(self.h.streaming)
+        self.assertEqual(len(response), 1)
+
+    def test_early_error(self):
+        def gen():
+            raise koji.GenericError('early error')
+            yield 1
+
+        response = self.h._wrap_handler(lambda environ: gen(), {})
+        self.assertFalse(self.h.streaming)
+        self.assertTrue(self.h.traceback)
+        with self.assertRaises(Fault) as cm:
+            loads(response[0])
+        self.assertEqual(cm.exception.faultString, 'early error')
+
+    def test_streamed_response(self):
+        chunks = self.h._wrap_handler(lambda environ: self.gen(), {})
+        cleanup = mock.patch('kojihub.kojixmlrpc.cleanup_request').start()
+        streamed = kojixmlrpc.StreamedResponse(self.h, chunks, 0, 0)
+        data = b''.join(streamed)
+        cleanup.assert_not_called()
+        streamed.close()
+        self.assertEqual(streamed.size, len(data))
+        cleanup.assert_called_once_with()
+        # nothing to commit
+        self.context.cnx.commit.assert_not_called()
+        self.context.cnx.rollback.assert_not_called()
+
+    def test_streamed_response_error(self):
+        def gen():
+            for n in range(10000):
+                yield {'id': n}
+            raise koji.GenericError('late error')
+
+        chunks = self.h._wrap_handler(lambda environ: gen(), {})
+        cleanup = mock.patch('kojihub.kojixmlrpc.cleanup_request').start()
+        streamed = kojixmlrpc.StreamedResponse(self.h, chunks, 0, 0)
+        with self.assertRaises(koji.GenericError):
+            b''.join(streamed)
+        streamed.close()
+        self.context.cnx.rollback.assert_called_once_with()
+        cleanup.assert_called_once_with()
+
+
+class TestJSONTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.context = mock.patch('kojihub.kojixmlrpc.context').start()
+        self.context.opts = {'JSONTransport': True}
+        self.context.commit_pending = False
+        self.h = kojixmlrpc.ModXMLRPCRequestHandler(kojixmlrpc.HandlerRegistry())
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def test_wants_json(self):
+        self.assertTrue(self.h._wants_json({'HTTP_ACCEPT': 'application/json, text/xml'}))
+        self.assertTrue(self.h._wants_json({'CONTENT_TYPE': 'application/json'}))
+        self.assertFalse(self.h._wants_json({'HTTP_ACCEPT': 'text/xml'}))
+        self.assertFalse(self.h._wants_json({}))
+        self.context.opts['JSONTransport'] = False
+        self.assertFalse(self.h._wants_json({'HTTP_ACCEPT': 'application/json'}))
+        # json requests are always answered in json
+        self.assertTrue(self.h._wants_json({'CONTENT_TYPE': 'application/json'}))
+
+    def test_response(self):
+        environ = {'HTTP_ACCEPT': 'application/json'}
+        ts = datetime.datetime(2024, 1, 2, 3, 4, 5)
+        response = self.h._wrap_handler(lambda environ: {'ts': ts}, environ)
+        self.assertTrue(self.h.json)
+        # datetimes are returned as strings, as for xmlrpc
+        self.assertEqual(koji.jsonplus.loads_response(response[0]), {'ts': '2024-01-02 03:04:05'})
+
+    def test_fault(self):
+        def handler(environ):
+            raise koji.GenericError('json error')
+
+        response = self.h._wrap_handler(handler, {'HTTP_ACCEPT': 'application/json'})
+        self.assertTrue(self.h.traceback)
+        with self.assertRaises(Fault) as cm:
+            koji.jsonplus.loads_response(response[0])
+        self.assertEqual(cm.exception.faultString, 'json error')
+
+    def test_stream(self):
+        self.context.opts['StreamResponses'] = True
+
+        def gen():
+            for n in range(10000):
+                yield {'id': n}
+
+        response = self.h._wrap_handler(lambda environ: gen(), {'HTTP_ACCEPT': 'application/json'})
+        self.assertTrue(self.h.streaming)
+        chunks = list(response)
+        self.assertGreater(len(chunks), 1)
+        self.assertEqual(koji.jsonplus.loads_response(''.join(chunks)), list(gen()))
+
+    def test_read_request(self):
+        self.context.environ = {'CONTENT_TYPE': 'application/json'}
+        mock.patch('kojihub.kojixmlrpc.opts', new={}, create=True).start()
+        request = koji.jsonplus.dumps_request('getTag', ['foo']).encode()
+        stream = io.BytesIO(request)
+        self.assertEqual(self.h._read_request(stream), (('foo',), 'getTag'))
+
+        stream = io.BytesIO(b'{"method": "getTag"}')
+        with self.assertRaises(kojixmlrpc.BadRequest):
+            self.h._read_request(stream)
+
+
+class TestReplicaRouting(unittest.TestCase):
+
+    def setUp(self):
+        self.context = mock.patch('kojihub.kojixmlrpc.context').start()
+        self.context.opts = {'DBReplicaConnectionString': 'dbname=replica',
+                             'ReplicaMaxLag': 30, 'ReplicaMethods': 'pluginCall'}
+        self.primary = mock.MagicMock()
+        self.context.cnx = self.primary
+        self.context.replica = False
+        self.replica = mock.MagicMock()
+        self.connect_replica = mock.patch('kojihub.db.connect_replica',
+                                          return_value=self.replica).start()
+        self.registry = kojixmlrpc.HandlerRegistry()
+        self.registry.register_instance(kojihub.RootExports())
+        self.h = kojixmlrpc.ModXMLRPCRequestHandler(self.registry)
+        self.h._dispatch = mock.MagicMock()
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def handle(self, method, params, environ=None):
+        self.h._read_request = mock.MagicMock(return_value=(params, method))
+        environ = environ or {}
+        environ['wsgi.input'] = None
+        self.h.handle_rpc(environ)
+        self.h._dispatch.assert_called_once_with(method, params)
+
+    def test_read_only(self):
+        self.handle('getBuild', (1,))
+        self.connect_replica.assert_called_once_with(max_lag=30)
+        self.primary.close.assert_called_once_with()
+        self.assertEqual(self.context.cnx, self.replica)
+        self.assertTrue(self.context.replica)
+
+    def test_registry(self):
+        self.assertIn('getBuild', self.registry.read_only)
+        self.assertIn('listTagged', self.registry.read_only)
+        self.assertNotIn('tagBuild', self.registry.read_only)
+        # dispatches to any method
+        self.assertNotIn('count', self.registry.read_only)
+
+        @koji.plugin.read_only
+        def pluginRead():
+            pass
+
+        self.registry.register_function(pluginRead)
+        self.assertIn('pluginRead', self.registry.read_only)
+        self.registry.register_function(mock.MagicMock(read_only=None), name='pluginRead')
+        self.assertNotIn('pluginRead', self.registry.read_only)
+
+    def test_count(self):
+        self.handle('count', ('listBuilds',))
+        self.connect_replica.assert_not_called()
+
+    def test_extra_method(self):
+        self.handle('pluginCall', ())
+        self.assertEqual(self.context.cnx, self.replica)
+
+    def test_write(self):
+        self.handle('tagBuild', ('tag', 'build'))
+        self.connect_replica.assert_not_called()
+        self.assertEqual(self.context.cnx, self.primary)
+
+    def test_logged_in(self):
+        self.handle('getBuild', (1,), {'HTTP_KOJI_SESSION_ID': '1'})
+        self.connect_replica.assert_not_called()
+        self.h._dispatch.reset_mock()
+        self.handle('getBuild', (1,), {'QUERY_STRING': 'session-id=1&session-key=x'})
+        self.connect_replica.assert_not_called()
+        self.assertEqual(self.context.cnx, self.primary)
+
+    def test_not_configured(self):
+        self.context.opts['DBReplicaConnectionString'] = None
+        self.handle('getBuild', (1,))
+        self.connect_replica.assert_not_called()
+
+    def test_unavailable(self):
+        self.connect_replica.return_value = None
+        self.handle('getBuild', (1,))
+        self.primary.close.assert_not_called()
+        self.assertEqual(self.context.cnx, self.primary)
+        self.assertFalse(self.context.replica)
+
+    def test_multicall(self):
+        calls = [{'methodName': 'getBuild', 'params': (1,)},
+                 {'methodName': 'listTagged', 'params': ('tag',)}]
+        self.handle('multiCall', (calls,))
+        self.assertEqual(self.context.cnx, self.replica)
+
+    def test_multicall_write(self):
+        calls = [{'methodName': 'getBuild', 'params': (1,)},
+                 {'methodName': 'untagBuild', 'params': ('tag', 'build')}]
+        self.handle('multiCall', (calls,))
+        self.connect_replica.assert_not_called()
+        self.h._dispatch.reset_mock()
+        self.handle('multiCall', ('garbage',))
+        self.connect_replica.assert_not_called()
+
+
+class TestReplicaStats(unittest.TestCase):
+
+    def setUp(self):
+        self.context = mock.patch('kojihub.kojixmlrpc.context').start()
+        self.context.opts = {'DBReplicaConnectionString': 'dbname=replica',
+                             'ReplicaMethods': 'pluginCall'}
+        self.context.replica = True
+        self.stats = mock.patch('kojihub.db.replica_stats', new=kojihub.db.ReplicaStats()).start()
+        self.registry = kojixmlrpc.HandlerRegistry()
+        self.registry.register_function(koji.plugin.read_only(mock.MagicMock()), name='getFoo')
+        self.registry.register_function(mock.MagicMock(read_only=None), name='pluginCall')
+        self.registry.register_function(mock.MagicMock(read_only=None), name='setFoo')
+        self.h = kojixmlrpc.ModXMLRPCRequestHandler(self.registry)
+        self.h.check_session = mock.MagicMock()
+        self.h.enforce_lockout = mock.MagicMock()
+        mock.patch('koji.util.call_with_argcheck').start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def test_stats(self):
+        self.h._dispatch('getFoo', ())
+        self.h._dispatch('getFoo', ())
+        self.h._dispatch('pluginCall', ())
+        self.h._dispatch('setFoo', ())
+        self.context.replica = False
+        self.h._dispatch('getFoo', ())
+        self.assertEqual(self.stats.stats(), {
+            'getFoo': {'replica': 2, 'primary': 1},
+            'pluginCall': {'replica': 1, 'primary': 0},
+        })
+
+    def test_not_configured(self):
+        self.context.opts['DBReplicaConnectionString'] = None
+        self.h._dispatch('getFoo', ())
+        self.assertEqual(self.stats.stats(), {})
@@ -0,0 +1,64 @@
+import mock
+import unittest
+
+import koji
+import kojihub
+
+
+QP = kojihub.QueryProcessor
+
+
+class TestListTrashCandidates(unittest.TestCase):
+
+    def setUp(self):
+        self.exports = kojihub.RootExports()
+        self.queries = []
+        self.QueryProcessor = mock.patch('kojihub.kojihub.QueryProcessor',
+                                         side_effect=self.get_query).start()
+        self.time = mock.patch('time.time', return_value=1000000.0).start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def get_query(self, *args, **kwargs):
+        query = QP(*args, **kwargs)
+        query.iterate = mock.MagicMock(return_value=iter(['builds']))
+        self.queries.append(query)
+        return query
+
+    def test_query(self):
+        result = self.exports.listTrashCandidates(3600)
+
+        self.assertEqual(list(result), ['builds'])
+        self.assertEqual(len(self.queries), 1)
+        query = self.queries[0]
+        self.assertEqual(query.tables, ['build'])
+        self.assertEqual(query.values['before'], 1000000.0 - 3600)
+        self.assertEqual(query.values['st_complete'], koji.BUILD_STATES['COMPLETE'])
+        self.assertEqual(query.aliases, ['draft', 'id', 'name', 'nvr', 'owner_id',
+                                         'owner_name', 'release', 'version'])
+        clauses = ' '.join(query.clauses)
+        for table in ('tag_listing', 'buildroot_listing', 'archive_rpm_components',
+                      'buildroot_archives', 'archive_components', 'standard_buildroot'):
+            self.assertIn(table, clauses)
+        self.assertIn('build.state = %(st_complete)i', query.clauses)
+        self.assertEqual(len(query.clauses), 10)
+        query.iterate.assert_called_once_with()
+
+    def test_filters(self):
+        self.exports.listTrashCandidates('60', name='foo', draft=False,
+                                         queryOpts={'limit': 10})
+
+        query = self.queries[0]
+        self.assertEqual(query.values['before'], 1000000.0 - 60)
+        self.assertIn('package.name = %(name)s', query.clauses)
+        self.assertIn('build.draft IS NOT TRUE', query.clauses)
+        self.assertEqual(query.values['name'], 'foo')
+        self.assertEqual(query.opts, {'limit': 10})
+
+    def test_invalid_age(self):
+        with self.assertRaises(koji.ParameterError):
+            self.exports.listTrashCandidates(-1)
+        with self.assertRaises(koji.ParameterError):
+            self.exports.listTrashCandidates('soon')
+        self.assertEqual(self.queries, [])
@@ -0,0 +1,138 @@
+import mock
+
+import koji
+import kojihub
+from .utils import DBQueryTestCase
+
+
+def rpm(rpm_id, name, external_repo_id=0, draft=False, payloadhash='hash'):
+    return {'id': rpm_id, 'name': name, 'version': '1.0', 'release': '1', 'arch': 'noarch',
+            'draft': draft, 'external_repo_id': external_repo_id,
+            'external_repo_name': 'repo%i' % external_repo_id, 'payloadhash': payloadhash}
+
+
+class TestLookupRPMs(DBQueryTestCase):
+
+    def setUp(self):
+        super(TestLookupRPMs, self).setUp()
+        self.get_external_repo_id = mock.patch('kojihub.kojihub.get_external_repo_id').start()
+        self.get_external_repo_id.return_value = 5
+
+    def test_nvras(self):
+        self.qp_execute_side_effect = [[
+            rpm(1, 'foo'),
+            rpm(2, 'bar', draft=True),
+            rpm(3, 'bar', draft=True),
+            rpm(4, 'foo', external_repo_id=5),
+            rpm(5, 'baz', external_repo_id=5),
+        ]]
+
+        result = kojihub.lookup_rpms(['foo-1.0-1.noarch', 'bar-1.0-1.noarch',
+                                      {'name': 'baz', 'version': '1.0', 'release': '1',
+                                       'arch': 'noarch', 'location': 'repo5'},
+                                      'foo-1.0-1.noarch@repo5', 'missing-1.0-1.noarch'])
+
+        # internal nondraft, then the latest draft, then external
+        self.assertEqual([r and r['id'] for r in result], [1, 3, 5, 4, None])
+        self.assertEqual(len(self.queries), 1)
+        query = self.queries[0]
+        self.assertEqual(query.tables, ['rpminfo'])
+        self.assertEqual(query.clauses, [
+            '(rpminfo.name, rpminfo.version, rpminfo.release, rpminfo.arch) IN %(keys)s'])
+        self.assertEqual(query.values['keys'], [
+            ('bar', '1.0', '1', 'noarch'),
+            ('baz', '1.0', '1', 'noarch'),
+            ('foo', '1.0', '1', 'noarch'),
+            ('missing', '1.0', '1', 'noarch'),
+        ])
+        self.get_external_repo_id.assert_called_once_with('repo5', strict=True)
+
+    def test_ids(self):
+        self.qp_execute_side_effect = [[rpm(1, 'foo')]]
+
+        result = kojihub.lookup_rpms([1, '1', 2])
+
+        self.assertEqual([r and r['id'] for r in result], [1, 1, None])
+        self.assertEqual(len(self.queries), 1)
+        self.assertEqual(self.queries[0].clauses, ['rpminfo.id IN %(keys)s'])
+        self.assertEqual(self.queries[0].values, {'keys': [1, 2]})
+
+    def test_batches(self):
+        self.qp_execute_side_effect = [[], [], []]
+        rpminfos = ['pkg%i-1.0-1.noarch' % i for i in range(2500)]
+
+        result = kojihub.lookup_rpms(rpminfos)
+
+        self.assertEqual(result, [None] * 2500)
+        self.assertEqual([len(q.values['keys']) for q in self.queries], [1000, 1000, 500])
+
+    def test_strict(self):
+        self.qp_execute_side_effect = [[rpm(1, 'foo')]]
+
+        with self.assertRaises(koji.GenericError) as cm:
+            kojihub.lookup_rpms(['foo-1.0-1.noarch', 'bar-1.0-1.noarch'], strict=True)
+        self.assertIn('No such rpm', str(cm.exception))
+
+    def test_empty(self):
+        self.assertEqual(kojihub.lookup_rpms([]), [])
+        self.assertEqual(self.queries, [])
+
+
+class TestLookupRPMList(DBQueryTestCase):
+
+    def setUp(self):
+        super(TestLookupRPMList, self).setUp()
+        self.lookup_rpms = mock.patch('kojihub.kojihub.lookup_rpms').start()
+        self.add_external_rpm = mock.patch('kojihub.kojihub.add_external_rpm').start()
+        self.external = {'name': 'ext', 'version': '1.0', 'release': '1', 'epoch': None,
+                         'arch': 'noarch', 'payloadhash': 'hash', 'size': 10,
+                         'buildtime': 1000, 'location': 'repo5'}
+        self.internal = {'name': 'foo', 'version': '1.0', 'release': '1', 'arch': 'noarch'}
+
+    def test_list(self):
+        new = dict(self.external, name='new')
+        self.lookup_rpms.return_value = [rpm(1, 'foo'), rpm(2, 'ext', 5), None]
+
+        result = kojihub.lookup_rpm_list([self.internal, self.external, new])
+
+        self.assertEqual(result, [rpm(1, 'foo'), rpm(2, 'ext', 5),
+                                  self.add_external_rpm.return_value])
+        self.add_external_rpm.assert_called_once_with(new, 'repo5', strict=False)
+
+    def test_missing(self):
+        self.lookup_rpms.return_value = [None]
+
+        with self.assertRaises(koji.GenericError) as cm:
+            kojihub.lookup_rpm_list([self.internal])
+        self.assertEqual(str(cm.exception), 'No such rpm: %r' % self.internal)
+
+    def test_hash_changed(self):
+        self.lookup_rpms.return_value = [rpm(2, 'ext', 5, payloadhash='other')]
+
+        with self.assertRaises(koji.GenericError) as cm:
+            kojihub.lookup_rpm_list([self.external])
+        self.assertIn('hash changed for external rpm', str(cm.exception))
+
+    def test_invalid_external(self):
+        del self.external['size']
+
+        with self.assertRaises(koji.GenericError) as cm:
+            kojihub.lookup_rpm_list([self.external])
+        self.assertIn('size field missing', str(cm.exception))
+        self.lookup_rpms.assert_not_called()
+
+    def test_buildroot_set_list(self):
+        self.lookup_rpms.return_value = [rpm(7, 'foo'), rpm(2, 'ext', 5)]
+        insert = mock.patch('kojihub.kojihub.BulkInsertProcessor').start()
+        br = kojihub.BuildRoot()
+        br.id = 100
+        br.is_standard = False
+
+        br.setList([self.internal, self.external])
+
+        self.lookup_rpms.assert_called_once_with([self.internal, self.external])
+        insert.return_value.add_record.assert_has_calls([
+            mock.call(buildroot_id=100, rpm_id=2, is_update=False),
+            mock.call(buildroot_id=100, rpm_id=7, is_update=False),
+        ])
+        insert.return_value.execute.assert_called_once_with()
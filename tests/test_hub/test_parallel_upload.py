@@ -0,0 +1,241 @@
+import io
+import os
+import mock
+import shutil
+import tempfile
+import threading
+import unittest
+
+import koji
+import kojihub
+import kojihub.auth
+from koji.context import context
+
+
+class TestParallelUpload(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.context = mock.patch('kojihub.kojihub.context').start()
+        self.context.session.logged_in = True
+        self.context.session.assertLogin = mock.MagicMock()
+        self.get_upload_path = mock.patch('kojihub.kojihub.get_upload_path',
+                                          side_effect=self.upload_path).start()
+        self.exports = kojihub.RootExports()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        mock.patch.stopall()
+
+    def upload_path(self, reldir, name, create=False, volume=None):
+        return os.path.join(self.tempdir, name)
+
+    def upload(self, data, offset, parallel=True, name='file'):
+        query = 'filename=%s&filepath=work/upload&fileverify=adler32&offset=%i' % (name, offset)
+        if parallel:
+            query += '&parallel=1'
+        environ = {'QUERY_STRING': query, 'wsgi.input': io.BytesIO(data)}
+        return kojihub.handle_upload(environ)
+
+    def read(self, name='file'):
+        with open(os.path.join(self.tempdir, name), 'rb') as fo:
+            return fo.read()
+
+    def test_prepare(self):
+        self.exports.prepareUploads('work/upload', [{'name': 'a', 'size': 10},
+                                                    {'name': 'b', 'size': 0}])
+
+        self.assertEqual(self.read('a'), b'\0' * 10)
+        self.assertEqual(self.read('b'), b'')
+        self.context.session.assertLogin.assert_called_once_with()
+        self.get_upload_path.assert_has_calls([
+            mock.call('work/upload', 'a', create=True, volume=None),
+            mock.call('work/upload', 'b', create=True, volume=None),
+        ])
+
+    def test_prepare_exists(self):
+        with open(os.path.join(self.tempdir, 'file'), 'wb') as fo:
+            fo.write(b'data')
+
+        with self.assertRaises(koji.GenericError) as cm:
+            self.exports.prepareUploads('work/upload', [{'name': 'file', 'size': 1}])
+        self.assertIn('upload path exists', str(cm.exception))
+
+        self.exports.prepareUploads('work/upload', [{'name': 'file', 'size': 2}],
+                                    overwrite=True)
+        self.assertEqual(self.read(), b'\0\0')
+
+    def test_prepare_invalid_size(self):
+        with self.assertRaises(koji.ParameterError):
+            self.exports.prepareUploads('work/upload', [{'name': 'file', 'size': -1}])
+
+    def test_chunks_out_of_order(self):
+        self.exports.prepareUploads('work/upload', [{'name': 'file', 'size': 12}])
+
+        result = self.upload(b'9abc', 8)
+        self.assertEqual(result['size'], 4)
+        self.assertEqual(result['offset'], 8)
+        self.assertEqual(result['hexdigest'],
+                         koji.util.adler32_constructor(b'9abc').hexdigest())
+        self.upload(b'1234', 0)
+        self.upload(b'5678', 4)
+
+        self.assertEqual(self.read(), b'123456789abc')
+
+    def test_not_prepared(self):
+        with self.assertRaises(koji.GenericError):
+            self.upload(b'data', 0)
+        self.assertFalse(os.path.exists(os.path.join(self.tempdir, 'file')))
+
+    def test_invalid_offset(self):
+        self.exports.prepareUploads('work/upload', [{'name': 'file', 'size': 4}])
+        with self.assertRaises(koji.GenericError):
+            self.upload(b'data', -1)
+
+    def test_sequential_truncates(self):
+        with open(os.path.join(self.tempdir, 'file'), 'wb') as fo:
+            fo.write(b'123456789abc')
+
+        self.upload(b'xy', 4, parallel=False)
+
+        self.assertEqual(self.read(), b'1234xy')
+
+
+class SessionRowLock(object):
+    """Emulates the row lock of the session in the database"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.holder = None
+
+    def acquire(self, cnx):
+        if self.holder is cnx:
+            return
+        if not self.lock.acquire(timeout=2):
+            raise AssertionError('waited for the session row lock')
+        self.holder = cnx
+
+    def release(self, cnx):
+        if self.holder is cnx:
+            self.holder = None
+            self.lock.release()
+
+
+class FakeConnection(object):
+
+    def __init__(self, row_lock):
+        self.row_lock = row_lock
+
+    def commit(self):
+        self.row_lock.release(self)
+
+    def rollback(self):
+        self.row_lock.release(self)
+
+
+class SlowInput(object):
+    """Request body that is only sent once the event is set"""
+
+    def __init__(self, data, event):
+        self.data = io.BytesIO(data)
+        self.event = event
+
+    def read(self, size):
+        if not self.event.wait(timeout=2):
+            raise AssertionError('the other chunk did not complete')
+        return self.data.read(size)
+
+
+class TestParallelUploadSession(unittest.TestCase):
+    """Concurrent chunks of one logged-in session"""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        with open(os.path.join(self.tempdir, 'file'), 'wb') as fo:
+            fo.write(b'\0' * 8)
+        self.row_lock = SessionRowLock()
+        mock.patch('kojihub.auth.context', new=context).start()
+        mock.patch('kojihub.kojihub.context', new=context).start()
+        mock.patch('kojihub.auth.QueryProcessor', side_effect=self.getQuery).start()
+        mock.patch('kojihub.auth.UpdateProcessor', side_effect=self.getUpdate).start()
+        mock.patch('kojihub.kojihub.get_upload_path',
+                   return_value=os.path.join(self.tempdir, 'file')).start()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+        mock.patch.stopall()
+
+    def getQuery(self, tables, **kwargs):
+        query = mock.MagicMock()
+        if kwargs.get('opts', {}).get('rowlock'):
+            # SELECT ... FOR UPDATE
+            self.row_lock.acquire(context.cnx)
+        if tables == ['sessions']:
+            query.executeOne.return_value = {
+                'authtype': 2, 'callnum': 1, 'exclusive': None, 'expired': False,
+                'master': None, 'user_id': 1, 'renew_ts': None}
+            query.singleValue.return_value = None
+        else:
+            query.executeOne.return_value = {'name': 'kojid', 'status': 0, 'usertype': 1}
+        return query
+
+    def getUpdate(self, table, **kwargs):
+        update = mock.MagicMock()
+        update.execute.side_effect = lambda: self.row_lock.acquire(context.cnx)
+        return update
+
+    def upload(self, data, offset, callnum, body_event, results):
+        context._threadclear()
+        context.opts = {'CheckClientIP': False, 'DisableURLSessions': True,
+                        'SessionRenewalTimeout': 0}
+        context.cnx = FakeConnection(self.row_lock)
+        environ = {
+            'HTTP_KOJI_SESSION_ID': '123',
+            'HTTP_KOJI_SESSION_KEY': 'xyz',
+            'QUERY_STRING': 'filename=file&filepath=work/upload&fileverify=&offset=%i'
+                            '&parallel=1' % offset,
+            'wsgi.input': SlowInput(data, body_event),
+        }
+        if callnum is not None:
+            environ['HTTP_KOJI_CALLNUM'] = str(callnum)
+        context.environ = environ
+        try:
+            context.session = kojihub.auth.Session()
+            results[offset] = kojihub.handle_upload(environ)
+        except Exception as e:
+            results[offset] = e
+        finally:
+            # what cleanup_request does
+            context.cnx.rollback()
+            context._threadclear()
+
+    def check_concurrent(self, callnums):
+        second_done = threading.Event()
+        results = {}
+        # the body of the first chunk arrives after the second chunk completed
+        first = threading.Thread(target=self.upload,
+                                 args=(b'0123', 0, callnums[0], second_done, results))
+        first.start()
+        ready = threading.Event()
+        ready.set()
+        second = threading.Thread(target=self.upload,
+                                  args=(b'4567', 4, callnums[1], ready, results))
+        second.start()
+        second.join()
+        second_done.set()
+        first.join()
+
+        for offset in (0, 4):
+            if isinstance(results[offset], Exception):
+                raise results[offset]
+        self.assertEqual(results[4]['size'], 4)
+        self.assertEqual(results[0]['size'], 4)
+        with open(os.path.join(self.tempdir, 'file'), 'rb') as fo:
+            self.assertEqual(fo.read(), b'01234567')
+
+    def test_concurrent_chunks(self):
+        self.check_concurrent([None, None])
+
+    def test_concurrent_chunks_callnum(self):
+        # chunks of older clients still have a callnum
+        self.check_concurrent([5, 6])
@@ -97,6 +97,7 @@ class TestPolicyGetUser(unittest.TestCase):
 class TestPolicyGetCGs(unittest.TestCase):
 
     def setUp(self):
+        kojihub.lookup_cache.clear()
         self.get_build = mock.patch('kojihub.kojihub.get_build').start()
         self.list_rpms = mock.patch('kojihub.kojihub.list_rpms').start()
         self.list_archives = mock.patch('kojihub.kojihub.list_archives').start()
@@ -162,6 +163,7 @@ class TestPolicyGetCGs(unittest.TestCase):
 class TestBuildTagTest(unittest.TestCase):
 
     def setUp(self):
+        kojihub.lookup_cache.clear()
         self.get_build = mock.patch('kojihub.kojihub.get_build').start()
         self.get_tag = mock.patch('kojihub.kojihub.get_tag').start()
         self.list_rpms = mock.patch('kojihub.kojihub.list_rpms').start()
@@ -186,21 +188,29 @@ class TestBuildTagTest(unittest.TestCase):
         data = {'build_tag': 'TAGINFO'}
         self.get_tag.return_value = {'name': 'foo-3.0-build'}
         self.assertTrue(obj.run(data))
+        # lookups are cached for the rest of the request
+        kojihub.lookup_cache.clear()
         self.get_tag.return_value = {'name': 'bar-1.2-build'}
         self.assertFalse(obj.run(data))
 
         obj = kojihub.BuildTagTest('buildtag foo-3* foo-4* fake-*')
         data = {'build_tag': 'TAGINFO', 'build': 'BUILDINFO'}
+        kojihub.lookup_cache.clear()
         self.get_tag.return_value = {'name': 'foo-4.0-build'}
         self.assertTrue(obj.run(data))
+        kojihub.lookup_cache.clear()
         self.get_tag.return_value = {'name': 'foo-3.0.1-build'}
         self.assertTrue(obj.run(data))
+        kojihub.lookup_cache.clear()
         self.get_tag.return_value = {'name': 'fake-0.99-build'}
         self.assertTrue(obj.run(data))
+        kojihub.lookup_cache.clear()
         self.get_tag.return_value = {'name': 'foo-2.1'}
         self.assertFalse(obj.run(data))
+        kojihub.lookup_cache.clear()
         self.get_tag.return_value = {'name': 'foo-5.5-alt'}
         self.assertFalse(obj.run(data))
+        kojihub.lookup_cache.clear()
         self.get_tag.return_value = {'name': 'baz-2-candidate'}
         self.assertFalse(obj.run(data))
 
@@ -255,6 +265,7 @@ class TestBuildTagTest(unittest.TestCase):
 class TestHasTagTest(unittest.TestCase):
 
     def setUp(self):
+        kojihub.lookup_cache.clear()
         self.list_tags = mock.patch('kojihub.kojihub.list_tags').start()
 
     def tearDown(self):
@@ -282,6 +293,7 @@ class TestHasTagTest(unittest.TestCase):
 class TestBuildTagInheritsFromTest(unittest.TestCase):
 
     def setUp(self):
+        kojihub.lookup_cache.clear()
         self.policy_get_build_tags = mock.patch('kojihub.kojihub.policy_get_build_tags').start()
         self.readFullInheritance = mock.patch('kojihub.kojihub.readFullInheritance').start()
 
@@ -339,6 +351,7 @@ class TestBuildTagInheritsFromTest(unittest.TestCase):
 
 class TestBuildTypeTest(unittest.TestCase):
     def setUp(self):
+        kojihub.lookup_cache.clear()
         self.get_build_type = mock.patch('kojihub.kojihub.get_build_type').start()
         self.get_build = mock.patch('kojihub.kojihub.get_build').start()
 
@@ -374,6 +387,7 @@ class TestBuildTypeTest(unittest.TestCase):
 
 class TestImportedTest(unittest.TestCase):
     def setUp(self):
+        kojihub.lookup_cache.clear()
         self.list_rpms = mock.patch('kojihub.kojihub.list_rpms').start()
         self.list_archives = mock.patch('kojihub.kojihub.list_archives').start()
         self.get_build = mock.patch('kojihub.kojihub.get_build').start()
@@ -437,6 +451,7 @@ class TestImportedTest(unittest.TestCase):
 
 class TestPolicyGetVersion(unittest.TestCase):
     def setUp(self):
+        kojihub.lookup_cache.clear()
         self.get_build = mock.patch('kojihub.kojihub.get_build').start()
 
     def tearDown(self):
@@ -466,6 +481,7 @@ class TestPolicyGetVersion(unittest.TestCase):
 
 class TestPolicyGetRelease(unittest.TestCase):
     def setUp(self):
+        kojihub.lookup_cache.clear()
         self.get_build = mock.patch('kojihub.kojihub.get_build').start()
 
     def tearDown(self):
@@ -495,6 +511,7 @@ class TestPolicyGetRelease(unittest.TestCase):
 
 class TestPolicyGetPkg(unittest.TestCase):
     def setUp(self):
+        kojihub.lookup_cache.clear()
         self.get_build = mock.patch('kojihub.kojihub.get_build').start()
         self.lookup_package = mock.patch('kojihub.kojihub.lookup_package').start()
 
@@ -546,6 +563,7 @@ class TestPolicyGetPkg(unittest.TestCase):
 
 class TestVolumeTest(unittest.TestCase):
     def setUp(self):
+        kojihub.lookup_cache.clear()
         self.lookup_name = mock.patch('kojihub.kojihub.lookup_name').start()
         self.get_build = mock.patch('kojihub.kojihub.get_build').start()
 
@@ -579,6 +597,7 @@ class TestVolumeTest(unittest.TestCase):
 
 class TestTagTest(unittest.TestCase):
     def setUp(self):
+        kojihub.lookup_cache.clear()
         self.get_tag = mock.patch('kojihub.kojihub.get_tag').start()
 
     def tearDown(self):
@@ -607,6 +626,7 @@ class TestTagTest(unittest.TestCase):
 
 class FromTagTest(unittest.TestCase):
     def setUp(self):
+        kojihub.lookup_cache.clear()
         self.get_tag = mock.patch('kojihub.kojihub.get_tag').start()
 
     def tearDown(self):
@@ -628,6 +648,7 @@ class FromTagTest(unittest.TestCase):
 
 class CGMatchAnyTest(unittest.TestCase):
     def setUp(self):
+        kojihub.lookup_cache.clear()
         self.policy_get_cgs = mock.patch('kojihub.kojihub.policy_get_cgs').start()
         self.multi_fnmatch = mock.patch('kojihub.kojihub.multi_fnmatch').start()
 
@@ -650,6 +671,7 @@ class CGMatchAnyTest(unittest.TestCase):
 
 class CGMatchAllTest(unittest.TestCase):
     def setUp(self):
+        kojihub.lookup_cache.clear()
         self.policy_get_cgs = mock.patch('kojihub.kojihub.policy_get_cgs').start()
         self.multi_fnmatch = mock.patch('kojihub.kojihub.multi_fnmatch').start()
 
@@ -685,6 +707,7 @@ class CGMatchAllTest(unittest.TestCase):
 
 class UserTest(unittest.TestCase):
     def setUp(self):
+        kojihub.lookup_cache.clear()
         self.policy_get_user = mock.patch('kojihub.kojihub.policy_get_user').start()
 
     def tearDown(self):
@@ -705,6 +728,7 @@ class UserTest(unittest.TestCase):
 
 class IsBuildOwnerTest(unittest.TestCase):
     def setUp(self):
+        kojihub.lookup_cache.clear()
         self.policy_get_user = mock.patch('kojihub.kojihub.policy_get_user').start()
         self.get_build = mock.patch('kojihub.kojihub.get_build').start()
         self.get_user = mock.patch('kojihub.kojihub.get_user').start()
@@ -761,3 +785,81 @@ class IsBuildOwnerTest(unittest.TestCase):
         self.get_user.assert_called_once_with(3)
         self.policy_get_user.assert_called_once_with(data)
         self.get_user_groups.assert_not_called()
+
+
+class TestLookupCache(unittest.TestCase):
+
+    def setUp(self):
+        self.context = mock.patch('kojihub.kojihub.context').start()
+        self.context.lookup_cache = {}
+        self.get_build = mock.patch('kojihub.kojihub.get_build').start()
+        self.get_build.return_value = {'id': 42, 'name': 'foo', 'version': '1',
+                                       'release': '1', 'package_id': 7}
+        self.list_rpms = mock.patch('kojihub.kojihub.list_rpms').start()
+        self.list_rpms.return_value = [{'buildroot_id': n % 3} for n in range(300)]
+        self.list_archives = mock.patch('kojihub.kojihub.list_archives').start()
+        self.list_archives.return_value = []
+        self.get_buildroot = mock.patch('kojihub.kojihub.get_buildroot').start()
+        self.get_buildroot.side_effect = lambda br_id, strict: {
+            'cg_name': None, 'tag_name': 'f40-build', 'repo_create_event_id': 1000}
+        self.get_tag = mock.patch('kojihub.kojihub.get_tag').start()
+        self.get_tag.return_value = {'id': 1, 'name': 'f40-build', 'query_event': 1000}
+        self.readFullInheritance = mock.patch('kojihub.kojihub.readFullInheritance').start()
+        self.readFullInheritance.return_value = [{'name': 'f40'}]
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def test_call(self):
+        result = kojihub.lookup_cache.call(self.get_build, 'foo-1-1', strict=True)
+        result['name'] = 'changed'
+        result = kojihub.lookup_cache.call(self.get_build, 'foo-1-1', strict=True)
+        self.assertEqual(result['name'], 'foo')
+        self.get_build.assert_called_once_with('foo-1-1', strict=True)
+
+        # different arguments
+        kojihub.lookup_cache.call(self.get_build, 'foo-1-1')
+        self.assertEqual(self.get_build.call_count, 2)
+        # unhashable arguments are not cached
+        kojihub.lookup_cache.call(self.get_build, {'id': 42})
+        kojihub.lookup_cache.call(self.get_build, {'id': 42})
+        self.assertEqual(self.get_build.call_count, 4)
+
+        kojihub.lookup_cache.clear()
+        kojihub.lookup_cache.call(self.get_build, 'foo-1-1', strict=True)
+        self.assertEqual(self.get_build.call_count, 5)
+
+    def test_errors_not_cached(self):
+        self.get_build.side_effect = koji.GenericError('no such build')
+        for i in range(2):
+            with self.assertRaises(koji.GenericError):
+                kojihub.lookup_cache.call(self.get_build, 'foo-1-1', strict=True)
+        self.assertEqual(self.get_build.call_count, 2)
+
+    def test_policy(self):
+        data = {'build': 42}
+        tests = [
+            kojihub.BuildTagTest('buildtag f40-*'),
+            kojihub.BuildTagInheritsFromTest('buildtag_inherits_from f40'),
+            kojihub.CGMatchAnyTest('cg_match_any foo'),
+            kojihub.PackageTest('package foo'),
+            kojihub.VersionTest('version 1'),
+        ]
+        for i in range(3):
+            for test in tests:
+                test.run(data)
+
+        self.get_build.assert_called_once_with(42, strict=True)
+        self.list_rpms.assert_called_once_with(buildID=42)
+        self.list_archives.assert_called_once_with(buildID=42)
+        self.assertEqual(self.get_buildroot.call_count, 3)
+        self.get_tag.assert_called_once_with('f40-build', strict=True, event=1000)
+
+
+class TestLookupCacheDML(unittest.TestCase):
+
+    @mock.patch('kojihub.db.context')
+    def test_dml_clears(self, context):
+        context.lookup_cache = {'key': 'value'}
+        kojihub.db._dml('UPDATE build SET state = 1', {})
+        self.assertEqual(context.lookup_cache, {})
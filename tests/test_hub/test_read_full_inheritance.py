@@ -0,0 +1,238 @@
+import unittest
+
+import mock
+
+import kojihub
+
+
+# child, parent, priority, maxdepth, intransitive, noconfig, pkg_filter
+LINKS = [
+    (1, 2, 10, None, False, False, ''),
+    (1, 3, 20, None, False, False, 'foo-.*'),
+    (1, 4, 30, 1, False, True, ''),
+    (2, 5, 10, None, False, False, ''),
+    (2, 6, 20, None, True, False, ''),
+    (3, 5, 10, 2, False, False, ''),
+    (4, 7, 10, None, False, False, ''),
+    (5, 7, 10, None, False, False, 'bar'),
+    (6, 8, 10, None, False, False, ''),
+    # loop
+    (7, 1, 10, None, False, False, ''),
+    (9, 1, 10, None, False, False, ''),
+]
+
+
+def link_row(link):
+    tag_id, parent_id, priority, maxdepth, intransitive, noconfig, pkg_filter = link
+    return {
+        'tag_id': tag_id,
+        'parent_id': parent_id,
+        'priority': priority,
+        'maxdepth': maxdepth,
+        'intransitive': intransitive,
+        'noconfig': noconfig,
+        'pkg_filter': pkg_filter,
+    }
+
+
+def readInheritanceData(tag_id, event=None):
+    data = []
+    for link in sorted(LINKS, key=lambda x: x[2]):
+        if link[0] == tag_id:
+            row = link_row(link)
+            del row['tag_id']
+            row['name'] = 'tag-%i' % row['parent_id']
+            row['child_id'] = tag_id
+            data.append(row)
+    return data
+
+
+def readDescendantsData(tag_id, event=None):
+    data = []
+    for link in sorted(LINKS, key=lambda x: x[2]):
+        if link[1] == tag_id:
+            row = link_row(link)
+            row['name'] = 'tag-%i' % row['tag_id']
+            data.append(row)
+    return data
+
+
+def multiRow(query, values, fields):
+    # emulate the recursive query
+    tag_id = values['tag_id']
+    reverse = 'links.tag_id = tag.id' in query
+    seen = set()
+    todo = [tag_id]
+    rows = []
+    while todo:
+        node = todo.pop()
+        if node in seen:
+            continue
+        seen.add(node)
+        for link in LINKS:
+            if reverse and link[1] == node:
+                nxt = link[0]
+            elif not reverse and link[0] == node:
+                nxt = link[1]
+            else:
+                continue
+            row = link_row(link)
+            row['name'] = 'tag-%i' % nxt
+            rows.append(row)
+            todo.append(nxt)
+    rows.sort(key=lambda x: x['priority'])
+    return rows
+
+
+class TestReadFullInheritance(unittest.TestCase):
+
+    def setUp(self):
+        self.context = mock.patch('kojihub.kojihub.context').start()
+        self.context.event_id = None
+        self._multiRow = mock.patch('kojihub.kojihub._multiRow', side_effect=multiRow).start()
+        self.readInheritanceData = mock.patch('kojihub.kojihub.readInheritanceData',
+                                              side_effect=readInheritanceData).start()
+        self.readDescendantsData = mock.patch('kojihub.kojihub.readDescendantsData',
+                                              side_effect=readDescendantsData).start()
+        self.QueryProcessor = mock.patch('kojihub.kojihub.QueryProcessor').start()
+        # whether the event is stable
+        self.QueryProcessor.return_value.singleValue.return_value = True
+        self.QueryProcessor.return_value.execute.side_effect = self.tag_names
+        self.names = dict([(i, 'tag-%i' % i) for i in range(1, 10)])
+        self.cache = kojihub.InheritanceCache()
+        mock.patch('kojihub.kojihub.inheritance_cache', new=self.cache).start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def tag_names(self):
+        return list(self.names.items())
+
+    def old_inheritance(self, tag_id, event=None, reverse=False):
+        order = []
+        kojihub.readFullInheritanceRecurse(tag_id, event, order, {}, {}, 0, None, False, [],
+                                           reverse)
+        return order
+
+    def test_same_as_recursion(self):
+        for reverse in (False, True):
+            for tag_id in range(1, 10):
+                self.cache.invalidate()
+                expected = self.old_inheritance(tag_id, reverse=reverse)
+                result = kojihub.readFullInheritance(tag_id, reverse=reverse)
+                self.assertEqual(result, expected)
+
+    def test_single_query(self):
+        kojihub.readFullInheritance(1)
+        self._multiRow.assert_called_once()
+        query = self._multiRow.call_args[0][0]
+        self.assertIn('WITH RECURSIVE', query)
+        self.readInheritanceData.assert_not_called()
+
+    def test_graph_event(self):
+        kojihub.readInheritanceGraph(1, event=42)
+        query = self._multiRow.call_args[0][0]
+        self.assertIn('create_event <= 42', query)
+        self.assertIn('tag_inheritance.create_event <= 42', query)
+        self.assertNotIn('active = TRUE', query)
+
+    def test_cache_past_event(self):
+        first = kojihub.readFullInheritance(1, event=100)
+        second = kojihub.readFullInheritance(1, event=100)
+        self.assertEqual(first, second)
+        self._multiRow.assert_called_once()
+        self.assertEqual(self.cache.hits, 1)
+        # results are copies
+        second[0]['filter'].append('baz')
+        self.assertEqual(kojihub.readFullInheritance(1, event=100), first)
+
+    def test_no_cache_unstable_event(self):
+        # events that could still be preceded by open transactions
+        self.QueryProcessor.return_value.singleValue.return_value = False
+        kojihub.readFullInheritance(1, event=100)
+        kojihub.readFullInheritance(1, event=100)
+        self.assertEqual(self._multiRow.call_count, 2)
+        self.assertEqual(len(self.cache.entries), 0)
+        self.assertEqual(self.cache.stable_event, None)
+
+    def test_stable_before_read(self):
+        calls = []
+        self.QueryProcessor.return_value.singleValue.side_effect = \
+            lambda **kw: calls.append('stable') or True
+        self._multiRow.side_effect = lambda *a: calls.append('read') or multiRow(*a)
+        kojihub.readFullInheritance(1, event=100)
+        self.assertEqual(calls, ['stable', 'read'])
+        query = self.QueryProcessor.call_args[1]
+        self.assertEqual(query['tables'], ['events'])
+        self.assertIn('pg_stat_activity', query['columns'][0])
+
+    def test_stable_event_remembered(self):
+        kojihub.readFullInheritance(1, event=100)
+        self.assertEqual(self.cache.stable_event, 100)
+        self.QueryProcessor.return_value.singleValue.return_value = False
+        # older events are stable as well
+        kojihub.readFullInheritance(1, event=90)
+        self.assertEqual(self.QueryProcessor.return_value.singleValue.call_count, 1)
+        self.assertIn((1, 90, False), self.cache.entries)
+        # newer ones are checked again
+        kojihub.readFullInheritance(1, event=110)
+        self.assertNotIn((1, 110, False), self.cache.entries)
+
+    def test_no_cache_own_event(self):
+        self.context.event_id = 100
+        kojihub.readFullInheritance(1, event=100)
+        self.assertEqual(len(self.cache.entries), 0)
+
+    def test_no_cache_replica(self):
+        self.context.replica = True
+        kojihub.readFullInheritance(1, event=100)
+        self.assertEqual(len(self.cache.entries), 0)
+
+    def test_cache_rename(self):
+        first = kojihub.readFullInheritance(1, event=100)
+        self.assertEqual(first[0]['name'], 'tag-2')
+        for link in self.cache.entries[(1, 100, False)]:
+            self.assertNotIn('name', link)
+        # tag names are not versioned
+        self.names[2] = 'renamed'
+        self.context.lookup_cache = {}
+        second = kojihub.readFullInheritance(1, event=100)
+        self._multiRow.assert_called_once()
+        self.assertEqual(second[0]['name'], 'renamed')
+        first[0]['name'] = 'renamed'
+        self.assertEqual(second, first)
+
+    def test_cache_reverse_names(self):
+        first = kojihub.readFullInheritance(7, event=100, reverse=True)
+        second = kojihub.readFullInheritance(7, event=100, reverse=True)
+        self._multiRow.assert_called_once()
+        self.assertEqual(second, first)
+        self.assertEqual([link['name'] for link in second],
+                         ['tag-%i' % link['tag_id'] for link in second])
+
+    def test_cache_current_per_request(self):
+        self.context.inheritance_cache = {}
+        kojihub.readFullInheritance(1)
+        kojihub.readFullInheritance(1)
+        self._multiRow.assert_called_once()
+        self.assertEqual(len(self.cache.entries), 0)
+        # new request
+        self.context.inheritance_cache = {}
+        kojihub.readFullInheritance(1)
+        self.assertEqual(self._multiRow.call_count, 2)
+
+    def test_cache_size(self):
+        self.cache.size = 2
+        for tag_id in (1, 2, 3):
+            kojihub.readFullInheritance(tag_id, event=100)
+        self.assertEqual(list(self.cache.entries), [(2, 100, False), (3, 100, False)])
+        self.cache.size = 0
+        self.cache.invalidate()
+        kojihub.readFullInheritance(1, event=100)
+        self.assertEqual(len(self.cache.entries), 0)
+
+    def test_invalidate(self):
+        kojihub.readFullInheritance(1, event=100)
+        self.cache.invalidate()
+        self.assertEqual(len(self.cache.entries), 0)
+        self.assertEqual(self.context.inheritance_cache, {})
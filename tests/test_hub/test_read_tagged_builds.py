@@ -210,3 +210,61 @@ class TestReadTaggedBuilds(unittest.TestCase):
         self.assertEqual(set(query.clauses), set(clauses))
         # function passes values=locals(), so we only check the relevant values
         self.assertEqual(dslice(query.values, values.keys()), values)
+
+    def test_get_tagged_builds_inherit_single_query(self):
+        self.readPackageList.return_value = {
+            1: {'blocked': False, 'package_id': 1},
+            2: {'blocked': True, 'package_id': 2},
+            3: {'blocked': False, 'package_id': 3},
+        }
+        with mock.patch('kojihub.kojihub.readFullInheritance') as readFullInheritance:
+            readFullInheritance.return_value = [{'parent_id': 5}, {'parent_id': 6}]
+            kojihub.readTaggedBuilds(4, inherit=True, latest=True)
+
+        # the per-tag query is not used and the inner query only generates sql
+        self.assertEqual(len(self.queries), 3)
+        pertag, inner, query = self.queries
+        query.execute.assert_called_once()
+        pertag.execute.assert_not_called()
+        inner.execute.assert_not_called()
+        self.assertEqual(query.tables, ['(%s) AS ranked' % inner])
+        self.assertEqual(query.clauses, ['pkg_rank <= %(latest)i'])
+        self.assertEqual(query.opts, {'order': 'chain_order,-create_event'})
+        self.assertEqual(inner.tables,
+                         ['(VALUES (%(tag_0)i, 0), (%(tag_1)i, 1), (%(tag_2)i, 2)) '
+                          'AS chain(tag_id, ord)'])
+        self.assertEqual(inner.joins,
+                         ['tag_listing ON tag_listing.tag_id = chain.tag_id'] + self.joins)
+        self.assertNotIn('tag_id = %(tagid)s', inner.clauses)
+        self.assertIn('build.pkg_id IN %(pkg_ids)s', inner.clauses)
+        self.assertIn('row_number() OVER (PARTITION BY build.pkg_id ORDER BY chain.ord, '
+                      'tag_listing.create_event DESC) AS pkg_rank', inner.columns)
+        values = {'tag_0': 4, 'tag_1': 5, 'tag_2': 6, 'latest': 1, 'pkg_ids': [1, 3]}
+        self.assertEqual(dslice(query.values, values.keys()), values)
+        self.assertEqual(set(query.aliases), set(self.aliases + ['chain_order']))
+
+    def test_get_tagged_builds_inherit_not_latest(self):
+        self.readPackageList.return_value = {1: {'blocked': False, 'package_id': 1}}
+        with mock.patch('kojihub.kojihub.readFullInheritance') as readFullInheritance:
+            readFullInheritance.return_value = [{'parent_id': 5}]
+            query_result = [{'id': 1, 'chain_order': 0}, {'id': 2, 'chain_order': 1}]
+            with mock.patch('kojihub.kojihub.QueryProcessor') as QueryProcessor:
+                QueryProcessor.return_value.execute.return_value = query_result
+                result = kojihub.readTaggedBuilds(4, inherit=True)
+
+        self.assertEqual(result, [{'id': 1}, {'id': 2}])
+        outer_kwargs = QueryProcessor.call_args_list[-1][1]
+        self.assertEqual(outer_kwargs['clauses'], [])
+        inner_kwargs = QueryProcessor.call_args_list[-2][1]
+        for column in inner_kwargs['columns']:
+            self.assertNotIn('pkg_rank', column)
+
+    def test_get_tagged_builds_inherit_all_blocked(self):
+        self.readPackageList.return_value = {1: {'blocked': True, 'package_id': 1}}
+        with mock.patch('kojihub.kojihub.readFullInheritance') as readFullInheritance:
+            readFullInheritance.return_value = [{'parent_id': 5}]
+            result = kojihub.readTaggedBuilds(4, inherit=True, latest=True)
+
+        self.assertEqual(result, [])
+        self.assertEqual(len(self.queries), 1)
+        self.queries[0].execute.assert_not_called()
@@ -37,7 +37,8 @@ class TestReadTaggedRPMS(unittest.TestCase):
                         'payloadhash', 'size', 'buildtime', 'buildroot_id', 'build_id',
                         'metadata_only']
         self.clauses = ['(tag_listing.active = TRUE)',
-                        'tag_id=%(tagid)s']
+                        'tag_id=%(tagid)s',
+                        'rpminfo.build_id IN %(build_ids)s']
         self.tables = ['rpminfo']
         self.pkg_name = 'test_pkg'
         self.build_list = [
@@ -118,4 +119,33 @@ class TestReadTaggedRPMS(unittest.TestCase):
         self.assertEqual(set(query.joins), set(self.joins))
         self.assertEqual(set(query.aliases), set(self.aliases))
         self.assertEqual(set(query.clauses), set(clauses))
-        self.assertEqual(query.values, {})
\ No newline at end of file
+        self.assertEqual(query.values, {})
+
+    def test_get_tagged_rpms_only_chosen_builds(self):
+        builds = []
+        for build_id, tag_id in [(1, 1), (2, 3), (3, 1)]:
+            build = self.build_list[0].copy()
+            build.update({'build_id': build_id, 'id': build_id, 'tag_id': tag_id})
+            builds.append(build)
+        self.readTaggedBuilds.return_value = builds
+        values = []
+
+        def iterate():
+            values.append(query.values.copy())
+            if query.values['tagid'] == 1:
+                return iter([{'build_id': 1, 'id': 10}, {'build_id': 3, 'id': 30}])
+            return iter([{'build_id': 2, 'id': 20}])
+
+        with mock.patch('kojihub.kojihub.readFullInheritance') as readFullInheritance:
+            readFullInheritance.return_value = [{'parent_id': 2}, {'parent_id': 3},
+                                                {'parent_id': 1}]
+            rpms, result = kojihub.readTaggedRPMS(1, inherit=True, extra=False)
+            query = self.queries[0]
+            query.iterate = iterate
+            rpms = list(rpms)
+
+        self.assertEqual(result, builds)
+        self.assertEqual([r['id'] for r in rpms], [10, 30, 20])
+        # tag 2 has no chosen builds, tag 1 is only queried once
+        self.assertEqual(values, [{'tagid': 1, 'build_ids': [1, 3]},
+                                  {'tagid': 3, 'build_ids': [2]}])
@@ -1,8 +1,16 @@
+import json
+import os
+import shutil
+import tempfile
 import unittest
 
+import mock
+
 import koji
 import kojihub
 
+QP = kojihub.QueryProcessor
+
 
 class TestRepoInit(unittest.TestCase):
 
@@ -12,3 +20,163 @@ class TestRepoInit(unittest.TestCase):
             kojihub.repo_init('test-tag', task_id)
         self.assertEqual(f"Invalid type for value '{task_id}': {type(task_id)}, "
                          f"expected type <class 'int'>", str(cm.exception))
+
+
+class TestIncrementalRepoLists(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.repo_arches = {'x86_64': 1, 'aarch64': 1}
+        self.builddirs = {}
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def make_build(self, build_id, package_id, tag_id):
+        self.builddirs[build_id] = 'packages/pkg%i/1/%i' % (package_id, build_id)
+        return {'build_id': build_id, 'id': build_id, 'package_id': package_id,
+                'tag_id': tag_id}
+
+    def make_rpms(self, build):
+        rpms = []
+        for n, arch in enumerate(['src', 'x86_64', 'noarch', 'aarch64', 'ppc64le']):
+            rpms.append({
+                'name': 'pkg%i' % build['package_id'],
+                'version': '1',
+                'release': str(build['build_id']),
+                'arch': arch,
+                'id': build['build_id'] * 10 + n,
+                'build_id': build['build_id'],
+                'extra': None,
+            })
+        return rpms
+
+    def full_rpms(self, builds, taglist):
+        # the order of readTaggedRPMS
+        rpms = []
+        for tag_id in taglist:
+            for build in builds:
+                if build['tag_id'] == tag_id:
+                    rpms.extend(self.make_rpms(build))
+        rpms.sort(key=lambda r: (taglist.index(
+            [b for b in builds if b['build_id'] == r['build_id']][0]['tag_id']), r['id']))
+        return rpms
+
+    def write_full(self, name, builds, taglist):
+        repodir = os.path.join(self.tempdir, name)
+        for arch in self.repo_arches:
+            os.makedirs(os.path.join(repodir, arch))
+        entries = kojihub.kojihub._repo_list_entries(self.full_rpms(builds, taglist),
+                                                     self.builddirs, self.repo_arches,
+                                                     with_src=True)
+        kojihub.kojihub._write_repo_lists(repodir, self.repo_arches, entries)
+        return repodir
+
+    def read_lists(self, repodir, suffix=''):
+        data = {}
+        for arch in self.repo_arches:
+            for fn in ('pkglist', 'rpmlist.jsonl'):
+                with open(os.path.join(repodir, arch, fn + suffix), 'rt') as fp:
+                    data[(arch, fn)] = fp.read()
+        return data
+
+    def test_same_as_full(self):
+        taglist = [1, 2]
+        old_builds = [self.make_build(1, 1, 1), self.make_build(2, 2, 2),
+                      self.make_build(3, 3, 2), self.make_build(4, 4, 1)]
+        base_dir = self.write_full('base', old_builds, taglist)
+        # build 5 replaces 2, package 3 is untagged and package 6 is new
+        new_builds = [old_builds[0], old_builds[3], self.make_build(5, 2, 1),
+                      self.make_build(6, 6, 2)]
+        new_dir = self.write_full('new', new_builds, taglist)
+        changed = set([2, 3, 6])
+        base = {'id': 1, 'dir': base_dir, 'taglist': taglist, 'changed_pkgs': changed}
+        new_rpms = [r for r in self.full_rpms(new_builds, taglist)
+                    if r['build_id'] in (5, 6)]
+        entries = kojihub.kojihub._repo_list_entries(new_rpms, self.builddirs,
+                                                     self.repo_arches, with_src=True)
+        kojihub.kojihub._write_repo_lists_incremental(new_dir, self.repo_arches, base,
+                                                      new_builds, entries, suffix='.incremental')
+        expected = self.read_lists(new_dir)
+        self.assertEqual(self.read_lists(new_dir, '.incremental'), expected)
+        self.assertIn('pkg2-1-5.noarch.rpm', expected[('x86_64', 'pkglist')])
+        self.assertNotIn('pkg3-1-3', expected[('x86_64', 'pkglist')])
+
+    def test_unordered_base(self):
+        taglist = [1]
+        builds = [self.make_build(1, 1, 1), self.make_build(2, 2, 1)]
+        base_dir = self.write_full('base', builds, taglist)
+        path = os.path.join(base_dir, 'x86_64', 'rpmlist.jsonl')
+        with open(path, 'rt') as fp:
+            lines = fp.readlines()
+        with open(path, 'wt') as fp:
+            fp.writelines(reversed(lines))
+        base = {'id': 1, 'dir': base_dir, 'taglist': taglist, 'changed_pkgs': set()}
+        new_dir = self.write_full('new', builds, taglist)
+        with self.assertRaises(koji.GenericError):
+            kojihub.kojihub._write_repo_lists_incremental(new_dir, self.repo_arches, base,
+                                                          builds, [], suffix='.incremental')
+
+
+class TestRepoInitBase(unittest.TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.pathinfo = koji.PathInfo(self.tempdir)
+        mock.patch('koji.pathinfo', new=self.pathinfo).start()
+        self.tinfo = {'id': 1, 'name': 'tag', 'arches': 'x86_64', 'extra': {}}
+        self.get_tag = mock.patch('kojihub.kojihub.get_tag', return_value=self.tinfo).start()
+        self.readFullInheritance = mock.patch('kojihub.kojihub.readFullInheritance',
+                                              return_value=[{'parent_id': 2}]).start()
+        self.queries = []
+        self.results = {}
+        mock.patch('kojihub.kojihub.QueryProcessor', side_effect=self.getQuery).start()
+        self.options = {'with_src': False, 'with_separate_src': False, 'with_debuginfo': False}
+        repodir = self.pathinfo.repo(10, 'tag')
+        os.makedirs(repodir)
+        with open(os.path.join(repodir, 'repo.json'), 'wt') as fp:
+            json.dump(dict(self.options, id=10), fp)
+        self.results['repo'] = [{'id': 10, 'create_event': 100}]
+
+    def tearDown(self):
+        mock.patch.stopall()
+        shutil.rmtree(self.tempdir)
+
+    def getQuery(self, *args, **kwargs):
+        query = QP(*args, **kwargs)
+        query.execute = mock.MagicMock(return_value=self.results.get(query.tables[0], []))
+        self.queries.append(query)
+        return query
+
+    def test_changed_packages(self):
+        self.results['tag_listing'] = [[5], [6]]
+        self.results['tag_packages'] = [[6], [7]]
+        base = kojihub.kojihub._repo_init_base(self.tinfo, 200, {'x86_64': 1}, True, self.options)
+        self.assertEqual(base['id'], 10)
+        self.assertEqual(base['taglist'], [1, 2])
+        self.assertEqual(base['changed_pkgs'], set([5, 6, 7]))
+        self.assertEqual([q.tables[0] for q in self.queries],
+                         ['repo', 'tag_updates', 'tag_listing', 'tag_packages'])
+        self.assertEqual(self.queries[2].values, {'taglist': [1, 2], 'start': 100, 'end': 200})
+        self.readFullInheritance.assert_has_calls([mock.call(1, event=200),
+                                                   mock.call(1, event=100)])
+
+    def test_tag_updates(self):
+        self.results['tag_updates'] = [{'id': 1}]
+        self.assertIsNone(
+            kojihub.kojihub._repo_init_base(self.tinfo, 200, {'x86_64': 1}, True, self.options))
+
+    def test_different_options(self):
+        options = dict(self.options, with_src=True)
+        self.assertIsNone(
+            kojihub.kojihub._repo_init_base(self.tinfo, 200, {'x86_64': 1}, True, options))
+
+    def test_changed_arches(self):
+        arches = {'x86_64': 1, 'ppc64le': 1}
+        self.assertIsNone(
+            kojihub.kojihub._repo_init_base(self.tinfo, 200, arches, True, self.options))
+
+    def test_changed_inheritance(self):
+        self.readFullInheritance.side_effect = [[{'parent_id': 2}], [{'parent_id': 3}]]
+        self.assertIsNone(
+            kojihub.kojihub._repo_init_base(self.tinfo, 200, {'x86_64': 1}, True, self.options))
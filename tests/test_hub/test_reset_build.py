@@ -44,6 +44,7 @@ class TestResetBuild(unittest.TestCase):
         ).start()
         self.updates = []
         self.get_build = mock.patch("kojihub.kojihub.get_build").start()
+        self.set_tag_update = mock.patch("kojihub.kojihub.set_tag_update").start()
         self.context = mock.patch("kojihub.kojihub.context").start()
         self.context.session.assertPerm = mock.MagicMock()
         # don't remove anything unexpected
@@ -82,6 +83,7 @@ class TestResetBuild(unittest.TestCase):
         self.query_execute.side_effect = [
             [(123,)],  # rpm ids
             [(9999,)],  # archive ids
+            [(7,)],  # tag ids
             {"id": 0, "name": "DEFAULT"},  # volume DEFAULT
             [
                 {"id": 0, "name": "DEFAULT"},
@@ -92,7 +94,7 @@ class TestResetBuild(unittest.TestCase):
 
         kojihub.reset_build(self.build_id)
 
-        self.assertEqual(len(self.queries), 4)
+        self.assertEqual(len(self.queries), 5)
         query = self.queries[0]
         self.assertEqual(query.tables, ["rpminfo"])
         self.assertEqual(query.joins, None)
@@ -206,6 +208,11 @@ class TestResetBuild(unittest.TestCase):
         self.assertEqual(delete.clauses, ["build_id=%(id)i"])
         self.assertEqual(delete.values, {"id": self.binfo["build_id"]})
 
+        query = self.queries[2]
+        self.assertEqual(query.tables, ["tag_listing"])
+        self.assertEqual(query.clauses, ["build_id = %(id)i"])
+        self.set_tag_update.assert_called_once_with(7, 'MANUAL')
+
         self.get_build.assert_has_calls(
             [mock.call(self.build_id), mock.call(self.build_id, strict=True)]
         )
@@ -1,4 +1,5 @@
 import datetime
+import json
 import mock
 import unittest
 
@@ -31,6 +32,9 @@ class BaseTest(unittest.TestCase):
             'SoftRefusalTimeout': 900,
             'HostTimeout': 900,
             'RunInterval': 60,
+            'MemoryPerWeight': 0,
+            'DiskPerWeight': 0,
+            'AffinityBonus': 2,
         }
 
         self.db_lock = mock.patch('kojihub.scheduler.db_lock').start()
@@ -52,6 +56,8 @@ class BaseTest(unittest.TestCase):
 
         self.get_task_refusals = mock.patch('kojihub.scheduler.get_task_refusals').start()
         self.get_task_runs = mock.patch('kojihub.scheduler.get_task_runs').start()
+        mock.patch('kojihub.scheduler.host_config_cache', new=scheduler.HostConfigCache()).start()
+        mock.patch('kojihub.scheduler.task_repo_cache', new=scheduler.TaskRepoCache()).start()
 
     def tearDown(self):
         mock.patch.stopall()
@@ -247,6 +253,361 @@ class TestDoSchedule(BaseTest):
         self.assertEqual(t_assigned, list(range(3,5)))
         self.assertEqual(h_used, list(range(3,5)))
 
+    def get_assigns(self):
+        return [(task['task_id'], host['id']) for task, host in self.assigns]
+
+    def test_refused(self):
+        hosts = [self.mkhost(id=n) for n in range(2)]
+        self.sched._get_hosts.return_value = hosts
+        self.sched.get_hosts()
+        self.sched.free_tasks = [self.mktask(task_id=100)]
+        self.sched.get_refusals.return_value = {100: {0: {'host_id': 0}}}
+
+        self.sched.do_schedule()
+
+        self.assertEqual(self.get_assigns(), [(100, 1)])
+        # all the demand is on the host that did not refuse
+        self.assertEqual(hosts[0]['_demand'], 0.0)
+        self.assertEqual(hosts[1]['_demand'], 1.0)
+
+    def test_skip_for_heavy_task(self):
+        self.sched.capacity_overcommit = 0.0
+        hosts = [self.mkhost(id=0, capacity=1.0), self.mkhost(id=1)]
+        # host 0 ranks best, but has only 0.5 capacity left
+        active = [self.mktask(task_id=1, host_id=0, weight=0.5)]
+        active += [self.mktask(task_id=n, host_id=1, waiting=True) for n in range(2, 5)]
+        self.sched._get_hosts.return_value = hosts
+        self.sched.get_hosts()
+        self.sched.active_tasks = active
+        self.sched.free_tasks = [self.mktask(task_id=100, weight=2.0),
+                                 self.mktask(task_id=101, weight=0.2)]
+        self.sched.get_refusals.return_value = {}
+
+        self.sched.do_schedule()
+
+        # the skipped host is still available for the lighter task
+        self.assertEqual(self.get_assigns(), [(100, 1), (101, 0)])
+
+    def test_maxjobs(self):
+        hosts = [self.mkhost(id=0, data={'maxjobs': 1}), self.mkhost(id=1)]
+        self.sched._get_hosts.return_value = hosts
+        self.sched.get_hosts()
+        self.sched.free_tasks = [self.mktask(task_id=n) for n in range(4)]
+        self.sched.get_refusals.return_value = {}
+
+        self.sched.do_schedule()
+
+        h_used = [h_id for t_id, h_id in self.get_assigns()]
+        self.assertEqual(len(h_used), 4)
+        self.assertEqual(h_used.count(0), 1)
+
+    def test_not_ready(self):
+        hosts = [self.mkhost(id=0, ready=False), self.mkhost(id=1, arches='aarch64')]
+        self.sched._get_hosts.return_value = hosts
+        self.sched.get_hosts()
+        self.sched.free_tasks = [self.mktask(task_id=100, arch='x86_64')]
+        self.sched.get_refusals.return_value = {}
+
+        self.sched.do_schedule()
+
+        self.sched.assign.assert_not_called()
+
+    def test_memory(self):
+        self.sched.mem_per_weight = 1024
+        data = {'mem_total': 8192, 'mem_available': 2048}
+        hosts = [self.mkhost(id=0, data=data), self.mkhost(id=1, data=dict(data))]
+        self.sched._get_hosts.return_value = hosts
+        self.sched.get_hosts()
+        self.sched.free_tasks = [self.mktask(task_id=n, weight=1.5) for n in range(3)]
+        self.sched.get_refusals.return_value = {}
+
+        self.sched.do_schedule()
+
+        # each host has memory for just one of these
+        self.assertEqual(sorted(self.get_assigns()), [(0, 0), (1, 1)])
+        self.assertEqual(hosts[0]['_mem_avail'], 512)
+
+    def test_disk(self):
+        self.sched.disk_per_weight = 1000
+        hosts = [self.mkhost(id=0, data={'disk_free': 500}), self.mkhost(id=1)]
+        self.sched._get_hosts.return_value = hosts
+        self.sched.get_hosts()
+        self.sched.free_tasks = [self.mktask(task_id=n) for n in range(3)]
+        self.sched.get_refusals.return_value = {}
+
+        self.sched.do_schedule()
+
+        # no data means no limit
+        self.assertEqual([h_id for t_id, h_id in self.get_assigns()], [1, 1, 1])
+
+    def test_pressure(self):
+        hosts = [
+            self.mkhost(id=0, data={'cpus': 4, 'loadavg': [16.0, 8.0, 4.0]}),
+            self.mkhost(id=1, data={'mem_total': 8192, 'mem_available': 1024}),
+            self.mkhost(id=2, data={'cpus': 4, 'loadavg': [1.0, 1.0, 1.0],
+                                    'mem_total': 8192, 'mem_available': 8192}),
+        ]
+        self.sched._get_hosts.return_value = hosts
+        self.sched.get_hosts()
+        self.sched.free_tasks = [self.mktask(task_id=100)]
+        self.sched.get_refusals.return_value = {}
+
+        self.sched.do_schedule()
+
+        self.assertEqual(hosts[0]['_pressure'], 2.0)
+        self.assertEqual(hosts[1]['_pressure'], 0.875)
+        self.assertEqual(hosts[2]['_pressure'], 0.25)
+        self.assertEqual(self.get_assigns(), [(100, 2)])
+
+    def test_affinity(self):
+        hosts = [self.mkhost(id=0), self.mkhost(id=1, data={'repo_cache': [42]})]
+        # host 1 ranks worse, but within the affinity bonus
+        active = [self.mktask(task_id=1, host_id=1, waiting=True)]
+        self.sched._get_hosts.return_value = hosts
+        self.sched.get_hosts()
+        self.sched.active_tasks = active
+        self.sched.free_tasks = [self.mktask(task_id=100, _repo_id=42),
+                                 self.mktask(task_id=101)]
+        self.sched.get_refusals.return_value = {}
+        self.sched.update_affinity_stats = mock.MagicMock()
+
+        self.sched.do_schedule()
+
+        # the host skipped for the first task is still available for the second one
+        self.assertEqual(self.get_assigns(), [(100, 1), (101, 0)])
+        self.sched.update_affinity_stats.assert_called_once_with(1, 1)
+
+    def test_affinity_bonus(self):
+        hosts = [self.mkhost(id=0), self.mkhost(id=1, data={'repo_cache': [42]})]
+        active = [self.mktask(task_id=n, host_id=1, waiting=True) for n in range(3)]
+        self.sched._get_hosts.return_value = hosts
+        self.sched.get_hosts()
+        self.sched.active_tasks = active
+        self.sched.free_tasks = [self.mktask(task_id=100, _repo_id=42)]
+        self.sched.get_refusals.return_value = {}
+        self.sched.update_affinity_stats = mock.MagicMock()
+
+        self.sched.do_schedule()
+
+        self.assertEqual(self.get_assigns(), [(100, 0)])
+        self.sched.update_affinity_stats.assert_called_once_with(1, 0)
+
+    def test_affinity_refused(self):
+        hosts = [self.mkhost(id=0), self.mkhost(id=1, data={'repo_cache': [42]})]
+        self.sched._get_hosts.return_value = hosts
+        self.sched.get_hosts()
+        self.sched.free_tasks = [self.mktask(task_id=100, _repo_id=42)]
+        self.sched.get_refusals.return_value = {100: {1: {}}}
+        self.sched.update_affinity_stats = mock.MagicMock()
+
+        self.sched.do_schedule()
+
+        self.assertEqual(self.get_assigns(), [(100, 0)])
+
+    def test_affinity_reads_repos(self):
+        hosts = [self.mkhost(id=1, data={'repo_cache': [42]}),
+                 self.mkhost(id=2, arches='aarch64')]
+        self.sched._get_hosts.return_value = hosts
+        self.sched.get_hosts()
+        self.sched.free_tasks = [self.mktask(task_id=n, arch=arch)
+                                 for n, arch in ((1, 'x86_64'), (2, 'aarch64'), (3, 'ppc64le'))]
+        self.sched.get_refusals.return_value = {}
+        self.sched.update_affinity_stats = mock.MagicMock()
+        get = mock.patch.object(scheduler.task_repo_cache, 'get',
+                                return_value={1: 42, 2: 43}).start()
+
+        self.sched.do_schedule()
+
+        # only the task that a warm host could take is read before assigning, then the
+        # other assigned ones for the stats
+        self.assertEqual(self.get_assigns(), [(1, 1), (2, 2)])
+        self.assertEqual(get.call_args_list, [mock.call([1]), mock.call([2])])
+        self.assertNotIn('_repo_id', self.sched.free_tasks[2])
+        self.sched.update_affinity_stats.assert_called_once_with(2, 1)
+
+    def test_demand(self):
+        # compare with a direct calculation over each task's candidate hosts
+        self.sched.capacity_overcommit = 1.0
+        hosts = [self.mkhost(id=n, capacity=2.0 + n % 3, arches=['x86_64', 'aarch64'][n % 2])
+                 for n in range(10)]
+        active = [self.mktask(task_id=n, host_id=n, weight=1.5) for n in range(4)]
+        free = [self.mktask(task_id=100 + n, weight=[0.5, 1.0, 3.0][n % 3],
+                            arch=['x86_64', 'aarch64', 'noarch'][n % 3])
+                for n in range(20)]
+        for task in free:
+            task['_bin'] = '%(channel_id)s:%(arch)s' % task
+        refusals = {100: {0: {}, 2: {}}, 101: {1: {}}, 105: {9: {}}}
+        self.sched._get_hosts.return_value = hosts
+        self.sched.get_hosts()
+        self.sched.active_tasks = active
+        self.sched.free_tasks = free
+        self.sched.get_host_load()
+
+        expected = dict([(h['id'], 0.0) for h in hosts])
+        for task in free:
+            min_avail = min(0, task['weight'] - 1.0)
+            options = [h for h in self.sched.hosts_by_bin.get(task['_bin'], [])
+                       if h['capacity'] - h['_load'] > min_avail and
+                       h['id'] not in refusals.get(task['task_id'], {})]
+            for h in options:
+                expected[h['id']] += task['weight'] / len(options)
+        total = sum(expected.values())
+
+        self.sched.get_demand(refusals)
+
+        for host in hosts:
+            self.assertAlmostEqual(host['_demand'], expected[host['id']] / total)
+
+
+class TestAffinity(BaseTest):
+
+    def test_get_task_repo(self):
+        request = koji.xmlrpcplus.dumps(('work/foo.src.rpm', 1, 'x86_64', False,
+                                         {'repo_id': 42}), methodname='buildArch')
+        self.assertEqual(scheduler.get_task_repo(request), 42)
+        request = koji.xmlrpcplus.dumps(('foo.src.rpm', 'target', {}), methodname='build')
+        self.assertEqual(scheduler.get_task_repo(request), None)
+        self.assertEqual(scheduler.get_task_repo('b2xkIGRhdGE='), None)
+
+    def test_get_tasks(self):
+        sched = scheduler.TaskScheduler()
+        free = [{'task_id': 1, 'channel_id': 1, 'arch': 'x86_64'}]
+        self.queries_data = [[], free]
+        self.QueryProcessor.side_effect = self.getQueryData
+        sched.get_tasks()
+        self.assertEqual(sched.free_tasks, [{'task_id': 1, 'channel_id': 1, 'arch': 'x86_64',
+                                             '_bin': '1:x86_64'}])
+        # the requests are only read for the tasks that need them
+        self.assertNotIn('task.request', self.queries[1].columns)
+
+    def test_task_repo_cache(self):
+        request = koji.xmlrpcplus.dumps(('foo.src.rpm', 1, 'x86_64', False, {'repo_id': 42}),
+                                        methodname='buildArch')
+        self.queries_data = [[{'id': 1, 'request': request}, {'id': 2, 'request': None}]]
+        self.QueryProcessor.side_effect = self.getQueryData
+        cache = scheduler.TaskRepoCache(size=3)
+
+        self.assertEqual(cache.get([1, 2, 3]), {1: 42, 2: None, 3: None})
+        self.assertEqual(len(self.queries), 1)
+        self.assertEqual(self.queries[0].values, {'task_ids': [1, 2, 3]})
+
+        # requests do not change, so they are not read again
+        self.assertEqual(cache.get([2, 1]), {1: 42, 2: None})
+        self.assertEqual(len(self.queries), 1)
+        self.assertEqual((cache.hits, cache.misses), (2, 3))
+
+        # the oldest entries are dropped
+        self.queries_data = [[]]
+        cache.get([4])
+        self.assertEqual(list(cache.repos), [2, 3, 4])
+
+    def getQueryData(self, *args, **kwargs):
+        query = QP(*args, **kwargs)
+        query.execute = mock.MagicMock(return_value=self.queries_data.pop(0))
+        self.queries.append(query)
+        return query
+
+    def test_stats(self):
+        sched = scheduler.TaskScheduler()
+        self.UpsertProcessor = mock.patch('kojihub.scheduler.UpsertProcessor').start()
+        with mock.patch('kojihub.scheduler.get_affinity_stats') as get_stats:
+            get_stats.return_value = {'tasks': 10, 'hits': 5, 'hit_rate': 0.5}
+            sched.update_affinity_stats(4, 3)
+            sched.update_affinity_stats(0, 0)
+        self.UpsertProcessor.assert_called_once()
+        data = self.UpsertProcessor.call_args[1]['data']
+        self.assertEqual(data['name'], 'affinity_stats')
+        self.assertEqual(json.loads(data['data']), {'tasks': 14, 'hits': 8})
+
+    def test_get_stats(self):
+        with mock.patch.object(QP, 'singleValue', return_value={'tasks': 4, 'hits': 3}):
+            self.assertEqual(scheduler.get_affinity_stats(),
+                             {'tasks': 4, 'hits': 3, 'hit_rate': 0.75})
+        with mock.patch.object(QP, 'singleValue', return_value=None):
+            self.assertEqual(scheduler.get_affinity_stats(),
+                             {'tasks': 0, 'hits': 0, 'hit_rate': None})
+
+
+class TestHostConfigCache(BaseTest):
+
+    def setUp(self):
+        super(TestHostConfigCache, self).setUp()
+        self.cache = scheduler.HostConfigCache()
+        # row counts and event sums of host_config and host_channels, enabled channels
+        self.fingerprint = [2, 15, 0, 3, 24, 0, [1, 2]]
+        self.query_executeOne.side_effect = lambda *a, **kw: list(self.fingerprint)
+        self.host_config = [{'host_id': 1, 'arches': 'x86_64', 'capacity': 2.0},
+                            {'host_id': 2, 'arches': 'aarch64', 'capacity': 4.0}]
+        self.host_channels = [{'host_id': 1, 'channel_id': 1},
+                              {'host_id': 2, 'channel_id': 1},
+                              {'host_id': 2, 'channel_id': 2}]
+
+    def getQuery(self, *args, **kwargs):
+        query = super(TestHostConfigCache, self).getQuery(*args, **kwargs)
+        if query.tables == ['host_channels']:
+            query.execute.return_value = self.host_channels
+        elif query.tables == ['host']:
+            query.execute.return_value = [{'id': 1, 'name': 'host1'}, {'id': 2, 'name': 'host2'}]
+        elif 'host_id' in query.columns:
+            query.execute.return_value = self.host_config
+        return query
+
+    def test_get(self):
+        config = self.cache.get()
+        self.assertEqual(config, {
+            1: {'arches': 'x86_64', 'capacity': 2.0, 'channels': [1]},
+            2: {'arches': 'aarch64', 'capacity': 4.0, 'channels': [1, 2]},
+        })
+        self.assertEqual(len(self.queries), 3)
+        self.assertEqual(self.cache.misses, 1)
+
+        # unchanged fingerprint, only the check is repeated
+        self.assertIs(self.cache.get(), config)
+        self.assertEqual(len(self.queries), 4)
+        self.assertEqual(self.cache.hits, 1)
+
+        # a host was removed from a channel
+        self.fingerprint[5] += 11
+        self.host_channels.pop()
+        config = self.cache.get()
+        self.assertEqual(config[2]['channels'], [1])
+        self.assertEqual(len(self.queries), 7)
+        self.assertEqual(self.cache.misses, 2)
+
+        # a lower event committed after the latest one
+        self.fingerprint[0] += 1
+        self.fingerprint[1] += 6
+        self.fingerprint[2] += 6
+        self.host_config[0]['capacity'] = 3.0
+        config = self.cache.get()
+        self.assertEqual(config[1]['capacity'], 3.0)
+        self.assertEqual(self.cache.misses, 3)
+
+    def test_fingerprint(self):
+        self.cache.get()
+        query = self.queries[0]
+        self.assertEqual(query.tables, ['host_config'])
+        self.assertIn('COUNT(*)', query.columns)
+        self.assertIn('SUM(COALESCE(host_config.revoke_event, 0))', query.columns)
+        self.assertNotIn('MAX', ' '.join(query.columns))
+
+    def test_get_hosts(self):
+        sched = scheduler.TaskScheduler()
+        with mock.patch('kojihub.scheduler.host_config_cache', new=self.cache):
+            config = self.cache.get()
+            del self.queries[:]
+            hosts = sched._get_hosts()
+
+        # only the dynamic host data is queried
+        self.assertEqual(len(self.queries), 2)
+        query = self.queries[1]
+        self.assertEqual(query.tables, ['host'])
+        self.assertEqual(sorted(query.values['host_ids']), [1, 2])
+        # the cached data is not shared with the returned hosts
+        for host in hosts:
+            self.assertIsNot(host['channels'], config[host['id']]['channels'])
+
+
 class TestCheckActiveRuns(BaseTest):
 
     def setUp(self):
@@ -372,3 +733,35 @@ class TestCheckActiveRuns(BaseTest):
         self.assertEqual(len(self.updates), 1)
         update = self.updates[0]
         self.assertEqual(update.table, 'scheduler_task_runs')
+
+
+class TestNotify(unittest.TestCase):
+
+    def setUp(self):
+        self.context = mock.patch('kojihub.scheduler.context').start()
+        self.context.opts = {'TaskWaitTimeout': 60}
+        self._dml = mock.patch('kojihub.scheduler._dml').start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def test_notify_host(self):
+        scheduler.notify_host(23)
+        self._dml.assert_called_once_with('NOTIFY koji_host_23', {})
+
+    def test_notify_no_host(self):
+        scheduler.notify_host(None)
+        self._dml.assert_not_called()
+
+    def test_notify_task_host(self):
+        scheduler.notify_task_host(99)
+        self._dml.assert_called_once()
+        query, values = self._dml.call_args[0]
+        self.assertIn("pg_notify('koji_host_' || host_id, '')", query)
+        self.assertEqual(values, {'task_id': 99})
+
+    def test_disabled(self):
+        self.context.opts['TaskWaitTimeout'] = 0
+        scheduler.notify_host(23)
+        scheduler.notify_task_host(99)
+        self._dml.assert_not_called()
@@ -0,0 +1,81 @@
+import unittest
+
+import mock
+
+import kojihub
+
+QP = kojihub.QueryProcessor
+
+
+class TestSetTagLastChange(unittest.TestCase):
+
+    def setUp(self):
+        self._dml = mock.patch('kojihub.kojihub._dml').start()
+        self.get_event = mock.patch('kojihub.kojihub.get_event', return_value=42).start()
+        self.context = mock.patch('kojihub.kojihub.context').start()
+        self.context.tag_last_change = None
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def test_single_tag(self):
+        kojihub.kojihub.set_tag_last_change(5)
+        # nothing is written until the flush
+        self._dml.assert_not_called()
+        self.assertEqual(self.context.tag_last_change, [(5, 42)])
+
+        kojihub.flush_tag_last_change()
+        self._dml.assert_called_once()
+        sql, values = self._dml.call_args[0]
+        self.assertIn('INSERT INTO tag_last_change', sql)
+        self.assertIn('ORDER BY tag.id', sql)
+        self.assertIn('GREATEST(tag_last_change.event_id, EXCLUDED.event_id)', sql)
+        self.assertEqual(values, {'tag_ids': [5], 'event_ids': [42]})
+        self.assertEqual(self.context.tag_last_change, [])
+
+    def test_multiple_tags(self):
+        kojihub.kojihub.set_tag_last_change([3, 1, 3], event_id=7)
+        kojihub.kojihub.set_tag_last_change(2)
+        kojihub.kojihub.set_tag_last_change(3, event_id=5)
+        self.get_event.assert_called_once_with()
+
+        kojihub.flush_tag_last_change()
+        # one statement, in tag order, with the greatest event of each tag
+        self._dml.assert_called_once()
+        sql, values = self._dml.call_args[0]
+        self.assertEqual(values, {'tag_ids': [1, 2, 3], 'event_ids': [7, 42, 7]})
+
+    def test_flush_nothing(self):
+        kojihub.flush_tag_last_change()
+        self.context.tag_last_change = []
+        kojihub.flush_tag_last_change()
+        self._dml.assert_not_called()
+
+
+class TestTagChangedSinceEvent(unittest.TestCase):
+
+    def getQuery(self, *args, **kwargs):
+        query = QP(*args, **kwargs)
+        query.execute = mock.MagicMock(return_value=self.query_result)
+        self.queries.append(query)
+        return query
+
+    def setUp(self):
+        mock.patch('kojihub.kojihub.QueryProcessor', side_effect=self.getQuery).start()
+        self.queries = []
+        self.query_result = []
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def test_not_changed(self):
+        self.assertFalse(kojihub.tag_changed_since_event(100, [1, 2]))
+        self.assertEqual(len(self.queries), 1)
+        query = self.queries[0]
+        self.assertEqual(query.tables, ['tag_last_change'])
+        self.assertEqual(query.clauses, ['event_id > %(event)i', 'tag_id IN %(taglist)s'])
+        self.assertEqual(query.values, {'event': 100, 'taglist': [1, 2]})
+
+    def test_changed(self):
+        self.query_result = [{'tag_id': 2}]
+        self.assertTrue(kojihub.tag_changed_since_event(100, [1, 2]))
@@ -0,0 +1,104 @@
+import mock
+import unittest
+
+import koji
+import kojihub
+
+
+QP = kojihub.QueryProcessor
+ASSIGNED = koji.TASK_STATES['ASSIGNED']
+OPEN = koji.TASK_STATES['OPEN']
+
+
+class TestWaitForTasks(unittest.TestCase):
+
+    def setUp(self):
+        self.context = mock.patch('kojihub.kojihub.context').start()
+        self.context.opts = {'TaskWaitTimeout': 60, 'ReadyTimeout': 180}
+        self.context.in_multicall = False
+        self.host_id = 99
+        self.context.session.getHostId.return_value = self.host_id
+        self.host = kojihub.Host(self.host_id)
+        self.host.taskWaitCheck = mock.MagicMock(return_value=(False, []))
+        self.listen = mock.patch('kojihub.kojihub.listen').start()
+        self.unlisten = mock.patch('kojihub.kojihub.unlisten').start()
+        self.wait_notify = mock.patch('kojihub.kojihub.wait_notify').start()
+        self.queries = []
+        self.execute = mock.MagicMock()
+        self.execute.return_value = [
+            {'id': 1, 'state': OPEN, 'waiting': True},
+            {'id': 2, 'state': ASSIGNED, 'waiting': False},
+        ]
+        self.QueryProcessor = mock.patch('kojihub.kojihub.QueryProcessor',
+                                         side_effect=self.get_query).start()
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def get_query(self, *args, **kwargs):
+        query = QP(*args, **kwargs)
+        query.execute = self.execute
+        self.queries.append(query)
+        return query
+
+    def test_snapshot(self):
+        self.host.taskWaitCheck.return_value = (True, [3])
+
+        snapshot = self.host.getTaskSnapshot()
+
+        self.assertEqual(snapshot, [[1, OPEN, True], [2, ASSIGNED, False]])
+        self.host.taskWaitCheck.assert_called_once_with(1)
+        self.assertEqual(len(self.queries), 1)
+        query = self.queries[0]
+        self.assertEqual(query.tables, ['task'])
+        self.assertEqual(query.clauses, ['host_id = %(host_id)s', 'state IN %(states)s'])
+        self.assertEqual(query.values, {'host_id': self.host_id, 'states': [ASSIGNED, OPEN]})
+
+    def test_changed(self):
+        result = self.host.waitForTasks([[1, OPEN, False]])
+
+        self.assertEqual(result, [[1, OPEN, False], [2, ASSIGNED, False]])
+        self.listen.assert_called_once_with('koji_host_99')
+        self.wait_notify.assert_not_called()
+        self.unlisten.assert_called_once_with()
+
+    def test_first_call(self):
+        result = self.host.waitForTasks(None)
+
+        self.assertEqual(result, [[1, OPEN, False], [2, ASSIGNED, False]])
+        self.wait_notify.assert_not_called()
+
+    def test_unchanged(self):
+        snapshot = [[1, OPEN, False], [2, ASSIGNED, False]]
+
+        result = self.host.waitForTasks(snapshot)
+
+        self.assertEqual(result, snapshot)
+        self.listen.assert_called_once_with('koji_host_99')
+        self.wait_notify.assert_called_once_with(60)
+        self.unlisten.assert_called_once_with()
+
+    def test_timeout_capped(self):
+        self.context.opts['TaskWaitTimeout'] = 600
+        self.host.waitForTasks([[1, OPEN, False], [2, ASSIGNED, False]])
+        self.wait_notify.assert_called_once_with(90)
+
+    def test_disabled(self):
+        self.context.opts['TaskWaitTimeout'] = 0
+
+        self.assertEqual(self.host.waitForTasks(None), None)
+        self.listen.assert_not_called()
+        self.assertEqual(self.queries, [])
+
+    def test_multicall(self):
+        self.context.in_multicall = True
+
+        self.assertEqual(self.host.waitForTasks(None), None)
+        self.listen.assert_not_called()
+
+    def test_unlisten_on_error(self):
+        self.wait_notify.side_effect = koji.GenericError('broken connection')
+
+        with self.assertRaises(koji.GenericError):
+            self.host.waitForTasks([[1, OPEN, False], [2, ASSIGNED, False]])
+        self.unlisten.assert_called_once_with()
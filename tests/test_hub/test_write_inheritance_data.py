@@ -37,6 +37,7 @@ class TestWriteInheritanceData(unittest.TestCase):
         self.read_inheritance_data = mock.patch('kojihub.kojihub.readInheritanceData').start()
         self.get_tag = mock.patch('kojihub.kojihub.get_tag').start()
         self.context = mock.patch('kojihub.kojihub.context').start()
+        self.set_tag_last_change = mock.patch('kojihub.kojihub.set_tag_last_change').start()
         self.context.session.assertPerm = mock.MagicMock()
         self.tag_id = 5
         self.changes = {'parent_id': 10, 'priority': 7, 'maxdepth': None, 'intransitive': False,
@@ -77,6 +78,7 @@ class TestWriteInheritanceData(unittest.TestCase):
                                        'intransitive': False, 'noconfig': False,
                                        'pkg_filter': '', 'tag_id': 5})
         self.assertEqual(insert.rawdata, {})
+        self.set_tag_last_change.assert_called_once_with(5)
 
     def test_delete_link(self):
         changes = self.changes.copy()
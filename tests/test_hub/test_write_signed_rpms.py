@@ -0,0 +1,179 @@
+import hashlib
+import mock
+import os
+import shutil
+import tempfile
+
+import koji
+import kojihub
+from .utils import DBQueryTestCase
+
+
+DATADIR = os.path.join(os.path.dirname(__file__), '../test_lib/data/rpms')
+SIGKEY = 'abcd1234'
+
+
+def rpm(rpm_id, name):
+    return {'id': rpm_id, 'build_id': 10, 'name': name, 'version': '1', 'release': '1.fc24',
+            'arch': 'x86_64', 'external_repo_id': 0, 'external_repo_name': 'INTERNAL'}
+
+
+class TestWriteSignedRPMs(DBQueryTestCase):
+
+    def setUp(self):
+        super(TestWriteSignedRPMs, self).setUp()
+        self.tempdir = tempfile.mkdtemp()
+        mock.patch('koji.pathinfo', new=koji.PathInfo(topdir=self.tempdir)).start()
+        self.context = mock.patch('kojihub.kojihub.context').start()
+        self.context.opts = {'RPMDefaultChecksums': 'md5 sha256', 'WriteSignedRPMThreads': 2}
+        self.lookup_rpms = mock.patch('kojihub.kojihub.lookup_rpms').start()
+        self.create_rpm_checksums = mock.patch('kojihub.kojihub.create_rpm_checksums').start()
+        self.rpms = [rpm(1, 'foo'), rpm(2, 'bar'), rpm(3, 'baz')]
+        self.lookup_rpms.return_value = self.rpms
+        self.build = {'id': 10, 'name': 'pkg', 'version': '1', 'release': '1.fc24',
+                      'volume_name': 'DEFAULT'}
+        # the build query, then the rpmsigs query
+        self.qp_execute_side_effect = iter([[self.build], [[1], [2], [3]]])
+
+        with open(os.path.join(DATADIR, 'test-deps-1-1.fc24.x86_64.rpm.signed'), 'rb') as fo:
+            self.signed = fo.read()
+        sighdr = koji.rip_rpm_sighdr(os.path.join(DATADIR, 'test-deps-1-1.fc24.x86_64.rpm.signed'))
+        self.builddir = koji.pathinfo.build(self.build)
+        for rinfo in self.rpms:
+            path = os.path.join(self.builddir, koji.pathinfo.rpm(rinfo))
+            koji.ensuredir(os.path.dirname(path))
+            shutil.copyfile(os.path.join(DATADIR, 'test-deps-1-1.fc24.x86_64.rpm'), path)
+            path = os.path.join(self.builddir, koji.pathinfo.sighdr(rinfo, SIGKEY))
+            koji.ensuredir(os.path.dirname(path))
+            with open(path, 'wb') as fo:
+                fo.write(sighdr)
+
+    def tearDown(self):
+        super(TestWriteSignedRPMs, self).tearDown()
+        shutil.rmtree(self.tempdir)
+
+    def signed_path(self, rinfo):
+        return os.path.join(self.builddir, koji.pathinfo.signed(rinfo, SIGKEY))
+
+    def checksums(self):
+        return {'md5': hashlib.md5(self.signed).hexdigest(),
+                'sha256': hashlib.sha256(self.signed).hexdigest()}
+
+    def test_write(self):
+        result = kojihub.write_signed_rpms(['foo-1-1.fc24.x86_64', 2, 3, 3], SIGKEY.upper())
+
+        self.assertEqual(result, 3)
+        for rinfo in self.rpms:
+            with open(self.signed_path(rinfo), 'rb') as fo:
+                self.assertEqual(fo.read(), self.signed)
+        self.create_rpm_checksums.assert_called_once_with(
+            SIGKEY, {1: self.checksums(), 2: self.checksums(), 3: self.checksums()})
+        self.assertEqual(len(self.queries), 2)
+        self.assertEqual(self.queries[0].values, {'build_ids': [10]})
+        self.assertEqual(self.queries[1].values, {'rpm_ids': [1, 2, 3], 'sigkey': SIGKEY})
+
+    def test_build(self):
+        get_build = mock.patch('kojihub.kojihub.get_build', return_value=self.build).start()
+        list_rpms = mock.patch('kojihub.kojihub.list_rpms', return_value=self.rpms).start()
+
+        self.assertEqual(kojihub.write_signed_rpms('pkg-1-1.fc24', SIGKEY), 3)
+
+        get_build.assert_called_once_with('pkg-1-1.fc24', strict=True)
+        list_rpms.assert_called_once_with(buildID=10)
+        self.lookup_rpms.assert_not_called()
+
+    def test_existing(self):
+        path = self.signed_path(self.rpms[0])
+        koji.ensuredir(os.path.dirname(path))
+        with open(path, 'wb') as fo:
+            fo.write(b'existing')
+
+        kojihub.write_signed_rpms([1, 2, 3], SIGKEY)
+
+        with open(path, 'rb') as fo:
+            self.assertEqual(fo.read(), b'existing')
+        checksums = self.create_rpm_checksums.call_args[0][1]
+        self.assertEqual(checksums[1]['md5'], hashlib.md5(b'existing').hexdigest())
+        self.assertEqual(checksums[2], self.checksums())
+
+        self.qp_execute_side_effect = iter([[self.build], [[1], [2], [3]]])
+        kojihub.write_signed_rpms([1, 2, 3], SIGKEY, force=True)
+
+        with open(path, 'rb') as fo:
+            self.assertEqual(fo.read(), self.signed)
+
+    def test_missing_signature(self):
+        self.qp_execute_side_effect = iter([[self.build], [[1], [3]]])
+
+        with self.assertRaises(koji.GenericError) as cm:
+            kojihub.write_signed_rpms([1, 2, 3], SIGKEY)
+
+        self.assertIn('No cached signature for package bar', str(cm.exception))
+        self.assertFalse(os.path.exists(self.signed_path(self.rpms[0])))
+        self.create_rpm_checksums.assert_not_called()
+
+    def test_external(self):
+        self.rpms[1]['external_repo_id'] = 5
+
+        with self.assertRaises(koji.GenericError) as cm:
+            kojihub.write_signed_rpms([1, 2, 3], SIGKEY)
+
+        self.assertIn('Not an internal rpm', str(cm.exception))
+        self.assertEqual(self.queries, [])
+
+    def test_write_error(self):
+        os.unlink(os.path.join(self.builddir, koji.pathinfo.sighdr(self.rpms[2], SIGKEY)))
+
+        with self.assertRaises(IOError):
+            kojihub.write_signed_rpms([1, 2, 3], SIGKEY)
+
+        self.create_rpm_checksums.assert_not_called()
+
+
+class TestCreateRPMChecksums(DBQueryTestCase):
+
+    def setUp(self):
+        super(TestCreateRPMChecksums, self).setUp()
+        self.insert = mock.patch('kojihub.kojihub.BulkInsertProcessor').start()
+        self.insert.return_value.data = []
+
+        def add_record(**kwargs):
+            self.insert.return_value.data.append(kwargs)
+        self.insert.return_value.add_record.side_effect = add_record
+
+    def test_insert(self):
+        self.qp_execute_return_value = [
+            {'rpm_id': 1, 'checksum_type': koji.CHECKSUM_TYPES['md5'], 'checksum': 'md5-1'}]
+
+        kojihub.create_rpm_checksums(SIGKEY, {
+            1: {'md5': 'md5-1', 'sha256': 'sha256-1'},
+            2: {'md5': 'md5-2'},
+        })
+
+        self.assertEqual(self.queries[0].values, {'rpm_ids': [1, 2], 'sigkey': SIGKEY})
+        self.insert.assert_called_once_with(table='rpm_checksum', skip_dup=True)
+        self.assertEqual(self.insert.return_value.data, [
+            {'rpm_id': 1, 'sigkey': SIGKEY, 'checksum': 'sha256-1',
+             'checksum_type': koji.CHECKSUM_TYPES['sha256']},
+            {'rpm_id': 2, 'sigkey': SIGKEY, 'checksum': 'md5-2',
+             'checksum_type': koji.CHECKSUM_TYPES['md5']},
+        ])
+        self.insert.return_value.execute.assert_called_once_with()
+
+    def test_all_present(self):
+        self.qp_execute_return_value = [
+            {'rpm_id': 1, 'checksum_type': koji.CHECKSUM_TYPES['md5'], 'checksum': 'md5-1'}]
+
+        kojihub.create_rpm_checksums(SIGKEY, {1: {'md5': 'md5-1'}})
+
+        self.insert.return_value.execute.assert_not_called()
+
+    def test_mismatch(self):
+        self.qp_execute_return_value = [
+            {'rpm_id': 1, 'checksum_type': koji.CHECKSUM_TYPES['md5'], 'checksum': 'other'}]
+
+        with self.assertRaises(koji.GenericError) as cm:
+            kojihub.create_rpm_checksums(SIGKEY, {1: {'md5': 'md5-1'}})
+
+        self.assertIn('different than checksum in DB', str(cm.exception))
+        self.insert.return_value.execute.assert_not_called()
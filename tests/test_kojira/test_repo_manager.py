@@ -85,6 +85,40 @@ class RepoManagerTest(unittest.TestCase):
         # should have removed the close tasks
         self.assertEqual(list(self.mgr.tasks.keys()), [101, 102])
 
+    def test_check_current_repos(self):
+        repos = []
+        for repo_id in range(1, 1002):
+            repo = mock.MagicMock(repo_id=repo_id, event_id=100, taglist=[1, 2],
+                                  current=True, expire_ts=None)
+            repos.append(repo)
+        self.mgr.reposToCheck = mock.MagicMock(return_value=repos)
+        self.session.getTagsChangedSince.side_effect = [[1, 3], [], [1001]]
+
+        self.mgr.checkCurrentRepos()
+
+        self.assertEqual(self.session.getTagsChangedSince.call_count, 3)
+        self.session.tagChangedSinceEvent.assert_not_called()
+        checks = self.session.getTagsChangedSince.call_args_list[0][0][0]
+        self.assertEqual(len(checks), 500)
+        self.assertEqual(checks[0], [1, 100, [1, 2]])
+        self.assertEqual([r.repo_id for r in repos if not r.current], [1, 3, 1001])
+        self.assertIsNotNone(repos[0].expire_ts)
+        self.assertIsNone(repos[1].expire_ts)
+
+    def test_check_current_repos_old_hub(self):
+        repos = [mock.MagicMock(repo_id=repo_id, event_id=100, taglist=[1], current=True)
+                 for repo_id in (1, 2)]
+        self.mgr.reposToCheck = mock.MagicMock(return_value=repos)
+        self.session.getTagsChangedSince.side_effect = koji.GenericError(
+            'Invalid method: getTagsChangedSince')
+        self.session.tagChangedSinceEvent.side_effect = [False, True]
+
+        self.mgr.checkCurrentRepos()
+
+        self.assertEqual(self.session.tagChangedSinceEvent.call_count, 2)
+        self.assertTrue(repos[0].current)
+        self.assertFalse(repos[1].current)
+
     @mock.patch('time.sleep')
     def test_regen_loop(self, sleep):
         subsession = mock.MagicMock()
@@ -1,6 +1,11 @@
 from __future__ import absolute_import
+import hashlib
 import mock
+import os
+import shutil
 import six
+import tempfile
+import threading
 import weakref
 import requests
 import unittest
@@ -61,6 +66,117 @@ class TestClientSession(unittest.TestCase):
         ksession.getKojiVersion.assert_not_called()
 
 
+class TestJSONTransport(unittest.TestCase):
+
+    def setUp(self):
+        self.ksession = koji.ClientSession('http://koji.example.com/kojihub')
+
+    def tearDown(self):
+        del self.ksession
+
+    def response(self, content_type, body):
+        response = mock.MagicMock()
+        response.headers = {'Content-Type': content_type}
+        response.iter_content.return_value = [body[:10], body[10:]]
+        return response
+
+    def test_prep_call(self):
+        handler, headers, request = self.ksession._prepCall('getTag', ('foo',), {'strict': True})
+        headers = dict(headers)
+        # xml until the hub answered in json
+        self.assertEqual(headers['Content-Type'], 'text/xml')
+        self.assertEqual(headers['Accept'], 'application/json, text/xml')
+        self.assertEqual(koji.xmlrpcplus.loads(request)[0][0], 'foo')
+
+        self.ksession._json_ok = True
+        handler, headers, request = self.ksession._prepCall('getTag', ('foo',), {'strict': True})
+        headers = dict(headers)
+        self.assertEqual(headers['Content-Type'], 'application/json')
+        self.assertEqual(headers['Content-Length'], str(len(request)))
+        params, method = koji.jsonplus.loads_request(request)
+        self.assertEqual(method, 'getTag')
+        self.assertEqual(params, ('foo', {'strict': True, '__starstar': True}))
+
+    def test_prep_call_disabled(self):
+        self.ksession.opts['json_transport'] = False
+        self.ksession._json_ok = True
+        handler, headers, request = self.ksession._prepCall('getTag', ('foo',))
+        headers = dict(headers)
+        self.assertEqual(headers['Content-Type'], 'text/xml')
+        self.assertNotIn('Accept', headers)
+
+    def test_prep_call_callnum(self):
+        self.ksession.sinfo = {'session-id': 123, 'session-key': 'xyz', 'header-auth': True}
+        self.ksession.callnum = 5
+
+        handler, headers, request = self.ksession._prepCall('getTag', ('foo',))
+        self.assertEqual(dict(headers)['Koji-Session-Callnum'], '5')
+        self.assertEqual(self.ksession.callnum, 6)
+
+        handler, headers, request = self.ksession._prepCall('getTag', ('foo',), callnum=False)
+        headers = dict(headers)
+        self.assertEqual(headers['Koji-Session-Id'], '123')
+        self.assertNotIn('Koji-Session-Callnum', headers)
+        self.assertEqual(self.ksession.callnum, 6)
+
+    def test_read_json(self):
+        body = koji.jsonplus.dumps_response({'name': 'foo'}).encode()
+        response = self.response('application/json', body)
+        self.assertEqual(self.ksession._read_xmlrpc_response(response), {'name': 'foo'})
+        self.assertTrue(self.ksession._json_ok)
+
+    def test_read_json_fault(self):
+        fault = koji.Fault(1000, 'No such tag')
+        response = self.response('application/json',
+                                 koji.jsonplus.dumps_response(fault).encode())
+        with self.assertRaises(koji.Fault):
+            self.ksession._read_xmlrpc_response(response)
+
+    def test_json_fallback(self):
+        # e.g. an older hub behind the same load balancer
+        self.ksession._json_ok = True
+        handler, headers, request = self.ksession._prepCall('getTag', ('foo',), {'strict': True})
+        sent = []
+
+        def send(handler, headers, request):
+            sent.append((dict(headers), request))
+            if dict(headers)['Content-Type'] == 'application/json':
+                self.ksession._json_ok = False
+                raise koji.Fault(1, 'ExpatError: syntax error: line 1, column 0')
+            return 'result'
+
+        with mock.patch.object(self.ksession, '_sendCallReconnect', side_effect=send):
+            self.assertEqual(self.ksession._sendCall(handler, headers, request), 'result')
+
+        self.assertEqual(len(sent), 2)
+        headers, request = sent[1]
+        self.assertEqual(headers['Content-Type'], 'text/xml')
+        self.assertEqual(headers['Content-Length'], str(len(request)))
+        params, method = koji.xmlrpcplus.loads(request)
+        self.assertEqual(method, 'getTag')
+        self.assertEqual(params, ('foo', {'strict': True, '__starstar': True}))
+        self.assertFalse(self.ksession._json_ok)
+
+    def test_json_fault(self):
+        # a fault answered in json is a real one
+        self.ksession._json_ok = True
+        handler, headers, request = self.ksession._prepCall('getTag', ('foo',))
+
+        with mock.patch.object(self.ksession, '_sendCallReconnect',
+                               side_effect=koji.Fault(1000, 'No such tag')) as send:
+            with self.assertRaises(koji.Fault):
+                self.ksession._sendCall(handler, headers, request)
+        send.assert_called_once()
+
+    def test_read_xml(self):
+        self.ksession._json_ok = True
+        body = koji.xmlrpcplus.dumps(({'name': 'foo'},), methodresponse=1).encode()
+        response = self.response('text/xml', body)
+        self.assertEqual(self.ksession._read_xmlrpc_response(response), {'name': 'foo'})
+        # e.g. the hub was reconfigured
+        self.assertFalse(self.ksession._json_ok)
+
+
 class TestFastUpload(unittest.TestCase):
 
     def setUp(self):
@@ -177,6 +293,140 @@ class TestFastUpload(unittest.TestCase):
             self.assertEqual(kwargs['volume'], 'foobar')
 
 
+class TestUploadFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.ksession = koji.ClientSession('http://koji.example.com/kojihub')
+        self.ksession.logged_in = True
+        self.ksession.sinfo = {}
+        self.ksession.callnum = 1
+        self.ksession._callMethod = mock.MagicMock(side_effect=self.call)
+        self.ksession.uploadWrapper = mock.MagicMock()
+        self.tempdir = tempfile.mkdtemp()
+        self.files = {}
+        self.lock = threading.Lock()
+        self.localfiles = []
+        for name, data in (('a.rpm', b'0123456789'), ('b.rpm', b'abc'), ('c.rpm', b'')):
+            self.localfiles.append(os.path.join(self.tempdir, name))
+            with open(self.localfiles[-1], 'wb') as fo:
+                fo.write(data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def call(self, method, args, kwargs):
+        # emulates the hub
+        with self.lock:
+            if method == 'prepareUploads':
+                for info in args[1]:
+                    self.files[info['name']] = bytearray(info['size'])
+            elif method == 'rawUpload':
+                chunk, ofs, path, name = args
+                self.files[name][ofs:ofs + len(chunk)] = chunk
+                return {'size': len(chunk)}
+            elif method == 'multiCall':
+                results = []
+                for call in args[0]:
+                    path, name = call['params'][:2]
+                    data = bytes(self.files[name])
+                    results.append([{'size': len(data),
+                                     'hexdigest': hashlib.sha256(data).hexdigest()}])
+                return results
+
+    def test_parallel(self):
+        callback = mock.MagicMock()
+
+        self.ksession.uploadFiles(self.localfiles, 'target', callback=callback,
+                                  blocksize=4, jobs=3)
+
+        self.assertEqual(self.files, {'a.rpm': b'0123456789', 'b.rpm': b'abc', 'c.rpm': b''})
+        self.ksession._callMethod.assert_any_call(
+            'prepareUploads', ('target', [{'name': 'a.rpm', 'size': 10},
+                                          {'name': 'b.rpm', 'size': 3},
+                                          {'name': 'c.rpm', 'size': 0}]),
+            {'overwrite': False})
+        self.ksession._callMethod.assert_any_call(
+            'rawUpload', (b'4567', 4, 'target', 'a.rpm'), {'verify': '', 'parallel': True})
+        methods = [c[0][0] for c in self.ksession._callMethod.call_args_list]
+        self.assertEqual(methods, ['prepareUploads'] + ['rawUpload'] * 4 + ['multiCall'])
+        self.assertEqual(callback.call_args_list[0], mock.call(0, 13, 0, 0, 0))
+        self.assertEqual(callback.call_args_list[-1][0][0], 13)
+        self.ksession.uploadWrapper.assert_not_called()
+
+    def test_wrong_checksum(self):
+        orig_call = self.call
+
+        def call(method, args, kwargs):
+            if method == 'rawUpload':
+                args = (b'x' * len(args[0]),) + args[1:]
+            return orig_call(method, args, kwargs)
+
+        self.ksession._callMethod.side_effect = call
+        with self.assertRaises(koji.GenericError) as cm:
+            self.ksession.uploadFiles(self.localfiles, 'target', blocksize=4, jobs=2)
+        self.assertIn('wrong checksum', str(cm.exception))
+
+    def test_chunk_error(self):
+        orig_call = self.call
+
+        def call(method, args, kwargs):
+            if method == 'rawUpload' and args[1] == 4:
+                raise koji.GenericError('upload failed')
+            return orig_call(method, args, kwargs)
+
+        self.ksession._callMethod.side_effect = call
+        with self.assertRaises(koji.GenericError) as cm:
+            self.ksession.uploadFiles(self.localfiles, 'target', blocksize=4, jobs=2)
+        self.assertEqual(str(cm.exception), 'upload failed')
+        methods = [c[0][0] for c in self.ksession._callMethod.call_args_list]
+        self.assertNotIn('multiCall', methods)
+
+    def test_sequential(self):
+        self.ksession.uploadFiles(self.localfiles, 'target', names=['x', 'y', 'z'],
+                                  volume='foobar')
+
+        self.ksession._callMethod.assert_not_called()
+        self.ksession.uploadWrapper.assert_has_calls([
+            mock.call(self.localfiles[0], 'target', 'x', callback=None, blocksize=1048576,
+                      overwrite=False, volume='foobar'),
+            mock.call(self.localfiles[1], 'target', 'y', callback=None, blocksize=1048576,
+                      overwrite=False, volume='foobar'),
+            mock.call(self.localfiles[2], 'target', 'z', callback=None, blocksize=1048576,
+                      overwrite=False, volume='foobar'),
+        ])
+
+    def test_old_hub(self):
+        self.ksession._callMethod.side_effect = koji.GenericError(
+            'Invalid method: prepareUploads')
+        self.ksession.opts['upload_jobs'] = 4
+
+        self.ksession.uploadFiles(self.localfiles, 'target')
+
+        self.ksession._callMethod.assert_called_once()
+        self.assertEqual(self.ksession.uploadWrapper.call_count, 3)
+
+    def test_prep_upload_no_callnum(self):
+        self.ksession.sinfo = {'session-id': 123, 'session-key': 'xyz', 'header-auth': True}
+
+        handler, headers, request = self.ksession._prepUpload(
+            b'data', 4, 'target', 'a.rpm', verify='', parallel=True)
+
+        self.assertIn('parallel=1', handler)
+        self.assertEqual([h[0] for h in headers if h[0].startswith('Koji-Session')],
+                         ['Koji-Session-Id', 'Koji-Session-Key'])
+        self.assertEqual(self.ksession.callnum, 1)
+
+        self.ksession.sinfo = {'session-id': 123, 'session-key': 'xyz'}
+        handler, headers, request = self.ksession._prepUpload(
+            b'data', 4, 'target', 'a.rpm', verify='', parallel=True)
+        self.assertIn('session-id=123', handler)
+        self.assertNotIn('callnum', handler)
+
+        handler, headers, request = self.ksession._prepUpload(b'data', 4, 'target', 'a.rpm')
+        self.assertIn('callnum=1', handler)
+        self.assertEqual(self.ksession.callnum, 2)
+
+
 class TestMultiCall(unittest.TestCase):
 
     def setUp(self):
@@ -253,3 +503,25 @@ class TestMultiCall(unittest.TestCase):
             res = str(res)
             self.assertNotIn(url, res)
             self.assertIn(sanitized, res)
+
+
+class TestThreadSessions(unittest.TestCase):
+
+    @mock.patch('requests.Session')
+    def test_rsession_per_thread(self, rsession):
+        ksession = koji.ClientSession('http://koji.example.com/kojihub')
+        main = ksession.rsession
+        seen = []
+
+        def worker():
+            seen.append(ksession.rsession)
+            ksession.new_session()
+            seen.append(ksession.rsession)
+
+        thread = threading.Thread(target=worker)
+        thread.start()
+        thread.join()
+        self.assertEqual(seen[0], None)
+        self.assertIsNotNone(seen[1])
+        self.assertIs(ksession.rsession, main)
+        main.close.assert_not_called()
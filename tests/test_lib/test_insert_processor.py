@@ -1,3 +1,4 @@
+import datetime
 import mock
 import unittest
 
@@ -206,3 +207,71 @@ class TestBulkInsertProcessor(unittest.TestCase):
             mock.call('INSERT INTO sometable (foo) VALUES (%(foo0)s), (%(foo1)s), (%(foo2)s)',
                       {'foo0': 'bar1', 'foo1': 'bar2', 'foo2': 'bar3'}, log_errors=True)
         )
+
+    def copy_calls(self, cursor):
+        return [(c[1][0], c[1][1].getvalue()) for c in cursor.copy_expert.mock_calls]
+
+    def test_copy_execution(self):
+        cursor = mock.MagicMock()
+        self.context_db.cnx.cursor.return_value = cursor
+
+        proc = kojihub.BulkInsertProcessor('sometable', copy=True, batch=2)
+        proc.add_record(foo=1, bar=True, baz=None)
+        proc.add_record(foo=2, bar=False, baz='a\tb\\c\nd')
+        proc.add_record(foo=3, bar=True, baz=datetime.datetime(2024, 1, 2, 3, 4, 5))
+        proc.execute()
+
+        cursor.execute.assert_not_called()
+        self.assertEqual(self.copy_calls(cursor), [
+            ('COPY sometable (bar, baz, foo) FROM STDIN',
+             't\t\\N\t1\nf\ta\\tb\\\\c\\nd\t2\n'),
+            ('COPY sometable (bar, baz, foo) FROM STDIN',
+             't\t2024-01-02T03:04:05\t3\n'),
+        ])
+        self.assertTrue(self.context_db.commit_pending)
+
+    def test_copy_missing_values(self):
+        cursor = mock.MagicMock()
+        self.context_db.cnx.cursor.return_value = cursor
+
+        proc = kojihub.BulkInsertProcessor('sometable', copy=True)
+        proc.add_record(foo='bar')
+        proc.add_record(foo2='bar2')
+        with self.assertRaises(koji.GenericError) as cm:
+            proc.execute()
+        self.assertEqual(cm.exception.args[0], 'Missing value foo2 in BulkInsert')
+        cursor.copy_expert.assert_not_called()
+
+        proc = kojihub.BulkInsertProcessor('sometable', copy=True, strict=False)
+        proc.add_record(foo='bar')
+        proc.add_record(foo2='bar2')
+        proc.execute()
+        self.assertEqual(self.copy_calls(cursor), [
+            ('COPY sometable (foo, foo2) FROM STDIN', 'bar\t\\N\n\\N\tbar2\n')])
+
+    def test_copy_fallback(self):
+        cursor = mock.MagicMock()
+        self.context_db.cnx.cursor.return_value = cursor
+
+        # e.g. json values are adapted by psycopg2
+        proc = kojihub.BulkInsertProcessor('sometable', copy=True,
+                                           data=[{'foo': 1}, {'foo': [1, 2]}])
+        proc.execute()
+
+        cursor.copy_expert.assert_not_called()
+        cursor.execute.assert_called_once_with(
+            'INSERT INTO sometable (foo) VALUES (%(foo0)s), (%(foo1)s)',
+            {'foo0': 1, 'foo1': [1, 2]}, log_errors=True)
+
+    def test_skip_dup(self):
+        cursor = mock.MagicMock()
+        self.context_db.cnx.cursor.return_value = cursor
+
+        proc = kojihub.BulkInsertProcessor('sometable', copy=True, skip_dup=True,
+                                           data=[{'foo': 1}, {'foo': 2}])
+        proc.execute()
+
+        cursor.copy_expert.assert_not_called()
+        cursor.execute.assert_called_once_with(
+            'INSERT INTO sometable (foo) VALUES (%(foo0)s), (%(foo1)s) ON CONFLICT DO NOTHING',
+            {'foo0': 1, 'foo1': 2}, log_errors=True)
@@ -0,0 +1,111 @@
+# coding=utf-8
+from __future__ import absolute_import
+import datetime
+import re
+import unittest
+
+from six.moves import xmlrpc_client
+from koji import jsonplus, xmlrpcplus
+
+
+class TestJSON(unittest.TestCase):
+
+    standard_data = [
+        "Hello World",
+        5,
+        5.5,
+        None,
+        True,
+        False,
+        u'Hævē s°mə ŭnıčođė',
+        [1],
+        {"a": 1},
+        ["fnord"],
+        {"a": ["b", 1, 2, None], "b": {"c": 1}},
+        2 ** 63 - 1,
+        -(2 ** 63),
+    ]
+
+    def test_response(self):
+        for value in self.standard_data:
+            enc = jsonplus.dumps_response(value)
+            self.assertEqual(jsonplus.loads_response(enc), value)
+            # same as xmlrpc
+            xml = xmlrpcplus.dumps((value,), methodresponse=1)
+            self.assertEqual(xmlrpc_client.loads(xml)[0][0], value)
+
+    def test_request(self):
+        value = (1, 'two', {'three': 3, '__starstar': True})
+        enc = jsonplus.dumps_request('my_rpc_method', value)
+        params, method = jsonplus.loads_request(enc.encode('utf-8'))
+        self.assertEqual(params, value)
+        self.assertEqual(method, 'my_rpc_method')
+
+    def test_invalid_request(self):
+        for data in ('[]', '{"method": 1, "params": []}', '{"method": "foo"}', 'nope'):
+            with self.assertRaises(ValueError):
+                jsonplus.loads_request(data)
+
+    def test_fault(self):
+        enc = jsonplus.dumps_response(xmlrpcplus.Fault(1001, 'some useless error'))
+        with self.assertRaises(xmlrpcplus.Fault) as cm:
+            jsonplus.loads_response(enc)
+        self.assertEqual(cm.exception.faultCode, 1001)
+        self.assertEqual(cm.exception.faultString, 'some useless error')
+
+    def test_types(self):
+        dt = datetime.datetime(2024, 1, 2, 3, 4, 5)
+        value = {
+            'datetime': dt,
+            'DateTime': xmlrpc_client.DateTime(dt),
+            'bytes': b'\x00\xff',
+            'binary': xmlrpc_client.Binary(b'abc'),
+            'gen': (n for n in range(3)),
+            'tuple': (1, 2),
+            're': re.compile('^foo$'),
+        }
+        result = jsonplus.loads_response(jsonplus.dumps_response(value))
+        self.assertEqual(result['datetime'], xmlrpc_client.DateTime(dt))
+        self.assertEqual(result['DateTime'], xmlrpc_client.DateTime(dt))
+        self.assertEqual(result['bytes'], xmlrpc_client.Binary(b'\x00\xff'))
+        self.assertEqual(result['binary'], xmlrpc_client.Binary(b'abc'))
+        self.assertEqual(result['gen'], [0, 1, 2])
+        self.assertEqual(result['tuple'], [1, 2])
+        self.assertEqual(result['re'], "re.compile('^foo$')")
+
+    def test_unknown_type(self):
+        with self.assertRaises(TypeError):
+            jsonplus.dumps_response({'a': object()})
+        with self.assertRaises(ValueError):
+            jsonplus.loads_response('{"result": {"__koji_type__": "foo"}}')
+
+    def test_response_iter(self):
+        value = [{'id': n, 'name': 'build-%i' % n} for n in range(1000)]
+        chunks = list(jsonplus.dumps_response_iter(value, chunksize=1000))
+        self.assertGreater(len(chunks), 10)
+        self.assertEqual(''.join(chunks), jsonplus.dumps_response(value))
+
+    def test_response_iter_generator(self):
+        consumed = []
+
+        def rows():
+            for n in range(1000):
+                consumed.append(n)
+                yield {'id': n, 'name': 'build-%i' % n}
+
+        chunks = jsonplus.dumps_response_iter(rows(), chunksize=1000)
+        first = next(chunks)
+        # the generator is only consumed as the chunks are read
+        self.assertLess(len(consumed), 100)
+        data = first + ''.join(chunks)
+        self.assertEqual(len(consumed), 1000)
+        self.assertEqual(jsonplus.loads_response(data),
+                         [{'id': n, 'name': 'build-%i' % n} for n in range(1000)])
+
+    def test_response_iter_nested_generator(self):
+        value = {'builds': (n for n in range(3)), 'ts': datetime.datetime(2024, 1, 2),
+                 'list': [1, (n for n in 'ab')], 'empty': (n for n in [])}
+        data = ''.join(jsonplus.dumps_response_iter(value))
+        self.assertEqual(jsonplus.loads_response(data),
+                         {'builds': [0, 1, 2], 'ts': xmlrpcplus.DateTime('20240102T00:00:00'),
+                          'list': [1, ['a', 'b']], 'empty': []})
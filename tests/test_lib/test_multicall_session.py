@@ -50,3 +50,68 @@ class TestNewMultiCall(unittest.TestCase):
                 self.assertEqual(call['methodName'], "echo")
                 self.assertEqual(call['params'], (i,))
                 i += 1
+
+    def _echo_batch(self, name, args, kwargs, callnum=True):
+        return [[c['params'][0]] for c in args[0]]
+
+    def test_concurrent_multicall(self):
+        self._callMethod.side_effect = self._echo_batch
+        with self.session.multicall(batch=10, concurrency=4) as m:
+            ret = [m.echo(i) for i in range(42)]
+
+        self.assertEqual(self._callMethod.call_count, 5)
+        self.assertEqual([r.result for r in ret], list(range(42)))
+        sent = []
+        for args, kwargs in self._callMethod.call_args_list:
+            self.assertEqual(args[0], 'multiCall')
+            # concurrent batches go without a callnum
+            self.assertEqual(kwargs, {'callnum': False})
+            sent.extend([c['params'][0] for c in args[1][0]])
+        self.assertEqual(sorted(sent), list(range(42)))
+
+    def test_concurrent_call_all_order(self):
+        self._callMethod.side_effect = self._echo_batch
+        m = self.session.multicall(batch=3)
+        for i in range(20):
+            m.echo(i)
+        results = m.call_all(concurrency=8)
+        self.assertEqual(results, [[i] for i in range(20)])
+
+    def test_concurrent_strict(self):
+        def side_effect(name, args, kwargs, callnum=True):
+            results = self._echo_batch(name, args, kwargs)
+            for n, call in enumerate(args[0]):
+                if call['params'][0] in (7, 13):
+                    results[n] = {'faultCode': 1000, 'faultString': 'failed %s'
+                                  % call['params'][0]}
+            return results
+        self._callMethod.side_effect = side_effect
+        m = self.session.multicall(batch=2, concurrency=3)
+        calls = [m.echo(i) for i in range(20)]
+
+        with self.assertRaises(koji.GenericError) as cm:
+            m.call_all(strict=True)
+        self.assertEqual(str(cm.exception), 'failed 7')
+        # results are still available
+        self.assertEqual(calls[6].result, 6)
+
+        m = self.session.multicall(batch=2, concurrency=3)
+        calls = [m.echo(i) for i in range(20)]
+        results = m.call_all()
+        self.assertEqual(results[7], {'faultCode': 1000, 'faultString': 'failed 7'})
+        with self.assertRaises(koji.GenericError):
+            calls[13].result
+
+    def test_concurrent_error(self):
+        def side_effect(name, args, kwargs, callnum=True):
+            if args[0][0]['params'][0] == 4:
+                raise koji.ServerOffline('offline')
+            return self._echo_batch(name, args, kwargs)
+        self._callMethod.side_effect = side_effect
+        m = self.session.multicall(batch=2, concurrency=2)
+        calls = [m.echo(i) for i in range(8)]
+
+        with self.assertRaises(koji.ServerOffline):
+            m.call_all()
+        self.assertEqual(calls[0].result, 0)
+        self.assertEqual(calls[1].result, 1)
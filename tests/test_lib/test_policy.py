@@ -4,6 +4,7 @@ import pytest
 
 
 import koji.policy
+import koji.util
 
 
 class MyBoolTest(koji.policy.BoolTest):
@@ -209,6 +210,43 @@ class TestRuleHandling(unittest.TestCase):
         with self.assertRaises(ValueError):
             obj = koji.policy.SimpleRuleSet(rules, tests)
 
+    def test_test_results_reused(self):
+        runs = []
+
+        class CountTest(koji.policy.MatchTest):
+            name = 'count'
+            field = 'field'
+
+            def run(self, data):
+                runs.append(self.str.strip())
+                return super(CountTest, self).run(data)
+
+        tests = koji.policy.findSimpleTests([{'CountTest': CountTest}, koji.policy.__dict__])
+        policy = '''
+count foo* && false :: deny
+count foo* :: {
+    count bar* :: deny
+    count foo*  &&  count foo1* :: allow
+}
+'''
+        obj = koji.policy.SimpleRuleSet(policy.splitlines(), tests)
+        # identical tests share a handler
+        self.assertEqual(len(obj.handlers), 4)
+        self.assertEqual(obj.apply({'field': 'foo1'}), 'allow')
+        self.assertEqual(sorted(runs), ['count bar*', 'count foo*', 'count foo1*'])
+        # results are not kept between applies
+        del runs[:]
+        self.assertEqual(obj.apply({'field': 'bar'}), None)
+        self.assertEqual(runs, ['count foo*'])
+
+    def test_compile_patterns(self):
+        patterns = ['foo', 'bar*', 'b?z', '[0-9]x', 'a.b']
+        match = koji.policy.compile_patterns(patterns)
+        for value in ['foo', 'bar', 'barbaz', 'biz', '1x', 'a.b', 'fo', 'foox', 'ba',
+                      'bizz', 'ax', 'axb', 'x\nbar', 'bar\n', '']:
+            self.assertEqual(match(value), koji.util.multi_fnmatch(value, patterns), value)
+        self.assertFalse(koji.policy.compile_patterns([])('foo'))
+
     def test_last_rule(self):
         tests = koji.policy.findSimpleTests(koji.policy.__dict__)
         data = {}
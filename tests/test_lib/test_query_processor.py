@@ -72,6 +72,16 @@ class TestQueryProcessor(unittest.TestCase):
                    " ORDER BY something OFFSET 10 LIMIT 3"
         self.assertEqual(actual, expected)
 
+    def test_rowlock_as_string(self):
+        proc = kojihub.QueryProcessor(columns=['something'], tables=['awesome'],
+                                      opts={'limit': 3, 'rowlock': True})
+        actual = " ".join([token for token in str(proc).split() if token])
+        self.assertEqual(actual, "SELECT something FROM awesome LIMIT 3 FOR UPDATE")
+        proc = kojihub.QueryProcessor(columns=['something'], tables=['awesome'],
+                                      opts={'limit': 3, 'rowlock': 'skip'})
+        actual = " ".join([token for token in str(proc).split() if token])
+        self.assertEqual(actual, "SELECT something FROM awesome LIMIT 3 FOR UPDATE SKIP LOCKED")
+
     def test_simple_with_execution(self):
         cursor = mock.MagicMock()
         self.context_db.cnx.cursor.return_value = cursor
@@ -139,3 +149,91 @@ class TestQueryProcessor(unittest.TestCase):
         results = proc.execute()
         self.assertEqual(
             results, [['result_1_col_1', 'result_1_col_2'], ['result_2_col_1', 'result_2_col_2']])
+
+
+class TestStatementCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = kojihub.db.StatementCache(size=2)
+        mock.patch('kojihub.db.statement_cache', new=self.cache).start()
+        self.context_db = mock.patch('kojihub.db.context').start()
+        self.raw = mock.MagicMock()
+        self.cursor = kojihub.db.CursorWrapper(self.raw)
+        self.context_db.cnx.cursor.return_value = self.cursor
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def query(self, clauses=['id = %(id)i'], **values):
+        return kojihub.QueryProcessor(tables=['awesome'], columns=['something'],
+                                      clauses=clauses, values=values)
+
+    def test_reuse(self):
+        statement = self.query(id=1)._statement()
+        self.assertEqual(statement, str(self.query()))
+        self.assertIn('id = %(id)s', statement.sql)
+        self.assertIs(self.query(id=2)._statement(), statement)
+        self.assertEqual(self.cache.stats()['hits'], 1)
+        self.assertEqual(self.cache.stats()['misses'], 1)
+        self.assertEqual(self.cache.stats()['hit_rate'], 0.5)
+
+    def test_shape(self):
+        statement = self.query()._statement()
+        other = self.query(clauses=['id > %(id)i'])._statement()
+        self.assertIsNot(other, statement)
+        proc = self.query()
+        proc.opts['limit'] = 5
+        self.assertIn('LIMIT 5', proc._statement())
+        # the least recently used entry is dropped
+        self.assertEqual(len(self.cache.entries), 2)
+        self.assertIsNot(self.query()._statement(), statement)
+
+    def test_disabled(self):
+        self.cache.size = 0
+        statement = self.query()._statement()
+        self.assertNotIsInstance(statement, kojihub.db.Statement)
+        self.assertEqual(self.cache.stats()['misses'], 0)
+
+    def test_execute(self):
+        self.raw.fetchall.return_value = [('value',)]
+        result = self.query(clauses=['id IN %(ids)s'], ids=[1, 2]).execute()
+        self.assertEqual(result, [{'something': 'value'}])
+        statement = self.cache.entries[self.query(clauses=['id IN %(ids)s'])._shape()]
+        self.raw.execute.assert_called_once_with(statement.sql, {'ids': (1, 2)})
+
+    def test_prepare(self):
+        self.cache.prepare = True
+        self.query(id=1).execute()
+        self.query(id=2).execute()
+        calls = self.raw.execute.mock_calls
+        self.assertEqual(calls[0], mock.call('SAVEPOINT koji_prepare'))
+        self.assertIn('PREPARE koji_stmt_0 AS', calls[1][1][0])
+        self.assertIn('id = $1', calls[1][1][0])
+        self.assertEqual(calls[2], mock.call('RELEASE SAVEPOINT koji_prepare'))
+        self.assertEqual(calls[3:], [
+            mock.call('EXECUTE koji_stmt_0 (%(id)s)', {'id': 1}),
+            mock.call('EXECUTE koji_stmt_0 (%(id)s)', {'id': 2}),
+        ])
+        self.assertEqual(self.cache.stats()['executed_prepared'], 2)
+
+    def test_prepare_in_list(self):
+        self.cache.prepare = True
+        self.query(clauses=['id IN %(ids)s'], ids=[1, 2]).execute()
+        self.assertEqual(len(self.raw.execute.mock_calls), 1)
+        self.assertEqual(self.cache.stats()['executed_prepared'], 0)
+
+    def test_prepare_fails(self):
+        self.cache.prepare = True
+
+        def execute(sql, *args):
+            if sql.startswith('PREPARE'):
+                raise kojihub.db.psycopg2.Error('could not determine data type')
+        self.raw.execute.side_effect = execute
+        self.query(id=1).execute()
+        self.query(id=2).execute()
+        calls = self.raw.execute.mock_calls
+        self.assertEqual(calls[2], mock.call('ROLLBACK TO SAVEPOINT koji_prepare'))
+        statement = self.query()._statement()
+        self.assertEqual(calls[3:], [
+            mock.call(statement.sql, {'id': 1}),
+            mock.call(statement.sql, {'id': 2}),
+        ])
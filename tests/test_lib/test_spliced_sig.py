@@ -1,5 +1,7 @@
 # coding=utf-8
 from __future__ import absolute_import
+import errno
+import mock
 import os.path
 import shutil
 import tempfile
@@ -38,3 +40,28 @@ class TestCheckSigMD5(unittest.TestCase):
         koji.splice_rpm_sighdr(sighdr, self.path, dst=dst)
         contents_spliced = open(dst, 'rb').read()
         self.assertEqual(contents_signed, contents_spliced)
+
+    def test_splice_rpm_sighdr_copy_range(self):
+        contents_signed = open(self.signed, 'rb').read()
+        sighdr = koji.rip_rpm_sighdr(self.signed)
+        dst = '%s/signed-copy.rpm' % self.tempdir
+        bufs = []
+        koji.splice_rpm_sighdr(sighdr, self.path, dst=dst, bufsize=100, callback=bufs.append,
+                               copy_range=True)
+        contents_spliced = open(dst, 'rb').read()
+        self.assertEqual(contents_signed, contents_spliced)
+        self.assertEqual(b''.join(bufs), contents_signed)
+
+    @mock.patch('os.copy_file_range', create=True)
+    def test_splice_rpm_sighdr_copy_range_unsupported(self, copy_file_range):
+        copy_file_range.side_effect = OSError(errno.EXDEV, 'Invalid cross-device link')
+        contents_signed = open(self.signed, 'rb').read()
+        sighdr = koji.rip_rpm_sighdr(self.signed)
+        dst = '%s/signed-copy.rpm' % self.tempdir
+        bufs = []
+        koji.splice_rpm_sighdr(sighdr, self.path, dst=dst, callback=bufs.append,
+                               copy_range=True)
+        contents_spliced = open(dst, 'rb').read()
+        self.assertEqual(contents_signed, contents_spliced)
+        self.assertEqual(b''.join(bufs), contents_signed)
+        copy_file_range.assert_called_once()
@@ -410,6 +410,26 @@ class TasksTestCase(unittest.TestCase):
         self.assertEqual(obj.uploadFile(temp_file), None)
         self.assertEqual(obj.session.uploadWrapper.called, False)
 
+    # This patch removes the dependence on getUploadDir functioning
+    @patch('{0}.TaskTest.getUploadDir'.format(__name__), return_value='tasks/123/123')
+    def test_BaseTaskHandler_uploadFiles(self, mock_getUploadDir):
+        """ Tests that the uploadFiles function calls the uploadFiles function
+        on the session member variable, without the empty files.
+        """
+        temp_path = get_tmp_dir_path('TaskTest')
+        makedirs(temp_path)
+        files = []
+        for name, content in (('a.txt', 'Test'), ('b.txt', ''), ('c.txt', 'Test')):
+            files.append(path.join(temp_path, name))
+            with open(files[-1], 'wt') as temp_file_handler:
+                temp_file_handler.write(content)
+
+        obj = TaskTest(123, 'some_method', ['random_arg'], None, None, temp_path)
+        obj.session = Mock()
+        self.assertEqual(obj.uploadFiles(files, relPath='/sub/'), None)
+        obj.session.uploadFiles.assert_called_once_with(
+            [files[0], files[2]], 'tasks/123/123/sub', volume=None)
+
     def test_BaseTaskHandler_uploadTree(self):
         """ Tests that the uploadTree function calls the uploadFile function
         with the correct parameters.
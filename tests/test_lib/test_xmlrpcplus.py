@@ -190,6 +190,67 @@ class TestDump(unittest.TestCase):
             self.assertEqual(method, None)
 
 
+class TestDumpsIter(unittest.TestCase):
+
+    data = TestDump.standard_data + TestDump.long_data + [
+        [{'id': n, 'name': 'build-%i' % n, 'extra': {'a': [1, 2]}} for n in range(1000)],
+        {'tag_listing': [{'id': n, 'active': None} for n in range(500)], 'tag_config': []},
+    ]
+
+    def test_same_as_dumps(self):
+        for value in self.data:
+            value = (value,)
+            expect = xmlrpcplus.dumps(value, methodresponse=1)
+            chunks = list(xmlrpcplus.dumps_iter(value, methodresponse=1, chunksize=1000))
+            self.assertEqual(''.join(chunks), expect)
+
+    def test_chunks(self):
+        value = ([{'id': n, 'name': 'build-%i' % n} for n in range(1000)],)
+        chunks = list(xmlrpcplus.dumps_iter(value, methodresponse=1, chunksize=1000))
+        self.assertGreater(len(chunks), 50)
+        for chunk in chunks[:-2]:
+            self.assertLess(len(chunk), 1200)
+
+    def test_generator_consumed_lazily(self):
+        seen = []
+
+        def gen():
+            for n in range(1000):
+                seen.append(n)
+                yield {'id': n}
+
+        chunks = xmlrpcplus.dumps_iter((gen(),), methodresponse=1, chunksize=1000)
+        next(chunks)
+        self.assertLess(len(seen), 100)
+        rest = ''.join(chunks)
+        self.assertEqual(len(seen), 1000)
+        self.assertTrue(rest.endswith('</methodResponse>\n'))
+
+    def test_fault(self):
+        fault = xmlrpcplus.Fault(1001, 'some useless error')
+        enc = ''.join(xmlrpcplus.dumps_iter(fault))
+        self.assertEqual(enc, xmlrpcplus.dumps(fault))
+
+    def test_marshaller(self):
+        # the custom handlers are also used inside split containers
+        value = ([3.14159, [2.5]],)
+        enc = ''.join(xmlrpcplus.dumps_iter(value, methodresponse=1, marshaller=MyMarshaller))
+        params, method = xmlrpc_client.loads(enc)
+        self.assertEqual(params, ([3, [2]],))
+
+    def test_recursive(self):
+        value = [1]
+        value.append(value)
+        with self.assertRaises(TypeError):
+            ''.join(xmlrpcplus.dumps_iter((value,), methodresponse=1))
+
+    def test_badargs(self):
+        with self.assertRaises(TypeError):
+            list(xmlrpcplus.dumps_iter([1], methodresponse=1))
+        with self.assertRaises(ValueError):
+            list(xmlrpcplus.dumps_iter((1, 2), methodresponse=1))
+
+
 class MyMarshaller(xmlrpcplus.ExtendedMarshaller):
 
     dispatch = xmlrpcplus.ExtendedMarshaller.dispatch.copy()
@@ -15,6 +15,7 @@ else:
     from configparser import ConfigParser
 
 
+import koji
 from koji.context import context
 
 
@@ -493,6 +494,191 @@ send_timeout = 60
         self.assertTrue(self.handler.timeout_task is None)
 
 
+WORKER_CONF = """[broker]
+urls = amqps://broker1.example.com:5671 amqps://broker2.example.com:5671
+topic_prefix = koji
+connect_timeout = 10
+send_timeout = 60
+
+[queue]
+enabled = true
+worker = true
+batch_size = 3
+"""
+
+
+def read_conf(data):
+    conf = ConfigParser()
+    if six.PY2:
+        conf.readfp(six.StringIO(data))
+    else:
+        conf.read_string(data)
+    return conf
+
+
+class FakeBroker(object):
+    """Stands in for BrokerConnection, accepting all but the rejected addresses"""
+
+    def __init__(self, reject=(), error=None):
+        self.reject = reject
+        self.error = error
+        self.received = []
+        self.closed = 0
+
+    def send(self, msgs):
+        if self.error:
+            raise self.error
+        accepted = [m for m in msgs if m['address'] not in self.reject]
+        self.received.extend(accepted)
+        return accepted
+
+    def close(self):
+        self.closed += 1
+
+
+class TestDeliveryWorker(unittest.TestCase):
+
+    def setUp(self):
+        self.context = mock.patch('protonmsg.context').start()
+        self.QueryProcessor = mock.patch('protonmsg.QueryProcessor').start()
+        self.DeleteProcessor = mock.patch('protonmsg.DeleteProcessor').start()
+        self.msgs = [{'id': i, 'address': 'test.topic%i' % i, 'props': {'n': i},
+                      'body': '{}', 'age': 2.0} for i in range(1, 4)]
+        self.QueryProcessor.return_value.execute.side_effect = [self.msgs, []]
+        self.broker = FakeBroker()
+        self.worker = protonmsg.DeliveryWorker(read_conf(WORKER_CONF), broker=self.broker)
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def test_deliver(self):
+        self.assertEqual(self.worker.deliver(), (3, 3))
+
+        self.assertEqual(self.broker.received, self.msgs)
+        kwargs = self.QueryProcessor.call_args[1]
+        self.assertEqual(kwargs['opts'], {'order': 'id', 'limit': 3, 'rowlock': 'skip'})
+        self.DeleteProcessor.assert_called_once_with(
+            table='proton_queue', clauses=['id IN %(ids)s'], values={'ids': [1, 2, 3]})
+        self.DeleteProcessor.return_value.execute.assert_called_once_with()
+        self.context.cnx.commit.assert_called_once_with()
+        self.assertEqual(self.worker.stats['sent'], 3)
+        self.assertEqual(self.worker.stats['batches'], 1)
+        self.assertGreaterEqual(self.worker.stats['latency'], 2.0)
+
+    def test_deliver_empty(self):
+        self.QueryProcessor.return_value.execute.side_effect = [[]]
+
+        self.assertEqual(self.worker.deliver(), (0, 0))
+
+        self.DeleteProcessor.assert_not_called()
+        self.context.cnx.commit.assert_called_once_with()
+
+    def test_deliver_rejected(self):
+        self.broker.reject = ['test.topic2']
+
+        self.assertFalse(self.worker.drain())
+
+        self.DeleteProcessor.assert_called_once_with(
+            table='proton_queue', clauses=['id IN %(ids)s'], values={'ids': [1, 3]})
+        self.assertEqual(self.worker.stats['failed'], 1)
+
+    def test_deliver_broker_error(self):
+        self.broker.error = Exception('connection lost')
+
+        self.assertEqual(self.worker.deliver(), (3, 0))
+
+        self.assertEqual(self.broker.closed, 1)
+        self.DeleteProcessor.assert_not_called()
+        # releases the locked rows
+        self.context.cnx.commit.assert_called_once_with()
+        self.assertEqual(self.worker.stats['failed'], 3)
+
+    def test_drain(self):
+        self.assertTrue(self.worker.drain())
+        self.assertEqual(self.QueryProcessor.return_value.execute.call_count, 2)
+
+    def test_report(self):
+        self.QueryProcessor.return_value.executeOne.return_value = {'depth': 42, 'age': 3.5}
+        with tempfile.NamedTemporaryFile() as stats_file:
+            self.worker.stats_file = stats_file.name
+
+            self.worker.report()
+
+            with open(stats_file.name) as fo:
+                stats = json.load(fo)
+        self.assertEqual(stats['queue_depth'], 42)
+        self.assertEqual(stats['queue_age'], 3.5)
+        self.assertEqual(self.worker.stats['queue_depth'], 42)
+
+    @patch('protonmsg.store_to_db')
+    @patch('protonmsg.Container')
+    def test_send_queued_msgs_worker(self, Container, store_to_db):
+        conf = tempfile.NamedTemporaryFile()
+        conf.write(six.b(WORKER_CONF))
+        conf.flush()
+        protonmsg.CONFIG_FILE = conf.name
+        protonmsg.CONFIG = None
+        msgs = [{'address': 'test.topic', 'props': {'testheader': 1}, 'body': 'test body'}]
+        self.context.protonmsg_msgs = msgs
+
+        protonmsg.send_queued_msgs('postCommit')
+
+        Container.assert_not_called()
+        store_to_db.assert_called_once_with(msgs, notify=True)
+        protonmsg.CONFIG = None
+
+
+class TestBrokerConnection(unittest.TestCase):
+
+    def setUp(self):
+        self.BlockingConnection = mock.patch('protonmsg.BlockingConnection').start()
+        self.Message = mock.patch('protonmsg.Message').start()
+        self.conn = self.BlockingConnection.return_value
+        self.conn.wait.side_effect = lambda cond, **kw: self.assertTrue(cond())
+        self.broker = protonmsg.BrokerConnection(['amqps://broker1.example.com:5671'],
+                                                 read_conf(WORKER_CONF))
+
+    def tearDown(self):
+        mock.patch.stopall()
+
+    def delivery(self, state):
+        delivery = MagicMock()
+        delivery.settled = True
+        delivery.remote_state = state
+        return delivery
+
+    def test_send(self):
+        sender = self.conn.create_sender.return_value
+        sender.link.send.side_effect = [self.delivery(protonmsg.Delivery.ACCEPTED),
+                                        self.delivery(protonmsg.Delivery.REJECTED),
+                                        self.delivery(protonmsg.Delivery.ACCEPTED)]
+        msgs = [{'address': 'a', 'props': {}, 'body': '1'},
+                {'address': 'b', 'props': {}, 'body': '2'},
+                {'address': 'a', 'props': {}, 'body': '3'}]
+
+        self.assertEqual(self.broker.send(msgs), [msgs[0], msgs[2]])
+
+        self.BlockingConnection.assert_called_once_with(
+            'amqps://broker1.example.com:5671', timeout=10, ssl_domain=None)
+        # senders are reused
+        self.assertEqual(self.conn.create_sender.call_args_list,
+                         [mock.call('topic://koji.a'), mock.call('topic://koji.b')])
+        self.conn.wait.assert_called_once()
+
+        # the connection is kept for later batches
+        sender.link.send.side_effect = None
+        sender.link.send.return_value = self.delivery(protonmsg.Delivery.ACCEPTED)
+        self.assertEqual(self.broker.send(msgs[:1]), msgs[:1])
+        self.BlockingConnection.assert_called_once()
+
+    def test_connect_error(self):
+        self.BlockingConnection.side_effect = Exception('connection refused')
+
+        with self.assertRaises(koji.GenericError):
+            self.broker.send([{'address': 'a', 'props': {}, 'body': '1'}])
+        self.assertIsNone(self.broker.conn)
+
+
 @pytest.mark.parametrize('topic_prefix,expected', (
     ('koji', 'topic://koji'),
     ('brew', 'topic://brew'),